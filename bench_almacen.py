@@ -0,0 +1,1176 @@
+#!/usr/bin/env python3
+"""
+bench_almacen.py
+
+Mediciones de rendimiento del gestor sobre copias de los datos reales
+escaladas (nunca toca los ficheros originales).
+
+- formatos: tiempo de carga/guardado y tamaño de cada formato de
+  instantánea de DataStore frente al JSON indentado de siempre.
+- historial: arranque y movimientos en memoria con el histórico completo
+  frente al histórico por meses (cada réplica se desplaza un mes atrás,
+  simulando años de historia).
+- arranque: arranque en frío de GestorStock con ficheros sin versión de
+  esquema (primera vez: se migran) y ya al día, junto al recorrido que el
+  arranque antiguo hacía siempre sobre los pedidos pendientes.
+- backups: tiempo y bytes nuevos de la primera copia deduplicada y de las
+  siguientes tras unos pocos movimientos, con histórico completo y por meses.
+- salidas: casar salidas con pedidos pendientes por el índice
+  (modelo, talla, pedido) frente al recorrido completo de la lista.
+- normalizadores: norm_talla / norm_codigo / talla_sort_key sobre todos
+  los valores de los datos y exportación CSV completa, con y sin caché.
+- tallas: listado de stock ordenado y ordenaciones de la exportación por
+  talla_sort_key frente a los rangos enteros del catálogo de tallas.
+- auditoria: auditoría completa desde los históricos frente a la
+  incremental con el libro de netos tras unos pocos movimientos.
+- columnar: memoria por movimiento y suma por (modelo, talla) con el
+  histórico como lista de dicts frente a HistorialColumnar.
+- stockfecha: stock a varias fechas reproduciendo el histórico completo
+  frente a Inventory.stock_at (último cierre trimestral + el tramo que falta).
+- bloque: importar salidas y entradas línea a línea en una transacción
+  (register_exit / register_entry) frente a register_exits_bulk /
+  register_entries_bulk.
+- modelos: existencia, histórico y renombrado de unos modelos recorriendo
+  los históricos enteros frente a las posiciones por modelo
+  (has_model / history / rename_model).
+- estimado: stock estimado recorriendo pendientes y fabricación por cada
+  modelo/talla frente a la tabla mantenida por Prevision, en frío y tras
+  unos pocos movimientos.
+- motores: comprobación sobre datos aleatorios de que los motores "tabla"
+  y "pandas" de calc_estimated_stock dan lo mismo que el recorrido por
+  modelo/talla, y tiempos de ambos a gran escala (5.000 modelos x 20
+  tallas x 100.000 pendientes por defecto).
+- proyeccion: stock proyectado por (modelo, talla, periodo) recorriendo
+  pendientes y fabricación una vez por periodo frente al ordenar y
+  acumular por clave de Prevision.project_stock.
+- atp: consultas de disponible para prometer recorriendo pendientes y
+  fabricación en cada una frente a available_to_promise (mínimos por
+  modelo/talla y bisección), sueltas y en bloque.
+- corte: orden de corte sugerida por curva de tallas sobre datos
+  aleatorios con los motores "python" y "numpy" de suggest_cut_orders
+  (que coinciden lo comprueba tests/test_corte.py).
+
+Uso:
+  python bench_almacen.py formatos --datos datos_almacen.json --escala 50
+  python bench_almacen.py historial --datos datos_almacen.json --escala 60
+  python bench_almacen.py arranque --datos datos_almacen.json --prevision prevision.json --escala 200
+  python bench_almacen.py backups --datos datos_almacen.json --escala 100 --movimientos 10
+  python bench_almacen.py salidas --datos datos_almacen.json --prevision prevision.json --escala 200
+  python bench_almacen.py normalizadores --datos datos_almacen.json --prevision prevision.json --escala 50
+  python bench_almacen.py tallas --datos datos_almacen.json --escala 50
+  python bench_almacen.py auditoria --datos datos_almacen.json --escala 100 --movimientos 20
+  python bench_almacen.py columnar --datos datos_almacen.json --escala 100
+  python bench_almacen.py stockfecha --datos datos_almacen.json --escala 60
+  python bench_almacen.py bloque --datos datos_almacen.json --prevision prevision.json --escala 200 --lineas 2000
+  python bench_almacen.py modelos --datos datos_almacen.json --prevision prevision.json --escala 200 --modelos 20
+  python bench_almacen.py estimado --datos datos_almacen.json --prevision prevision.json --escala 100 --movimientos 20
+  python bench_almacen.py motores --modelos 5000 --tallas 20 --pendientes 100000 --casos 200
+  python bench_almacen.py proyeccion --modelos 5000 --tallas 20 --pendientes 100000 --meses 12
+  python bench_almacen.py atp --modelos 5000 --tallas 20 --pendientes 100000 --consultas 10000
+  python bench_almacen.py corte --modelos 5000 --tallas 20 --salidas 200000
+"""
+import argparse
+import contextlib
+import gestor_oop
+import copy
+import io
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, Tuple
+
+from gestor_oop import (
+    CATALOGO_TALLAS,
+    FORMATOS_SNAPSHOT,
+    MIGRACIONES,
+    BackupStore,
+    DataStore,
+    GestorStock,
+    HistorialColumnar,
+    HistorialSegmentado,
+    Workshop,
+    leer_json,
+    norm_codigo,
+    norm_talla,
+    talla_sort_key,
+)
+
+
+def _desplazar_meses(fecha: str, meses: int) -> str:
+    """Resta `meses` a una fecha AAAA-MM-DD (el día se conserva; tope 28)."""
+    try:
+        anio, mes, dia = int(fecha[:4]), int(fecha[5:7]), int(fecha[8:10])
+    except (TypeError, ValueError):
+        return fecha
+    total = anio * 12 + (mes - 1) - meses
+    return f"{total // 12:04d}-{total % 12 + 1:02d}-{min(dia, 28):02d}"
+
+
+def escalar_datos(datos: Dict, escala: int, desplazar_fechas: bool = False) -> Dict:
+    """Replica modelos e históricos `escala` veces con códigos de modelo distintos.
+
+    Con `desplazar_fechas`, la réplica i-ésima se mueve i meses atrás.
+    """
+    if escala <= 1:
+        return copy.deepcopy(datos)
+    out = {k: copy.deepcopy(v) for k, v in datos.items()
+           if k not in ("almacen", "info_modelos", "historial_entradas", "historial_salidas")}
+    out["almacen"], out["info_modelos"] = {}, {}
+    out["historial_entradas"], out["historial_salidas"] = [], []
+    for i in range(escala):
+        sufijo = f"-{i}" if i else ""
+        for m, tallas in datos.get("almacen", {}).items():
+            out["almacen"][m + sufijo] = dict(tallas)
+        for m, info in datos.get("info_modelos", {}).items():
+            out["info_modelos"][m + sufijo] = dict(info)
+        for clave in ("historial_entradas", "historial_salidas"):
+            for mov in datos.get(clave, []):
+                nuevo = dict(mov)
+                nuevo["modelo"] = str(mov.get("modelo", "")) + sufijo
+                if desplazar_fechas and i:
+                    nuevo["fecha"] = _desplazar_meses(str(mov.get("fecha", "")), i)
+                out[clave].append(nuevo)
+    return out
+
+
+def escalar_prevision(prevision: Dict, escala: int) -> Dict:
+    """Replica pedidos pendientes y órdenes de fabricación `escala` veces (modelos distintos)."""
+    out = copy.deepcopy(prevision)
+    out["pedidos"], out["pedidos_fabricacion"] = [], {}
+    for i in range(escala):
+        sufijo = f"-{i}" if i else ""
+        for p in prevision.get("pedidos", []):
+            nuevo = dict(p)
+            nuevo["modelo"] = str(p.get("modelo", "")) + sufijo
+            out["pedidos"].append(nuevo)
+        for m, items in prevision.get("pedidos_fabricacion", {}).items():
+            out["pedidos_fabricacion"][m + sufijo] = [dict(it) for it in items]
+    return out
+
+
+# Tallas para los datos aleatorios (textuales y numéricas)
+TALLAS_ALEATORIAS = ["XS", "S", "M", "L", "XL", "XXL", "3XL", "U"] + [str(n) for n in range(34, 62, 2)]
+
+
+def datos_aleatorios(rng: random.Random, modelos: int, tallas: int, pendientes: int) -> Tuple[Dict, Dict]:
+    """Inventario y previsión sintéticos; pedidos y órdenes con modelos/tallas sin normalizar."""
+    catalogo = TALLAS_ALEATORIAS[:tallas]
+    codigos = [f"M{i:05d}" for i in range(modelos)]
+    almacen = {m: {t: rng.randint(-5, 50) for t in rng.sample(catalogo, rng.randint(0, len(catalogo)))}
+               for m in codigos[: modelos * 9 // 10]}
+
+    def sucia(valor: str) -> str:
+        return rng.choice((valor, valor.lower(), f" {valor} "))
+
+    fabricacion = {}
+    for m in rng.sample(codigos, modelos // 2):
+        fabricacion[m] = [{"talla": sucia(rng.choice(catalogo)), "cantidad": rng.randint(0, 40),
+                           "fecha": f"2025-{rng.randint(1, 12):02d}-01"}
+                          for _ in range(rng.randint(0, 4))]
+    pedidos = [{"modelo": sucia(rng.choice(codigos)), "talla": sucia(rng.choice(catalogo)),
+                "cantidad": rng.randint(0, 12), "pedido": f"P{rng.randint(1, 50)}", "numero_pedido": "",
+                "cliente": "", "fecha": "2025-09-01"}
+               for _ in range(pendientes if codigos else 0)]
+    inventario = {"almacen": almacen, "historial_entradas": [], "historial_salidas": [],
+                  "info_modelos": {m: {"descripcion": f"Modelo {m}", "color": "", "cliente": ""}
+                                   for m in codigos[::3]}}
+    return inventario, {"pedidos": pedidos, "pedidos_fabricacion": fabricacion, "info_modelos": {}}
+
+
+def _estimado_recorrido(inv, prev) -> list:
+    """Stock estimado como se calculaba siempre: sumando por cada modelo/talla con recorridos."""
+    out = []
+    modelos = set(inv.almacen) | set(prev.pedidos_fabricacion) | \
+        {str(p.get("modelo", "")).strip().upper() for p in prev.pedidos}
+    for modelo in sorted(modelos):
+        tallas = set(inv.almacen.get(modelo, {}))
+        tallas |= {norm_talla(it.get("talla", "")) for it in prev.pedidos_fabricacion.get(modelo, [])}
+        tallas |= {norm_talla(p.get("talla", "")) for p in prev.pedidos
+                   if str(p.get("modelo", "")).strip().upper() == modelo}
+        for talla in CATALOGO_TALLAS.ordenar(tallas):
+            fabricar = sum(it.get("cantidad", 0) for it in prev.pedidos_fabricacion.get(modelo, [])
+                           if norm_talla(it.get("talla", "")) == talla)
+            pendientes = sum(p.get("cantidad", 0) for p in prev.pedidos
+                             if str(p.get("modelo", "")).strip().upper() == modelo
+                             and norm_talla(p.get("talla", "")) == talla)
+            out.append((modelo, talla, int(inv.almacen.get(modelo, {}).get(talla, 0)) + fabricar - pendientes))
+    return out
+
+
+def _gestor_en(carpeta: str, inventario: Dict, prevision: Dict, **kwargs) -> GestorStock:
+    """GestorStock sobre copias de `inventario`/`prevision` escritas en `carpeta`."""
+    os.makedirs(carpeta, exist_ok=True)
+    os.chdir(carpeta)
+    rutas = ("datos_almacen.json", "prevision.json", "talleres.json", "clientes.json")
+    for ruta, datos in zip(rutas, (inventario, prevision, {}, {})):
+        with open(ruta, "w", encoding="utf-8") as f:
+            json.dump(datos, f, ensure_ascii=False)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return GestorStock(*rutas, **kwargs)
+
+
+def _mejor(fn, repeticiones: int) -> float:
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        fn()
+        tiempos.append(time.perf_counter() - t0)
+    return min(tiempos)
+
+
+def bench_formatos(args) -> None:
+    datos = escalar_datos(leer_json(args.datos), args.escala)
+    movs = len(datos.get("historial_entradas", [])) + len(datos.get("historial_salidas", []))
+    print(f"=== FORMATOS DE INSTANTÁNEA (escala x{args.escala}, {movs:,} movimientos) ===")
+    print(f"{'formato':<10}{'tamaño':>14}{'vs json':>9}{'guardar ms':>12}{'cargar ms':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        base = None
+        for formato in FORMATOS_SNAPSHOT:
+            ruta = os.path.join(tmp, f"datos_{formato}.json")
+            store = DataStore(ruta, {}, formato=formato)
+            store.data = datos
+            t_save = _mejor(store.save, args.repeticiones)
+            t_load = _mejor(lambda: DataStore(ruta, {}), args.repeticiones)
+            assert DataStore(ruta, {}).data == datos, f"El formato {formato} no es reversible"
+            size = os.path.getsize(ruta)
+            base = base or size
+            print(f"{formato:<10}{size:>14,}{size / base:>8.0%} {t_save * 1000:>11.1f}{t_load * 1000:>11.1f}")
+
+
+def bench_historial(args) -> None:
+    datos = escalar_datos(leer_json(args.datos), args.escala, desplazar_fechas=True)
+    claves = ("historial_entradas", "historial_salidas")
+    movs = sum(len(datos[c]) for c in claves)
+    print(f"=== HISTÓRICO COMPLETO vs POR MESES (escala x{args.escala}, {movs:,} movimientos) ===")
+    print(f"{'modo':<12}{'instantánea':>14}{'arranque ms':>13}{'movs en memoria':>17}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for modo, segmentar in (("completo", ()), ("por meses", claves)):
+            ruta = os.path.join(tmp, f"datos_{len(segmentar)}.json")
+            store = DataStore(ruta, {}, formato="compacto", segmentar=segmentar)
+            for k, v in datos.items():
+                if k in segmentar:
+                    store.data[k].reemplazar(v)
+                else:
+                    store.data[k] = v
+            store.save()
+            t_load = _mejor(lambda: DataStore(ruta, {}), args.repeticiones)
+            cargada = DataStore(ruta, {})
+            en_memoria = 0
+            for c in claves:
+                h = cargada.data[c]
+                en_memoria += (sum(len(seg) for seg in h._segmentos.values())
+                               if isinstance(h, HistorialSegmentado) else len(h))
+            print(f"{modo:<12}{os.path.getsize(ruta):>14,}{t_load * 1000:>13.1f}{en_memoria:>17,}")
+
+
+def bench_arranque(args) -> None:
+    inventario = escalar_datos(leer_json(args.datos), args.escala)
+    prevision = escalar_prevision(leer_json(args.prevision), args.escala)
+    for datos in (inventario, prevision):
+        datos.pop(DataStore.SCHEMA_KEY, None)
+    print(f"=== ARRANQUE EN FRÍO (escala x{args.escala}, {len(prevision['pedidos']):,} pedidos pendientes, "
+          f"{len(inventario.get('historial_salidas', [])):,} salidas) ===")
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        # GestorStock crea su carpeta de exportación relativa al directorio actual
+        os.chdir(tmp)
+        try:
+            rutas = ("datos_almacen.json", "prevision.json", "talleres.json", "clientes.json")
+
+            def escribir_sin_version():
+                for ruta, datos in zip(rutas, (inventario, prevision, {}, {})):
+                    with open(ruta, "w", encoding="utf-8") as f:
+                        json.dump(datos, f, ensure_ascii=False, indent=4)
+
+            def arrancar():
+                with contextlib.redirect_stdout(io.StringIO()):
+                    GestorStock(*rutas)
+
+            primera = []
+            for _ in range(args.repeticiones):
+                escribir_sin_version()
+                t0 = time.perf_counter()
+                arrancar()
+                primera.append(time.perf_counter() - t0)
+            al_dia = _mejor(arrancar, args.repeticiones)
+            # Lo que el arranque antiguo repetía siempre: recorrer (y guardar si cambiaba) los pedidos
+            store = DataStore("prevision.json", {})
+            recorrido = _mejor(lambda: [fn(store.data) for v, fn in MIGRACIONES["prevision"] if v == 2],
+                               args.repeticiones)
+            print(f"{'escenario':<38}{'ms':>10}")
+            print(f"{'1er arranque (migra y guarda)':<38}{min(primera) * 1000:>10.1f}")
+            print(f"{'arranque con esquema al día':<38}{al_dia * 1000:>10.1f}")
+            print(f"{'recorrido de pedidos que se ahorra':<38}{recorrido * 1000:>10.1f}")
+        finally:
+            os.chdir(cwd)
+
+
+def bench_backups(args) -> None:
+    datos = escalar_datos(leer_json(args.datos), args.escala, desplazar_fechas=True)
+    claves = ("historial_entradas", "historial_salidas")
+    print(f"=== BACKUPS DEDUPLICADOS (escala x{args.escala}, {args.movimientos} movimientos entre copias) ===")
+    print(f"{'modo':<12}{'datos':>12}{'copia':>7}{'ms':>9}{'bytes nuevos':>15}{'trozos nuevos':>16}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for modo, segmentar in (("completo", ()), ("por meses", claves)):
+            ruta = os.path.join(tmp, f"datos_{len(segmentar)}.json")
+            store = DataStore(ruta, {}, formato="compacto", segmentar=segmentar)
+            for k, v in datos.items():
+                if k in segmentar:
+                    store.data[k].reemplazar(v)
+                else:
+                    store.data[k] = copy.deepcopy(v)
+            store.save()
+            backups = BackupStore(os.path.join(tmp, f"backups_{len(segmentar)}"))
+            modelo = next(iter(store.data["almacen"]))
+            for copia in range(1, 4):
+                if copia > 1:
+                    for _ in range(args.movimientos):
+                        mov = {"modelo": modelo, "talla": "40", "cantidad": 1,
+                               "fecha": time.strftime("%Y-%m-%d"), "pedido": "", "albaran": ""}
+                        store.data["historial_salidas"].append(mov)
+                        store.data["almacen"][modelo]["40"] = store.data["almacen"][modelo].get("40", 0) - 1
+                    store.save()
+                t0 = time.perf_counter()
+                r = backups.crear({"inventario": store})
+                ms = (time.perf_counter() - t0) * 1000
+                print(f"{modo:<12}{os.path.getsize(ruta):>12,}{copia:>7}{ms:>9.1f}{r['bytes_nuevos']:>15,}"
+                      f"{r['nuevos']:>9}/{r['trozos']}")
+
+
+def bench_salidas(args) -> None:
+    inventario = escalar_datos(leer_json(args.datos), args.escala)
+    prevision = escalar_prevision(leer_json(args.prevision), args.escala)
+    pedidos = prevision["pedidos"]
+    # Salidas repartidas por toda la lista, cada una contra un pendiente real
+    paso = max(len(pedidos) // max(args.salidas, 1), 1)
+    lineas = [(p["modelo"], p["talla"], p["pedido"], 1) for p in pedidos[::paso][:args.salidas]]
+    print(f"=== SALIDAS CONTRA PENDIENTES (escala x{args.escala}, {len(pedidos):,} pendientes, "
+          f"{len(lineas)} salidas) ===")
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        # GestorStock crea su carpeta de exportación relativa al directorio actual
+        os.chdir(tmp)
+        try:
+            rutas = ("datos_almacen.json", "prevision.json", "talleres.json", "clientes.json")
+            for ruta, datos in zip(rutas, (inventario, prevision, {}, {})):
+                with open(ruta, "w", encoding="utf-8") as f:
+                    json.dump(datos, f, ensure_ascii=False)
+            with contextlib.redirect_stdout(io.StringIO()):
+                gestor = GestorStock(*rutas)
+
+            # Lo que hacía cada salida antes: normalizar y comparar todos los pendientes
+            def recorrido():
+                for modelo, talla, pedido, _ in lineas:
+                    modelo, talla, pedido = str(modelo).strip().upper(), norm_talla(talla), norm_codigo(pedido)
+                    [p for p in gestor.prevision.pedidos
+                     if str(p.get("modelo", "")).strip().upper() == modelo
+                     and norm_talla(p.get("talla", "")) == talla
+                     and norm_codigo(p.get("pedido", "")) == pedido]
+
+            t0 = time.perf_counter()
+            gestor.prevision._indice()
+            construir = time.perf_counter() - t0
+            antes = _mejor(recorrido, args.repeticiones)
+            indice = _mejor(lambda: [gestor.prevision.pendings_for(m, t, p) for m, t, p, _ in lineas],
+                            args.repeticiones)
+            t0 = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()), gestor.transaction():
+                for modelo, talla, pedido, cantidad in lineas:
+                    gestor.inventory.register_exit(modelo, talla, cantidad, "", pedido, "")
+            salidas = time.perf_counter() - t0
+            print(f"{'escenario':<42}{'ms':>10}")
+            print(f"{'casar salidas recorriendo la lista':<42}{antes * 1000:>10.1f}")
+            print(f"{'construir el índice (una vez)':<42}{construir * 1000:>10.1f}")
+            print(f"{'casar salidas por el índice':<42}{indice * 1000:>10.1f}")
+            print(f"{'registrar las salidas (una transacción)':<42}{salidas * 1000:>10.1f}")
+        finally:
+            os.chdir(cwd)
+
+
+def bench_normalizadores(args) -> None:
+    inventario = escalar_datos(leer_json(args.datos), args.escala)
+    prevision = escalar_prevision(leer_json(args.prevision), args.escala)
+    movimientos = inventario.get("historial_entradas", []) + inventario.get("historial_salidas", [])
+    tallas = [m.get("talla") for m in movimientos] + [p.get("talla") for p in prevision["pedidos"]]
+    codigos = [m.get(c) for m in movimientos for c in ("pedido", "albaran")]
+    print(f"=== NORMALIZADORES (escala x{args.escala}, {len(tallas):,} tallas, {len(codigos):,} códigos, "
+          f"{len(set(map(str, tallas)))} tallas distintas) ===")
+    sin_cache = {"norm_talla": gestor_oop._norm_talla, "norm_codigo": gestor_oop._norm_codigo,
+                 "talla_sort_key": gestor_oop._talla_sort_key}
+    con_cache = {nombre: getattr(gestor_oop, nombre) for nombre in sin_cache}
+
+    @contextlib.contextmanager
+    def normalizadores(cache: bool):
+        # Todo el módulo resuelve estos nombres en tiempo de llamada
+        for nombre, fn in (con_cache if cache else sin_cache).items():
+            setattr(gestor_oop, nombre, fn)
+        gestor_oop.limpiar_caches_normalizacion()
+        try:
+            yield
+        finally:
+            for nombre, fn in con_cache.items():
+                setattr(gestor_oop, nombre, fn)
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        # GestorStock crea su carpeta de exportación relativa al directorio actual
+        os.chdir(tmp)
+        try:
+            rutas = ("datos_almacen.json", "prevision.json", "talleres.json", "clientes.json")
+            for ruta, datos in zip(rutas, (inventario, prevision, {}, {})):
+                with open(ruta, "w", encoding="utf-8") as f:
+                    json.dump(datos, f, ensure_ascii=False)
+            with contextlib.redirect_stdout(io.StringIO()):
+                gestor = GestorStock(*rutas)
+            gestor.EXPORT_DIR = os.path.join(tmp, "export")
+            os.makedirs(gestor.EXPORT_DIR, exist_ok=True)
+
+            def exportar():
+                with contextlib.redirect_stdout(io.StringIO()):
+                    gestor._exportar_todos_los_datos()
+
+            casos = [
+                ("norm_talla", lambda: [gestor_oop.norm_talla(t) for t in tallas]),
+                ("norm_codigo", lambda: [gestor_oop.norm_codigo(c) for c in codigos]),
+                ("talla_sort_key", lambda: [gestor_oop.talla_sort_key(t) for t in tallas]),
+                ("exportación completa", exportar),
+            ]
+            print(f"{'caso':<24}{'sin caché ms':>14}{'con caché ms':>14}{'x':>8}")
+            for nombre, fn in casos:
+                with normalizadores(False):
+                    antes = _mejor(fn, args.repeticiones)
+                with normalizadores(True):
+                    despues = _mejor(fn, args.repeticiones)
+                print(f"{nombre:<24}{antes * 1000:>14.1f}{despues * 1000:>14.1f}{antes / despues:>8.1f}")
+        finally:
+            os.chdir(cwd)
+
+
+def bench_tallas(args) -> None:
+    datos = escalar_datos(leer_json(args.datos), args.escala)
+    almacen = datos.get("almacen", {})
+    stock = [{"MODELO": m, "TALLA": t, "CANTIDAD": q} for m, tallas in almacen.items() for t, q in tallas.items()]
+    movimientos = [{"MODELO": mov.get("modelo", ""), "TALLA": mov.get("talla", "")}
+                   for clave in ("historial_entradas", "historial_salidas") for mov in datos.get(clave, [])]
+    print(f"=== ORDEN POR TALLA (escala x{args.escala}, {len(stock):,} filas de stock, "
+          f"{len(movimientos):,} movimientos, {len(CATALOGO_TALLAS)} tallas en catálogo) ===")
+
+    def por_clave(filas):
+        return sorted(filas, key=lambda x: (x["MODELO"], talla_sort_key(x["TALLA"])))
+
+    def por_rango(filas):
+        rangos = CATALOGO_TALLAS.rangos(x["TALLA"] for x in filas)
+        return sorted(filas, key=lambda x: (x["MODELO"], rangos[x["TALLA"]]))
+
+    def listado_clave():
+        return [(m, t) for m in sorted(almacen)
+                for t, _ in sorted(almacen[m].items(), key=lambda x: talla_sort_key(x[0]))]
+
+    def listado_catalogo():
+        return [(m, t) for m in sorted(almacen) for t in CATALOGO_TALLAS.ordenar(almacen[m])]
+
+    # Mismo orden salvo empates de talla_sort_key (p. ej. "36" y "T36")
+    clave = lambda filas: [(x["MODELO"], talla_sort_key(x["TALLA"])) for x in filas]
+    assert clave(por_clave(movimientos)) == clave(por_rango(movimientos))
+    assert [(m, talla_sort_key(t)) for m, t in listado_clave()] == \
+        [(m, talla_sort_key(t)) for m, t in listado_catalogo()]
+
+    casos = [
+        ("listado de stock", listado_clave, listado_catalogo),
+        ("exportación: stock", lambda: por_clave(stock), lambda: por_rango(stock)),
+        ("exportación: movimientos", lambda: por_clave(movimientos), lambda: por_rango(movimientos)),
+    ]
+    print(f"{'caso':<28}{'sort_key ms':>13}{'catálogo ms':>13}{'x':>8}")
+    for nombre, antes, despues in casos:
+        t_antes = _mejor(antes, args.repeticiones)
+        t_despues = _mejor(despues, args.repeticiones)
+        print(f"{nombre:<28}{t_antes * 1000:>13.1f}{t_despues * 1000:>13.1f}{t_antes / t_despues:>8.1f}")
+
+
+def bench_auditoria(args) -> None:
+    inventario = escalar_datos(leer_json(args.datos), args.escala)
+    print(f"=== AUDITORÍA (escala x{args.escala}, {len(inventario.get('historial_entradas', [])):,} entradas, "
+          f"{len(inventario.get('historial_salidas', [])):,} salidas, {args.movimientos} movimientos entre auditorías) ===")
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        # GestorStock crea su carpeta de exportación relativa al directorio actual
+        os.chdir(tmp)
+        try:
+            rutas = ("datos_almacen.json", "prevision.json", "talleres.json", "clientes.json")
+            for ruta, datos in zip(rutas, (inventario, {}, {}, {})):
+                with open(ruta, "w", encoding="utf-8") as f:
+                    json.dump(datos, f, ensure_ascii=False)
+            with contextlib.redirect_stdout(io.StringIO()):
+                gestor = GestorStock(*rutas)
+            inv = gestor.inventory
+            claves = [(m, t) for m, tallas in inv.almacen.items() for t in tallas][:args.movimientos]
+
+            def mover():
+                with contextlib.redirect_stdout(io.StringIO()), gestor.transaction():
+                    for m, t in claves:
+                        inv.register_entry(m, t, 2)
+                        inv.register_exit(m, t, 1, "", "", "")
+
+            completa = _mejor(lambda: inv.audit_and_fix_stock(completa=True), args.repeticiones)
+            tiempos = []
+            for _ in range(args.repeticiones):
+                mover()
+                t0 = time.perf_counter()
+                cambios = inv.audit_and_fix_stock()
+                tiempos.append(time.perf_counter() - t0)
+            assert sorted(map(str, cambios)) == sorted(map(str, inv.audit_and_fix_stock(completa=True)))
+            print(f"{'escenario':<38}{'ms':>10}")
+            print(f"{'auditoría completa (históricos)':<38}{completa * 1000:>10.2f}")
+            print(f"{'auditoría incremental (libro)':<38}{min(tiempos) * 1000:>10.2f}")
+        finally:
+            os.chdir(cwd)
+
+
+def bench_columnar(args) -> None:
+    datos = escalar_datos(leer_json(args.datos), args.escala)
+    movimientos = datos.get("historial_salidas", []) + datos.get("historial_entradas", [])
+    texto = json.dumps(movimientos, ensure_ascii=False)
+    print(f"=== HISTÓRICO POR COLUMNAS (escala x{args.escala}, {len(movimientos):,} movimientos, "
+          f"numpy {'sí' if gestor_oop.np is not None else 'no'}) ===")
+
+    def memoria(construir):
+        tracemalloc.start()
+        obj = construir()
+        actual, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return obj, actual
+
+    lista, bytes_lista = memoria(lambda: json.loads(texto))
+    columnas, bytes_columnas = memoria(lambda: HistorialColumnar(json.loads(texto)))
+    assert columnas == lista
+
+    def suma_dicts():
+        out = {}
+        for r in lista:
+            k = (r.get("modelo"), r.get("talla"))
+            out[k] = out.get(k, 0) + int(r.get("cantidad", 0) or 0)
+        return out
+
+    assert suma_dicts() == columnas.sumar_por(("modelo", "talla"))
+    t_dicts = _mejor(suma_dicts, args.repeticiones)
+    t_columnas = _mejor(lambda: columnas.sumar_por(("modelo", "talla")), args.repeticiones)
+    n = max(len(movimientos), 1)
+    print(f"{'':<26}{'lista de dicts':>16}{'columnas':>12}{'x':>8}")
+    print(f"{'bytes por movimiento':<26}{bytes_lista / n:>16.0f}{bytes_columnas / n:>12.0f}"
+          f"{bytes_lista / bytes_columnas:>8.1f}")
+    print(f"{'suma (modelo, talla) ms':<26}{t_dicts * 1000:>16.1f}{t_columnas * 1000:>12.1f}"
+          f"{t_dicts / t_columnas:>8.1f}")
+
+
+def bench_stockfecha(args) -> None:
+    inventario = escalar_datos(leer_json(args.datos), args.escala, desplazar_fechas=True)
+    movs = len(inventario.get("historial_entradas", [])) + len(inventario.get("historial_salidas", []))
+    print(f"=== STOCK A UNA FECHA (escala x{args.escala}, {movs:,} movimientos, "
+          f"{args.escala} meses hacia atrás) ===")
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            rutas = ("datos_almacen.json", "prevision.json", "talleres.json", "clientes.json")
+            for ruta, datos in zip(rutas, (inventario, {}, {}, {})):
+                with open(ruta, "w", encoding="utf-8") as f:
+                    json.dump(datos, f, ensure_ascii=False)
+            with contextlib.redirect_stdout(io.StringIO()):
+                gestor = GestorStock(*rutas)
+            inv = gestor.inventory
+            fechas = sorted({str(m.get("fecha") or "")[:10] for m in inv.historial_salidas
+                             if len(str(m.get("fecha") or "")) >= 10})
+            fechas = fechas[::max(len(fechas) // 20, 1)]
+
+            def completo(fecha):
+                # Lo de siempre: recorrer todos los movimientos hasta la fecha
+                stock = {}
+                for clave, signo in (("historial_entradas", 1), ("historial_salidas", -1)):
+                    for r in getattr(inv, clave):
+                        f = r.get("fecha") or ""
+                        if HistorialSegmentado.mes_de(r) != HistorialSegmentado.SIN_FECHA and f > fecha:
+                            continue
+                        k = (str(r.get("modelo", "")).strip().upper(), norm_talla(r.get("talla", "")))
+                        stock[k] = stock.get(k, 0) + signo * int(r.get("cantidad", 0) or 0)
+                return {k: q for k, q in stock.items() if q}
+
+            def por_cierres(fecha):
+                return {(m, t): q for m, tallas in inv.stock_at(fecha).items() for t, q in tallas.items()}
+
+            t0 = time.perf_counter()
+            por_cierres(fechas[-1])
+            t_cierres = time.perf_counter() - t0
+            for fecha in fechas:
+                assert completo(fecha) == por_cierres(fecha), fecha
+            t_completo = _mejor(lambda: [completo(f) for f in fechas], args.repeticiones)
+            t_stock_at = _mejor(lambda: [por_cierres(f) for f in fechas], args.repeticiones)
+            n = max(len(fechas), 1)
+            print(f"{inv.save_checkpoints()} cierres calculados en {t_cierres * 1000:.1f} ms; {n} fechas consultadas")
+            print(f"{'escenario':<38}{'ms/consulta':>12}")
+            print(f"{'histórico completo':<38}{t_completo / n * 1000:>12.2f}")
+            print(f"{'stock_at (cierre + tramo)':<38}{t_stock_at / n * 1000:>12.2f}")
+            print(f"{'x':<38}{t_completo / t_stock_at:>12.1f}")
+        finally:
+            os.chdir(cwd)
+
+
+def bench_bloque(args) -> None:
+    inventario = escalar_datos(leer_json(args.datos), args.escala)
+    prevision = escalar_prevision(leer_json(args.prevision), args.escala)
+    pedidos, fabricacion = prevision["pedidos"], prevision["pedidos_fabricacion"]
+    # Como un Excel de albaranes: varias líneas por pendiente, repartidas por toda la lista
+    paso = max(len(pedidos) // max(args.lineas, 1), 1)
+    salidas = [{"modelo": p["modelo"], "talla": p["talla"], "cantidad": 2, "cliente": p.get("cliente", ""),
+                "pedido": p["pedido"], "albaran": f"ALB{i % 50}", "fecha": "2025-09-30"}
+               for i, p in enumerate((pedidos[::paso] * 2)[:args.lineas])]
+    ordenes = [(m, it["talla"]) for m, its in fabricacion.items() for it in its]
+    paso = max(len(ordenes) // max(args.lineas, 1), 1)
+    entradas = [{"modelo": m, "talla": t, "cantidad": 3, "taller": "", "fecha": "2025-09-30"}
+                for m, t in (ordenes[::paso] * 2)[:args.lineas]]
+    print(f"=== SALIDAS Y ENTRADAS EN BLOQUE (escala x{args.escala}, {len(pedidos):,} pendientes, "
+          f"{len(ordenes):,} órdenes, {len(salidas)} salidas, {len(entradas)} entradas) ===")
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            def medir(en_bloque: bool):
+                carpeta = os.path.join(tmp, "bloque" if en_bloque else "lineas")
+                os.makedirs(carpeta)
+                os.chdir(carpeta)
+                rutas = ("datos_almacen.json", "prevision.json", "talleres.json", "clientes.json")
+                for ruta, datos in zip(rutas, (inventario, prevision, {}, {})):
+                    with open(ruta, "w", encoding="utf-8") as f:
+                        json.dump(datos, f, ensure_ascii=False)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    # Con journal, guardar cuesta lo anotado y no la instantánea entera
+                    gestor = GestorStock(*rutas, journal=True)
+                    inv = gestor.inventory
+                    gestor.prevision._indice()
+                    # Antes: una transacción con una llamada por línea; ahora: una llamada en bloque
+                    t0 = time.perf_counter()
+                    if en_bloque:
+                        inv.register_exits_bulk(salidas)
+                    else:
+                        with gestor.transaction():
+                            for L in salidas:
+                                inv.register_exit(L["modelo"], L["talla"], L["cantidad"], L["cliente"],
+                                                  L["pedido"], L["albaran"], L["fecha"])
+                    t_salidas = time.perf_counter() - t0
+                    t0 = time.perf_counter()
+                    if en_bloque:
+                        inv.register_entries_bulk(entradas)
+                    else:
+                        with gestor.transaction():
+                            for L in entradas:
+                                inv.register_entry(L["modelo"], L["talla"], L["cantidad"], L["taller"], L["fecha"])
+                    t_entradas = time.perf_counter() - t0
+                estado = (inv.almacen, gestor.prevision.pedidos, gestor.prevision.pedidos_fabricacion)
+                return t_salidas, t_entradas, json.dumps(estado, sort_keys=True)
+
+            s_lineas, e_lineas, estado_lineas = medir(False)
+            s_bloque, e_bloque, estado_bloque = medir(True)
+            assert estado_lineas == estado_bloque
+            print(f"{'escenario':<14}{'línea a línea ms':>18}{'en bloque ms':>14}{'x':>8}")
+            print(f"{'salidas':<14}{s_lineas * 1000:>18.1f}{s_bloque * 1000:>14.1f}{s_lineas / s_bloque:>8.1f}")
+            print(f"{'entradas':<14}{e_lineas * 1000:>18.1f}{e_bloque * 1000:>14.1f}{e_lineas / e_bloque:>8.1f}")
+        finally:
+            os.chdir(cwd)
+
+
+def bench_modelos(args) -> None:
+    inventario = escalar_datos(leer_json(args.datos), args.escala)
+    prevision = escalar_prevision(leer_json(args.prevision), args.escala)
+    movs = len(inventario.get("historial_entradas", [])) + len(inventario.get("historial_salidas", []))
+    print(f"=== MODELOS (escala x{args.escala}, {movs:,} movimientos, "
+          f"{len(prevision['pedidos']):,} pendientes, {args.modelos} modelos) ===")
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            def medir(por_posiciones: bool):
+                carpeta = os.path.join(tmp, "posiciones" if por_posiciones else "recorrido")
+                os.makedirs(carpeta)
+                os.chdir(carpeta)
+                rutas = ("datos_almacen.json", "prevision.json", "talleres.json", "clientes.json")
+                for ruta, datos in zip(rutas, (inventario, prevision, {}, {})):
+                    with open(ruta, "w", encoding="utf-8") as f:
+                        json.dump(datos, f, ensure_ascii=False)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    gestor = GestorStock(*rutas, journal=True)
+                    inv, prev = gestor.inventory, gestor.prevision
+                    modelos = sorted({m.get("modelo") for m in inv.historial_salidas})
+                    modelos = modelos[::max(len(modelos) // args.modelos, 1)][:args.modelos]
+                    if por_posiciones:
+                        # Los índices se crean al primer uso (una vez por sesión)
+                        inv.has_model("")
+                        prev.has_model("")
+                    tiempos = []
+                    t0 = time.perf_counter()
+                    for m in modelos:
+                        if por_posiciones:
+                            inv.has_model(m) or prev.has_model(m)
+                        else:
+                            (any(e.get("modelo") == m for e in inv.historial_entradas)
+                             or any(s.get("modelo") == m for s in inv.historial_salidas)
+                             or any(p.get("modelo") == m for p in prev.pedidos))
+                    tiempos.append(time.perf_counter() - t0)
+                    t0 = time.perf_counter()
+                    for m in modelos:
+                        if por_posiciones:
+                            inv.history("historial_salidas", m)
+                        else:
+                            [r for r in inv.historial_salidas if str(r.get("modelo", "")).strip().upper() == m]
+                    tiempos.append(time.perf_counter() - t0)
+                    t0 = time.perf_counter()
+                    for m in modelos:
+                        nuevo = m + "-R"
+                        if por_posiciones:
+                            inv.rename_model(m, nuevo)
+                            prev.rename_model(m, nuevo)
+                            continue
+                        # Lo de siempre: recorrer todo, cambiar en memoria y guardar completo
+                        inv.almacen[nuevo] = inv.almacen.pop(m, {})
+                        for clave in ("historial_entradas", "historial_salidas"):
+                            for r in getattr(inv, clave):
+                                if r.get("modelo") == m:
+                                    r["modelo"] = nuevo
+                        for p in prev.pedidos:
+                            if p.get("modelo") == m:
+                                p["modelo"] = nuevo
+                        inv.save(historial_desde="")
+                        prev.save()
+                    tiempos.append(time.perf_counter() - t0)
+                    estado = (inv.almacen, list(inv.historial_salidas), prev.pedidos)
+                return tiempos, json.dumps(estado, sort_keys=True)
+
+            t_recorrido, estado_recorrido = medir(False)
+            t_posiciones, estado_posiciones = medir(True)
+            assert estado_recorrido == estado_posiciones
+            n = max(args.modelos, 1)
+            print(f"{'escenario':<14}{'recorrido ms/modelo':>21}{'posiciones ms/modelo':>22}{'x':>8}")
+            for nombre, a, b in zip(("existencia", "histórico", "renombrar"), t_recorrido, t_posiciones):
+                print(f"{nombre:<14}{a / n * 1000:>21.2f}{b / n * 1000:>22.2f}{a / b:>8.1f}")
+        finally:
+            os.chdir(cwd)
+
+
+def bench_estimado(args) -> None:
+    inventario = escalar_datos(leer_json(args.datos), args.escala)
+    prevision = escalar_prevision(leer_json(args.prevision), args.escala)
+    print(f"=== STOCK ESTIMADO (escala x{args.escala}, {len(inventario['almacen']):,} modelos, "
+          f"{len(prevision['pedidos']):,} pendientes, {args.movimientos} movimientos entre lecturas) ===")
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            rutas = ("datos_almacen.json", "prevision.json", "talleres.json", "clientes.json")
+            for ruta, datos in zip(rutas, (inventario, prevision, {}, {})):
+                with open(ruta, "w", encoding="utf-8") as f:
+                    json.dump(datos, f, ensure_ascii=False)
+            with contextlib.redirect_stdout(io.StringIO()):
+                gestor = GestorStock(*rutas, journal=True)
+            inv, prev = gestor.inventory, gestor.prevision
+
+            def recorrido():
+                # Lo de siempre: por cada modelo/talla, sumar recorriendo pendientes y fabricación
+                return _estimado_recorrido(inv, prev)
+
+            def tabla():
+                return [(x["modelo"], x["talla"], x["stock_estimado"]) for x in prev.calc_estimated_stock(inv)]
+
+            t0 = time.perf_counter()
+            filas = tabla()
+            t_frio = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            assert recorrido() == filas
+            t_recorrido = time.perf_counter() - t0
+            # Unos pocos movimientos entre lecturas, como en la pestaña de Previsión
+            pedidos = prev.pedidos[::max(len(prev.pedidos) // max(args.movimientos, 1), 1)][:args.movimientos]
+            lineas = [{"modelo": p["modelo"], "talla": p["talla"], "cantidad": 1, "cliente": "",
+                       "pedido": p["pedido"], "albaran": "B", "fecha": "2025-09-30"} for p in pedidos]
+            with contextlib.redirect_stdout(io.StringIO()):
+                inv.register_exits_bulk(lineas)
+            t0 = time.perf_counter()
+            filas = tabla()
+            t_tras = time.perf_counter() - t0
+            assert recorrido() == filas
+            t_tabla = _mejor(tabla, args.repeticiones)
+            print(f"{len(filas):,} filas")
+            print(f"{'escenario':<38}{'ms':>12}")
+            print(f"{'recorrido por modelo/talla':<38}{t_recorrido * 1000:>12.1f}")
+            print(f"{'tabla: primera lectura (se crea)':<38}{t_frio * 1000:>12.1f}")
+            print(f"{'tabla: tras los movimientos':<38}{t_tras * 1000:>12.1f}")
+            print(f"{'tabla: sin cambios':<38}{t_tabla * 1000:>12.1f}")
+            print(f"{'x (recorrido / tras movimientos)':<38}{t_recorrido / t_tras:>12.1f}")
+        finally:
+            os.chdir(cwd)
+
+
+def bench_motores(args) -> None:
+    if gestor_oop.pd is None:
+        print("⚠️ pandas no está instalado: el motor 'pandas' no está disponible.")
+        return
+    print(f"=== MOTORES DE STOCK ESTIMADO ({args.casos} casos aleatorios; "
+          f"{args.modelos:,} modelos x {args.tallas} tallas x {args.pendientes:,} pendientes) ===")
+    rng = random.Random(args.semilla)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            # Propiedad: mismos resultados que el recorrido, también tras mover stock y pendientes
+            filas = 0
+            for caso in range(args.casos):
+                inventario, prevision = datos_aleatorios(rng, rng.randint(0, 30), rng.randint(1, args.tallas),
+                                                         rng.randint(0, 200))
+                gestor = _gestor_en(os.path.join(tmp, f"caso{caso}"), inventario, prevision)
+                inv, prev = gestor.inventory, gestor.prevision
+                for ronda in range(2):
+                    esperado = _estimado_recorrido(inv, prev)
+                    for motor in prev.MOTORES_ESTIMADO:
+                        obtenido = [(x["modelo"], x["talla"], x["stock_estimado"])
+                                    for x in prev.calc_estimated_stock(inv, motor=motor)]
+                        assert obtenido == esperado, (caso, ronda, motor)
+                    filas += len(esperado)
+                    pedidos = rng.sample(prev.pedidos, min(5, len(prev.pedidos)))
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        inv.register_exits_bulk([{"modelo": p["modelo"], "talla": p["talla"], "cantidad": 3,
+                                                  "cliente": "", "pedido": p["pedido"], "albaran": "B",
+                                                  "fecha": "2025-09-30"} for p in pedidos])
+                        for m in list(prev.pedidos_fabricacion)[:2]:
+                            prev.register_pending(m, rng.choice(TALLAS_ALEATORIAS), 4, "PX", "")
+            print(f"✅ {args.casos} casos, {filas:,} filas comparadas: tabla == pandas == recorrido")
+
+            inventario, prevision = datos_aleatorios(rng, args.modelos, args.tallas, args.pendientes)
+            gestor = _gestor_en(os.path.join(tmp, "grande"), inventario, prevision)
+            inv, prev = gestor.inventory, gestor.prevision
+            t0 = time.perf_counter()
+            filas = prev.calc_estimated_stock(inv)
+            t_frio = time.perf_counter() - t0
+            t_tabla = _mejor(lambda: prev.calc_estimated_stock(inv), args.repeticiones)
+            t_pandas = _mejor(lambda: prev.calc_estimated_stock(inv, motor="pandas"), args.repeticiones)
+            assert prev.calc_estimated_stock(inv, motor="pandas") == filas
+            print(f"{len(filas):,} filas")
+            print(f"{'motor':<38}{'ms':>12}")
+            print(f"{'tabla: primera lectura (se crea)':<38}{t_frio * 1000:>12.1f}")
+            print(f"{'tabla: mantenida':<38}{t_tabla * 1000:>12.1f}")
+            print(f"{'pandas (group-by en cada lectura)':<38}{t_pandas * 1000:>12.1f}")
+        finally:
+            os.chdir(cwd)
+
+
+def bench_proyeccion(args) -> None:
+    rng = random.Random(args.semilla)
+    inventario, prevision = datos_aleatorios(rng, args.modelos, args.tallas, args.pendientes)
+    # Fechas repartidas por los próximos meses (y algunas vencidas o sin fecha)
+    hoy = time.strftime("%Y-%m-%d")
+    fechas = [None, "", _desplazar_meses(hoy, 2)] + [_desplazar_meses(hoy, -i) for i in range(args.meses)]
+    for items in prevision["pedidos_fabricacion"].values():
+        for it in items:
+            it["fecha"] = rng.choice(fechas)
+    for p in prevision["pedidos"]:
+        p["fecha"] = rng.choice(fechas)
+    print(f"=== PROYECCIÓN POR PERIODOS ({args.modelos:,} modelos x {args.tallas} tallas, "
+          f"{args.pendientes:,} pendientes, {args.meses} meses) ===")
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            gestor = _gestor_en(tmp, inventario, prevision)
+            inv, prev = gestor.inventory, gestor.prevision
+            actual = prev.periodo_de(hoy)
+
+            def por_periodo():
+                # Una pasada por pendientes y fabricación por cada periodo, acumulando hasta él
+                def per(fecha):
+                    return max(prev.periodo_de(fecha) or actual, actual)
+                movs = [(m, norm_talla(it.get("talla", "")), per(it.get("fecha")), it.get("cantidad", 0))
+                        for m, items in prev.pedidos_fabricacion.items() for it in items]
+                movs += [(str(p.get("modelo", "")).strip().upper(), norm_talla(p.get("talla", "")),
+                          per(p.get("fecha")), -p.get("cantidad", 0)) for p in prev.pedidos]
+                out = {}
+                for periodo in sorted({x[2] for x in movs} | {actual}):
+                    stock = {(m, t): 0 for m, t, _, _ in movs}
+                    stock.update(((m, t), int(q)) for m, tallas in inv.almacen.items() for t, q in tallas.items())
+                    for m, t, pm, q in movs:
+                        if pm <= periodo:
+                            stock[(m, t)] = stock.get((m, t), 0) + q
+                    for clave, q in stock.items():
+                        out[clave + (periodo,)] = q
+                return out
+
+            def barrido():
+                return prev.project_stock(inv)
+
+            t0 = time.perf_counter()
+            completo = por_periodo()
+            t_periodo = time.perf_counter() - t0
+            filas = barrido()
+            for f in filas:
+                assert completo[(f["modelo"], f["talla"], f["periodo"])] == f["stock_proyectado"]
+            t_barrido = _mejor(barrido, args.repeticiones)
+            t_negativos = _mejor(lambda: prev.first_negative_periods(inv), args.repeticiones)
+            print(f"{len(filas):,} filas (clave y periodo con movimientos)")
+            print(f"{'escenario':<38}{'ms':>12}")
+            print(f"{'una pasada por periodo':<38}{t_periodo * 1000:>12.1f}")
+            print(f"{'project_stock (ordenar y acumular)':<38}{t_barrido * 1000:>12.1f}")
+            print(f"{'first_negative_periods':<38}{t_negativos * 1000:>12.1f}")
+            print(f"{'x':<38}{t_periodo / t_barrido:>12.1f}")
+        finally:
+            os.chdir(cwd)
+
+
+def bench_atp(args) -> None:
+    rng = random.Random(args.semilla)
+    inventario, prevision = datos_aleatorios(rng, args.modelos, args.tallas, args.pendientes)
+    hoy = time.strftime("%Y-%m-%d")
+    dias = [None, ""] + [_desplazar_meses(hoy, i)[:8] + f"{rng.randint(1, 28):02d}" for i in range(-2, args.meses)]
+    for items in prevision["pedidos_fabricacion"].values():
+        for it in items:
+            it["fecha"] = rng.choice(dias)
+    for p in prevision["pedidos"]:
+        p["fecha"] = rng.choice(dias)
+    print(f"=== DISPONIBLE PARA PROMETER ({args.modelos:,} modelos x {args.tallas} tallas, "
+          f"{args.pendientes:,} pendientes, {args.consultas:,} consultas) ===")
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            gestor = _gestor_en(tmp, inventario, prevision)
+            inv, prev = gestor.inventory, gestor.prevision
+            claves = [(m, t) for m, tallas in inv.almacen.items() for t in tallas]
+            consultas = [(m, t, rng.randint(1, 50), rng.choice(dias[2:])) for m, t in rng.choices(claves, k=args.consultas)]
+
+            def recorrido(m, t, q, fecha):
+                # Sumar por día fabricación y pendientes de la clave y buscar el mínimo desde `fecha`
+                def dia(f):
+                    return prev._dia(f)
+                eventos = {}
+                for it in prev.pedidos_fabricacion.get(m, []):
+                    if norm_talla(it.get("talla", "")) == t:
+                        eventos[dia(it.get("fecha"))] = eventos.get(dia(it.get("fecha")), 0) + it.get("cantidad", 0)
+                for p in prev.pedidos:
+                    if str(p.get("modelo", "")).strip().upper() == m and norm_talla(p.get("talla", "")) == t:
+                        eventos[dia(p.get("fecha"))] = eventos.get(dia(p.get("fecha")), 0) - p.get("cantidad", 0)
+                desde = max(fecha, hoy)
+                acumulado = sum(v for d, v in eventos.items() if d <= desde)
+                minimo = acumulado
+                for d in sorted(d for d in eventos if d > desde):
+                    acumulado += eventos[d]
+                    minimo = min(minimo, acumulado)
+                disponible = inv.almacen.get(m, {}).get(t, 0) + minimo
+                return max(disponible, 0), disponible >= q
+
+            muestra = consultas[:200]
+            t0 = time.perf_counter()
+            esperado = [recorrido(*c) for c in muestra]
+            t_recorrido = (time.perf_counter() - t0) / len(muestra)
+            t0 = time.perf_counter()
+            for c in consultas:
+                prev.available_to_promise(inv, *c)
+            t_frio = time.perf_counter() - t0
+            for c, (disp, cumple) in zip(muestra, esperado):
+                r = prev.available_to_promise(inv, *c)
+                assert (r["disponible"], r["cumple"]) == (disp, cumple), (c, r, disp)
+            t_consulta = _mejor(lambda: [prev.available_to_promise(inv, *c) for c in consultas],
+                                args.repeticiones) / len(consultas)
+            t_bloque = _mejor(lambda: prev.available_to_promise_bulk(inv, consultas), args.repeticiones)
+            print(f"{'escenario':<42}{'µs/consulta':>14}")
+            print(f"{'recorrido por consulta':<42}{t_recorrido * 1e6:>14.1f}")
+            print(f"{'available_to_promise (1ª pasada, precálculo)':<42}{t_frio / len(consultas) * 1e6:>14.1f}")
+            print(f"{'available_to_promise (precalculado)':<42}{t_consulta * 1e6:>14.1f}")
+            print(f"{'available_to_promise_bulk':<42}{t_bloque / len(consultas) * 1e6:>14.1f}")
+            print(f"{'x':<42}{t_recorrido / t_consulta:>14.1f}")
+        finally:
+            os.chdir(cwd)
+
+
+def _datos_corte_aleatorios(rng: random.Random, modelos: int, tallas: int, salidas: int):
+    """datos_aleatorios con salidas del último año, entradas con taller y talleres con mínimo/lote."""
+    inventario, prevision = datos_aleatorios(rng, modelos, tallas, salidas // 20)
+    catalogo = TALLAS_ALEATORIAS[:tallas]
+    codigos = [f"M{i:05d}" for i in range(modelos)]
+    talleres = [Workshop(nombre=f"T{i}", minimo=rng.choice((0, 0, 30, 120)), lote=rng.choice((1, 1, 6, 12)))
+                for i in range(max(modelos // 50, 1))]
+    hoy = time.time()
+
+    def fecha(dias: int) -> str:
+        return time.strftime("%Y-%m-%d", time.localtime(hoy - dias * 86400))
+
+    if codigos:
+        # Cada modelo vende con su propia curva (pesos por talla)
+        curvas = {m: [rng.random() ** 3 for _ in catalogo] for m in codigos}
+        for m in rng.choices(codigos, k=salidas):
+            inventario["historial_salidas"].append({
+                "modelo": m, "talla": rng.choices(catalogo, curvas[m])[0], "cantidad": rng.randint(1, 6),
+                "fecha": fecha(rng.randint(0, 500)), "pedido": "", "albaran": "", "cliente": ""})
+        for m in rng.sample(codigos, len(codigos) * 2 // 3):
+            inventario["historial_entradas"].append({
+                "modelo": m, "talla": rng.choice(catalogo), "cantidad": 10, "fecha": fecha(rng.randint(0, 400)),
+                "taller": rng.choice([t.nombre for t in talleres] + [""]), "proveedor": "", "observaciones": ""})
+    return inventario, prevision, talleres
+
+
+def bench_corte(args) -> None:
+    if gestor_oop.np is None:
+        print("⚠️ numpy no está instalado: el motor 'numpy' no está disponible.")
+        return
+    print(f"=== ORDEN DE CORTE SUGERIDA ({args.modelos:,} modelos x {args.tallas} tallas x "
+          f"{args.salidas:,} salidas) ===")
+    rng = random.Random(args.semilla)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            inventario, prevision, talleres = _datos_corte_aleatorios(rng, args.modelos, args.tallas, args.salidas)
+            gestor = _gestor_en(os.path.join(tmp, "grande"), inventario, prevision)
+            inv, prev = gestor.inventory, gestor.prevision
+            cortes = prev.suggest_cut_orders(inv, talleres)
+            t_python = _mejor(lambda: prev.suggest_cut_orders(inv, talleres, motor="python"), args.repeticiones)
+            t_numpy = _mejor(lambda: prev.suggest_cut_orders(inv, talleres), args.repeticiones)
+            t_datos = _mejor(lambda: prev._datos_corte(inv, talleres, 365), args.repeticiones)
+            with contextlib.redirect_stdout(io.StringIO()):
+                t0 = time.perf_counter()
+                altas = prev.register_orders_bulk([(c["modelo"], c["talla"], c["cantidad"]) for c in cortes])
+                t_alta = time.perf_counter() - t0
+            print(f"{len(cortes):,} cortes sugeridos ({sum(c['cantidad'] for c in cortes):,} uds), "
+                  f"{altas:,} órdenes dadas de alta")
+            print(f"{'escenario':<38}{'ms':>12}")
+            print(f"{'preparar columnas (salidas, estimado)':<38}{t_datos * 1000:>12.1f}")
+            print(f"{'motor python':<38}{t_python * 1000:>12.1f}")
+            print(f"{'motor numpy':<38}{t_numpy * 1000:>12.1f}")
+            print(f"{'register_orders_bulk':<38}{t_alta * 1000:>12.1f}")
+        finally:
+            os.chdir(cwd)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmarks del gestor de almacén")
+    sub = ap.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("formatos", help="Carga/guardado y tamaño por formato de instantánea")
+    p.add_argument("--datos", default="datos_almacen.json", help="Ruta a datos_almacen.json")
+    p.add_argument("--escala", type=int, default=50, help="Veces que se replican los datos")
+    p.add_argument("--repeticiones", type=int, default=3, help="Repeticiones (se toma la mejor)")
+    p.set_defaults(func=bench_formatos)
+
+    p = sub.add_parser("historial", help="Arranque con histórico completo vs por meses")
+    p.add_argument("--datos", default="datos_almacen.json", help="Ruta a datos_almacen.json")
+    p.add_argument("--escala", type=int, default=60, help="Réplicas (una por mes hacia atrás)")
+    p.add_argument("--repeticiones", type=int, default=3, help="Repeticiones (se toma la mejor)")
+    p.set_defaults(func=bench_historial)
+
+    p = sub.add_parser("arranque", help="Arranque en frío con migraciones pendientes vs al día")
+    p.add_argument("--datos", default="datos_almacen.json", help="Ruta a datos_almacen.json")
+    p.add_argument("--prevision", default="prevision.json", help="Ruta a prevision.json")
+    p.add_argument("--escala", type=int, default=200, help="Veces que se replican los datos")
+    p.add_argument("--repeticiones", type=int, default=3, help="Repeticiones (se toma la mejor)")
+    p.set_defaults(func=bench_arranque)
+
+    p = sub.add_parser("backups", help="Copias deduplicadas: primera vs incrementales")
+    p.add_argument("--datos", default="datos_almacen.json", help="Ruta a datos_almacen.json")
+    p.add_argument("--escala", type=int, default=100, help="Réplicas (una por mes hacia atrás)")
+    p.add_argument("--movimientos", type=int, default=10, help="Salidas registradas entre copias")
+    p.set_defaults(func=bench_backups)
+
+    p = sub.add_parser("salidas", help="Salidas contra pendientes: índice vs recorrido completo")
+    p.add_argument("--datos", default="datos_almacen.json", help="Ruta a datos_almacen.json")
+    p.add_argument("--prevision", default="prevision.json", help="Ruta a prevision.json")
+    p.add_argument("--escala", type=int, default=200, help="Veces que se replican los datos")
+    p.add_argument("--salidas", type=int, default=200, help="Salidas a registrar")
+    p.add_argument("--repeticiones", type=int, default=3, help="Repeticiones (se toma la mejor)")
+    p.set_defaults(func=bench_salidas)
+
+    p = sub.add_parser("normalizadores", help="Normalizadores y exportación completa con y sin caché")
+    p.add_argument("--datos", default="datos_almacen.json", help="Ruta a datos_almacen.json")
+    p.add_argument("--prevision", default="prevision.json", help="Ruta a prevision.json")
+    p.add_argument("--escala", type=int, default=50, help="Veces que se replican los datos")
+    p.add_argument("--repeticiones", type=int, default=3, help="Repeticiones (se toma la mejor)")
+    p.set_defaults(func=bench_normalizadores)
+
+    p = sub.add_parser("tallas", help="Ordenación por talla: talla_sort_key vs catálogo de tallas")
+    p.add_argument("--datos", default="datos_almacen.json", help="Ruta a datos_almacen.json")
+    p.add_argument("--escala", type=int, default=50, help="Veces que se replican los datos")
+    p.add_argument("--repeticiones", type=int, default=5, help="Repeticiones (se toma la mejor)")
+    p.set_defaults(func=bench_tallas)
+
+    p = sub.add_parser("auditoria", help="Auditoría completa vs incremental con libro de netos")
+    p.add_argument("--datos", default="datos_almacen.json", help="Ruta a datos_almacen.json")
+    p.add_argument("--escala", type=int, default=100, help="Veces que se replican los datos")
+    p.add_argument("--movimientos", type=int, default=20, help="Tallas con movimientos entre auditorías")
+    p.add_argument("--repeticiones", type=int, default=3, help="Repeticiones (se toma la mejor)")
+    p.set_defaults(func=bench_auditoria)
+
+    p = sub.add_parser("columnar", help="Memoria y agregados: lista de dicts vs histórico por columnas")
+    p.add_argument("--datos", default="datos_almacen.json", help="Ruta a datos_almacen.json")
+    p.add_argument("--escala", type=int, default=100, help="Veces que se replican los datos")
+    p.add_argument("--repeticiones", type=int, default=3, help="Repeticiones (se toma la mejor)")
+    p.set_defaults(func=bench_columnar)
+
+    p = sub.add_parser("stockfecha", help="Stock a una fecha: histórico completo vs cierres periódicos")
+    p.add_argument("--datos", default="datos_almacen.json", help="Ruta a datos_almacen.json")
+    p.add_argument("--escala", type=int, default=60, help="Réplicas (una por mes hacia atrás)")
+    p.add_argument("--repeticiones", type=int, default=3, help="Repeticiones (se toma la mejor)")
+    p.set_defaults(func=bench_stockfecha)
+
+    p = sub.add_parser("bloque", help="Salidas/entradas línea a línea vs en bloque")
+    p.add_argument("--datos", default="datos_almacen.json", help="Ruta a datos_almacen.json")
+    p.add_argument("--prevision", default="prevision.json", help="Ruta a prevision.json")
+    p.add_argument("--escala", type=int, default=200, help="Veces que se replican los datos")
+    p.add_argument("--lineas", type=int, default=2000, help="Líneas de salida y de entrada a registrar")
+    p.set_defaults(func=bench_bloque)
+
+    p = sub.add_parser("modelos", help="Existencia/histórico/renombrado: recorrido vs posiciones por modelo")
+    p.add_argument("--datos", default="datos_almacen.json", help="Ruta a datos_almacen.json")
+    p.add_argument("--prevision", default="prevision.json", help="Ruta a prevision.json")
+    p.add_argument("--escala", type=int, default=200, help="Veces que se replican los datos")
+    p.add_argument("--modelos", type=int, default=20, help="Modelos a consultar y renombrar")
+    p.set_defaults(func=bench_modelos)
+
+    p = sub.add_parser("estimado", help="Stock estimado: recorrido por modelo/talla vs tabla mantenida")
+    p.add_argument("--datos", default="datos_almacen.json", help="Ruta a datos_almacen.json")
+    p.add_argument("--prevision", default="prevision.json", help="Ruta a prevision.json")
+    p.add_argument("--escala", type=int, default=100, help="Veces que se replican los datos")
+    p.add_argument("--movimientos", type=int, default=20, help="Salidas registradas entre lecturas")
+    p.add_argument("--repeticiones", type=int, default=3, help="Repeticiones (se toma la mejor)")
+    p.set_defaults(func=bench_estimado)
+
+    p = sub.add_parser("motores", help="Stock estimado: motores tabla/pandas sobre datos aleatorios")
+    p.add_argument("--modelos", type=int, default=5000, help="Modelos del caso grande")
+    p.add_argument("--tallas", type=int, default=20, help="Tallas por modelo (máximo)")
+    p.add_argument("--pendientes", type=int, default=100000, help="Pedidos pendientes del caso grande")
+    p.add_argument("--casos", type=int, default=200, help="Casos aleatorios pequeños a comprobar")
+    p.add_argument("--semilla", type=int, default=1, help="Semilla de los datos aleatorios")
+    p.add_argument("--repeticiones", type=int, default=3, help="Repeticiones (se toma la mejor)")
+    p.set_defaults(func=bench_motores)
+
+    p = sub.add_parser("proyeccion", help="Proyección por periodos: pasada por periodo vs ordenar y acumular")
+    p.add_argument("--modelos", type=int, default=5000, help="Modelos")
+    p.add_argument("--tallas", type=int, default=20, help="Tallas por modelo (máximo)")
+    p.add_argument("--pendientes", type=int, default=100000, help="Pedidos pendientes")
+    p.add_argument("--meses", type=int, default=12, help="Meses por delante con fabricación y pendientes")
+    p.add_argument("--semilla", type=int, default=1, help="Semilla de los datos aleatorios")
+    p.add_argument("--repeticiones", type=int, default=3, help="Repeticiones (se toma la mejor)")
+    p.set_defaults(func=bench_proyeccion)
+
+    p = sub.add_parser("atp", help="Disponible para prometer: recorrido por consulta vs mínimos y bisección")
+    p.add_argument("--modelos", type=int, default=5000, help="Modelos")
+    p.add_argument("--tallas", type=int, default=20, help="Tallas por modelo (máximo)")
+    p.add_argument("--pendientes", type=int, default=100000, help="Pedidos pendientes")
+    p.add_argument("--meses", type=int, default=12, help="Meses por delante con fabricación y pendientes")
+    p.add_argument("--consultas", type=int, default=10000, help="Consultas (el recorrido mide solo 200)")
+    p.add_argument("--semilla", type=int, default=1, help="Semilla de los datos aleatorios")
+    p.add_argument("--repeticiones", type=int, default=3, help="Repeticiones (se toma la mejor)")
+    p.set_defaults(func=bench_atp)
+
+    p = sub.add_parser("corte", help="Orden de corte sugerida: motores python/numpy sobre datos aleatorios")
+    p.add_argument("--modelos", type=int, default=5000, help="Modelos")
+    p.add_argument("--tallas", type=int, default=20, help="Tallas por modelo (máximo)")
+    p.add_argument("--salidas", type=int, default=200000, help="Salidas en el último año")
+    p.add_argument("--semilla", type=int, default=1, help="Semilla de los datos aleatorios")
+    p.add_argument("--repeticiones", type=int, default=3, help="Repeticiones (se toma la mejor)")
+    p.set_defaults(func=bench_corte)
+
+    args = ap.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+convertir_formato_datos.py
+
+- Reescribe ficheros de datos del gestor (datos_almacen.json, prevision.json...)
+  en otro formato de instantánea: json (indentado), compacto, gzip o lzma.
+- El formato de origen se detecta solo; el journal pendiente se incorpora.
+- Hace copia de seguridad de cada fichero antes de convertirlo (salvo --sin-backup).
+
+Uso:
+  python convertir_formato_datos.py --formato gzip datos_almacen.json prevision.json
+  python convertir_formato_datos.py --formato json datos_almacen.json   # vuelta atrás
+"""
+import argparse
+import os
+import shutil
+from datetime import datetime
+
+from gestor_oop import FORMATOS_SNAPSHOT, convertir_formato, detectar_formato
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Convierte el formato de los ficheros de datos")
+    ap.add_argument("ficheros", nargs="+", help="Ficheros a convertir")
+    ap.add_argument("--formato", required=True, choices=FORMATOS_SNAPSHOT, help="Formato destino")
+    ap.add_argument("--sin-backup", action="store_true", help="No copiar los originales antes")
+    args = ap.parse_args()
+
+    print("=== CONVERSIÓN DE FORMATO ===")
+    for ruta in args.ficheros:
+        if not os.path.exists(ruta):
+            print(f"❌ No existe {ruta}")
+            continue
+        with open(ruta, "rb") as f:
+            origen = detectar_formato(f.read(512))
+        if not args.sin_backup:
+            ts = datetime.now().strftime("%Y%m%d-%H%M%S")
+            base, ext = os.path.splitext(ruta)
+            shutil.copy2(ruta, f"{base}.backup-{ts}{ext or '.json'}")
+        antes, despues = convertir_formato(ruta, args.formato)
+        print(f"✅ {ruta}: {origen} → {args.formato}  ({antes:,} → {despues:,} bytes)")
+
+if __name__ == "__main__":
+    main()
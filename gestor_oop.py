@@ -16,20 +16,63 @@ cada una de las clases de dominio.
 
 from __future__ import annotations
 
+import atexit
 import json
 import os
 import csv
+import gzip
+import hashlib
+import lzma
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+import weakref
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from contextlib import ExitStack, contextmanager
 from dataclasses import dataclass
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from itertools import compress
+from operator import itemgetter
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple, TypedDict
 
 try:
     import pandas as pd
 except ImportError:
     pd = None  # así tus funciones pueden seguir avisando "no disponible"
 
+try:
+    import numpy as np
+except ImportError:
+    np = None  # sin numpy, las agregaciones de HistorialColumnar van en Python
+
+# Bloqueo de ficheros entre procesos: msvcrt en Windows, fcntl en el resto
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
-def norm_talla(x):
+
+###############################################################################
+# Normalización (memoizada)
+###############################################################################
+
+# Valores distintos que recuerda cada caché de normalización.  En la práctica
+# hay unos cientos de tallas/códigos distintos repetidos en miles de filas.
+NORM_CACHE_MAX = 8192
+
+
+def _norm_talla(x):
     """
     Normaliza representaciones de talla:
     - 36.0 (float/str) -> "36"
@@ -68,8 +111,25 @@ def norm_talla(x):
     except Exception:
         return str(x).strip().upper()
 
+
+@lru_cache(maxsize=NORM_CACHE_MAX, typed=True)
+def _norm_talla_cacheada(x) -> str:
+    return sys.intern(_norm_talla(x))
+
+
+def norm_talla(x) -> str:
+    """Versión memoizada de :func:`_norm_talla`; devuelve la cadena canónica internada."""
+    try:
+        return _norm_talla_cacheada(x)
+    except TypeError:  # valor no hashable: se normaliza sin caché
+        return _norm_talla(x)
+
 import re
 
+# Patrones de talla_sort_key, compilados una sola vez
+_RE_TALLA_NUMERICA = re.compile(r"\d+(\.\d+)?")
+_RE_TALLA_T = re.compile(r"T(\d+(\.\d+)?)")
+
 TALLA_ORDEN_TEXTUAL = {
     "XXXS": 0,
     "XXS": 1,
@@ -85,7 +145,7 @@ TALLA_ORDEN_TEXTUAL = {
     "U": 11,  # Talla única al final de las textuales
 }
 
-def talla_sort_key(t: str):
+def _talla_sort_key(t: str):
     """
     Clave de orden natural para tallas:
     1) Números (p.ej., 34, 36) y prefijo 'T' + número (T36) -> orden numérico
@@ -95,7 +155,7 @@ def talla_sort_key(t: str):
     s = norm_talla(t)
 
     # 1) Estrictamente numérica (o decimal)
-    if re.fullmatch(r"\d+(\.\d+)?", s):
+    if _RE_TALLA_NUMERICA.fullmatch(s):
         # Si tiene decimales, ordénala por float (zapatillas 36.5)
         try:
             return (0, float(s))
@@ -103,7 +163,7 @@ def talla_sort_key(t: str):
             return (0, float(int(s)))  # fallback
 
     # 1b) 'T' + número (T36, T38.5)
-    m = re.fullmatch(r"T(\d+(\.\d+)?)", s)
+    m = _RE_TALLA_T.fullmatch(s)
     if m:
         num = m.group(1)
         try:
@@ -118,8 +178,21 @@ def talla_sort_key(t: str):
     # 3) Resto (alfabético)
     return (2, 0, s)
 
-    
-def norm_codigo(x: object) -> str:
+
+@lru_cache(maxsize=NORM_CACHE_MAX, typed=True)
+def _talla_sort_key_cacheada(t):
+    return _talla_sort_key(t)
+
+
+def talla_sort_key(t: str):
+    """Versión memoizada de :func:`_talla_sort_key` (se usa como `key=` al ordenar)."""
+    try:
+        return _talla_sort_key_cacheada(t)
+    except TypeError:
+        return _talla_sort_key(t)
+
+
+def _norm_codigo(x: object) -> str:
     """
     Normaliza códigos numérico-textuales (pedido, albarán, etc.):
     - 1234.0 / "1234.0" -> "1234"
@@ -139,6 +212,112 @@ def norm_codigo(x: object) -> str:
     if s.endswith(".0") and s[:-2].isdigit():
         return s[:-2]
     return s
+
+
+@lru_cache(maxsize=NORM_CACHE_MAX, typed=True)
+def _norm_codigo_cacheada(x) -> str:
+    return sys.intern(_norm_codigo(x))
+
+
+def norm_codigo(x: object) -> str:
+    """Versión memoizada de :func:`_norm_codigo`; devuelve la cadena canónica internada."""
+    try:
+        return _norm_codigo_cacheada(x)
+    except TypeError:
+        return _norm_codigo(x)
+
+
+def limpiar_caches_normalizacion() -> None:
+    """Vacía las cachés de norm_talla, norm_codigo y talla_sort_key."""
+    for cache in (_norm_talla_cacheada, _norm_codigo_cacheada, _talla_sort_key_cacheada):
+        cache.cache_clear()
+
+
+class CatalogoTallas:
+    """Catálogo de tallas canónicas con id entero y rango de orden precalculado.
+
+    Cada talla normalizada (ver :func:`norm_talla`) recibe un id estable
+    mientras viva el proceso y un rango: su posición en el orden natural
+    de :func:`talla_sort_key` entre todas las tallas conocidas.  Ordenar
+    por rango compara enteros en lugar de tuplas.  Los ficheros siguen
+    guardando la etiqueta; el catálogo solo vive en memoria.
+
+    Los rangos se recalculan al aparecer una talla nueva (son unos
+    cientos): para ordenar se piden de una vez con :meth:`rangos`, que da
+    de alta todas las tallas antes de leerlos, y no se guardan de una
+    ordenación a otra.
+
+    Alcance: el catálogo solo se usa para ordenar.  El almacén, los
+    índices de pendientes, las colas de fabricación y la tabla prevista
+    siguen indexados por la etiqueta normalizada; los ids no salen de aquí.
+    """
+
+    def __init__(self, tallas=()):
+        self._ids: Dict[str, int] = {}
+        self._crudos: Dict[str, int] = {}  # texto tal cual llega -> id (evita renormalizar)
+        self._etiquetas: List[str] = []
+        self._rangos: List[int] = []      # id -> rango
+        self._lock = threading.Lock()
+        for t in tallas:
+            self.id(t)
+
+    def __len__(self) -> int:
+        return len(self._etiquetas)
+
+    def id(self, talla) -> int:
+        """Id entero de la talla (se da de alta si no existía)."""
+        es_texto = type(talla) is str
+        if es_texto:
+            i = self._crudos.get(talla)
+            if i is not None:
+                return i
+        t = norm_talla(talla)
+        i = self._ids.get(t)
+        if i is None:
+            i = self._alta(t)
+        if es_texto and len(self._crudos) < NORM_CACHE_MAX:
+            self._crudos[talla] = i
+        return i
+
+    def _alta(self, t: str) -> int:
+        with self._lock:
+            i = self._ids.get(t)
+            if i is not None:
+                return i
+            etiquetas = self._etiquetas + [t]
+            orden = sorted(range(len(etiquetas)),
+                           key=lambda j: (_talla_sort_key(etiquetas[j]), etiquetas[j]))
+            rangos = [0] * len(etiquetas)
+            for rango, j in enumerate(orden):
+                rangos[j] = rango
+            # Se publica lista nueva entera: quien lea sin lock ve una u otra
+            self._etiquetas, self._rangos = etiquetas, rangos
+            i = len(etiquetas) - 1
+            self._ids[t] = i
+            return i
+
+    def etiqueta(self, id_talla: int) -> str:
+        return self._etiquetas[id_talla]
+
+    def rangos(self, tallas) -> Dict[object, int]:
+        """Rango entero de cada talla de `tallas` (las claves son los valores tal cual llegan)."""
+        ids = {t: self.id(t) for t in set(tallas)}
+        rangos = self._rangos      # leído tras las altas: todos del mismo reparto
+        return {t: rangos[i] for t, i in ids.items()}
+
+    def ordenar(self, tallas) -> List:
+        """Las tallas dadas (sin renormalizar) en orden natural."""
+        tallas = list(tallas)
+        ids = [self.id(t) for t in tallas]
+        rangos = self._rangos      # leído tras las altas
+        orden = sorted(range(len(tallas)), key=lambda k: rangos[ids[k]])
+        return [tallas[k] for k in orden]
+
+
+# Catálogo compartido por todo el proceso (las tallas conocidas de antemano van primero)
+CATALOGO_TALLAS = CatalogoTallas(TALLA_ORDEN_TEXTUAL)
+
+
 def parse_fecha_excel(value) -> str:
     """
     Intenta normalizar una fecha proveniente de Excel a 'YYYY-MM-DD'.
@@ -293,6 +472,703 @@ def prompt_select_name(prompt: str, disponibles: list[str], allow_empty: bool =
 # Utilidades de almacenamiento
 ###############################################################################
 
+# Formatos de instantánea admitidos por DataStore:
+# - "json": JSON indentado (legible, el formato de siempre)
+# - "compacto": JSON minificado
+# - "gzip" / "lzma": JSON minificado y comprimido con la librería estándar
+FORMATOS_SNAPSHOT = ("json", "compacto", "gzip", "lzma")
+
+_MAGIA_GZIP = b"\x1f\x8b"
+_MAGIA_LZMA = b"\xfd7zXZ\x00"
+
+
+def detectar_formato(raw: bytes) -> str:
+    """Identifica el formato de una instantánea por sus primeros bytes."""
+    if raw.startswith(_MAGIA_GZIP):
+        return "gzip"
+    if raw.startswith(_MAGIA_LZMA):
+        return "lzma"
+    # El JSON indentado lleva saltos de línea desde el principio; el compacto no.
+    # Un '{}' o '[]' vacío se escribe igual en los dos: se queda en "json"
+    inicio = raw[:256].strip()
+    if b"\n" in inicio or inicio.lstrip(b"\xef\xbb\xbf") in (b"{}", b"[]", b""):
+        return "json"
+    return "compacto"
+
+
+def _json_default(obj):
+    """Convierte los contenedores propios (HistorialColumnar) a tipos JSON al serializar."""
+    if isinstance(obj, HistorialColumnar):
+        return obj.como_lista()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def serializar_json(data, formato: str = "json") -> bytes:
+    """Serializa `data` en el formato de instantánea indicado."""
+    if formato == "json":
+        return json.dumps(data, indent=4, ensure_ascii=False, default=_json_default).encode("utf-8")
+    if formato not in FORMATOS_SNAPSHOT:
+        raise ValueError(f"Formato de instantánea desconocido: {formato}")
+    raw = json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=_json_default).encode("utf-8")
+    if formato == "gzip":
+        return gzip.compress(raw, compresslevel=6, mtime=0)
+    if formato == "lzma":
+        return lzma.compress(raw)
+    return raw
+
+
+def deserializar_json(raw: bytes):
+    """Inverso de :func:`serializar_json`: detecta el formato y decodifica."""
+    formato = detectar_formato(raw)
+    if formato == "gzip":
+        raw = gzip.decompress(raw)
+    elif formato == "lzma":
+        raw = lzma.decompress(raw)
+    return json.loads(raw.decode("utf-8-sig"))
+
+
+def leer_json(path: str):
+    """Lee un fichero JSON en cualquiera de los formatos de instantánea."""
+    with open(path, "rb") as f:
+        return deserializar_json(f.read())
+
+
+class HistorialSegmentado:
+    """Lista de movimientos repartida en un fichero por mes, cargados bajo demanda.
+
+    Sustituye a la lista `historial_entradas`/`historial_salidas` cuando la
+    store se abre con ``segmentar``.  Se usa como una lista (iterar, `len`,
+    `append`), pero cada mes vive en ``<directorio>/<clave>/<AAAA-MM>.json``
+    y solo se lee al tocarlo: `append` carga únicamente el mes del
+    movimiento y :meth:`rango` solo los meses entre dos fechas.  El orden de
+    iteración es por mes y, dentro del mes, por orden de alta.
+
+    La instantánea principal guarda cuántos movimientos confirmados tiene
+    cada mes; al leer un segmento se descarta lo que exceda ese número (lo
+    escrito tras la última instantánea lo reaplica el journal).
+    """
+
+    SIN_FECHA = "sin-fecha"
+
+    def __init__(self, directorio: str, clave: str, conteos: Optional[Dict[str, int]] = None,
+                 formato: str = "json"):
+        self.clave = clave
+        self.directorio = os.path.join(directorio, clave)
+        self.formato = formato
+        self._conteos: Dict[str, int] = dict(conteos or {})   # mes -> movimientos en disco
+        self._segmentos: Dict[str, List[Dict]] = {}           # meses cargados
+        self._firmas: Dict[str, str] = {}                     # contenido al cargar/escribir
+
+    @classmethod
+    def mes_de(cls, mov: Dict) -> str:
+        fecha = str(mov.get("fecha") or "")
+        return fecha[:7] if len(fecha) >= 7 and fecha[4] == "-" else cls.SIN_FECHA
+
+    @staticmethod
+    def _firma(seg: List[Dict]) -> str:
+        raw = json.dumps(seg, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return hashlib.sha1(raw).hexdigest()
+
+    def _ruta(self, mes: str) -> str:
+        return os.path.join(self.directorio, f"{mes}.json")
+
+    def _segmento(self, mes: str) -> List[Dict]:
+        seg = self._segmentos.get(mes)
+        if seg is None:
+            seg = []
+            n = self._conteos.get(mes, 0)
+            if n and os.path.exists(self._ruta(mes)):
+                seg = leer_json(self._ruta(mes))[:n]
+            self._segmentos[mes] = seg
+            self._firmas[mes] = self._firma(seg)
+        return seg
+
+    def meses(self) -> List[str]:
+        return sorted(set(self._conteos) | set(self._segmentos))
+
+    def conteos(self) -> Dict[str, int]:
+        """Movimientos por mes, sin leer los meses que no están cargados."""
+        return {m: len(self._segmentos[m]) if m in self._segmentos else self._conteos.get(m, 0)
+                for m in self.meses()}
+
+    def del_mes(self, mes: str) -> List[Dict]:
+        """Movimientos de un mes ("AAAA-MM" o SIN_FECHA), leyendo solo ese segmento."""
+        return list(self._segmento(mes))
+
+    def __iter__(self):
+        for mes in self.meses():
+            yield from self._segmento(mes)
+
+    def __len__(self) -> int:
+        return sum(self.conteos().values())
+
+    def __getitem__(self, i):
+        """Movimiento i-ésimo (o una rebanada), leyendo solo los meses que lo contienen."""
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        conteos = self.conteos()
+        n = sum(conteos.values())
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError(f"{self.clave}: posición fuera de rango")
+        for mes, cuantos in conteos.items():
+            if i < cuantos:
+                return self._segmento(mes)[i]
+            i -= cuantos
+
+    def __repr__(self) -> str:
+        return f"<HistorialSegmentado {self.clave}: {len(self)} movimientos, {len(self.meses())} meses>"
+
+    def append(self, mov: Dict) -> None:
+        self._segmento(self.mes_de(mov)).append(mov)
+
+    def extend(self, movs) -> None:
+        for mov in movs:
+            self.append(mov)
+
+    def rango(self, desde: Optional[str] = None, hasta: Optional[str] = None) -> List[Dict]:
+        """Movimientos con fecha entre `desde` y `hasta` (AAAA-MM-DD), leyendo solo esos meses."""
+        if not (desde or hasta):
+            return list(self)
+        out = []
+        for mes in self.meses():
+            if mes == self.SIN_FECHA or (desde and mes < desde[:7]) or (hasta and mes > hasta[:7]):
+                continue
+            out.extend(r for r in self._segmento(mes)
+                       if (not desde or (r.get("fecha") or "") >= desde)
+                       and (not hasta or (r.get("fecha") or "") <= hasta))
+        return out
+
+    def reemplazar(self, movs) -> None:
+        """Sustituye todo el contenido (p. ej. al migrar una lista completa)."""
+        movs = list(movs)
+        for mes in self.meses():
+            self._segmentos[mes] = []
+            self._firmas.setdefault(mes, "")
+        self.extend(movs)
+
+    def guardar(self) -> Dict[str, int]:
+        """Escribe los meses cargados que han cambiado y devuelve los conteos por mes."""
+        for mes, seg in self._segmentos.items():
+            firma = self._firma(seg)
+            if firma == self._firmas.get(mes):
+                continue
+            ruta = self._ruta(mes)
+            if seg:
+                os.makedirs(self.directorio, exist_ok=True)
+                tmp = ruta + ".tmp"
+                with open(tmp, "wb") as f:
+                    f.write(serializar_json(seg, self.formato))
+                os.replace(tmp, ruta)
+            elif os.path.exists(ruta):
+                os.remove(ruta)
+            self._firmas[mes] = firma
+        for mes, seg in self._segmentos.items():
+            if seg:
+                self._conteos[mes] = len(seg)
+            else:
+                self._conteos.pop(mes, None)
+        return dict(self._conteos)
+
+    def liberar(self, conservar: Tuple[str, ...] = ()) -> None:
+        """Descarga de memoria los meses ya guardados (salvo `conservar`)."""
+        for mes in list(self._segmentos):
+            if mes in conservar or self._firmas.get(mes) != self._firma(self._segmentos[mes]):
+                continue
+            del self._segmentos[mes]
+            del self._firmas[mes]
+
+    def adoptar(self, otro: "HistorialSegmentado") -> None:
+        """Toma el estado de `otro` (recién leído) conservando este objeto."""
+        self.directorio, self.formato = otro.directorio, otro.formato
+        self._conteos, self._segmentos, self._firmas = otro._conteos, otro._segmentos, otro._firmas
+
+
+# Valores que HistorialColumnar guarda como código de categoría
+_ESCALARES = (str, int, float, bool, type(None))
+
+
+class FilaMovimiento(dict):
+    """Movimiento de un :class:`HistorialColumnar` entregado como dict.
+
+    Es una copia que se lee, serializa y compara como cualquier dict;
+    asignar o borrar claves (p. ej. al renombrar un modelo) actualiza también
+    la fila del historial.  Es de usar y tirar: si se borran filas
+    anteriores deja de apuntar a la suya.
+    """
+
+    __slots__ = ("_historial", "_i")
+
+    def __init__(self, historial: "HistorialColumnar", i: int, valores: Dict):
+        dict.__init__(self, valores)
+        self._historial = historial
+        self._i = i
+
+    def __reduce__(self):
+        # copy/deepcopy/pickle dan un dict normal (sin arrastrar el historial)
+        return dict, (dict(self),)
+
+    def _volcar(self) -> None:
+        self._historial._escribir(self._i, self)
+
+    def __setitem__(self, clave, valor):
+        dict.__setitem__(self, clave, valor)
+        self._volcar()
+
+    def __delitem__(self, clave):
+        dict.__delitem__(self, clave)
+        self._volcar()
+
+    def update(self, *args, **kwargs):
+        dict.update(self, *args, **kwargs)
+        self._volcar()
+
+    def setdefault(self, clave, defecto=None):
+        if clave not in self:
+            self[clave] = defecto
+        return dict.__getitem__(self, clave)
+
+    def pop(self, clave, *defecto):
+        presente = clave in self
+        valor = dict.pop(self, clave, *defecto)
+        if presente:
+            self._volcar()
+        return valor
+
+
+class HistorialColumnar:
+    """Lista de movimientos guardada por columnas en memoria.
+
+    Sustituye a la lista de dicts de `historial_entradas`/`historial_salidas`
+    cuando la store se abre con ``columnar``: la cantidad va en un ``array``
+    de enteros, la fecha como ordinal de día y los textos repetidos (modelo,
+    talla, cliente, taller, pedido, albarán, ...) como códigos de categoría,
+    así que un movimiento ocupa unas decenas de bytes en lugar de un dict.
+    Se usa como una lista (`append`, `len`, índices, iterar) y cada fila se
+    entrega como :class:`FilaMovimiento`.  Lo que no cabe en una columna
+    (otras claves, valores de otro tipo, fechas no ISO) se guarda aparte por
+    fila, y el orden de claves de cada fila se conserva: el JSON que se
+    escribe es el mismo que se leyó.
+
+    :meth:`sumar_por` agrega cantidades y :meth:`indices` filtra por
+    categoría sin crear las filas (con numpy si está instalado).
+    """
+
+    CATEGORICAS = ("modelo", "talla", "cliente", "taller", "pedido", "albaran", "proveedor", "observaciones")
+    CAMPOS = ("cantidad", "fecha") + CATEGORICAS
+    _AUSENTE = -1
+    _ESTADO = ("_cantidad", "_fecha", "_forma", "_codigos", "_categorias", "_indices",
+               "_formas", "_indice_formas", "_lectores", "_extras", "_fechas_txt", "_fechas_ord")
+
+    def __init__(self, filas=()):
+        self._cantidad = array("q")
+        self._fecha = array("i")
+        self._forma = array("i")
+        self._codigos: Dict[str, array] = {c: array("i") for c in self.CATEGORICAS}
+        self._categorias: Dict[str, List] = {c: [] for c in self.CATEGORICAS}   # código -> valor
+        self._indices: Dict[str, Dict] = {c: {} for c in self.CATEGORICAS}      # valor -> código
+        self._formas: List[Tuple[str, ...]] = []         # claves (en orden) de cada forma de fila
+        self._indice_formas: Dict[Tuple[str, ...], int] = {}
+        self._lectores: List = []                         # forma -> itemgetter sobre CAMPOS (o None)
+        self._extras: Dict[int, Dict] = {}                # fila -> valores fuera de columna
+        self._fechas_txt: Dict[int, str] = {}             # ordinal -> "AAAA-MM-DD"
+        self._fechas_ord: Dict[str, int] = {}
+        self.extend(filas)
+
+    # ------------------------------------------------------------------
+    # Codificación
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _clave_categoria(valor):
+        # 36, 36.0 y True son la misma clave de dict: se distinguen por tipo
+        return valor if type(valor) is str else (type(valor), valor)
+
+    def _codigo(self, campo: str, valor) -> int:
+        indice = self._indices[campo]
+        clave = self._clave_categoria(valor)
+        cod = indice.get(clave)
+        if cod is None:
+            cod = indice[clave] = len(self._categorias[campo])
+            self._categorias[campo].append(valor)
+        return cod
+
+    def _ordinal(self, fecha) -> Optional[int]:
+        """Ordinal de una fecha "AAAA-MM-DD" exacta (None si no lo es)."""
+        if type(fecha) is not str:
+            return None
+        o = self._fechas_ord.get(fecha)
+        if o is None:
+            try:
+                d = date.fromisoformat(fecha)
+            except ValueError:
+                return None
+            if d.isoformat() != fecha:
+                return None
+            o = self._fechas_ord[fecha] = d.toordinal()
+            self._fechas_txt[o] = fecha
+        return o
+
+    def _codigo_forma(self, forma: Tuple[str, ...]) -> int:
+        cod = self._indice_formas.get(forma)
+        if cod is None:
+            cod = self._indice_formas[forma] = len(self._formas)
+            self._formas.append(forma)
+            # Filas de esta forma sin extras se leen de una tupla con todas las columnas
+            if forma and all(k in self.CAMPOS for k in forma):
+                pos = [self.CAMPOS.index(k) for k in forma]
+                self._lectores.append(itemgetter(*pos) if len(pos) > 1 else (lambda t, p=pos[0]: (t[p],)))
+            else:
+                self._lectores.append(None)
+        return cod
+
+    def _codificar(self, fila: Dict) -> Tuple[int, int, int, List[int], Dict]:
+        extras = {}
+        cantidad = fila.get("cantidad", 0)
+        if type(cantidad) is not int or not -(1 << 63) <= cantidad < (1 << 63):
+            if "cantidad" in fila:
+                extras["cantidad"] = cantidad
+            cantidad = 0
+        ordinal = 0
+        if "fecha" in fila:
+            ordinal = self._ordinal(fila["fecha"])
+            if ordinal is None:
+                extras["fecha"] = fila["fecha"]
+                ordinal = 0
+        codigos = []
+        for campo in self.CATEGORICAS:
+            if campo not in fila:
+                codigos.append(self._AUSENTE)
+            elif type(fila[campo]) in _ESCALARES:
+                codigos.append(self._codigo(campo, fila[campo]))
+            else:
+                extras[campo] = fila[campo]
+                codigos.append(self._AUSENTE)
+        for k, v in fila.items():
+            if k not in self.CAMPOS:
+                extras[k] = v
+        return self._codigo_forma(tuple(fila)), cantidad, ordinal, codigos, extras
+
+    # ------------------------------------------------------------------
+    # Interfaz de lista
+    # ------------------------------------------------------------------
+    def __len__(self) -> int:
+        return len(self._forma)
+
+    def __repr__(self) -> str:
+        return f"<HistorialColumnar: {len(self)} movimientos>"
+
+    def _posicion(self, i: int) -> int:
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("índice de historial fuera de rango")
+        return i
+
+    def append(self, fila: Dict) -> None:
+        forma, cantidad, ordinal, codigos, extras = self._codificar(fila)
+        i = len(self._forma)
+        self._forma.append(forma)
+        self._cantidad.append(cantidad)
+        self._fecha.append(ordinal)
+        for campo, cod in zip(self.CATEGORICAS, codigos):
+            self._codigos[campo].append(cod)
+        if extras:
+            self._extras[i] = extras
+
+    def extend(self, filas) -> None:
+        for fila in filas:
+            self.append(fila)
+
+    def _escribir(self, i: int, fila: Dict) -> None:
+        forma, cantidad, ordinal, codigos, extras = self._codificar(fila)
+        self._forma[i], self._cantidad[i], self._fecha[i] = forma, cantidad, ordinal
+        for campo, cod in zip(self.CATEGORICAS, codigos):
+            self._codigos[campo][i] = cod
+        if extras:
+            self._extras[i] = extras
+        else:
+            self._extras.pop(i, None)
+
+    def _fila(self, i: int) -> FilaMovimiento:
+        extras = self._extras.get(i, {})
+        valores = {}
+        for k in self._formas[self._forma[i]]:
+            if k in extras:
+                valores[k] = extras[k]
+            elif k == "cantidad":
+                valores[k] = self._cantidad[i]
+            elif k == "fecha":
+                valores[k] = self._fechas_txt[self._fecha[i]]
+            else:
+                valores[k] = self._categorias[k][self._codigos[k][i]]
+        return FilaMovimiento(self, i, valores)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._fila(j) for j in range(*i.indices(len(self)))]
+        return self._fila(self._posicion(i))
+
+    def __setitem__(self, i: int, fila: Dict) -> None:
+        self._escribir(self._posicion(i), fila)
+
+    def __delitem__(self, i: int) -> None:
+        i = self._posicion(i)
+        for columna in (self._forma, self._cantidad, self._fecha, *self._codigos.values()):
+            del columna[i]
+        if self._extras:
+            self._extras = {(j - 1 if j > i else j): v for j, v in self._extras.items() if j != i}
+
+    def pop(self, i: int = -1) -> Dict:
+        i = self._posicion(i)
+        fila = dict(self._fila(i))
+        del self[i]
+        return fila
+
+    def _columnas(self) -> List:
+        """Valores de cada columna de CAMPOS, fila a fila (sin crear dicts)."""
+        cols = [self._cantidad, map(self._fechas_txt.get, self._fecha)]
+        for campo in self.CATEGORICAS:
+            # El código -1 (ausente) cae en el None añadido al final
+            cols.append(map((self._categorias[campo] + [None]).__getitem__, self._codigos[campo]))
+        return cols
+
+    def __iter__(self):
+        lectores, formas, extras = self._lectores, self._formas, self._extras
+        for i, (f, tupla) in enumerate(zip(self._forma, zip(*self._columnas()))):
+            lector = lectores[f]
+            if lector is None or i in extras:
+                yield self._fila(i)
+            else:
+                yield FilaMovimiento(self, i, zip(formas[f], lector(tupla)))
+
+    def como_lista(self) -> List[Dict]:
+        return list(self)
+
+    def __eq__(self, otro):
+        if isinstance(otro, HistorialColumnar):
+            # Mismas columnas y mismos diccionarios de códigos: iguales sin crear filas
+            if (self._forma == otro._forma and self._formas == otro._formas
+                    and self._cantidad == otro._cantidad and self._fecha == otro._fecha
+                    and self._codigos == otro._codigos and self._extras == otro._extras
+                    and all(list(self._indices[c]) == list(otro._indices[c]) for c in self.CATEGORICAS)):
+                return True
+        if isinstance(otro, (list, HistorialColumnar)):
+            return len(self) == len(otro) and all(a == b for a, b in zip(self, otro))
+        return NotImplemented
+
+    __hash__ = None
+
+    # ------------------------------------------------------------------
+    # Consultas sin crear filas
+    # ------------------------------------------------------------------
+    def indices(self, campo: str, condicion: Callable[[object], bool]) -> List[int]:
+        """Posiciones de las filas cuyo `campo` (categórico) cumple `condicion`.
+
+        La condición se evalúa una vez por categoría, no por fila.  Las filas
+        sin ese campo no se incluyen.
+        """
+        aceptados = [cod for cod, valor in enumerate(self._categorias[campo]) if condicion(valor)]
+        codigos = self._codigos[campo]
+        if not aceptados:
+            posiciones = []
+        elif np is not None:
+            posiciones = np.flatnonzero(np.isin(np.frombuffer(codigos, dtype=np.int32), aceptados)).tolist()
+        else:
+            aceptados = set(aceptados)
+            posiciones = [i for i, cod in enumerate(codigos) if cod in aceptados]
+        raros = [i for i, extras in self._extras.items() if campo in extras and condicion(extras[campo])]
+        return sorted(posiciones + raros) if raros else posiciones
+
+    def posiciones_por(self, campo: str) -> List[Tuple[object, List[int]]]:
+        """Pares (valor, posiciones de sus filas) para un `campo` categórico.
+
+        Se recorre la columna de códigos una vez, sin crear las filas.  Las
+        filas con el valor fuera de columna dan un par cada una; las que no
+        tienen el campo no aparecen.
+        """
+        por_codigo: Dict[int, List[int]] = {}
+        for i, cod in enumerate(self._codigos[campo]):
+            por_codigo.setdefault(cod, []).append(i)
+        por_codigo.pop(self._AUSENTE, None)
+        categorias = self._categorias[campo]
+        pares = [(categorias[cod], posiciones) for cod, posiciones in por_codigo.items()]
+        pares.extend((extras[campo], [i]) for i, extras in self._extras.items() if campo in extras)
+        return pares
+
+    def filas(self, posiciones) -> List[FilaMovimiento]:
+        return [self._fila(i) for i in posiciones]
+
+    def sumar_por(self, campos: Tuple[str, ...], ausente=None) -> Dict[Tuple, int]:
+        """Suma `cantidad` agrupando por campos categóricos, sin crear las filas.
+
+        Devuelve {(valor de cada campo): suma}, con un grupo por combinación
+        presente aunque sume 0.  Un campo que la fila no tiene vale `ausente`;
+        una cantidad no entera cuenta como ``int(cantidad or 0)``.
+        """
+        campos = tuple(campos)
+        if not campos:
+            raise ValueError("sumar_por necesita al menos un campo")
+        cods = [self._codigos[c] for c in campos]
+        # El código -1 (campo ausente) cae en el `ausente` añadido al final
+        tablas = [self._categorias[c] + [ausente] for c in campos]
+        # Filas con la cantidad o algún campo fuera de columna: se suman aparte, fila a fila
+        aparte = {i: extras for i, extras in self._extras.items()
+                  if "cantidad" in extras or any(c in extras for c in campos)}
+        producto = 1
+        for t in tablas:
+            producto *= len(t)
+        if np is not None and len(self) and producto < (1 << 62):
+            # Una clave entera por combinación de códigos; ordenar y reduceat (todo en C)
+            columnas = [np.frombuffer(c, dtype=np.int32) for c in cods]
+            cantidades = np.frombuffer(self._cantidad, dtype=np.int64)
+            if aparte:
+                mascara = np.ones(len(self), dtype=bool)
+                mascara[list(aparte)] = False
+                columnas = [col[mascara] for col in columnas]
+                cantidades = cantidades[mascara]
+            clave = np.zeros(len(cantidades), dtype=np.int64)
+            for col, t in zip(columnas, tablas):
+                clave = clave * len(t) + (col.astype(np.int64) + 1)
+            orden = np.argsort(clave, kind="stable")
+            inicios = np.flatnonzero(np.diff(clave[orden])) + 1
+            inicios = np.concatenate(([0], inicios)) if len(clave) else inicios
+            sumas = np.add.reduceat(cantidades[orden], inicios).tolist() if len(clave) else []
+            primeras = orden[inicios]
+            grupos = list(zip(*[col[primeras].tolist() for col in columnas]))
+        else:
+            filas, cantidades = zip(*cods), self._cantidad
+            if aparte:
+                mascara = [True] * len(self)
+                for i in aparte:
+                    mascara[i] = False
+                filas, cantidades = compress(filas, mascara), compress(cantidades, mascara)
+            acumulado: Dict[Tuple[int, ...], int] = {}
+            for k, c in zip(filas, cantidades):
+                acumulado[k] = acumulado.get(k, 0) + c
+            grupos, sumas = list(acumulado), list(acumulado.values())
+        # Se decodifica columna a columna, no grupo a grupo
+        claves = zip(*[map(t.__getitem__, col) for t, col in zip(tablas, zip(*grupos))])
+        resultado: Dict[Tuple, int] = {}
+        for k, suma in zip(claves, sumas):
+            # Códigos distintos pueden dar valores iguales (p. ej. 36 y 36.0): se juntan
+            resultado[k] = resultado.get(k, 0) + suma
+        for i, extras in aparte.items():
+            k = tuple(extras[c] if c in extras else t[cod[i]] for c, t, cod in zip(campos, tablas, cods))
+            cantidad = int(extras["cantidad"] or 0) if "cantidad" in extras else self._cantidad[i]
+            resultado[k] = resultado.get(k, 0) + cantidad
+        return resultado
+
+    # ------------------------------------------------------------------
+    # Integración con DataStore
+    # ------------------------------------------------------------------
+    def reemplazar(self, filas) -> None:
+        """Sustituye todo el contenido conservando este objeto."""
+        self.adoptar(HistorialColumnar(filas))
+
+    def adoptar(self, otro: "HistorialColumnar") -> None:
+        """Toma el estado de `otro` (recién leído) conservando este objeto."""
+        for atributo in self._ESTADO:
+            setattr(self, atributo, getattr(otro, atributo))
+
+
+class ConflictoVersion(RuntimeError):
+    """El fichero cambió en disco (otro proceso) y lo que hay en memoria no se puede fusionar.
+
+    `rechazadas` son las mutaciones anotadas que no se han aplicado (cada
+    una con su motivo en "error"); ya no están pendientes, así que no hay
+    que repetir nada: los datos en memoria son los del disco.
+    """
+
+    def __init__(self, mensaje: str = "", rechazadas: Optional[List[Dict]] = None):
+        super().__init__(mensaje)
+        self.rechazadas = list(rechazadas or [])
+
+
+class _BloqueoFichero:
+    """Bloqueo exclusivo entre procesos sobre ``<ruta>.lock``.
+
+    Es reentrante y lo comparten todas las stores del proceso con la misma
+    ruta (ver :func:`_bloqueo_para`): entre hilos se serializa con un RLock
+    y entre procesos con `msvcrt.locking` (Windows) o `fcntl.flock`.
+    """
+
+    def __init__(self, path: str, timeout: float = 30.0):
+        self.path = path + ".lock"
+        self.timeout = timeout
+        self._mutex = threading.RLock()
+        self._nivel = 0
+        self._f = None
+
+    def __enter__(self):
+        self._mutex.acquire()
+        if self._nivel == 0:
+            try:
+                self._adquirir()
+            except BaseException:
+                self._mutex.release()
+                raise
+        self._nivel += 1
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._nivel -= 1
+        if self._nivel == 0:
+            self._soltar()
+        self._mutex.release()
+
+    def _adquirir(self) -> None:
+        base_dir = os.path.dirname(self.path)
+        if base_dir and not os.path.exists(base_dir):
+            os.makedirs(base_dir, exist_ok=True)
+        f = open(self.path, "a+b")
+        limite = time.monotonic() + self.timeout
+        while True:
+            try:
+                if msvcrt is not None:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                elif fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except OSError:
+                if time.monotonic() >= limite:
+                    f.close()
+                    raise TimeoutError(f"No se pudo bloquear {self.path}: otro proceso lo tiene ocupado.")
+                time.sleep(0.05)
+        self._f = f
+
+    def _soltar(self) -> None:
+        f, self._f = self._f, None
+        try:
+            if msvcrt is not None:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            elif fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        finally:
+            f.close()
+
+
+_BLOQUEOS: Dict[str, _BloqueoFichero] = {}
+_BLOQUEOS_MUTEX = threading.Lock()
+
+
+def _bloqueo_para(path: str, timeout: float = 30.0) -> _BloqueoFichero:
+    """Bloqueo compartido por todas las stores del proceso que usan `path`."""
+    clave = os.path.abspath(path)
+    with _BLOQUEOS_MUTEX:
+        bloqueo = _BLOQUEOS.get(clave)
+        if bloqueo is None:
+            bloqueo = _BLOQUEOS[clave] = _BloqueoFichero(path, timeout)
+        return bloqueo
+
+
+# Marca "no se indicó valor previo" en DataStore.record (None es un previo válido)
+_SIN_PREVIO = object()
+
+
 class DataStore:
     """Componente de persistencia genérico.
 
@@ -301,34 +1177,1728 @@ class DataStore:
     fichero no existe o contiene datos corruptos, se usa la estructura por
     defecto.  Al guardar, se serializa el diccionario interno en JSON con
     indentación para facilitar la lectura humana.
+
+    Modo journal (opcional, ``journal=True``): las clases de dominio anotan
+    cada mutación con :meth:`record` y persisten con :meth:`commit`, que
+    añade una línea compacta por mutación a ``<ruta>.journal`` en lugar de
+    reescribir el fichero completo.  Cada ``journal_max_ops`` mutaciones se
+    compacta (se reescribe la instantánea y se vacía el journal).  Al cargar
+    se reaplica el journal sobre la instantánea, se use o no el modo journal,
+    para no perder movimientos si se alterna entre modos.
+
+    Formato (``formato``): uno de :data:`FORMATOS_SNAPSHOT`.  Al cargar se
+    detecta solo; con ``formato=None`` se conserva el del fichero existente
+    (``"json"`` si es nuevo) y con un valor explícito el siguiente `save()`
+    convierte el fichero (ver :func:`convertir_formato`).
+
+    Históricos por mes (``segmentar``): las claves indicadas se guardan
+    fuera de la instantánea, en un fichero por mes bajo ``<ruta>_historial/``
+    (ver :class:`HistorialSegmentado`), y solo se leen los meses que se
+    tocan.  Una vez segmentado, el fichero se abre así aunque no se pida.
+
+    Históricos por columnas (``columnar``): las claves indicadas se tienen
+    en memoria como :class:`HistorialColumnar` (mucha menos memoria y
+    agregaciones sin recorrer dicts); en disco siguen siendo listas.
+
+    Lotes (:meth:`batch`): dentro del bloque, `save()`/`commit()` solo marcan
+    la store como sucia; al salir se escribe una única vez.  Si escapa una
+    excepción se restaura en memoria el estado previo al lote.
+
+    Escritura en segundo plano (opcional, ``async_write=True``): `save()`
+    serializa la instantánea y se la entrega a un hilo escritor, sin esperar
+    al disco (útil si el JSON está en una unidad de red).  Varias
+    instantáneas seguidas se agrupan en una sola escritura, y ninguna espera
+    más de ``max_staleness`` segundos.  :meth:`flush` fuerza la escritura y
+    :meth:`write_stats` devuelve las métricas del escritor.
+
+    Concurrencia entre procesos (la app en la LAN, el menú de consola y los
+    scripts pueden escribir el mismo fichero): toda lectura/escritura se hace
+    bajo un bloqueo de fichero (``<ruta>.lock``) y cada escritura incrementa
+    un sello de versión (``<ruta>.version``).  Si al ir a escribir el sello
+    (o el tamaño/fecha del fichero) no es el que se leyó, la copia en memoria
+    está obsoleta y se aplica la política ``conflictos``:
+
+    - "fusionar" (por defecto): se recarga lo que hay en disco y se le
+      reaplican las mutaciones anotadas con :meth:`record` (ver
+      :func:`fusionar_op`).  Las que ya no encajan se descartan y, tras
+      escribir el resto, se informa de ellas con :class:`ConflictoVersion`.
+      Si hay cambios sin anotar (un `save()` directo) no se puede fusionar:
+      se descartan todos y se recarga el disco.
+    - "rechazar": cualquier cambio concurrente descarta lo que hay en
+      memoria, recarga el disco y lanza :class:`ConflictoVersion`.
+    - "sobrescribir": el último que escribe gana (comportamiento antiguo).
+
+    En ningún caso se queda nada rechazado pendiente de escribir.  Para
+    escribir varias stores como una unidad, ver :func:`commit_conjunto`.
     """
 
-    def __init__(self, path: str, default_structure: Dict):
+    JOURNAL_SUFFIX = ".journal"
+    VERSION_SUFFIX = ".version"
+    # Clave con la que la instantánea identifica el journal que le corresponde
+    SNAPSHOT_ID_KEY = "__snapshot_id__"
+    # Clave con los conteos por mes de los históricos segmentados
+    SEGMENTS_KEY = "__segmentos__"
+    # Clave con la versión de esquema de los datos (ver migrate y MIGRACIONES)
+    SCHEMA_KEY = "__esquema__"
+    POLITICAS_CONFLICTO = ("fusionar", "rechazar", "sobrescribir")
+    # Atributos que fija _cargar (se restauran si una fusión falla)
+    _ESTADO_CARGA = ("formato", "_snapshot_id", "_journal_ops", "_pending_ops", "_historiales",
+                     "_columnares", "_sello", "_huella", "_generacion", "_sin_anotar", "_en_vuelo", "_conflicto_async")
+
+    def __init__(self, path: str, default_structure: Dict,
+                 journal: bool = False, journal_max_ops: int = 500,
+                 async_write: bool = False, max_staleness: float = 2.0,
+                 formato: Optional[str] = None, segmentar: Tuple[str, ...] = (),
+                 conflictos: str = "fusionar", lock_timeout: float = 30.0,
+                 columnar: Tuple[str, ...] = ()):
+        if formato is not None and formato not in FORMATOS_SNAPSHOT:
+            raise ValueError(f"Formato de instantánea desconocido: {formato}")
+        if conflictos not in self.POLITICAS_CONFLICTO:
+            raise ValueError(f"Política de conflictos desconocida: {conflictos}")
         self.path = path
+        self.formato = formato or "json"
+        self._formato_fijo = formato is not None
+        self.segmentar = tuple(segmentar)
+        self.historial_dir = os.path.splitext(path)[0] + "_historial"
+        self._historiales: Dict[str, HistorialSegmentado] = {}
+        self.columnar = tuple(columnar)
+        self._columnares: Dict[str, HistorialColumnar] = {}
         # Copiamos el default para no modificar el original
         self.default_structure = json.loads(json.dumps(default_structure))
+        self.journal = journal
+        self.journal_max_ops = journal_max_ops
+        self.journal_path = path + self.JOURNAL_SUFFIX
+        self.version_path = path + self.VERSION_SUFFIX
+        self.conflictos = conflictos
+        self._bloqueo = _bloqueo_para(path, lock_timeout)
+        self._sello: Tuple = ()            # versión y firma del disco en la última lectura/escritura
+        self._huella: Optional[str] = None  # SHA-1 de la instantánea leída/escrita
+        self._generacion = 0               # sube en cada recarga (invalida escrituras en vuelo)
+        self._sin_anotar = False           # hubo save() directo: no se puede fusionar
+        self._snapshot_id = ""
+        self._journal_ops = 0          # líneas del journal ya escritas y vigentes
+        self._pending_ops: List[str] = []
+        self._batch_depth = 0
+        self._batch_full = False       # dentro de lote se pidió un save() completo
+        self._batch_previas = 0        # mutaciones anotadas antes del lote y sin escribir
+        self._listeners: List = []
+        # Escritura en segundo plano: (seq, ops, sin_anotar) entregados y aún no en disco
+        self._estado_mutex = threading.Lock()
+        self._en_vuelo: List[Tuple[int, List[str], bool]] = []
+        self._seq = 0
+        self._conflicto_async = False
+        self._writer = _SnapshotWriter(self, max_staleness) if async_write else None
         self.data = self.load()
 
     def load(self) -> Dict:
-        """Carga el fichero JSON o devuelve la estructura por defecto."""
-        if not os.path.exists(self.path):
+        """Carga el fichero JSON (más su journal) o devuelve la estructura por defecto."""
+        # Una escritura en segundo plano del mismo fichero (de esta u otra store) va antes
+        flush_pending_writes(path=self.path)
+        with self._bloqueo:
+            return self._cargar()
+
+    def _leer_bruto(self) -> Optional[bytes]:
+        try:
+            with open(self.path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _cargar(self, raw: Optional[bytes] = None) -> Dict:
+        """Lee instantánea (o interpreta `raw`), históricos y journal (el llamante tiene el bloqueo)."""
+        if raw is None:
+            raw = self._leer_bruto()
+        self._huella = hashlib.sha1(raw).hexdigest() if raw is not None else None
+        self._pending_ops = []
+        self._journal_ops = 0
+        self._snapshot_id = ""
+        self._sin_anotar = False
+        with self._estado_mutex:
+            self._en_vuelo = []
+            self._conflicto_async = False
+            self._generacion += 1
+        if raw is None:
             # Si no existe, nos aseguramos de crear la carpeta contenedora
             base_dir = os.path.dirname(self.path)
             if base_dir and not os.path.exists(base_dir):
                 os.makedirs(base_dir, exist_ok=True)
-            return json.loads(json.dumps(self.default_structure))
+            data = json.loads(json.dumps(self.default_structure))
+        else:
+            try:
+                if not self._formato_fijo:
+                    self.formato = detectar_formato(raw)
+                data = deserializar_json(raw)
+            except Exception:
+                # Si hay error, devolvemos copia del default
+                data = json.loads(json.dumps(self.default_structure))
+        if isinstance(data, dict):
+            self._snapshot_id = str(data.pop(self.SNAPSHOT_ID_KEY, "") or "")
+            self._abrir_historiales(data)
+            self._replay_journal(data)
+        self._sello = self._leer_sello()
+        return data
+
+    def _abrir_historiales(self, data: Dict) -> None:
+        """Sustituye en `data` las claves segmentadas por sus HistorialSegmentado."""
+        manifiesto = data.pop(self.SEGMENTS_KEY, None) or {}
+        self._historiales = {}
+        for clave in list(manifiesto) + [c for c in self.segmentar if c not in manifiesto]:
+            hist = HistorialSegmentado(self.historial_dir, clave, manifiesto.get(clave), self.formato)
+            previo = data.get(clave)
+            if isinstance(previo, list):
+                # Lista completa (fichero aún sin segmentar o backup restaurado)
+                hist.reemplazar(previo)
+            data[clave] = hist
+            self._historiales[clave] = hist
+        self._columnares = {}
+        for clave in self.columnar:
+            if clave not in self._historiales and isinstance(data.get(clave), list):
+                data[clave] = self._columnares[clave] = HistorialColumnar(data[clave])
+
+    @property
+    def _contenedores(self) -> Dict:
+        """Históricos que no son listas (por meses o por columnas)."""
+        return {**self._historiales, **self._columnares}
+
+    # ------------------------------------------------------------------
+    # Versión en disco y conflictos
+    # ------------------------------------------------------------------
+    def _leer_sello(self) -> Tuple:
+        """Versión y firma (fecha/tamaño de instantánea y journal) de lo que hay en disco."""
         try:
-            with open(self.path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            # Si hay error, devolvemos copia del default
-            return json.loads(json.dumps(self.default_structure))
+            with open(self.version_path, "r", encoding="utf-8") as f:
+                version = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            version = 0
+        firma = []
+        for ruta in (self.path, self.journal_path):
+            try:
+                st = os.stat(ruta)
+                firma.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                firma.append(None)
+        return (version, *firma)
+
+    def _marcar_version(self) -> None:
+        """Incrementa el sello de versión tras escribir (con el bloqueo tomado)."""
+        tmp = self.version_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(str(self._leer_sello()[0] + 1))
+        os.replace(tmp, self.version_path)
+        self._sello = self._leer_sello()
+
+    def _obsoleta(self) -> bool:
+        """La copia en memoria no parte de lo que hay ahora en disco."""
+        return self._conflicto_async or self._leer_sello() != self._sello
+
+    def _resolver_conflicto(self) -> List[Dict]:
+        """Aplica la política `conflictos` a una copia obsoleta (con el bloqueo tomado).
+
+        Con "fusionar" deja en memoria lo del disco más las mutaciones que
+        encajan (pendientes de escribir) y devuelve las que no, ya
+        descartadas, cada una con su motivo en "error".  Si no se puede
+        fusionar, descarta todo lo no escrito y lanza ConflictoVersion.
+        """
+        if self.conflictos == "sobrescribir":
+            with self._estado_mutex:
+                self._conflicto_async = False
+            return []
+        with self._estado_mutex:
+            en_vuelo = list(self._en_vuelo)
+        if self.conflictos == "rechazar" or self._sin_anotar or any(s for _, _, s in en_vuelo):
+            self._descartar_cambios()
+            raise ConflictoVersion(
+                f"{os.path.basename(self.path)} ha cambiado en disco (otro proceso o usuario) y los "
+                "cambios en memoria no se podían fusionar: no se han guardado y se han recargado los datos.")
+        ops = [json.loads(linea) for _, lineas, _ in en_vuelo for linea in lineas]
+        ops += [json.loads(linea) for linea in self._pending_ops]
+        fresco = self._cargar()
+        aplicadas, rechazadas = [], []
+        for rec in ops:
+            try:
+                aplicada = fusionar_op(fresco, rec)
+            except ConflictoVersion as e:
+                rechazadas.append(dict(rec, error=str(e)))
+                continue
+            if aplicada is not None:
+                aplicadas.append(aplicada)
+        self._reemplazar_en_sitio(fresco)
+        self._pending_ops = [json.dumps(rec, ensure_ascii=False, separators=(",", ":")) for rec in aplicadas]
+        if aplicadas:
+            print(f"ℹ️ {os.path.basename(self.path)} había cambiado en disco: "
+                  f"fusionados {len(aplicadas)} cambios pendientes.")
+        for fn in self._listeners:
+            fn(set(fresco))
+        return rechazadas
+
+    def _descartar_cambios(self) -> None:
+        """Vuelve a lo que hay en disco tirando lo no escrito (con el bloqueo tomado)."""
+        claves = set(self.data)
+        fresco = self._cargar()
+        self._reemplazar_en_sitio(fresco)
+        for fn in self._listeners:
+            fn(claves | set(fresco))
+
+    def _conflicto_rechazadas(self, rechazadas: List[Dict]) -> ConflictoVersion:
+        detalle = "; ".join(describir_op(r) for r in rechazadas)
+        return ConflictoVersion(
+            f"{os.path.basename(self.path)} había cambiado en disco (otro proceso o usuario) y no se ha "
+            f"aplicado: {detalle}. El resto de cambios se ha guardado y se ven los datos actuales.",
+            rechazadas)
+
+    def _reemplazar_en_sitio(self, nuevo: Dict, conservar=(), claves: Optional[Set[str]] = None) -> None:
+        """Vuelca `nuevo` en `self.data` sin cambiar sus contenedores (alias de las clases de dominio).
+
+        Con `claves`, solo se tocan esas secciones.
+        """
+        for clave in list(self.data):
+            if clave not in nuevo and clave not in conservar and (claves is None or clave in claves):
+                del self.data[clave]
+        for clave, valor in nuevo.items():
+            if claves is not None and clave not in claves:
+                continue
+            actual = self.data.get(clave)
+            if isinstance(actual, HistorialSegmentado) and isinstance(valor, HistorialSegmentado):
+                actual.adoptar(valor)
+                self._historiales[clave] = actual
+            elif isinstance(actual, HistorialColumnar) and isinstance(valor, (HistorialColumnar, list)):
+                if isinstance(valor, list):
+                    actual.reemplazar(valor)
+                else:
+                    actual.adoptar(valor)
+                self._columnares[clave] = actual
+            elif isinstance(actual, list) and isinstance(valor, list):
+                actual[:] = valor
+            elif isinstance(actual, dict) and isinstance(valor, dict):
+                actual.clear()
+                actual.update(valor)
+            else:
+                self.data[clave] = valor
+
+    def add_reload_listener(self, fn) -> None:
+        """Registra `fn(claves)` para cuando una recarga o fusión cambia secciones en sitio."""
+        self._listeners.append(fn)
+
+    def changed_on_disk(self) -> bool:
+        """Comprobación barata (sello de versión, fecha y tamaño) de si otro escribió el fichero."""
+        return self._leer_sello() != self._sello
+
+    def refresh(self) -> Set[str]:
+        """Recarga desde disco si el fichero cambió desde la última lectura/escritura.
+
+        Si solo cambió la fecha (misma huella SHA-1 y mismo journal) no se
+        reinterpreta nada.  Si no, se sustituyen en sitio únicamente las
+        secciones (claves de primer nivel) distintas, se avisa a los oyentes
+        de :meth:`add_reload_listener` y se devuelven sus nombres.  Con
+        cambios propios sin escribir se fusionan como en un conflicto.
+        """
+        if self._batch_depth:
+            return set()
+        self.flush()
+        with self._bloqueo:
+            sello = self._leer_sello()
+            if sello == self._sello and not self._conflicto_async:
+                return set()
+            if self._pending_ops or self._sin_anotar or self._en_vuelo or self._conflicto_async:
+                rechazadas = self._resolver_conflicto()
+                if rechazadas:
+                    raise self._conflicto_rechazadas(rechazadas)
+                return set(self.data)
+            raw = self._leer_bruto()
+            huella = hashlib.sha1(raw).hexdigest() if raw is not None else None
+            if huella == self._huella and sello[2] == self._sello[2]:
+                self._sello = sello
+                return set()
+            fresco = self._cargar(raw)
+            cambiadas = {k for k in set(fresco) | set(self.data)
+                         if not _misma_seccion(self.data.get(k), fresco.get(k))}
+            # Los históricos segmentados o en columnas se adoptan siempre (es
+            # barato: no lee meses ni copia columnas)
+            self._reemplazar_en_sitio(fresco, claves=cambiadas | set(self._contenedores))
+        if cambiadas:
+            for fn in self._listeners:
+                fn(cambiadas)
+        return cambiadas
+
+    # ------------------------------------------------------------------
+    # Versión de esquema
+    # ------------------------------------------------------------------
+    @property
+    def schema_version(self) -> int:
+        return int(self.data.get(self.SCHEMA_KEY, 0) or 0)
+
+    def migrate(self, migraciones: List[Tuple[int, Callable[[Dict], None]]]) -> List[int]:
+        """Aplica una sola vez, en orden, las migraciones posteriores a la versión del fichero.
+
+        Cada migración modifica `self.data` en sitio; al terminar se sella la
+        versión y se guarda una única vez, todo bajo el bloqueo del fichero.
+        Con el fichero al día no se recorre ningún dato.  Devuelve las
+        versiones aplicadas.
+        """
+        if not any(v > self.schema_version for v, _ in migraciones):
+            return []
+        self.flush()
+        aplicadas = []
+        with self._bloqueo:
+            # Otro puesto pudo migrar el fichero entre la carga y ahora
+            self.refresh()
+            for version, fn in sorted(migraciones, key=lambda m: m[0]):
+                if version > self.schema_version:
+                    fn(self.data)
+                    self.data[self.SCHEMA_KEY] = version
+                    aplicadas.append(version)
+            if aplicadas:
+                self.save()
+        self.flush()
+        return aplicadas
+
+    # ------------------------------------------------------------------
+    # Journal de mutaciones
+    # ------------------------------------------------------------------
+    def _replay_journal(self, data: Dict) -> None:
+        """Reaplica sobre `data` las mutaciones del journal de esta instantánea.
+
+        Un journal cuya cabecera no coincide con la instantánea es residuo de
+        una compactación ya completada (o de un backup restaurado) y se ignora.
+        Una última línea truncada (corte a mitad de escritura) también se ignora.
+        """
+        if not os.path.exists(self.journal_path):
+            return
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                cabecera = f.readline()
+                if not cabecera.strip() or not self._snapshot_id:
+                    return
+                if json.loads(cabecera).get("base") != self._snapshot_id:
+                    return
+                for linea in f:
+                    try:
+                        rec = json.loads(linea)
+                    except ValueError:
+                        break
+                    apply_journal_op(data, rec)
+                    self._journal_ops += 1
+        except Exception as e:
+            print(f"⚠️ No se pudo reaplicar el journal {self.journal_path}: {e}")
+
+    def record(self, op: str, path: Tuple, value=None, previo=_SIN_PREVIO) -> None:
+        """Anota una mutación ya aplicada sobre `self.data`.
+
+        - op="append": añade `value` a la lista en `path`.
+        - op="set": asigna `value` en `path` (crea diccionarios intermedios).
+        - op="setdefault": como "set", pero solo si la clave no existe.
+        - op="incr": suma `value` al número en `path` (movimientos de stock).
+        - op="consume": resta `value` al campo `path` de un elemento de lista
+          (la cantidad de un pendiente o de una orden) y, si no queda nada,
+          quita el elemento de la lista.
+        - op="del": elimina la clave/posición final de `path`.
+
+        `previo` es el valor anterior del elemento de lista tocado (o de la
+        clave, si la ruta no pasa por una lista); sirve para recolocar o
+        validar la mutación al fusionar con cambios de otro proceso.
+        "incr" y "consume" se fusionan aunque otro haya cambiado la cantidad.
+
+        El valor se serializa en el momento, de modo que cambios posteriores
+        del mismo objeto en memoria no alteran lo anotado.  Sin modo journal
+        y con ``conflictos="sobrescribir"`` no hace nada.
+        """
+        if not self.journal and self.conflictos == "sobrescribir":
+            return
+        rec = {"op": op, "path": list(path)}
+        if op != "del":
+            rec["value"] = value
+        if previo is not _SIN_PREVIO:
+            rec["prev"] = previo
+        self._pending_ops.append(json.dumps(rec, ensure_ascii=False, separators=(",", ":")))
+
+    def commit(self) -> None:
+        """Persiste las mutaciones anotadas con :meth:`record`.
+
+        En modo journal añade solo las líneas pendientes (coste proporcional
+        al movimiento) y compacta al superar `journal_max_ops`.  Sin modo
+        journal equivale a :meth:`save`, pero fusionable.
+        """
+        if self._batch_depth:
+            # Se escribe al cerrar el lote; sin journal, eso exige un save completo
+            self._batch_full = self._batch_full or not self.journal
+            return
+        if not self.journal:
+            self._guardar()
+            return
+        if not self._pending_ops and not self._conflicto_async:
+            return
+        # El journal se apoya en la instantánea: debe estar en disco antes
+        self.flush()
+        with self._bloqueo:
+            rechazadas = self._resolver_conflicto() if self._obsoleta() else []
+            if not self._snapshot_id or self._journal_ops + len(self._pending_ops) > self.journal_max_ops:
+                self._guardar()
+            elif self._pending_ops:
+                nuevo = not os.path.exists(self.journal_path)
+                with open(self.journal_path, "a", encoding="utf-8") as f:
+                    if nuevo:
+                        f.write(json.dumps({"base": self._snapshot_id}) + "\n")
+                    f.write("\n".join(self._pending_ops) + "\n")
+                self._journal_ops += len(self._pending_ops)
+                self._pending_ops.clear()
+                self._marcar_version()
+        if rechazadas:
+            raise self._conflicto_rechazadas(rechazadas)
+
+    def compact(self) -> None:
+        """Vuelca el journal sobre la instantánea (solo si hay journal en disco)."""
+        if self._pending_ops or os.path.exists(self.journal_path):
+            self._guardar()
+
+    def drop_journal(self) -> None:
+        """Descarta el journal en disco (p. ej. tras restaurar un backup encima)."""
+        self.flush()
+        with self._bloqueo:
+            self._pending_ops.clear()
+            self._journal_ops = 0
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+                self._marcar_version()
+
+    def export_snapshot(self, destino: str) -> None:
+        """Copia el estado persistido (journal incluido) a `destino` en JSON."""
+        self.compact()
+        self.flush()
+        if self._historiales:
+            # El backup debe ser autocontenido: los meses van dentro como listas
+            data = {k: (list(v) if isinstance(v, HistorialSegmentado) else v)
+                    for k, v in self.data.items()}
+            with open(destino, "wb") as f:
+                f.write(serializar_json(data, self.formato))
+            return
+        with self._bloqueo:
+            shutil.copy2(self.path, destino)
+
+    def import_snapshot(self, origen: str) -> None:
+        """Sustituye el estado persistido por el JSON `origen` y lo recarga.
+
+        Las clases de dominio mantienen alias a `self.data`: el llamante
+        debe reinstanciarlas tras importar.
+        """
+        # Que una escritura en segundo plano no pise lo importado
+        self.flush()
+        with self._bloqueo:
+            shutil.copyfile(origen, self.path)
+            self._marcar_version()
+            # El journal pertenecía al estado sobrescrito: se descarta
+            self.drop_journal()
+            self.data = self._cargar()
+
+    # ------------------------------------------------------------------
+    # Lotes
+    # ------------------------------------------------------------------
+    @contextmanager
+    def batch(self):
+        """Agrupa muchas mutaciones en una sola escritura.
+
+        Los lotes se pueden anidar; solo el más externo escribe o deshace.
+        Al empezar no se copia nada: hasta el final el lote no escribe, así
+        que para deshacerlo basta releer el disco (ver :meth:`_rollback_batch`).
+        """
+        if self._batch_depth == 0:
+            self._batch_previas = len(self._pending_ops)
+            self._batch_full = False
+        self._batch_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self._rollback_batch()
+            raise
+        self._batch_depth -= 1
+        if self._batch_depth == 0:
+            if self._batch_full:
+                self._guardar()
+            elif self._pending_ops:
+                self.commit()
+
+    @property
+    def dirty(self) -> bool:
+        """Hay cambios del lote en curso pendientes de escribir."""
+        return self._batch_full or bool(self._pending_ops)
+
+    def _rollback_batch(self) -> None:
+        """Vuelve al estado previo al lote sin romper los alias de las clases de dominio.
+
+        Se relee el disco, que el lote no ha tocado, y encima se reaplica lo
+        anotado antes del lote que aún no estaba escrito (incluido lo que el
+        hilo escritor no pudo escribir), que sigue pendiente.
+        """
+        previas = self._pending_ops[:self._batch_previas]
+        self._batch_full = False
+        if self._writer is not None:
+            # Lo entregado antes del lote se serializó sin los cambios del lote
+            self._writer.flush()
+        with self._estado_mutex:
+            previas = [linea for _, lineas, _ in self._en_vuelo for linea in lineas] + previas
+        claves = set(self.data)
+        with self._bloqueo:
+            fresco = self._cargar()
+        pendientes = []
+        for linea in previas:
+            try:
+                aplicada = fusionar_op(fresco, json.loads(linea))
+            except ConflictoVersion as e:
+                print(f"⚠️ Cambio descartado al deshacer el lote: {e}")
+                continue
+            if aplicada is not None:
+                pendientes.append(json.dumps(aplicada, ensure_ascii=False, separators=(",", ":")))
+        self._reemplazar_en_sitio(fresco)
+        self._pending_ops = pendientes
+        for fn in self._listeners:
+            fn(claves | set(fresco))
 
     def save(self) -> None:
-        """Guarda el diccionario actual en disco."""
-        with open(self.path, "w", encoding="utf-8") as f:
+        """Guarda el diccionario actual en disco (instantánea completa).
+
+        Sirve para cambios que no se han anotado con :meth:`record`; por eso,
+        si otro proceso ha escrito entretanto, no se fusiona sino que se
+        rechaza (salvo ``conflictos="sobrescribir"``).
+        """
+        self._sin_anotar = True
+        if self._batch_depth:
+            self._batch_full = True
+            return
+        self._guardar()
+
+    def _guardar(self) -> None:
+        """Escribe la instantánea completa bajo bloqueo, resolviendo antes un posible conflicto."""
+        with self._bloqueo:
+            rechazadas = self._resolver_conflicto() if self._obsoleta() else []
+            self._escribir_todo()
+        if rechazadas:
+            raise self._conflicto_rechazadas(rechazadas)
+
+    def _escribir_todo(self) -> None:
+        """Escribe la instantánea completa (con el bloqueo tomado y la copia al día)."""
+        payload = self.data
+        if self._historiales:
+            # Primero los meses (sobrescribir un mes es seguro: se recorta a
+            # lo que diga la instantánea); luego la instantánea con los conteos
+            payload = {k: v for k, v in self.data.items() if k not in self._historiales}
+            payload[self.SEGMENTS_KEY] = self._guardar_historiales()
+        if self.journal:
+            self._snapshot_id = uuid.uuid4().hex
+            payload = dict(payload)
+            payload[self.SNAPSHOT_ID_KEY] = self._snapshot_id
+        raw = serializar_json(payload, self.formato)
+        if self._writer is not None:
+            # Serializado aquí (los datos siguen cambiando); el disco lo toca el hilo escritor.
+            # Las mutaciones quedan "en vuelo" hasta que se escriban, por si hay que fusionar.
+            with self._estado_mutex:
+                self._seq += 1
+                self._en_vuelo.append((self._seq, self._pending_ops, self._sin_anotar))
+                seq, generacion = self._seq, self._generacion
+            self._pending_ops = []
+            self._journal_ops = 0
+            self._sin_anotar = False
+            self._writer.submit(raw, seq, generacion)
+            return
+        self._escribir_instantanea(raw)
+        self._pending_ops.clear()
+        self._journal_ops = 0
+        self._sin_anotar = False
+
+    def _escribir_instantanea(self, raw: bytes) -> None:
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(raw)
+        os.replace(tmp, self.path)
+        self._huella = hashlib.sha1(raw).hexdigest()
+        # La instantánea ya contiene todo lo anotado: el journal queda obsoleto
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._marcar_version()
+
+    def _escribir_en_segundo_plano(self, raw: bytes, seq: int, generacion: int) -> str:
+        """Lo ejecuta el hilo escritor: "ok", "conflicto" u "obsoleta"."""
+        with self._bloqueo:
+            if generacion != self._generacion:
+                # Hubo una recarga/fusión después: ya hay una instantánea más nueva
+                return "obsoleta"
+            if self._leer_sello() != self._sello:
+                with self._estado_mutex:
+                    self._conflicto_async = True
+                return "conflicto"
+            self._escribir_instantanea(raw)
+            with self._estado_mutex:
+                self._en_vuelo = [e for e in self._en_vuelo if e[0] > seq]
+            return "ok"
+
+    def _guardar_historiales(self) -> Dict[str, Dict[str, int]]:
+        manifiesto = {}
+        mes_actual = datetime.now().strftime("%Y-%m")
+        for clave, hist in self._historiales.items():
+            actual = self.data.get(clave)
+            if isinstance(actual, list):
+                # Alguien sustituyó la lista entera: se vuelve a repartir por meses
+                hist.reemplazar(actual)
+                self.data[clave] = hist
+            manifiesto[clave] = hist.guardar()
+            # Solo se queda en memoria el mes en curso (donde caen las altas)
+            hist.liberar(conservar=(mes_actual,))
+        return manifiesto
+
+    # ------------------------------------------------------------------
+    # Escritura en segundo plano
+    # ------------------------------------------------------------------
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Espera a que la instantánea pendiente esté en disco.
+
+        Si el hilo escritor encontró el fichero cambiado por otro proceso,
+        aquí se fusiona y se reintenta.  Devuelve False si vence `timeout`
+        o falla la escritura.  Sin modo asíncrono no hace nada.
+        """
+        if self._writer is None:
+            return True
+        ok = self._writer.flush(timeout)
+        if self._conflicto_async:
+            self._guardar()
+            ok = self._writer.flush(timeout)
+        return ok and not self._conflicto_async
+
+    def write_stats(self) -> Dict:
+        """Métricas del escritor en segundo plano (pendiente, agrupadas, errores...)."""
+        if self._writer is None:
+            return {"asincrono": False}
+        return self._writer.stats()
+
+
+class _SnapshotWriter:
+    """Hilo escritor de instantáneas de una DataStore.
+
+    Solo guarda la última instantánea recibida: las anteriores aún no
+    escritas se descartan (agrupación).  Escribe cuando pasa
+    ``COALESCE_DELAY`` sin instantáneas nuevas o cuando la más antigua
+    pendiente alcanza ``max_staleness``.  El hilo se arranca al recibir
+    trabajo y termina cuando no queda nada pendiente.
+    """
+
+    COALESCE_DELAY = 0.25
+
+    def __init__(self, store: DataStore, max_staleness: float):
+        self.store = store
+        self.path = store.path
+        self.max_staleness = max(float(max_staleness), 0.0)
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._payload: Optional[Tuple[bytes, int, int]] = None
+        self._primera = 0.0        # instante de la instantánea pendiente más antigua
+        self._ultima = 0.0         # instante de la última instantánea recibida
+        self._escribiendo = False
+        self._urgentes = 0         # llamadas a flush() esperando
+        self._solicitadas = 0
+        self._escritas = 0
+        self._agrupadas = 0
+        self._conflictos = 0
+        self._errores = 0
+        self._ultimo_error = ""
+        self._ultima_escritura: Optional[float] = None
+        self._duracion_ultima = 0.0
+        _ESCRITORES.add(self)
+
+    def submit(self, raw: bytes, seq: int, generacion: int) -> None:
+        with self._cond:
+            ahora = time.monotonic()
+            if self._payload is None:
+                self._primera = ahora
+            else:
+                self._agrupadas += 1
+            self._payload = (raw, seq, generacion)
+            self._ultima = ahora
+            self._solicitadas += 1
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name=f"DataStore-writer:{os.path.basename(self.path)}", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if self._payload is None:
+                    self._thread = None
+                    return
+                # Agrupa ráfagas sin superar la antigüedad máxima
+                while not self._urgentes:
+                    limite = min(self._ultima + self.COALESCE_DELAY, self._primera + self.max_staleness)
+                    espera = limite - time.monotonic()
+                    if espera <= 0:
+                        break
+                    self._cond.wait(espera)
+                payload, self._payload = self._payload, None
+                self._escribiendo = True
+            inicio = time.monotonic()
+            error = ""
+            try:
+                resultado = self.store._escribir_en_segundo_plano(*payload)
+            except Exception as e:
+                resultado = "error"
+                error = str(e)
+                print(f"❌ Error guardando {self.path} en segundo plano: {e}")
+            if resultado == "conflicto":
+                print(f"⚠️ {self.path} cambió en disco: se fusionará en la próxima escritura.")
+            with self._cond:
+                self._escribiendo = False
+                self._duracion_ultima = time.monotonic() - inicio
+                if resultado == "ok":
+                    self._escritas += 1
+                    self._ultima_escritura = time.time()
+                elif resultado == "conflicto":
+                    self._conflictos += 1
+                elif resultado == "error":
+                    self._errores += 1
+                    self._ultimo_error = error
+                self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        with self._cond:
+            errores = self._errores
+            self._urgentes += 1
+            self._cond.notify_all()
+            try:
+                ok = self._cond.wait_for(lambda: self._payload is None and not self._escribiendo, timeout)
+            finally:
+                self._urgentes -= 1
+            return ok and self._errores == errores
+
+    def stats(self) -> Dict:
+        with self._cond:
+            pendiente = self._payload is not None
+            return {
+                "asincrono": True,
+                "pendiente": pendiente or self._escribiendo,
+                "antiguedad_pendiente": round(time.monotonic() - self._primera, 3) if pendiente else 0.0,
+                "solicitadas": self._solicitadas,
+                "escritas": self._escritas,
+                "agrupadas": self._agrupadas,
+                "conflictos": self._conflictos,
+                "errores": self._errores,
+                "ultimo_error": self._ultimo_error,
+                "ultima_escritura": (datetime.fromtimestamp(self._ultima_escritura).isoformat(timespec="seconds")
+                                     if self._ultima_escritura else None),
+                "duracion_ultima": round(self._duracion_ultima, 3),
+            }
+
+
+# Escritores vivos, para volcarlos al salir (atexit, en el proceso que importa el gestor)
+_ESCRITORES: "weakref.WeakSet[_SnapshotWriter]" = weakref.WeakSet()
+
+
+def flush_pending_writes(timeout: Optional[float] = None, path: Optional[str] = None) -> bool:
+    """Vuelca las instantáneas pendientes de todos los escritores (o solo los de `path`)."""
+    ok = True
+    destino = os.path.abspath(path) if path else None
+    for escritor in list(_ESCRITORES):
+        if destino and os.path.abspath(escritor.path) != destino:
+            continue
+        try:
+            ok = escritor.store.flush(timeout) and ok
+        except ConflictoVersion as e:
+            print(f"❌ {e}")
+            ok = False
+    return ok
+
+
+atexit.register(flush_pending_writes, 30.0)
+
+
+def apply_journal_op(data: Dict, rec: Dict) -> None:
+    """Aplica un registro de journal ({op, path, value}) sobre `data`."""
+    op, path = rec["op"], rec["path"]
+    if op == "consume":
+        lista = data
+        for k in path[:-2]:
+            lista = lista[k]
+        i, campo = path[-2], path[-1]
+        restante = lista[i].get(campo, 0) - rec["value"]
+        if restante > 0:
+            lista[i][campo] = restante
+        else:
+            lista.pop(i)
+        return
+    target = data
+    for k in path[:-1]:
+        target = target.setdefault(k, {}) if isinstance(target, dict) else target[k]
+    last = path[-1]
+    if op == "append":
+        lista = target.setdefault(last, []) if isinstance(target, dict) else target[last]
+        lista.append(rec["value"])
+    elif op == "set":
+        target[last] = rec["value"]
+    elif op == "setdefault":
+        if last not in target:
+            target[last] = rec["value"]
+    elif op == "incr":
+        target[last] = (target.get(last, 0) if isinstance(target, dict) else target[last]) + rec["value"]
+    elif op == "del":
+        if isinstance(target, dict):
+            target.pop(last, None)
+        else:
+            target.pop(last)
+
+
+def _misma_seccion(actual, nueva) -> bool:
+    if isinstance(actual, HistorialSegmentado) and isinstance(nueva, HistorialSegmentado):
+        return actual._conteos == nueva._conteos
+    return actual == nueva
+
+
+def _valor_en(data, path, defecto=None):
+    actual = data
+    for k in path:
+        try:
+            actual = actual[k]
+        except (KeyError, IndexError, TypeError):
+            return defecto
+    return actual
+
+
+def fusionar_op(data: Dict, rec: Dict) -> Optional[Dict]:
+    """Reaplica `rec` sobre un estado más reciente que aquel en que se anotó.
+
+    "append", "incr" y "setdefault" se aplican siempre.  Con ``prev``, la
+    posición de lista se recoloca buscando el elemento anotado, y un
+    "set"/"del" sin lista exige que el valor actual siga siendo el previo
+    (o ya sea el nuevo).  "consume"/"incr" sobre un elemento de lista
+    también lo reconocen aunque otro haya cambiado ese mismo campo (la
+    cantidad).  Borrar lo que ya no existe, o un contenedor vacío (``prev``
+    [] o {}) que otro ha vuelto a llenar, se omite.  Devuelve el registro tal
+    y como se aplicó (None si se omitió); si no encaja lanza ConflictoVersion.
+    """
+    path = list(rec["path"])
+    if "prev" in rec:
+        previo = rec["prev"]
+        k = next((i for i, p in enumerate(path) if isinstance(p, int)), None)
+        if k is not None:
+            lista = _valor_en(data, path[:k])
+            if not isinstance(lista, (list, HistorialColumnar)):
+                lista = []
+            i = path[k]
+            if not (0 <= i < len(lista) and lista[i] == previo):
+                j = next((j for j, x in enumerate(lista) if x == previo), None)
+                if j is None and rec["op"] in ("consume", "incr") and len(path) == k + 2:
+                    campo = path[k + 1]
+                    resto = {c: v for c, v in previo.items() if c != campo}
+                    candidatas = ([i] if 0 <= i < len(lista) else []) + list(range(len(lista)))
+                    j = next((j for j in candidatas if isinstance(lista[j], dict)
+                              and {c: v for c, v in lista[j].items() if c != campo} == resto), None)
+                if j is None:
+                    raise ConflictoVersion(f"{'/'.join(map(str, path[:k + 1]))} ya no existe o lo cambió otro")
+                path[k] = j
+        else:
+            actual = _valor_en(data, path)
+            if rec["op"] == "del" and (actual is None or (previo in ([], {}) and actual != previo)):
+                return None
+            if actual != previo and not (rec["op"] == "set" and actual == rec.get("value")):
+                raise ConflictoVersion(f"{'/'.join(map(str, path))} lo cambió otro ({previo} → {actual})")
+    rec = dict(rec, path=path)
+    apply_journal_op(data, rec)
+    return rec
+
+
+def describir_op(rec: Dict) -> str:
+    """Descripción legible de una mutación anotada, para avisar de las que no se aplicaron."""
+    path = list(rec.get("path") or [])
+    elem = next((v for v in (rec.get("prev"), rec.get("value")) if isinstance(v, dict)), {})
+    clave = path[0] if path else ""
+    if clave == "pedidos":
+        return (f"pendiente {elem.get('modelo', '')} T{elem.get('talla', '')} "
+                f"pedido {elem.get('pedido', '')}").strip()
+    if clave == "pedidos_fabricacion" and len(path) > 1:
+        talla = f" T{elem['talla']}" if elem.get("talla") else ""
+        return f"orden de fabricación {path[1]}{talla}"
+    if clave == "almacen" and len(path) > 2:
+        return f"stock {path[1]} T{path[2]}"
+    if clave in ("historial_entradas", "historial_salidas") and elem:
+        tipo = "entrada" if clave == "historial_entradas" else "salida"
+        return f"{tipo} {elem.get('modelo', '')} T{elem.get('talla', '')} ({elem.get('cantidad', '')} uds)"
+    if clave == "info_modelos" and len(path) > 1:
+        return f"ficha del modelo {path[1]}"
+    return "/".join(map(str, path))
+
+
+def commit_conjunto(stores, que: str = "") -> None:
+    """Persiste varias stores como una unidad frente a cambios concurrentes.
+
+    Con los bloqueos de todas tomados (siempre en el orden dado), primero
+    se fusiona en cada una lo que otro proceso haya escrito.  Si alguna
+    mutación ya no encaja, se descarta lo no escrito de todas, se recargan
+    del disco y se lanza ConflictoVersion indicando `que` no se ha aplicado
+    (lo que se ve ya es el estado real; no hay que repetirlo a ciegas).
+    Dentro de un lote solo se difiere, como en :meth:`DataStore.commit`.
+
+    Con escritura en segundo plano no se espera al hilo escritor: lo que
+    tenga aún sin escribir se fusiona junto con el movimiento (ver
+    :meth:`DataStore._resolver_conflicto`) y la instantánea se le entrega
+    sin bloquear.
+    """
+    stores = list(stores)
+    if any(ds._batch_depth for ds in stores):
+        for ds in stores:
+            ds.commit()
+        return
+    # En modo journal la instantánea debe estar en disco antes de añadir
+    # líneas, y el hilo escritor necesita el bloqueo: se le espera fuera
+    for ds in stores:
+        if ds.journal:
+            ds.flush()
+    with ExitStack() as stack:
+        for ds in stores:
+            stack.enter_context(ds._bloqueo)
+        rechazadas: List[Dict] = []
+        fusionable = True
+        try:
+            for ds in stores:
+                if ds._obsoleta():
+                    rechazadas += ds._resolver_conflicto()
+        except ConflictoVersion:
+            fusionable = False
+        if rechazadas or not fusionable:
+            for ds in stores:
+                ds._descartar_cambios()
+            raise ConflictoVersion(
+                f"No se ha aplicado {que or 'el cambio'}: otro proceso o usuario había modificado "
+                "los mismos datos. Se han recargado los datos de disco; revisa el estado actual.",
+                rechazadas)
+        for ds in stores:
+            ds.commit()
+
+
+class SQLiteDataStore(DataStore):
+    """Variante de DataStore respaldada por un fichero SQLite local.
+
+    Inventario y previsión comparten el mismo fichero; `ambito` distingue
+    las tablas/filas de cada uno donde hay solapamiento (info_modelos y
+    claves sueltas en `meta`).  En memoria se mantiene la misma estructura
+    de diccionarios que con JSON, de modo que Inventory y Prevision no
+    cambian; lo que cambia es la persistencia:
+
+    - :meth:`commit` traduce cada mutación anotada con :meth:`record` a
+      INSERT/UPDATE/DELETE de filas sueltas (siempre activo aquí).
+    - :meth:`save` reescribe todas las tablas del ámbito (solo para rutas
+      que no anotan sus cambios).
+    - Las consultas de histórico filtradas por modelo/fecha se resuelven
+      con índices (:meth:`query_history`, :meth:`query_pendings`).
+    - :meth:`refresh` solo relee las secciones que otra conexión cambió:
+      unos triggers cuentan los cambios por sección en la tabla `cambios`
+      y lo escrito por la propia store no cuenta como ajeno.
+
+    Al abrir se leen todas las secciones del ámbito (Inventory y Prevision
+    trabajan sobre la estructura completa en memoria).
+    """
+
+    # Claves con tabla propia; el resto se guardan como JSON en `meta`
+    LIST_TABLES = {
+        "historial_entradas": ("modelo", "talla", "cantidad", "fecha"),
+        "historial_salidas": ("modelo", "talla", "cantidad", "fecha", "pedido", "albaran"),
+        "pedidos": ("modelo", "talla", "cantidad", "fecha", "pedido"),
+    }
+    TABLES = set(LIST_TABLES) | {"almacen", "pedidos_fabricacion", "info_modelos"}
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS almacen_modelos (modelo TEXT PRIMARY KEY);
+        CREATE TABLE IF NOT EXISTS almacen (
+            modelo TEXT NOT NULL, talla TEXT NOT NULL, cantidad INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (modelo, talla));
+        CREATE TABLE IF NOT EXISTS historial_entradas (
+            id INTEGER PRIMARY KEY, modelo TEXT, talla TEXT, cantidad INTEGER, fecha TEXT,
+            datos TEXT NOT NULL);
+        CREATE INDEX IF NOT EXISTS ix_entradas_modelo ON historial_entradas (modelo, talla);
+        CREATE INDEX IF NOT EXISTS ix_entradas_fecha ON historial_entradas (fecha);
+        CREATE TABLE IF NOT EXISTS historial_salidas (
+            id INTEGER PRIMARY KEY, modelo TEXT, talla TEXT, cantidad INTEGER, fecha TEXT,
+            pedido TEXT, albaran TEXT, datos TEXT NOT NULL);
+        CREATE INDEX IF NOT EXISTS ix_salidas_modelo ON historial_salidas (modelo, talla, pedido, albaran);
+        CREATE INDEX IF NOT EXISTS ix_salidas_fecha ON historial_salidas (fecha);
+        CREATE TABLE IF NOT EXISTS pedidos (
+            id INTEGER PRIMARY KEY, modelo TEXT, talla TEXT, cantidad INTEGER, fecha TEXT,
+            pedido TEXT, datos TEXT NOT NULL);
+        CREATE INDEX IF NOT EXISTS ix_pedidos_clave ON pedidos (modelo, talla, pedido);
+        CREATE TABLE IF NOT EXISTS pedidos_fabricacion (
+            id INTEGER PRIMARY KEY, modelo TEXT NOT NULL, talla TEXT, cantidad INTEGER, fecha TEXT,
+            datos TEXT NOT NULL);
+        CREATE INDEX IF NOT EXISTS ix_fabricacion_clave ON pedidos_fabricacion (modelo, talla, fecha);
+        CREATE TABLE IF NOT EXISTS info_modelos (
+            ambito TEXT NOT NULL, modelo TEXT NOT NULL, datos TEXT NOT NULL,
+            PRIMARY KEY (ambito, modelo));
+        CREATE TABLE IF NOT EXISTS meta (
+            ambito TEXT NOT NULL, clave TEXT NOT NULL, valor TEXT NOT NULL,
+            PRIMARY KEY (ambito, clave));
+        CREATE TABLE IF NOT EXISTS cambios (seccion TEXT PRIMARY KEY, n INTEGER NOT NULL);
+    """
+    # Sección que cuenta los cambios de cada tabla (ver `cambios`); {f} es NEW u OLD
+    SECCIONES = {
+        "almacen_modelos": "'almacen'",
+        "almacen": "'almacen'",
+        "historial_entradas": "'historial_entradas'",
+        "historial_salidas": "'historial_salidas'",
+        "pedidos": "'pedidos'",
+        "pedidos_fabricacion": "'pedidos_fabricacion'",
+        "info_modelos": "'info_modelos/' || {f}.ambito",
+        "meta": "'meta/' || {f}.ambito",
+    }
+
+    def __init__(self, path: str, default_structure: Dict, ambito: str):
+        self.ambito = ambito
+        base_dir = os.path.dirname(path)
+        if base_dir and not os.path.exists(base_dir):
+            os.makedirs(base_dir, exist_ok=True)
+        # Streamlit ejecuta cada rerun en un hilo distinto
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(self.SCHEMA + "".join(
+            f"CREATE TRIGGER IF NOT EXISTS cambios_{tabla}_{evento.lower()} AFTER {evento} ON {tabla} "
+            f"BEGIN INSERT INTO cambios (seccion, n) VALUES ({seccion.format(f=fila)}, 1) "
+            "ON CONFLICT (seccion) DO UPDATE SET n = n + 1; END;\n"
+            for tabla, seccion in self.SECCIONES.items()
+            for evento, fila in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD"))))
+        # Cambios por sección ya vistos por esta store (leídos o escritos por ella)
+        self._vistos: Dict[str, int] = {}
+        # ids de fila alineados con las listas en memoria
+        self._ids: Dict[str, List[int]] = {}
+        self._ids_fab: Dict[str, List[int]] = {}
+        # SQLite ya serializa las escrituras entre procesos y los movimientos de
+        # stock son incrementos por fila: no hace falta el sello de versión
+        super().__init__(path, default_structure, journal=True, conflictos="sobrescribir")
+
+    # ------------------------------------------------------------------
+    # Carga
+    # ------------------------------------------------------------------
+    def _tables(self) -> List[str]:
+        return [k for k in self.default_structure if k in self.TABLES]
+
+    def _seccion(self, clave: str) -> str:
+        if clave == "info_modelos":
+            return f"info_modelos/{self.ambito}"
+        return clave if clave in self.TABLES else f"meta/{self.ambito}"
+
+    def _leer_cambios(self) -> Dict[str, int]:
+        return dict(self._conn.execute("SELECT seccion, n FROM cambios"))
+
+    def load(self) -> Dict:
+        self._pending_ops = []
+        self._ids, self._ids_fab = {}, {}
+        # Cambia cuando otra conexión (otro proceso o la otra store) confirma cambios
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        # Antes que los datos: si alguien escribe entre medias, se releerá
+        self._vistos = self._leer_cambios()
+        data = json.loads(json.dumps(self.default_structure))
+        data.update(self._leer_secciones(self._tables(), meta=True))
+        return data
+
+    def _cargar(self, raw: Optional[bytes] = None) -> Dict:
+        return self.load()
+
+    def _leer_secciones(self, tablas, meta: bool) -> Dict:
+        """Lee de la base las `tablas` indicadas (y con `meta`, las claves sueltas del ámbito)."""
+        c = self._conn
+        data: Dict = {}
+        for clave in tablas:
+            if clave == "almacen":
+                almacen: Dict[str, Dict] = {}
+                for (m,) in c.execute("SELECT modelo FROM almacen_modelos ORDER BY rowid"):
+                    almacen[m] = {}
+                for m, t, q in c.execute("SELECT modelo, talla, cantidad FROM almacen ORDER BY rowid"):
+                    almacen.setdefault(m, {})[t] = q
+                data[clave] = almacen
+            elif clave == "pedidos_fabricacion":
+                fab: Dict[str, List[Dict]] = {}
+                self._ids_fab = {}
+                for rid, m, datos in c.execute(
+                        "SELECT id, modelo, datos FROM pedidos_fabricacion ORDER BY id"):
+                    fab.setdefault(m, []).append(json.loads(datos))
+                    self._ids_fab.setdefault(m, []).append(rid)
+                data[clave] = fab
+            elif clave == "info_modelos":
+                data[clave] = {
+                    m: json.loads(datos) for m, datos in c.execute(
+                        "SELECT modelo, datos FROM info_modelos WHERE ambito = ? ORDER BY rowid",
+                        (self.ambito,))
+                }
+            else:
+                filas = c.execute(f"SELECT id, datos FROM {clave} ORDER BY id").fetchall()
+                data[clave] = [json.loads(datos) for _, datos in filas]
+                self._ids[clave] = [rid for rid, _ in filas]
+        if meta:
+            data.update(json.loads(json.dumps({k: v for k, v in self.default_structure.items()
+                                               if k not in self.TABLES})))
+            # La versión de esquema la da `meta`; una base sin ella se migra desde el principio
+            data.pop(self.SCHEMA_KEY, None)
+            for clave, valor in c.execute("SELECT clave, valor FROM meta WHERE ambito = ?", (self.ambito,)):
+                data[clave] = json.loads(valor)
+        return data
+
+    def refresh(self) -> Set[str]:
+        """Como :meth:`DataStore.refresh`, releyendo solo las secciones que otro cambió.
+
+        ``PRAGMA data_version`` dice si otra conexión confirmó algo; la tabla
+        `cambios`, en qué secciones.  Las escrituras de la otra store del
+        mismo fichero (otro ámbito) no provocan ninguna relectura.
+        """
+        if self._batch_depth or self._pending_ops:
+            return set()
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return set()
+        self._data_version = version
+        cambios = self._leer_cambios()
+        tablas = [k for k in self._tables()
+                  if cambios.get(self._seccion(k), 0) != self._vistos.get(self._seccion(k), 0)]
+        seccion_meta = self._seccion(self.SCHEMA_KEY)
+        meta = cambios.get(seccion_meta, 0) != self._vistos.get(seccion_meta, 0)
+        if not tablas and not meta:
+            return set()
+        self._vistos = cambios
+        fresco = self._leer_secciones(tablas, meta)
+        leidas = set(fresco) | (set(self.data) - self.TABLES if meta else set())
+        cambiadas = {k for k in leidas if self.data.get(k) != fresco.get(k)}
+        self._reemplazar_en_sitio(fresco, claves=cambiadas)
+        if cambiadas:
+            for fn in self._listeners:
+                fn(cambiadas)
+        return cambiadas
+
+    # ------------------------------------------------------------------
+    # Escritura
+    # ------------------------------------------------------------------
+    def commit(self) -> None:
+        """Traduce las mutaciones anotadas a sentencias sobre filas sueltas."""
+        if self._batch_depth or not self._pending_ops:
+            return
+        with self._transaccion():
+            for linea in self._pending_ops:
+                self._apply_sql(json.loads(linea))
+        self._pending_ops.clear()
+
+    @contextmanager
+    def _transaccion(self):
+        """Transacción de escritura; lo escrito en ella no cuenta como cambio ajeno en :meth:`refresh`."""
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            antes = self._leer_cambios()
+            yield
+            despues = self._leer_cambios()
+        for seccion, n in despues.items():
+            # Si otro había escrito la sección desde la última lectura, sigue pendiente de releer
+            if antes.get(seccion, 0) == self._vistos.get(seccion, 0):
+                self._vistos[seccion] = n
+
+    def compact(self) -> None:
+        self.commit()
+
+    def drop_journal(self) -> None:
+        self._pending_ops.clear()
+
+    def _guardar(self) -> None:
+        """Reescribe todas las tablas del ámbito desde memoria."""
+        self._pending_ops.clear()
+        self._sin_anotar = False
+        with self._transaccion():
+            for clave in self._tables():
+                self._rewrite(clave)
+            self._conn.execute("DELETE FROM meta WHERE ambito = ?", (self.ambito,))
+            for clave, valor in self.data.items():
+                if clave not in self.TABLES:
+                    self._write_meta(clave)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def export_snapshot(self, destino: str) -> None:
+        self.commit()
+        with open(destino, "w", encoding="utf-8") as f:
             json.dump(self.data, f, indent=4, ensure_ascii=False)
 
+    def import_snapshot(self, origen: str) -> None:
+        data = leer_json(origen)
+        data.pop(self.SNAPSHOT_ID_KEY, None)
+        self.data = data
+        self.save()
+        self.data = self.load()
+
+    def _write_meta(self, clave: str) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO meta (ambito, clave, valor) VALUES (?, ?, ?)",
+            (self.ambito, clave, json.dumps(self.data.get(clave), ensure_ascii=False)))
+
+    def _insert_row(self, tabla: str, fila: Dict, modelo: Optional[str] = None) -> int:
+        datos = json.dumps(fila, ensure_ascii=False)
+        if tabla == "pedidos_fabricacion":
+            cur = self._conn.execute(
+                "INSERT INTO pedidos_fabricacion (modelo, talla, cantidad, fecha, datos) VALUES (?, ?, ?, ?, ?)",
+                (modelo, fila.get("talla"), fila.get("cantidad"), fila.get("fecha"), datos))
+        else:
+            cols = self.LIST_TABLES[tabla]
+            cur = self._conn.execute(
+                f"INSERT INTO {tabla} ({', '.join(cols)}, datos) VALUES ({', '.join('?' * (len(cols) + 1))})",
+                tuple(fila.get(k) for k in cols) + (datos,))
+        return cur.lastrowid
+
+    def _update_row(self, tabla: str, rid: int, fila: Dict) -> None:
+        cols = self.LIST_TABLES.get(tabla, ("talla", "cantidad", "fecha"))
+        self._conn.execute(
+            f"UPDATE {tabla} SET {', '.join(k + ' = ?' for k in cols)}, datos = ? WHERE id = ?",
+            tuple(fila.get(k) for k in cols) + (json.dumps(fila, ensure_ascii=False), rid))
+
+    def _update_field(self, tabla: str, rid: int, campo: str, valor) -> None:
+        row = self._conn.execute(f"SELECT datos FROM {tabla} WHERE id = ?", (rid,)).fetchone()
+        fila = json.loads(row[0]) if row else {}
+        fila[campo] = valor
+        self._update_row(tabla, rid, fila)
+
+    def _consume_field(self, tabla: str, ids: List[int], i: int, campo: str, valor) -> None:
+        """Resta `valor` al campo de la fila i-ésima (según `ids`) y la borra si no queda nada."""
+        rid = ids[i]
+        row = self._conn.execute(f"SELECT datos FROM {tabla} WHERE id = ?", (rid,)).fetchone()
+        fila = json.loads(row[0]) if row else {}
+        restante = fila.get(campo, 0) - valor
+        if restante > 0:
+            fila[campo] = restante
+            self._update_row(tabla, rid, fila)
+        else:
+            self._conn.execute(f"DELETE FROM {tabla} WHERE id = ?", (ids.pop(i),))
+
+    def _rewrite(self, clave: str) -> None:
+        """Reescribe una clave completa desde memoria (fallback genérico)."""
+        c = self._conn
+        valor = self.data.get(clave)
+        if clave == "almacen":
+            c.execute("DELETE FROM almacen")
+            c.execute("DELETE FROM almacen_modelos")
+            for m, tallas in (valor or {}).items():
+                self._write_almacen_model(m, tallas)
+        elif clave == "info_modelos":
+            c.execute("DELETE FROM info_modelos WHERE ambito = ?", (self.ambito,))
+            for m, info in (valor or {}).items():
+                self._write_info(m, info)
+        elif clave == "pedidos_fabricacion":
+            c.execute("DELETE FROM pedidos_fabricacion")
+            self._ids_fab = {}
+            for m, items in (valor or {}).items():
+                self._ids_fab[m] = [self._insert_row(clave, it, m) for it in items]
+        elif clave in self.LIST_TABLES:
+            c.execute(f"DELETE FROM {clave}")
+            self._ids[clave] = [self._insert_row(clave, fila) for fila in (valor or [])]
+        else:
+            self._write_meta(clave)
+
+    def _write_almacen_model(self, modelo: str, tallas: Dict) -> None:
+        self._conn.execute("INSERT OR IGNORE INTO almacen_modelos (modelo) VALUES (?)", (modelo,))
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO almacen (modelo, talla, cantidad) VALUES (?, ?, ?)",
+            [(modelo, t, q) for t, q in (tallas or {}).items()])
+
+    def _write_info(self, modelo: str, info: Dict) -> None:
+        self._conn.execute(
+            "INSERT INTO info_modelos (ambito, modelo, datos) VALUES (?, ?, ?) "
+            "ON CONFLICT (ambito, modelo) DO UPDATE SET datos = excluded.datos",
+            (self.ambito, modelo, json.dumps(info, ensure_ascii=False)))
+
+    def _apply_sql(self, rec: Dict) -> None:
+        """Traduce un registro {op, path, value} a SQL manteniendo los ids alineados."""
+        op, path = rec["op"], rec["path"]
+        valor = rec.get("value")
+        clave, resto = path[0], path[1:]
+        c = self._conn
+        if clave not in self.TABLES:
+            if op == "del" and not resto:
+                c.execute("DELETE FROM meta WHERE ambito = ? AND clave = ?", (self.ambito, clave))
+            else:
+                self._write_meta(clave)
+        elif not resto:
+            if op == "append" and clave in self.LIST_TABLES:
+                self._ids.setdefault(clave, []).append(self._insert_row(clave, valor))
+            else:
+                self._rewrite(clave)
+        elif clave == "almacen":
+            m = resto[0]
+            if len(resto) == 1:
+                if op == "setdefault":
+                    if c.execute("INSERT OR IGNORE INTO almacen_modelos (modelo) VALUES (?)", (m,)).rowcount:
+                        self._write_almacen_model(m, valor)
+                    return
+                c.execute("DELETE FROM almacen WHERE modelo = ?", (m,))
+                if op == "del":
+                    c.execute("DELETE FROM almacen_modelos WHERE modelo = ?", (m,))
+                else:
+                    self._write_almacen_model(m, valor)
+            elif op == "del":
+                c.execute("DELETE FROM almacen WHERE modelo = ? AND talla = ?", (m, resto[1]))
+            elif op == "incr":
+                # Suma en la fila: dos procesos que mueven stock a la vez no se pisan
+                c.execute("INSERT OR IGNORE INTO almacen_modelos (modelo) VALUES (?)", (m,))
+                c.execute("INSERT INTO almacen (modelo, talla, cantidad) VALUES (?, ?, ?) "
+                          "ON CONFLICT (modelo, talla) DO UPDATE SET cantidad = cantidad + excluded.cantidad",
+                          (m, resto[1], valor))
+            else:
+                self._write_almacen_model(m, {resto[1]: valor})
+        elif clave == "info_modelos":
+            m = resto[0]
+            if op == "del":
+                c.execute("DELETE FROM info_modelos WHERE ambito = ? AND modelo = ?", (self.ambito, m))
+            elif op == "setdefault" and len(resto) == 1:
+                c.execute("INSERT INTO info_modelos (ambito, modelo, datos) VALUES (?, ?, ?) "
+                          "ON CONFLICT (ambito, modelo) DO NOTHING",
+                          (self.ambito, m, json.dumps(valor, ensure_ascii=False)))
+            elif len(resto) == 1:
+                self._write_info(m, valor)
+            else:
+                row = c.execute("SELECT datos FROM info_modelos WHERE ambito = ? AND modelo = ?",
+                                (self.ambito, m)).fetchone()
+                info = json.loads(row[0]) if row else {}
+                if op != "setdefault" or resto[1] not in info:
+                    info[resto[1]] = valor
+                self._write_info(m, info)
+        elif clave == "pedidos_fabricacion":
+            m = resto[0]
+            ids = self._ids_fab.setdefault(m, [])
+            if len(resto) == 1:
+                if op == "append":
+                    ids.append(self._insert_row(clave, valor, m))
+                else:
+                    c.execute("DELETE FROM pedidos_fabricacion WHERE modelo = ?", (m,))
+                    self._ids_fab[m] = [self._insert_row(clave, it, m) for it in (valor or [])] \
+                        if op == "set" else []
+            else:
+                i = resto[1]
+                if op == "del":
+                    c.execute("DELETE FROM pedidos_fabricacion WHERE id = ?", (ids.pop(i),))
+                elif op == "consume":
+                    self._consume_field(clave, ids, i, resto[2], valor)
+                elif len(resto) == 2:
+                    self._update_row(clave, ids[i], valor)
+                else:
+                    self._update_field(clave, ids[i], resto[2], valor)
+        else:
+            ids = self._ids.setdefault(clave, [])
+            i = resto[0]
+            if op == "del":
+                c.execute(f"DELETE FROM {clave} WHERE id = ?", (ids.pop(i),))
+            elif op == "consume":
+                self._consume_field(clave, ids, i, resto[1], valor)
+            elif len(resto) == 1:
+                self._update_row(clave, ids[i], valor)
+            else:
+                self._update_field(clave, ids[i], resto[1], valor)
+
+    # ------------------------------------------------------------------
+    # Consultas indexadas
+    # ------------------------------------------------------------------
+    def query_history(self, clave: str, modelo: Optional[str] = None, talla: Optional[str] = None,
+                      desde: Optional[str] = None, hasta: Optional[str] = None) -> List[Dict]:
+        """Filas de `clave` (historial_entradas/historial_salidas) filtradas por índice."""
+        conds, args = [], []
+        for col, val in (("modelo", modelo), ("talla", talla)):
+            if val is not None:
+                conds.append(f"{col} = ?")
+                args.append(val)
+        if desde:
+            conds.append("fecha >= ?")
+            args.append(desde)
+        if hasta:
+            conds.append("fecha <= ?")
+            args.append(hasta)
+        where = f" WHERE {' AND '.join(conds)}" if conds else ""
+        return [json.loads(d) for (d,) in self._conn.execute(
+            f"SELECT datos FROM {clave}{where} ORDER BY id", args)]
+
+    def query_pendings(self, modelo: str, talla: Optional[str] = None,
+                       pedido: Optional[str] = None) -> List[Dict]:
+        """Pendientes de un modelo (y opcionalmente talla/pedido) por índice."""
+        conds, args = ["modelo = ?"], [modelo]
+        if talla is not None:
+            conds.append("talla = ?")
+            args.append(talla)
+        if pedido is not None:
+            conds.append("pedido = ?")
+            args.append(pedido)
+        return [json.loads(d) for (d,) in self._conn.execute(
+            f"SELECT datos FROM pedidos WHERE {' AND '.join(conds)} ORDER BY id", args)]
+
+    def stock(self, modelo: str, talla: str) -> int:
+        row = self._conn.execute("SELECT cantidad FROM almacen WHERE modelo = ? AND talla = ?",
+                                 (modelo, talla)).fetchone()
+        return int(row[0]) if row else 0
+
+
+def importar_json_a_sqlite(path_sqlite: str,
+                           path_inventario: str = "datos_almacen.json",
+                           path_prevision: str = "prevision.json") -> Dict[str, int]:
+    """Vuelca los JSON actuales (con su journal) a un fichero SQLite.
+
+    Reescribe por completo los ámbitos 'inventario' y 'prevision' del
+    fichero destino.  Devuelve un pequeño resumen de filas importadas.
+    """
+    resumen: Dict[str, int] = {}
+    for path_json, ambito in ((path_inventario, "inventario"), (path_prevision, "prevision")):
+        origen = DataStore(path_json, {})
+        # Los históricos por meses o por columnas se vuelcan como listas normales
+        datos = {clave: (list(valor) if isinstance(valor, (HistorialSegmentado, HistorialColumnar)) else valor)
+                 for clave, valor in origen.data.items()}
+        vacio = {clave: (type(valor)() if isinstance(valor, (list, dict)) else valor)
+                 for clave, valor in datos.items()}
+        destino = SQLiteDataStore(path_sqlite, vacio, ambito)
+        destino.data = datos
+        destino.save()
+        destino.close()
+        for clave, valor in datos.items():
+            if clave in SQLiteDataStore.TABLES:
+                resumen[f"{ambito}.{clave}"] = len(valor)
+    return resumen
+
+
+def convertir_formato(path: str, formato: str) -> Tuple[int, int]:
+    """Reescribe un fichero de datos (con su journal) en otro formato de instantánea.
+
+    Devuelve el tamaño en bytes antes y después.  El formato de origen se
+    detecta solo, así que sirve también para volver a JSON indentado.
+    """
+    antes = os.path.getsize(path)
+    store = DataStore(path, {}, formato=formato)
+    store.save()
+    return antes, os.path.getsize(path)
+
+
+class BackupStore:
+    """Copias de seguridad deduplicadas y comprimidas de varias DataStore.
+
+    Cada copia (un "punto") es un manifiesto pequeño en ``puntos/`` que
+    enumera, por fichero y sección, los trozos que la forman.  Los trozos
+    se guardan una sola vez en ``objetos/`` (JSON compacto en gzip, con el
+    SHA-1 de su contenido como nombre), así que lo que no cambió entre dos
+    copias no ocupa más disco ni se vuelve a comprimir:
+
+    - las listas se parten cada ``TROZO_LISTA`` elementos (en los
+      históricos, que solo crecen, cambia únicamente el último trozo);
+    - los diccionarios grandes se reparten en cubos por hash de la clave;
+    - los históricos por mes van un trozo por mes, y los meses que siguen
+      igual en disco (fecha y tamaño) ni siquiera se vuelven a leer.
+
+    Tras cada copia se aplica la política de retención (la última copia
+    de cada una de las últimas N horas, días y meses) y se borran los
+    trozos que ya no usa ningún punto.
+    """
+
+    TROZO_LISTA = 500
+    TROZO_DICT = 256
+    RETENCION = {"horas": 24, "dias": 30, "meses": 12}
+    _PERIODOS = (("horas", "%Y-%m-%d %H"), ("dias", "%Y-%m-%d"), ("meses", "%Y-%m"))
+
+    def __init__(self, carpeta: str, retencion: Optional[Dict[str, int]] = None):
+        self.carpeta = carpeta
+        self.dir_objetos = os.path.join(carpeta, "objetos")
+        self.dir_puntos = os.path.join(carpeta, "puntos")
+        self.retencion = dict(self.RETENCION, **(retencion or {}))
+        # Meses ya guardados: ruta -> [mtime_ns, tamaño, conteo, hash]
+        self._indice_path = os.path.join(carpeta, "indice_meses.json")
+
+    # ------------------------------------------------------------------
+    # Objetos
+    # ------------------------------------------------------------------
+    def _ruta_objeto(self, h: str) -> str:
+        return os.path.join(self.dir_objetos, h[:2], h + ".gz")
+
+    def _guardar_objeto(self, valor, resumen: Dict) -> str:
+        raw = json.dumps(valor, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        h = hashlib.sha1(raw).hexdigest()
+        ruta = self._ruta_objeto(h)
+        resumen["trozos"] += 1
+        if not os.path.exists(ruta):
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            comprimido = gzip.compress(raw, compresslevel=6, mtime=0)
+            tmp = ruta + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(comprimido)
+            os.replace(tmp, ruta)
+            resumen["nuevos"] += 1
+            resumen["bytes_nuevos"] += len(comprimido)
+        return h
+
+    def _leer_objeto(self, h: str):
+        return leer_json(self._ruta_objeto(h))
+
+    # ------------------------------------------------------------------
+    # Crear
+    # ------------------------------------------------------------------
+    def _trocear(self, valor, resumen: Dict) -> Dict:
+        if isinstance(valor, list) and len(valor) > self.TROZO_LISTA:
+            return {"tipo": "lista", "trozos": [
+                self._guardar_objeto(valor[i:i + self.TROZO_LISTA], resumen)
+                for i in range(0, len(valor), self.TROZO_LISTA)]}
+        if isinstance(valor, dict) and len(valor) > self.TROZO_DICT:
+            # Número de cubos en potencias de 2: solo se reparte de nuevo al doblar el tamaño
+            n = 1
+            while n * self.TROZO_DICT < len(valor):
+                n *= 2
+            cubos: List[Dict] = [{} for _ in range(n)]
+            for k, v in valor.items():
+                cubos[zlib.crc32(str(k).encode("utf-8")) % n][k] = v
+            return {"tipo": "dict", "trozos": [self._guardar_objeto(c, resumen) for c in cubos]}
+        return {"tipo": "valor", "trozos": [self._guardar_objeto(valor, resumen)]}
+
+    def _trocear_historial(self, hist: HistorialSegmentado, indice: Dict, resumen: Dict) -> Dict:
+        trozos = []
+        for mes in hist.meses():
+            seg = hist._segmentos.get(mes)
+            if seg is not None:
+                trozos.append(self._guardar_objeto(seg, resumen))
+                continue
+            ruta = hist._ruta(mes)
+            n = hist._conteos.get(mes, 0)
+            try:
+                st = os.stat(ruta)
+            except OSError:
+                continue
+            firma = [st.st_mtime_ns, st.st_size, n]
+            previo = indice.get(ruta)
+            if previo and previo[:3] == firma and os.path.exists(self._ruta_objeto(previo[3])):
+                resumen["trozos"] += 1
+                trozos.append(previo[3])
+                continue
+            h = self._guardar_objeto(leer_json(ruta)[:n], resumen)
+            indice[ruta] = firma + [h]
+            trozos.append(h)
+        return {"tipo": "historial", "trozos": trozos}
+
+    def crear(self, stores: Dict[str, DataStore], etiqueta: str = "") -> Dict:
+        """Copia el estado persistido de `stores` ({nombre: store}) y aplica la retención.
+
+        Devuelve un resumen: id del punto, trozos totales, trozos nuevos y
+        bytes nuevos escritos.
+        """
+        os.makedirs(self.dir_puntos, exist_ok=True)
+        try:
+            indice = leer_json(self._indice_path)
+        except (OSError, ValueError):
+            indice = {}
+        resumen = {"trozos": 0, "nuevos": 0, "bytes_nuevos": 0}
+        ficheros = {}
+        for nombre, store in stores.items():
+            # Lo que se copia es lo persistido: journal volcado y escrituras pendientes en disco
+            store.compact()
+            store.flush()
+            secciones = {}
+            for clave, valor in store.data.items():
+                if isinstance(valor, HistorialSegmentado):
+                    secciones[clave] = self._trocear_historial(valor, indice, resumen)
+                elif isinstance(valor, HistorialColumnar):
+                    secciones[clave] = self._trocear(valor.como_lista(), resumen)
+                else:
+                    secciones[clave] = self._trocear(valor, resumen)
+            ficheros[nombre] = {"ruta": os.path.abspath(store.path), "secciones": secciones}
+        ahora = datetime.now()
+        punto_id = ahora.strftime("%Y%m%d-%H%M%S-%f")
+        manifiesto = {"id": punto_id, "fecha": ahora.isoformat(timespec="seconds"),
+                      "etiqueta": etiqueta, "ficheros": ficheros,
+                      "bytes_nuevos": resumen["bytes_nuevos"]}
+        tmp = os.path.join(self.dir_puntos, punto_id + ".json.tmp")
+        with open(tmp, "wb") as f:
+            f.write(serializar_json(manifiesto, "compacto"))
+        os.replace(tmp, os.path.join(self.dir_puntos, punto_id + ".json"))
+        with open(self._indice_path, "wb") as f:
+            f.write(serializar_json(indice, "compacto"))
+        resumen["id"] = punto_id
+        resumen["podados"] = self.podar()
+        return resumen
+
+    # ------------------------------------------------------------------
+    # Consultar y restaurar
+    # ------------------------------------------------------------------
+    def puntos(self) -> List[Dict]:
+        """Manifiestos de las copias existentes, de la más reciente a la más antigua."""
+        if not os.path.isdir(self.dir_puntos):
+            return []
+        out = []
+        for nombre in sorted(os.listdir(self.dir_puntos), reverse=True):
+            if nombre.endswith(".json"):
+                try:
+                    out.append(leer_json(os.path.join(self.dir_puntos, nombre)))
+                except (OSError, ValueError):
+                    print(f"⚠️ Manifiesto de backup ilegible: {nombre}")
+        return out
+
+    def leer(self, punto_id: str, nombre: str) -> Dict:
+        """Reconstruye los datos del fichero `nombre` tal como estaban en el punto."""
+        manifiesto = leer_json(os.path.join(self.dir_puntos, punto_id + ".json"))
+        data = {}
+        for clave, seccion in manifiesto["ficheros"][nombre]["secciones"].items():
+            partes = [self._leer_objeto(h) for h in seccion["trozos"]]
+            if seccion["tipo"] in ("lista", "historial"):
+                data[clave] = [x for parte in partes for x in parte]
+            elif seccion["tipo"] == "dict":
+                data[clave] = {k: v for parte in partes for k, v in parte.items()}
+            else:
+                data[clave] = partes[0]
+        return data
+
+    def restaurar(self, punto_id: str, stores: Dict[str, DataStore],
+                  nombres: Optional[List[str]] = None) -> List[str]:
+        """Sustituye el estado persistido de las stores por el del punto (todas o `nombres`).
+
+        Igual que con :meth:`DataStore.import_snapshot`, el llamante debe
+        reinstanciar las clases de dominio.  Devuelve los nombres restaurados.
+        """
+        manifiesto = leer_json(os.path.join(self.dir_puntos, punto_id + ".json"))
+        restaurados = []
+        for nombre, store in stores.items():
+            if nombre not in manifiesto["ficheros"] or (nombres and nombre not in nombres):
+                continue
+            data = self.leer(punto_id, nombre)
+            if store._historiales:
+                # Que el fichero siga repartido por meses al volver a cargarlo
+                data[DataStore.SEGMENTS_KEY] = {k: {} for k in store._historiales if k in data}
+            tmp = store.path + ".restaurar.tmp"
+            with open(tmp, "wb") as f:
+                f.write(serializar_json(data, store.formato))
+            try:
+                store.import_snapshot(tmp)
+            finally:
+                os.remove(tmp)
+            if store._historiales:
+                store.save()
+            restaurados.append(nombre)
+        return restaurados
+
+    # ------------------------------------------------------------------
+    # Retención
+    # ------------------------------------------------------------------
+    def podar(self) -> int:
+        """Aplica la retención y borra los trozos huérfanos; devuelve los puntos borrados."""
+        puntos = self.puntos()
+        conservar = {p["id"] for p in puntos[:1]}
+        for clave, patron in self._PERIODOS:
+            vistos: List[str] = []
+            for p in puntos:
+                periodo = datetime.fromisoformat(p["fecha"]).strftime(patron)
+                if periodo in vistos:
+                    continue
+                if len(vistos) >= self.retencion.get(clave, 0):
+                    break
+                vistos.append(periodo)
+                conservar.add(p["id"])
+        borrados = 0
+        usados = set()
+        for p in puntos:
+            if p["id"] in conservar:
+                for fichero in p["ficheros"].values():
+                    for seccion in fichero["secciones"].values():
+                        usados.update(seccion["trozos"])
+            else:
+                os.remove(os.path.join(self.dir_puntos, p["id"] + ".json"))
+                borrados += 1
+        if borrados and os.path.isdir(self.dir_objetos):
+            for sub in os.listdir(self.dir_objetos):
+                for nombre in os.listdir(os.path.join(self.dir_objetos, sub)):
+                    if nombre.endswith(".gz") and nombre[:-3] not in usados:
+                        os.remove(os.path.join(self.dir_objetos, sub, nombre))
+        return borrados
+
 ###############################################################################
 # Gestor de talleres y clientes
 ###############################################################################
@@ -339,9 +2909,13 @@ class Workshop:
 
     Por simplicidad sólo se almacenan nombre y contacto.  Se podría ampliar
     con dirección, CIF, etc.  El identificador del taller es el nombre.
+    `minimo` y `lote` son las unidades mínimas de un corte y el múltiplo en
+    que se cortan (ver Prevision.suggest_cut_orders).
     """
     nombre: str
     contacto: Optional[str] = None
+    minimo: int = 0
+    lote: int = 1
 
 @dataclass
 class Client:
@@ -360,21 +2934,26 @@ class WorkshopManager:
         # Internamente guardamos en un diccionario por nombre
         self.store = data_store
         self._talleres: Dict[str, Workshop] = {
-            nombre: Workshop(nombre=nombre, contacto=info.get("contacto"))
+            nombre: Workshop(nombre=nombre, contacto=info.get("contacto"),
+                             minimo=int(info.get("minimo", 0) or 0), lote=int(info.get("lote", 1) or 1))
             for nombre, info in self.store.data.items()
+            if not nombre.startswith("__")     # metadatos de la store (versión de esquema)
         }
 
-    def add(self, nombre: str, contacto: Optional[str] = None) -> None:
+    def add(self, nombre: str, contacto: Optional[str] = None, minimo: int = 0, lote: int = 1) -> None:
         if nombre in self._talleres:
             print(f"⚠️ El taller '{nombre}' ya existe.")
             return
-        self._talleres[nombre] = Workshop(nombre=nombre, contacto=contacto)
-        self.store.data[nombre] = {"contacto": contacto}
-        self.store.save()
+        minimo, lote = max(int(minimo), 0), max(int(lote), 1)
+        self._talleres[nombre] = Workshop(nombre=nombre, contacto=contacto, minimo=minimo, lote=lote)
+        self.store.data[nombre] = {"contacto": contacto, "minimo": minimo, "lote": lote}
+        self.store.record("set", (nombre,), self.store.data[nombre])
+        self.store.commit()
         print(f"✅ Taller '{nombre}' añadido.")
 
     def edit(self, nombre: str, nuevo_nombre: Optional[str] = None,
-             nuevo_contacto: Optional[str] = None) -> None:
+             nuevo_contacto: Optional[str] = None, nuevo_minimo: Optional[int] = None,
+             nuevo_lote: Optional[int] = None) -> None:
         taller = self._talleres.get(nombre)
         if not taller:
             print(f"❌ Taller '{nombre}' no encontrado.")
@@ -389,11 +2968,22 @@ class WorkshopManager:
             self._talleres[nuevo_nombre].nombre = nuevo_nombre
             # Actualizar en el store
             self.store.data[nuevo_nombre] = self.store.data.pop(nombre)
+            self.store.record("del", (nombre,))
+            self.store.record("set", (nuevo_nombre,), self.store.data[nuevo_nombre])
             nombre = nuevo_nombre
         if nuevo_contacto is not None:
             self._talleres[nombre].contacto = nuevo_contacto
             self.store.data[nombre]["contacto"] = nuevo_contacto
-        self.store.save()
+            self.store.record("set", (nombre, "contacto"), nuevo_contacto)
+        if nuevo_minimo is not None:
+            self._talleres[nombre].minimo = max(int(nuevo_minimo), 0)
+            self.store.data[nombre]["minimo"] = self._talleres[nombre].minimo
+            self.store.record("set", (nombre, "minimo"), self._talleres[nombre].minimo)
+        if nuevo_lote is not None:
+            self._talleres[nombre].lote = max(int(nuevo_lote), 1)
+            self.store.data[nombre]["lote"] = self._talleres[nombre].lote
+            self.store.record("set", (nombre, "lote"), self._talleres[nombre].lote)
+        self.store.commit()
         print(f"✅ Taller '{nombre}' actualizado.")
 
     def delete(self, nombre: str) -> None:
@@ -402,7 +2992,8 @@ class WorkshopManager:
             return
         self._talleres.pop(nombre)
         self.store.data.pop(nombre, None)
-        self.store.save()
+        self.store.record("del", (nombre,))
+        self.store.commit()
         print(f"🗑️ Taller '{nombre}' eliminado.")
 
     def list_all(self) -> List[Workshop]:
@@ -417,6 +3008,7 @@ class ClientManager:
         self._clientes: Dict[str, Client] = {
             nombre: Client(nombre=nombre, contacto=info.get("contacto"))
             for nombre, info in self.store.data.items()
+            if not nombre.startswith("__")     # metadatos de la store (versión de esquema)
         }
 
     def add(self, nombre: str, contacto: Optional[str] = None) -> None:
@@ -425,7 +3017,8 @@ class ClientManager:
             return
         self._clientes[nombre] = Client(nombre=nombre, contacto=contacto)
         self.store.data[nombre] = {"contacto": contacto}
-        self.store.save()
+        self.store.record("set", (nombre,), self.store.data[nombre])
+        self.store.commit()
         print(f"✅ Cliente '{nombre}' añadido.")
 
     def edit(self, nombre: str, nuevo_nombre: Optional[str] = None,
@@ -441,11 +3034,14 @@ class ClientManager:
             self._clientes[nuevo_nombre] = self._clientes.pop(nombre)
             self._clientes[nuevo_nombre].nombre = nuevo_nombre
             self.store.data[nuevo_nombre] = self.store.data.pop(nombre)
+            self.store.record("del", (nombre,))
+            self.store.record("set", (nuevo_nombre,), self.store.data[nuevo_nombre])
             nombre = nuevo_nombre
         if nuevo_contacto is not None:
             self._clientes[nombre].contacto = nuevo_contacto
             self.store.data[nombre]["contacto"] = nuevo_contacto
-        self.store.save()
+            self.store.record("set", (nombre, "contacto"), nuevo_contacto)
+        self.store.commit()
         print(f"✅ Cliente '{nombre}' actualizado.")
 
     def delete(self, nombre: str) -> None:
@@ -454,12 +3050,96 @@ class ClientManager:
             return
         self._clientes.pop(nombre)
         self.store.data.pop(nombre, None)
-        self.store.save()
+        self.store.record("del", (nombre,))
+        self.store.commit()
         print(f"🗑️ Cliente '{nombre}' eliminado.")
 
     def list_all(self) -> List[Client]:
         return list(self._clientes.values())
 
+###############################################################################
+# Registros de movimientos, pendientes y órdenes
+###############################################################################
+
+# Esquema de las filas de históricos, pendientes y órdenes.  En memoria y en el
+# JSON son dicts normales (TypedDict no cuesta nada en ejecución); lo que se
+# garantiza es que sus campos enteros ya vienen convertidos (ver tipar_registros).
+
+class Entrada(TypedDict, total=False):
+    """Fila de `historial_entradas`."""
+    modelo: str
+    talla: str
+    cantidad: int
+    fecha: str
+    taller: str
+    proveedor: str
+    observaciones: str
+
+
+class Salida(TypedDict, total=False):
+    """Fila de `historial_salidas`."""
+    modelo: str
+    talla: str
+    cantidad: int
+    fecha: str
+    pedido: str
+    albaran: str
+    cliente: str
+
+
+class Pendiente(TypedDict, total=False):
+    """Pedido pendiente de servir (`pedidos` de la previsión)."""
+    modelo: str
+    talla: str
+    cantidad: int
+    pedido: str
+    numero_pedido: str
+    cliente: str
+    fecha: str
+
+
+class OrdenFabricacion(TypedDict, total=False):
+    """Orden de corte abierta (elemento de `pedidos_fabricacion[modelo]`)."""
+    talla: str
+    cantidad: int
+    fecha: str
+
+
+# Campos que se convierten a int una sola vez, al cargar o al dar de alta
+CAMPOS_ENTEROS = ("cantidad",)
+
+
+def tipar_registros(filas, campos: Tuple[str, ...] = CAMPOS_ENTEROS) -> None:
+    """Convierte en sitio a int los `campos` presentes en cada fila de `filas`.
+
+    Se aplica al cargar (o recargar) una sección; a partir de ahí quien lee
+    ``fila["cantidad"]`` ya tiene un entero y no hace falta el
+    ``int(x or 0)`` en cada recorrido.  Un valor vacío cuenta como 0 y uno
+    entero escrito como decimal (``12.0``, ``"12,0"``) pasa a entero.  Lo
+    demás no detiene la carga: se avisa y un número con decimales se deja
+    como está, y un texto no numérico cuenta como 0.  Los históricos por mes
+    o por columnas no se tocan (no son listas: tienen su propio formato).
+    """
+    if type(filas) is not list:
+        return
+    for fila in filas:
+        for campo in campos:
+            valor = fila.get(campo, 0)
+            if type(valor) is int:
+                continue
+            try:
+                numero = float(str(valor).strip().replace(",", ".")) if valor else 0.0
+            except ValueError:
+                print(f"⚠️ '{campo}' no es un número en {fila!r}: se toma como 0.")
+                fila[campo] = 0
+                continue
+            if numero.is_integer():
+                fila[campo] = int(numero)
+            else:
+                print(f"⚠️ '{campo}' tiene decimales en {fila!r}: se deja como está.")
+                fila[campo] = numero
+
+
 ###############################################################################
 # Inventario
 ###############################################################################
@@ -467,6 +3147,11 @@ class ClientManager:
 class Inventory:
     """Gestiona el stock real y los movimientos de entradas/salidas."""
 
+    # Cada cuántos meses se guarda un cierre de stock (ver stock_at): fin de
+    # marzo, junio, septiembre y diciembre
+    MESES_ENTRE_CIERRES = 3
+    HISTORIALES = ("historial_entradas", "historial_salidas")
+
     def __init__(self, data_store: DataStore, prevision: 'Prevision'):
         self.store = data_store
         self.prevision = prevision
@@ -475,6 +3160,45 @@ class Inventory:
         self.historial_entradas: List[Dict] = self.store.data.setdefault("historial_entradas", [])
         self.historial_salidas: List[Dict] = self.store.data.setdefault("historial_salidas", [])
         self.info_modelos: Dict[str, Dict[str, str]] = self.store.data.setdefault("info_modelos", {})
+        # Cierres periódicos del stock según históricos: "AAAA-MM" -> {entradas, salidas, stock}
+        self.cierres_stock: Dict[str, Dict] = self.store.data.setdefault("cierres_stock", {})
+        # Cierres que ha calculado stock_at y aún no se han guardado (ver save_checkpoints)
+        self._cierres_calculados: Dict[str, Dict] = {}
+        # Cantidades validadas una vez (ver tipar_registros)
+        tipar_registros(self.historial_entradas)
+        tipar_registros(self.historial_salidas)
+        # Libro de netos (entradas - salidas) por (modelo, talla) para la auditoría.
+        # Se crea con la primera auditoría completa y luego se mantiene al registrar
+        # movimientos; `_tocadas` son las claves a revisar desde la última auditoría
+        # y `_discrepantes` las que no cuadraban entonces.
+        self._neto: Optional[Dict[Tuple[str, str], int]] = None
+        self._tocadas: Set[Tuple[str, str]] = set()
+        self._discrepantes: Set[Tuple[str, str]] = set()
+        # Posiciones de cada histórico por mes, para reproducir solo un tramo
+        self._por_mes: Dict[str, Dict[str, List[int]]] = {}
+        # Posiciones de cada histórico por modelo, para consultas y renombrados
+        self._por_modelo: Dict[str, Dict[str, List[int]]] = {}
+
+    def refresh_sections(self, claves: Set[str]) -> None:
+        """Rehace los alias (y lo derivado) de las secciones recargadas desde disco."""
+        if claves & {"almacen", "historial_entradas", "historial_salidas"}:
+            self._invalidar_neto()
+        for clave in claves & set(self.HISTORIALES):
+            self._por_mes.pop(clave, None)
+            self._por_modelo.pop(clave, None)
+            self._cierres_calculados = {}
+        if "cierres_stock" in claves:
+            self.cierres_stock = self.store.data.setdefault("cierres_stock", {})
+        if "almacen" in claves:
+            self.almacen = self.store.data.setdefault("almacen", {})
+        if "historial_entradas" in claves:
+            self.historial_entradas = self.store.data.setdefault("historial_entradas", [])
+            tipar_registros(self.historial_entradas)
+        if "historial_salidas" in claves:
+            self.historial_salidas = self.store.data.setdefault("historial_salidas", [])
+            tipar_registros(self.historial_salidas)
+        if "info_modelos" in claves:
+            self.info_modelos = self.store.data.setdefault("info_modelos", {})
 
     def _ensure_model(self, modelo: str, descripcion: str = "", color: str = "", cliente: Optional[str] = None) -> None:
         """Asegura que un modelo existe en el inventario y en info_modelos.
@@ -485,15 +3209,20 @@ class Inventory:
         """
         if modelo not in self.almacen:
             self.almacen[modelo] = {}
+            self.store.record("setdefault", ("almacen", modelo), {})
         if modelo not in self.info_modelos:
             self.info_modelos[modelo] = {"descripcion": descripcion, "color": color, "cliente": cliente or ""}
+            self.store.record("setdefault", ("info_modelos", modelo), self.info_modelos[modelo])
         else:
             # Actualizamos cliente si es proporcionado y no existía
-            if cliente is not None and not self.info_modelos[modelo].get("cliente"):
+            antes = self.info_modelos[modelo].get("cliente")
+            if cliente is not None and not antes:
                 self.info_modelos[modelo]["cliente"] = cliente
+                self.store.record("set", ("info_modelos", modelo, "cliente"), cliente, previo=antes)
         # También sincronizamos con prevision
         if modelo not in self.prevision.info_modelos:
             self.prevision.info_modelos[modelo] = {"descripcion": descripcion, "color": color, "cliente": cliente or ""}
+            self.prevision.store.record("setdefault", ("info_modelos", modelo), self.prevision.info_modelos[modelo])
 
     def register_entry(
         self,
@@ -515,7 +3244,7 @@ class Inventory:
             fecha = datetime.now().strftime("%Y-%m-%d")
 
         # 1) Histórico de ENTRADAS (incluye taller)
-        entrada = {
+        entrada: Entrada = {
             "modelo": modelo,
             "talla": talla,
             "cantidad": int(cantidad),
@@ -525,47 +3254,20 @@ class Inventory:
             "observaciones": observaciones,
         }
        
-        self.historial_entradas.append(entrada)
+        self._registrar_movimiento("historial_entradas", entrada, int(cantidad))
 
         # 2) Stock real
         self.almacen.setdefault(modelo, {})
         self.almacen[modelo][talla] = self.almacen[modelo].get(talla, 0) + int(cantidad)
+        self.store.record("incr", ("almacen", modelo, talla), int(cantidad))
 
-        # 3) Órdenes de corte (pedidos_fabricacion)
-        cubierto_desde_entrada = int(cantidad)
-        pendientes = getattr(self.prevision, "pedidos_fabricacion", {}).get(modelo, [])
-        pendientes.sort(key=lambda x: (x.get("fecha") or ""))
-
-
-        i = 0
-        while i < len(pendientes) and cubierto_desde_entrada > 0:
-            p = pendientes[i]
-            if norm_talla(p.get("talla")) != talla:
-                i += 1
-                continue
-            por_cubrir = int(p.get("cantidad", 0))
-            if por_cubrir <= 0:
-                i += 1
-                continue
-            usa = min(por_cubrir, cubierto_desde_entrada)
-            p["cantidad"] = por_cubrir - usa
-            cubierto_desde_entrada -= usa
-            if p["cantidad"] <= 0:
-                pendientes.pop(i)
-                continue
-            i += 1
+        # 3) Órdenes de corte (pedidos_fabricacion): solo la cola de esa talla, por fecha
+        cubierto = self.prevision.cover_fabrication(modelo, talla, int(cantidad))
 
-        # limpiar contenedor vacío con tolerancia
-        if modelo in self.prevision.pedidos_fabricacion and not self.prevision.pedidos_fabricacion[modelo]:
-            self.prevision.pedidos_fabricacion.pop(modelo, None)
-
-
-        # 4) Guardar
-        self.save()
-        self.prevision.save()   # <-- IMPORTANTE: persistir cambios en prevision
+        # 4) Guardar inventario y previsión a la vez (o ninguno si hay conflicto)
+        self._confirmar(f"la entrada {modelo} T{talla} +{cantidad}")
 
         # 5) Mensaje
-        cubierto = int(cantidad) - max(cubierto_desde_entrada, 0)
         print(
             f"✅ Entrada registrada: {modelo} {talla} +{cantidad} uds → stock real +{cantidad}. "
             f"Órdenes de corte cubiertas: {cubierto} uds."
@@ -593,43 +3295,131 @@ class Inventory:
 
         # Descontamos del stock real
         self.almacen[modelo][talla] -= cantidad
+        self.store.record("incr", ("almacen", modelo, talla), -cantidad)
 
         # Registramos la salida
-        self.historial_salidas.append({
+        salida: Salida = {
             "modelo": modelo,
             "talla": talla,
-            "cantidad": cantidad,
+            "cantidad": int(cantidad),
             "fecha": fecha,
             "pedido": pedido,
             "albaran": albaran,
             "cliente": cliente,
-        })
+        }
+        self._registrar_movimiento("historial_salidas", salida, -int(cantidad or 0))
 
-        # Actualizamos pedidos pendientes
-        nuevas_pedidos = []
-        restante = cantidad
-        for p in self.prevision.pedidos:
-            p_modelo = str(p.get("modelo","")).strip().upper()
-            p_talla = norm_talla(p.get("talla",""))
-            if (p_modelo == modelo and
-                p_talla == talla and
-                norm_codigo(p.get("pedido","")) == pedido and
-                restante > 0):
-                if restante >= p["cantidad"]:
-                    restante -= p["cantidad"]
-                else:
-                    p["cantidad"] -= restante
-                    restante = 0
-                    nuevas_pedidos.append(p)
-            else:
-                nuevas_pedidos.append(p)
-        self.prevision.pedidos[:] = nuevas_pedidos
+        # Descontamos de los pedidos pendientes de ese (modelo, talla, pedido)
+        self.prevision.consume_pendings(modelo, talla, pedido, cantidad)
 
-        self.save()
-        self.prevision.save()
+        self._confirmar(f"la salida {modelo} T{talla} -{cantidad}")
         print(f"✅ Salida registrada: {modelo} T{talla} -{cantidad}")
         return True
 
+    # ---------------------------------------------------------------------
+    # Entradas y salidas en bloque (importaciones)
+    # ---------------------------------------------------------------------
+    def register_entries_bulk(self, lineas: List[Dict]) -> List[Dict]:
+        """Registra muchas entradas de una vez, sin imprimir.
+
+        Cada línea es un dict con ``modelo``, ``talla`` y ``cantidad`` (y
+        opcionalmente ``taller``, ``fecha``, ``proveedor`` y
+        ``observaciones``).  Las órdenes de fabricación se cubren en una sola
+        pasada agrupada (ver Prevision.cover_fabrication_bulk) y cada
+        fichero se guarda una vez.  Devuelve, por línea,
+        {modelo, talla, aplicado, cubierto, avisos}.
+        """
+        hoy = datetime.now().strftime("%Y-%m-%d")
+        resultados: List[Dict] = []
+        aplicadas: List[Dict] = []
+        for linea in lineas:
+            modelo = str(linea.get("modelo", "")).strip().upper()
+            talla = norm_talla(linea.get("talla", ""))
+            cantidad = int(linea.get("cantidad", 0) or 0)
+            res = {"modelo": modelo, "talla": talla, "aplicado": 0, "cubierto": 0, "avisos": []}
+            resultados.append(res)
+            if not modelo or not talla or cantidad <= 0:
+                res["avisos"].append("Datos de entrada inválidos.")
+                continue
+            entrada: Entrada = {
+                "modelo": modelo,
+                "talla": talla,
+                "cantidad": cantidad,
+                "fecha": linea.get("fecha") or hoy,
+                "taller": linea.get("taller", ""),
+                "proveedor": linea.get("proveedor", ""),
+                "observaciones": linea.get("observaciones", ""),
+            }
+            self._registrar_movimiento("historial_entradas", entrada, cantidad)
+            self.almacen.setdefault(modelo, {})
+            self.almacen[modelo][talla] = self.almacen[modelo].get(talla, 0) + cantidad
+            self.store.record("incr", ("almacen", modelo, talla), cantidad)
+            res["aplicado"] = cantidad
+            aplicadas.append(res)
+
+        cubiertas = self.prevision.cover_fabrication_bulk(
+            [(r["modelo"], r["talla"], r["aplicado"]) for r in aplicadas])
+        for res, cubierto in zip(aplicadas, cubiertas):
+            res["cubierto"] = cubierto
+        self._confirmar(f"el bloque de {len(aplicadas)} entradas")
+        return resultados
+
+    def register_exits_bulk(self, lineas: List[Dict]) -> List[Dict]:
+        """Registra muchas salidas de una vez, sin imprimir.
+
+        Cada línea es un dict con ``modelo``, ``talla``, ``cantidad``,
+        ``cliente``, ``pedido``, ``albaran`` y opcionalmente ``fecha`` (sin
+        ella, la de hoy).  Como register_exit, deja el stock en negativo si
+        no llega (con aviso), y una cantidad 0 o negativa (devolución) se
+        registra igual, sin descontar pendientes.  Los pendientes se
+        descuentan en una sola pasada agrupada (ver
+        Prevision.consume_pendings_bulk) y cada fichero se guarda una vez.
+        Devuelve, por línea, {modelo, talla, pedido, registrada, aplicado,
+        servidos, avisos}.
+        """
+        hoy = datetime.now().strftime("%Y-%m-%d")
+        resultados: List[Dict] = []
+        aplicadas: List[Dict] = []
+        for linea in lineas:
+            modelo = str(linea.get("modelo", "")).strip().upper()
+            talla = norm_talla(linea.get("talla", ""))
+            pedido = norm_codigo(linea.get("pedido", ""))
+            cantidad = int(linea.get("cantidad", 0) or 0)
+            res = {"modelo": modelo, "talla": talla, "pedido": pedido, "registrada": False,
+                   "aplicado": 0, "servidos": 0, "avisos": []}
+            resultados.append(res)
+            if not modelo or not talla:
+                res["avisos"].append("Datos de salida inválidos.")
+                continue
+            tallas = self.almacen.setdefault(modelo, {})
+            disponible = tallas.setdefault(talla, 0)
+            if cantidad <= 0:
+                res["avisos"].append(f"Cantidad {cantidad}: se registra sin descontar pendientes.")
+            elif cantidad > disponible:
+                res["avisos"].append(f"Stock insuficiente: había {disponible} uds de {modelo} T{talla}.")
+            tallas[talla] = disponible - cantidad
+            self.store.record("incr", ("almacen", modelo, talla), -cantidad)
+            salida: Salida = {
+                "modelo": modelo,
+                "talla": talla,
+                "cantidad": cantidad,
+                "fecha": hoy if linea.get("fecha") is None else linea["fecha"],
+                "pedido": pedido,
+                "albaran": norm_codigo(linea.get("albaran", "")),
+                "cliente": linea.get("cliente", ""),
+            }
+            self._registrar_movimiento("historial_salidas", salida, -cantidad)
+            res["registrada"] = True
+            res["aplicado"] = cantidad
+            aplicadas.append(res)
+
+        servidas = self.prevision.consume_pendings_bulk(
+            [(r["modelo"], r["talla"], r["pedido"], r["aplicado"]) for r in aplicadas])
+        for res, servidos in zip(aplicadas, servidas):
+            res["servidos"] = servidos
+        self._confirmar(f"el bloque de {len(aplicadas)} salidas")
+        return resultados
+
 
     def modify_stock(self, modelo: str, talla: str, nuevo_valor: Optional[int],
                      descripcion: Optional[str] = None, color: Optional[str] = None,
@@ -654,26 +3444,35 @@ class Inventory:
                 info["color"] = color
             if cliente:
                 info["cliente"] = cliente
+            self.store.record("set", ("info_modelos", modelo), info)
         if nuevo_valor is None:
             # Eliminar talla
             if modelo in self.almacen and talla in self.almacen[modelo]:
-                self.almacen[modelo].pop(talla)
+                self._tocar(modelo, talla)
+                antes = self.almacen[modelo].pop(talla)
+                self.store.record("del", ("almacen", modelo, talla), previo=antes)
                 print(f"🗑️ Talla {talla} del modelo {modelo} eliminada.")
                 # Si se queda vacío, eliminamos el modelo
                 if not self.almacen[modelo]:
                     self.almacen.pop(modelo)
                     self.info_modelos.pop(modelo, None)
                     self.prevision.info_modelos.pop(modelo, None)
+                    self.store.record("del", ("almacen", modelo), previo={})
+                    self.store.record("del", ("info_modelos", modelo))
+                    self.prevision.store.record("del", ("info_modelos", modelo))
                     print(f"🗑️ Modelo {modelo} eliminado (sin tallas).")
             else:
                 print(f"❌ No existe {modelo} T{talla}.")
         else:
             # Asignar nuevo valor
             self.almacen.setdefault(modelo, {})
+            antes = self.almacen[modelo].get(talla)
             self.almacen[modelo][talla] = nuevo_valor
+            self._tocar(modelo, talla)
+            self.store.record("set", ("almacen", modelo, talla), nuevo_valor, previo=antes)
             print(f"🛠️ Stock actualizado: {modelo} T{talla} = {nuevo_valor} uds")
-        self.save()
-        self.prevision.save()
+        self.commit()
+        self.prevision.commit()
 
     def update_model_info(self, modelo: str, descripcion: Optional[str] = None,
                           color: Optional[str] = None, cliente: Optional[str] = None) -> None:
@@ -688,6 +3487,7 @@ class Inventory:
             info["color"] = color
         if cliente is not None:
             info["cliente"] = cliente
+        self.store.record("set", ("info_modelos", modelo), info)
         # Sincronizamos con la prevision
         if modelo in self.prevision.info_modelos:
             if descripcion:
@@ -696,8 +3496,9 @@ class Inventory:
                 self.prevision.info_modelos[modelo]["color"] = color
             if cliente is not None:
                 self.prevision.info_modelos[modelo]["cliente"] = cliente
-        self.save()
-        self.prevision.save()
+            self.prevision.store.record("set", ("info_modelos", modelo), self.prevision.info_modelos[modelo])
+        self.commit()
+        self.prevision.commit()
         print(f"✅ Información del modelo {modelo} actualizada.")
 
     def consult_stock(self, modelo_filtro: str = "") -> None:
@@ -707,56 +3508,447 @@ class Inventory:
             if modelo_filtro and modelo != modelo_filtro:
                 continue
             print(f"\n🔹 {modelo} - {self.info_modelos.get(modelo, {}).get('descripcion', '')}")
-            for talla, cantidad in sorted(self.almacen[modelo].items(), key=lambda x: talla_sort_key(x[0])):
+            for talla in CATALOGO_TALLAS.ordenar(self.almacen[modelo]):
+                cantidad = self.almacen[modelo][talla]
                 alerta = "⚠️" if cantidad < 10 else ""
                 print(f"  Talla {talla}: {cantidad} uds {alerta}")
 
-    def save(self) -> None:
+    def size_grid(self, modelo: str) -> List[str]:
+        """Tallas con stock registrado del modelo, en orden natural (catálogo de tallas)."""
+        return CATALOGO_TALLAS.ordenar(self.almacen.get(modelo, {}))
+
+    def save(self, historial_desde: Optional[str] = None) -> None:
+        """Guarda el inventario completo (cambios hechos a mano, sin anotar).
+
+        Los cierres de stock_at solo detectan altas y bajas en los
+        históricos; si se han editado movimientos ya registrados, indica en
+        `historial_desde` la fecha (AAAA-MM-DD) del más antiguo tocado y se
+        descartan los cierres de ese mes en adelante ("" para todos, p. ej.
+        si alguno no tenía fecha).  Tocar solo el stock no afecta a los cierres.
+        """
+        self._invalidar_neto()
+        self._por_mes = {}
+        self._por_modelo = {}
+        if historial_desde is not None:
+            desde = str(historial_desde)[:7]
+            for cierres in (self.cierres_stock, self._cierres_calculados):
+                for mes in [m for m in cierres if m >= desde]:
+                    del cierres[mes]
         self.store.save()
+
+    def commit(self) -> None:
+        """Persiste las mutaciones anotadas (journal) o guarda completo."""
+        self.store.commit()
+
+    def _confirmar(self, que: str) -> None:
+        """Persiste inventario y previsión juntos: un movimiento toca los dos (ver commit_conjunto)."""
+        commit_conjunto((self.store, self.prevision.store), que)
+
+    # ---------------------------------------------------------------------
+    # Libro de netos para la auditoría
+    # ---------------------------------------------------------------------
+    @staticmethod
+    def _clave_neto(modelo, talla) -> Tuple[str, str]:
+        return str(modelo).strip().upper(), norm_talla(talla)
+
+    def _invalidar_neto(self) -> None:
+        self._neto = None
+        self._tocadas = set()
+        self._discrepantes = set()
+
+    def _anotar_neto(self, modelo, talla, delta: int) -> None:
+        """Suma `delta` al neto de (modelo, talla) si el libro ya existe (O(1))."""
+        if self._neto is None:
+            return
+        clave = self._clave_neto(modelo, talla)
+        self._neto[clave] = self._neto.get(clave, 0) + delta
+        self._tocadas.add(clave)
+
+    def _tocar(self, modelo, talla) -> None:
+        """Marca (modelo, talla) para la próxima auditoría (cambio de stock sin movimiento)."""
+        if self._neto is not None:
+            self._tocadas.add(self._clave_neto(modelo, talla))
+
+    def _reconstruir_neto(self) -> None:
+        """Recalcula el libro de netos recorriendo los históricos completos."""
+        from collections import defaultdict
+        neto = defaultdict(int)
+        for clave, signo in (("historial_entradas", 1), ("historial_salidas", -1)):
+            filas = self.history(clave)
+            if isinstance(filas, HistorialColumnar):
+                # Agregado por columnas: se normaliza una vez por combinación, no por fila
+                sumas = filas.sumar_por(("modelo", "talla"), ausente="").items()
+            else:
+                sumas = (((r.get("modelo", ""), r.get("talla", "")), int(r.get("cantidad", 0) or 0))
+                         for r in filas)
+            for (modelo, talla), cantidad in sumas:
+                neto[self._clave_neto(modelo, talla)] += signo * cantidad
+        self._neto = dict(neto)
+        self._tocadas = set()
+        self._discrepantes = set()
+
+    def _registrar_movimiento(self, clave: str, mov: Dict, delta: int) -> None:
+        """Añade `mov` al histórico `clave`, lo anota en la store y mantiene lo derivado."""
+        historial = getattr(self, clave)
+        historial.append(mov)
+        self.store.record("append", (clave,), mov)
+        self._anotar_neto(mov.get("modelo", ""), mov.get("talla", ""), delta)
+        por_mes = self._por_mes.get(clave)
+        if por_mes is not None:
+            por_mes.setdefault(HistorialSegmentado.mes_de(mov), []).append(len(historial) - 1)
+        por_modelo = self._por_modelo.get(clave)
+        if por_modelo is not None:
+            por_modelo.setdefault(str(mov.get("modelo", "")).strip().upper(), []).append(len(historial) - 1)
+
+    # ---------------------------------------------------------------------
+    # Posiciones por modelo en los históricos
+    # ---------------------------------------------------------------------
+    def _indice_modelos(self, clave: str) -> Optional[Dict[str, List[int]]]:
+        """Modelo (normalizado) -> posiciones de sus filas en el histórico `clave`.
+
+        Se crea al primer uso y se mantiene al registrar movimientos.  Con
+        históricos por mes devuelve None: llegar a una fila por su posición
+        obliga a leer todos los meses.
+        """
+        filas = getattr(self, clave)
+        if isinstance(filas, HistorialSegmentado):
+            return None
+        por_modelo = self._por_modelo.get(clave)
+        if por_modelo is None:
+            por_modelo = {}
+            if isinstance(filas, HistorialColumnar):
+                # Una vez por valor distinto; si varios normalizan igual, se reordena
+                for valor, posiciones in filas.posiciones_por("modelo"):
+                    destino = por_modelo.setdefault(str(valor).strip().upper(), [])
+                    destino.extend(posiciones)
+                    if len(destino) > len(posiciones):
+                        destino.sort()
+            else:
+                for i, r in enumerate(filas):
+                    por_modelo.setdefault(str(r.get("modelo", "")).strip().upper(), []).append(i)
+            self._por_modelo[clave] = por_modelo
+        return por_modelo
+
+    def _filas_modelo(self, clave: str, modelo: str) -> List[Dict]:
+        """Filas del histórico `clave` del modelo (ya normalizado), en orden de alta."""
+        filas = getattr(self, clave)
+        por_modelo = self._indice_modelos(clave)
+        if por_modelo is None:
+            return [r for r in filas if str(r.get("modelo", "")).strip().upper() == modelo]
+        posiciones = por_modelo.get(modelo, ())
+        if isinstance(filas, HistorialColumnar):
+            return filas.filas(posiciones)
+        return [filas[i] for i in posiciones]
+
+    def has_model(self, modelo: str) -> bool:
+        """True si el modelo tiene stock, ficha o movimientos (sin recorrer los históricos)."""
+        modelo = str(modelo).strip().upper()
+        if modelo in self.almacen or modelo in self.info_modelos:
+            return True
+        for clave in self.HISTORIALES:
+            por_modelo = self._indice_modelos(clave)
+            if por_modelo is None:
+                if self._filas_modelo(clave, modelo):
+                    return True
+            elif por_modelo.get(modelo):
+                return True
+        return False
+
+    def rename_model(self, antiguo: str, nuevo: str) -> int:
+        """Cambia el código `antiguo` por `nuevo` en stock, fichas, históricos y cierres.
+
+        Los movimientos del modelo se localizan por sus posiciones, así que
+        el coste depende de sus filas y no del histórico completo; cada
+        cambio se anota y se persiste con un commit (con históricos por mes
+        se guarda completo).  Devuelve los movimientos renombrados.
+
+        Lanza ValueError si `nuevo` ya existe en el inventario o en la
+        previsión: sus datos se pisarían o se mezclarían sin avisar.
+        """
+        antiguo = str(antiguo).strip().upper()
+        nuevo = str(nuevo).strip().upper()
+        if not nuevo or nuevo == antiguo:
+            raise ValueError(f"Código de modelo no válido o igual al actual: {nuevo!r}")
+        if self.has_model(nuevo) or self.prevision.has_model(nuevo):
+            raise ValueError(f"El modelo {nuevo} ya existe: renombrar sobre él mezclaría sus datos.")
+        # Asegurar contenedor en almacen para renombrar, aunque esté vacío
+        if antiguo in self.almacen:
+            tallas = self.almacen.pop(antiguo)
+            self.almacen[nuevo] = tallas
+            self.store.record("set", ("almacen", nuevo), tallas)
+            self.store.record("del", ("almacen", antiguo), previo=tallas)
+        elif nuevo not in self.almacen:
+            self.almacen[nuevo] = {}
+            self.store.record("setdefault", ("almacen", nuevo), {})
+        if antiguo in self.info_modelos:
+            info = self.info_modelos.pop(antiguo)
+            self.info_modelos[nuevo] = info
+            self.store.record("set", ("info_modelos", nuevo), info)
+            self.store.record("del", ("info_modelos", antiguo), previo=info)
+
+        renombrados = 0
+        completo = False
+        for clave in self.HISTORIALES:
+            filas = getattr(self, clave)
+            por_modelo = self._indice_modelos(clave)
+            if por_modelo is None:
+                # Por meses: se cambian en memoria y se guarda completo
+                for r in self._filas_modelo(clave, antiguo):
+                    r["modelo"] = nuevo
+                    renombrados += 1
+                completo = True
+                continue
+            posiciones = por_modelo.pop(antiguo, [])
+            for i in posiciones:
+                fila = filas[i]
+                previo = dict(fila)
+                fila["modelo"] = nuevo      # en históricos por columnas, escribe en la fila
+                self.store.record("set", (clave, i, "modelo"), nuevo, previo=previo)
+            if posiciones:
+                destino = por_modelo.setdefault(nuevo, [])
+                destino.extend(posiciones)
+                if len(destino) > len(posiciones):
+                    destino.sort()
+            renombrados += len(posiciones)
+
+        # Cierres de stock_at (el modelo va en el stock de cada cierre)
+        for guardado, cierres in ((True, self.cierres_stock), (False, self._cierres_calculados)):
+            for mes, cierre in cierres.items():
+                stock = cierre.get("stock", {})
+                if antiguo in stock:
+                    destino = stock.setdefault(nuevo, {})
+                    for talla, cantidad in stock.pop(antiguo).items():
+                        destino[talla] = destino.get(talla, 0) + cantidad
+                    if guardado:
+                        self.store.record("set", ("cierres_stock", mes), cierre)
+
+        # El libro de netos va por (modelo, talla): se rehará en la próxima auditoría
+        self._invalidar_neto()
+        if completo:
+            self.store.save()
+        else:
+            self.commit()
+        return renombrados
+
+    # ---------------------------------------------------------------------
+    # Stock a una fecha (cierres periódicos)
+    # ---------------------------------------------------------------------
+    @staticmethod
+    def _orden_mes(mes: str) -> str:
+        # Los movimientos sin fecha cuentan como anteriores a cualquier mes
+        return "" if mes == HistorialSegmentado.SIN_FECHA else mes
+
+    @staticmethod
+    def _sumar_meses(mes: str, n: int) -> str:
+        total = int(mes[:4]) * 12 + int(mes[5:7]) - 1 + n
+        return f"{total // 12:04d}-{total % 12 + 1:02d}"
+
+    def _ultimo_cierre(self, mes: str) -> str:
+        """Último mes de cierre que sea `mes` o anterior."""
+        return self._sumar_meses(mes, -(int(mes[5:7]) % self.MESES_ENTRE_CIERRES))
+
+    def _indice_meses(self, clave: str) -> Dict[str, List[int]]:
+        """Posiciones de las filas de `clave` agrupadas por mes (se crea una vez)."""
+        por_mes = self._por_mes.get(clave)
+        if por_mes is None:
+            por_mes = {}
+            for i, mov in enumerate(getattr(self, clave)):
+                por_mes.setdefault(HistorialSegmentado.mes_de(mov), []).append(i)
+            self._por_mes[clave] = por_mes
+        return por_mes
+
+    def _conteos_mes(self, clave: str) -> Dict[str, int]:
+        filas = getattr(self, clave)
+        if isinstance(filas, HistorialSegmentado):
+            return filas.conteos()
+        return {mes: len(pos) for mes, pos in self._indice_meses(clave).items()}
+
+    def _movimientos_mes(self, clave: str, mes: str):
+        filas = getattr(self, clave)
+        if isinstance(filas, HistorialSegmentado):
+            return filas.del_mes(mes)
+        return (filas[i] for i in self._indice_meses(clave).get(mes, ()))
+
+    def _reproducir(self, stock: Dict[Tuple[str, str], int], meses, hasta: Optional[str] = None,
+                    modelo: Optional[str] = None) -> None:
+        """Suma a `stock` los movimientos de `meses` (con fecha <= `hasta` si se indica)."""
+        for clave, signo in (("historial_entradas", 1), ("historial_salidas", -1)):
+            for mes in meses:
+                for mov in self._movimientos_mes(clave, mes):
+                    if hasta and (mov.get("fecha") or "") > hasta and mes != HistorialSegmentado.SIN_FECHA:
+                        continue
+                    k = self._clave_neto(mov.get("modelo", ""), mov.get("talla", ""))
+                    if modelo and k[0] != modelo:
+                        continue
+                    stock[k] = stock.get(k, 0) + signo * int(mov.get("cantidad", 0) or 0)
+
+    def _cierre_hasta(self, objetivo: str, conteos: Dict[str, Dict[str, int]]) -> Tuple[Optional[str], Dict]:
+        """Stock al cierre de `objetivo`, partiendo del último cierre guardado que siga valiendo.
+
+        Un cierre vale si los movimientos hasta su mes siguen siendo los que
+        contó (un alta con fecha atrasada lo invalida).  Los cierres que faltan
+        hasta `objetivo` se calculan reproduciendo cada tramo y se quedan en
+        memoria: una consulta no escribe nada (ver :meth:`save_checkpoints`).
+        Devuelve (mes del cierre, {(modelo, talla): cantidad}), o (None, {})
+        si no hay movimientos con fecha hasta `objetivo`.
+        """
+        meses = sorted({m for c in self.HISTORIALES for m in conteos[c]}, key=self._orden_mes)
+
+        def acumulados(hasta: str) -> Tuple[int, ...]:
+            return tuple(sum(n for m, n in conteos[c].items() if self._orden_mes(m) <= hasta)
+                         for c in self.HISTORIALES)
+
+        fechados = [m for m in meses if m != HistorialSegmentado.SIN_FECHA]
+        if not fechados or fechados[0] > objetivo:
+            return None, {}
+
+        base, stock = None, {}
+        cierres = {**self.cierres_stock, **self._cierres_calculados}
+        for mes in sorted((m for m in cierres if m <= objetivo), reverse=True):
+            cierre = cierres[mes]
+            if (cierre.get("entradas"), cierre.get("salidas")) == acumulados(mes):
+                base = mes
+                stock = {(m, t): q for m, tallas in cierre.get("stock", {}).items() for t, q in tallas.items()}
+                break
+
+        actual = base or self._ultimo_cierre(self._sumar_meses(fechados[0], -1))
+        while actual < objetivo:
+            siguiente = self._sumar_meses(actual, self.MESES_ENTRE_CIERRES)
+            self._reproducir(stock, [m for m in meses if (base is None or self._orden_mes(m) > base)
+                                     and self._orden_mes(m) <= siguiente])
+            entradas, salidas = acumulados(siguiente)
+            valor = {"entradas": entradas, "salidas": salidas, "stock": {}}
+            for (m, t), q in sorted(stock.items()):
+                if q:
+                    valor["stock"].setdefault(m, {})[t] = q
+            self._cierres_calculados[siguiente] = valor
+            base = actual = siguiente
+        return base, stock
+
+    def save_checkpoints(self) -> int:
+        """Guarda los cierres que stock_at ha calculado en memoria; devuelve cuántos.
+
+        Así los siguientes arranques (y los demás puestos) ya parten de ellos.
+        Es una escritura explícita: consultar stock_at no toca el fichero.
+        """
+        nuevos = {m: c for m, c in self._cierres_calculados.items() if self.cierres_stock.get(m) != c}
+        for mes in sorted(nuevos):
+            self.cierres_stock[mes] = nuevos[mes]
+            self.store.record("set", ("cierres_stock", mes), nuevos[mes])
+        self._cierres_calculados = {}
+        if nuevos:
+            self.commit()
+        return len(nuevos)
+
+    def stock_at(self, fecha: str, modelo: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+        """Stock según los históricos (entradas - salidas) al final del día `fecha`.
+
+        Se parte del último cierre trimestral anterior al mes de `fecha` y
+        solo se reproducen los movimientos posteriores, así que el coste lo
+        marca el intervalo entre cierres y no el histórico completo.  Los
+        cierres que faltan o que ya no cuadran se calculan en memoria (no se
+        escribe nada; ver :meth:`save_checkpoints`).
+        Los movimientos sin fecha cuentan como anteriores a cualquier fecha.
+
+        Devuelve {modelo: {talla: cantidad}} con las tallas distintas de 0
+        (solo `modelo` si se indica).
+        """
+        fecha = str(fecha or "").strip()[:10]
+        try:
+            date.fromisoformat(fecha)
+        except ValueError:
+            raise ValueError(f"Fecha no válida (AAAA-MM-DD): {fecha!r}")
+        modelo = str(modelo).strip().upper() if modelo else None
+        mes = fecha[:7]
+
+        conteos = {c: self._conteos_mes(c) for c in self.HISTORIALES}
+        # Solo se cierran meses terminados
+        objetivo = min(self._ultimo_cierre(self._sumar_meses(mes, -1)),
+                       self._ultimo_cierre(self._sumar_meses(datetime.now().strftime("%Y-%m"), -1)))
+        base, stock = self._cierre_hasta(objetivo, conteos)
+        if modelo:
+            stock = {k: q for k, q in stock.items() if k[0] == modelo}
+
+        meses = sorted({m for c in self.HISTORIALES for m in conteos[c]}, key=self._orden_mes)
+        tramo = [m for m in meses if (base is None or self._orden_mes(m) > base) and self._orden_mes(m) <= mes]
+        self._reproducir(stock, tramo, hasta=fecha, modelo=modelo)
+
+        resultado: Dict[str, Dict[str, int]] = {}
+        for (m, t), q in stock.items():
+            if q:
+                resultado.setdefault(m, {})[t] = q
+        return {m: {t: resultado[m][t] for t in CATALOGO_TALLAS.ordenar(resultado[m])}
+                for m in sorted(resultado)}
+
+    def history(self, clave: str, modelo: Optional[str] = None,
+                desde: Optional[str] = None, hasta: Optional[str] = None) -> List[Dict]:
+        """Filas de `historial_entradas`/`historial_salidas` filtradas por modelo y fechas.
+
+        Con SQLiteDataStore (y sin cambios por persistir) se resuelve con una
+        consulta indexada; con históricos por mes solo se leen los meses del
+        rango; con modelo se toman sus filas por posición (ver
+        _indice_modelos); si no, filtrando la lista en memoria.  El filtro
+        por modelo es exacto (los historiales guardan el modelo normalizado).
+        """
+        consulta = getattr(self.store, "query_history", None)
+        if consulta is not None and not self.store._pending_ops and (modelo or desde or hasta):
+            return consulta(clave, modelo=modelo, desde=desde, hasta=hasta)
+        filas = getattr(self, clave)
+        if not (modelo or desde or hasta):
+            return filas
+        if isinstance(filas, HistorialSegmentado) and (desde or hasta):
+            # Solo se leen los meses del rango
+            filas = filas.rango(desde, hasta)
+        elif modelo:
+            # Solo las filas del modelo, por sus posiciones
+            filas = self._filas_modelo(clave, modelo)
+        return [
+            r for r in filas
+            if (not modelo or str(r.get("modelo", "")).strip().upper() == modelo)
+            and (not desde or (r.get("fecha") or "") >= desde)
+            and (not hasta or (r.get("fecha") or "") <= hasta)
+        ]
         
     # --- en class Inventory ---
     # >>> PATCH START: Inventory.audit_and_fix_stock + apply_stock_fixes
-    def audit_and_fix_stock(self, aplicar: bool = False, solo_modelo: str | None = None) -> list[dict]:
+    def audit_and_fix_stock(self, aplicar: bool = False, solo_modelo: str | None = None,
+                            completa: bool = False) -> list[dict]:
         """
-        Audita el stock recalculándolo desde historial_entradas/salidas.
+        Audita el stock comparándolo con el neto de historial_entradas/salidas.
         - aplicar=False: solo calcula y devuelve diferencias (no toca almacén).
         - aplicar=True: aplica TODOS los cambios recibidos (modo legacy, aún soportado).
         - solo_modelo: si se indica, limita la auditoría a ese modelo (upper).
+        - completa=True: recalcula el neto desde los históricos completos y revisa
+          todas las tallas.  Si no, usa el libro de netos y solo revisa lo tocado
+          desde la última auditoría y lo que entonces no cuadraba (la primera
+          auditoría siempre es completa).
 
         Devuelve una lista de dicts: {modelo,talla,antes,despues,delta}
         """
-        from collections import defaultdict
-        neto = defaultdict(int)
-
-        # 1) sumar entradas / salidas
-        for e in self.historial_entradas:
-            m = str(e.get("modelo","")).strip().upper()
-            t = norm_talla(e.get("talla",""))
-            if solo_modelo and m != solo_modelo.upper():
-                continue
-            c = int(e.get("cantidad",0) or 0)
-            neto[(m,t)] += c
-
-        for s in self.historial_salidas:
-            m = str(s.get("modelo","")).strip().upper()
-            t = norm_talla(s.get("talla",""))
-            if solo_modelo and m != solo_modelo.upper():
-                continue
-            c = int(s.get("cantidad",0) or 0)
-            neto[(m,t)] -= c
-
-        # 2) asegurar pares que existan en almacén aunque no estén en neto
-        for m, tallas in self.almacen.items():
-            if solo_modelo and m != solo_modelo.upper():
-                continue
-            for t in tallas.keys():
-                neto.setdefault((m,t), tallas[t])
-
-        # 3) construir lista de diferencias
+        m_filtro = solo_modelo.upper() if solo_modelo else None
+        if completa or self._neto is None:
+            self._reconstruir_neto()
+            # 1) todas las claves con movimientos o con stock
+            claves = set(self._neto)
+            for m, tallas in self.almacen.items():
+                claves.update((m, t) for t in tallas)
+            # Con filtro, el resto de modelos queda pendiente para la siguiente
+            self._tocadas = set(claves)
+        else:
+            # 1) solo lo que puede haber cambiado
+            claves = self._tocadas | self._discrepantes
+        if m_filtro:
+            claves = {k for k in claves if k[0] == m_filtro}
+        self._tocadas -= claves
+        self._discrepantes -= claves
+
+        # 2) comparar (sin movimientos, el stock se da por bueno)
         cambios = []
-        for (m,t), esperado in sorted(neto.items()):
+        for (m, t) in sorted(claves):
             real = self.almacen.get(m, {}).get(t, 0)
+            esperado = self._neto.get((m, t), real)
             if real != esperado:
+                self._discrepantes.add((m, t))
                 cambios.append({
                     "modelo": m,
                     "talla": t,
@@ -770,8 +3962,11 @@ class Inventory:
             for row in cambios:
                 m, t, nuevo = row["modelo"], row["talla"], row["despues"]
                 self.almacen.setdefault(m, {})
+                antes = self.almacen[m].get(t)
                 self.almacen[m][t] = nuevo
-            self.save()
+                self._tocar(m, t)
+                self.store.record("set", ("almacen", m, t), nuevo, previo=antes)
+            self.commit()
 
         return cambios
 
@@ -785,8 +3980,11 @@ class Inventory:
         for row in cambios:
             m, t, nuevo = row["modelo"], row["talla"], int(row["despues"])
             self.almacen.setdefault(m, {})
+            antes = self.almacen[m].get(t)
             self.almacen[m][t] = nuevo
-        self.save()
+            self._tocar(m, t)
+            self.store.record("set", ("almacen", m, t), nuevo, previo=antes)
+        self.commit()
         return len(cambios)
     # >>> PATCH END
 
@@ -839,7 +4037,7 @@ class Inventory:
             if delta < 0:
                 # falta en histórico: metemos ENTRADA de ajuste por -delta
                 entrada = dict(meta)
-                self.historial_entradas.append(entrada)
+                self._registrar_movimiento("historial_entradas", entrada, -delta)
             else:
                 # sobra en histórico: metemos SALIDA de ajuste por delta
                 salida = {
@@ -854,12 +4052,12 @@ class Inventory:
                     "origen": "regularizacion_auditoria",
                     "observaciones": f"{observacion} | antes={row['antes']} despues={row['despues']} delta={delta:+}",
                 }
-                self.historial_salidas.append(salida)
+                self._registrar_movimiento("historial_salidas", salida, -delta)
 
             creados += 1
 
         # Solo guardamos historiales; NO tocamos self.almacen
-        self.save()
+        self.commit()
         return creados
     # >>> PATCH END
 
@@ -878,6 +4076,44 @@ class Prevision:
         self.ordenes: List[Dict] = self.store.data.setdefault("ordenes", [])
         self.pedidos: List[Dict] = self.store.data.setdefault("pedidos", [])
         self.info_modelos: Dict[str, Dict[str, str]] = self.store.data.setdefault("info_modelos", {})
+        # Cantidades validadas una vez (ver tipar_registros)
+        tipar_registros(self.pedidos)
+        self._tipar_fabricacion()
+        # (modelo, talla, pedido) normalizados -> pendientes en orden de alta; se crea al usarlo
+        self._indice_pendientes: Optional[Dict[Tuple[str, str, str], List[Dict]]] = None
+        # modelo -> claves del índice con pendientes de ese modelo (se crea con el índice)
+        self._claves_modelo: Dict[str, Set[Tuple[str, str, str]]] = {}
+        # modelo -> talla -> órdenes de fabricación abiertas por fecha; se crean por modelo al usarlas
+        self._colas_fabricacion: Dict[str, Dict[str, Deque[Dict]]] = {}
+        # modelo -> talla -> [unidades a fabricar, unidades pendientes] (ver calc_estimated_stock);
+        # se crea al usarlo y cada mutación marca su modelo para rehacerlo en la próxima lectura
+        self._previsto: Optional[Dict[str, Dict[str, List[int]]]] = None
+        self._previsto_sucios: Set[str] = set()
+        # modelo -> talla -> (fechas, mínimos) para available_to_promise; por modelo al consultarlo
+        self._atp: Dict[str, Dict[str, Tuple[List[str], List[int]]]] = {}
+
+    def refresh_sections(self, claves: Set[str]) -> None:
+        """Rehace los alias (y lo derivado) de las secciones recargadas desde disco."""
+        if "pedidos" in claves or "pedidos_fabricacion" in claves:
+            self._previsto = None
+            self._atp = {}
+        if "pedidos" in claves:
+            self._indice_pendientes = None
+        if "pedidos_fabricacion" in claves:
+            self._colas_fabricacion = {}
+            self.pedidos_fabricacion = self.store.data.setdefault("pedidos_fabricacion", {})
+            self._tipar_fabricacion()
+        if "ordenes" in claves:
+            self.ordenes = self.store.data.setdefault("ordenes", [])
+        if "pedidos" in claves:
+            self.pedidos = self.store.data.setdefault("pedidos", [])
+            tipar_registros(self.pedidos)
+        if "info_modelos" in claves:
+            self.info_modelos = self.store.data.setdefault("info_modelos", {})
+
+    def _tipar_fabricacion(self) -> None:
+        for lista in self.pedidos_fabricacion.values():
+            tipar_registros(lista)
 
     # ---------------------------------------------------------------------
     # Registro de órdenes de fabricación
@@ -886,14 +4122,139 @@ class Prevision:
         talla = norm_talla(talla)
         if fecha is None:
             fecha = datetime.now().strftime("%Y-%m-%d")
-        self.pedidos_fabricacion.setdefault(modelo, []).append({
+        orden: OrdenFabricacion = {
             "talla": talla,
-            "cantidad": cantidad,
+            "cantidad": int(cantidad),
             "fecha": fecha
-        })
-        self.save()
+        }
+        self.pedidos_fabricacion.setdefault(modelo, []).append(orden)
+        self._encolar(modelo, orden)
+        self._tocar_previsto(modelo)
+        self.store.record("append", ("pedidos_fabricacion", modelo), orden)
+        self.commit()
         print(f"✅ Orden de fabricación registrada: {modelo} T{talla} +{cantidad}")
 
+    def register_orders_bulk(self, lineas, fecha: Optional[str] = None) -> int:
+        """Como register_order para muchas líneas (modelo, talla, cantidad), sin imprimir.
+
+        Todas las órdenes llevan la misma `fecha` (hoy si no se da) y se
+        guardan de una vez.  Las líneas sin unidades se ignoran.  Devuelve
+        cuántas órdenes se han dado de alta.
+        """
+        if fecha is None:
+            fecha = datetime.now().strftime("%Y-%m-%d")
+        altas = 0
+        tocados: Set[str] = set()
+        for modelo, talla, cantidad in lineas:
+            if int(cantidad) <= 0:
+                continue
+            orden: OrdenFabricacion = {
+                "talla": norm_talla(talla),
+                "cantidad": int(cantidad),
+                "fecha": fecha
+            }
+            self.pedidos_fabricacion.setdefault(modelo, []).append(orden)
+            self._encolar(modelo, orden)
+            self.store.record("append", ("pedidos_fabricacion", modelo), orden)
+            tocados.add(modelo)
+            altas += 1
+        self._tocar_previsto(*tocados)
+        self.commit()
+        return altas
+
+    # ---------------------------------------------------------------------
+    # Colas de fabricación por (modelo, talla)
+    # ---------------------------------------------------------------------
+    def _colas(self, modelo: str) -> Dict[str, Deque[Dict]]:
+        """Órdenes abiertas del modelo agrupadas por talla y ordenadas por fecha.
+
+        Son vistas sobre los mismos dicts de `pedidos_fabricacion` (el JSON
+        sigue siendo una lista por modelo); las órdenes sin unidades no
+        entran en la cola.
+        """
+        colas = self._colas_fabricacion.get(modelo)
+        if colas is None:
+            por_talla: Dict[str, List[Dict]] = {}
+            for it in self.pedidos_fabricacion.get(modelo, []):
+                if it.get("cantidad", 0) > 0:
+                    por_talla.setdefault(norm_talla(it.get("talla")), []).append(it)
+            # sorted es estable: a igual fecha manda el orden de alta
+            colas = {t: deque(sorted(its, key=lambda x: x.get("fecha") or ""))
+                     for t, its in por_talla.items()}
+            self._colas_fabricacion[modelo] = colas
+        return colas
+
+    def _encolar(self, modelo: str, orden: Dict) -> None:
+        colas = self._colas_fabricacion.get(modelo)
+        if colas is None or orden.get("cantidad", 0) <= 0:
+            return
+        cola = colas.setdefault(norm_talla(orden.get("talla")), deque())
+        fecha = orden.get("fecha") or ""
+        # Lo habitual es que llegue la más reciente: se busca el hueco desde el final
+        i = len(cola)
+        while i > 0 and (cola[i - 1].get("fecha") or "") > fecha:
+            i -= 1
+        cola.insert(i, orden)
+
+    def cover_fabrication(self, modelo: str, talla: str, cantidad: int) -> int:
+        """Cubre órdenes de fabricación de (modelo, talla) con una entrada, de la más antigua a la más nueva.
+
+        Solo recorre la cola de esa talla.  Las órdenes completadas se
+        eliminan y la última puede quedar parcial; si el modelo se queda sin
+        órdenes desaparece su lista.  Anota las mutaciones (sin persistir)
+        y devuelve las unidades cubiertas.
+        """
+        return self.cover_fabrication_bulk([(modelo, talla, cantidad)])[0]
+
+    def cover_fabrication_bulk(self, lineas) -> List[int]:
+        """Como cover_fabrication para muchas entradas (modelo, talla, cantidad) en una pasada.
+
+        Las líneas consumen las colas en orden; al final, por cada modelo
+        tocado, las órdenes completadas se quitan de su lista de una vez y
+        cada orden anota lo cubierto como "consume" (fusionable aunque otro
+        proceso haya cubierto la misma orden).  Devuelve las unidades
+        cubiertas por línea.
+        """
+        cubiertas: List[int] = []
+        tocadas: Dict[str, Dict[int, Tuple[Dict, Dict]]] = {}   # modelo -> id -> (orden, previo)
+        completas: Set[int] = set()
+        for modelo, talla, cantidad in lineas:
+            talla = norm_talla(talla)
+            colas = self._colas(modelo)
+            cola = colas.get(talla)
+            restante = int(cantidad)
+            while cola and restante > 0:
+                orden = cola[0]
+                tocadas.setdefault(modelo, {}).setdefault(id(orden), (orden, dict(orden)))
+                por_cubrir = orden.get("cantidad", 0)
+                if restante < por_cubrir:
+                    orden["cantidad"] = por_cubrir - restante
+                    restante = 0
+                else:
+                    restante -= por_cubrir
+                    completas.add(id(orden))
+                    cola.popleft()
+            if cola is not None and not cola:
+                colas.pop(talla, None)
+            cubiertas.append(int(cantidad) - restante)
+
+        self._tocar_previsto(*tocadas)
+        for modelo, ordenes in tocadas.items():
+            lista = self.pedidos_fabricacion[modelo]
+            pos = {id(x): i for i, x in enumerate(lista) if id(x) in ordenes}
+            # De atrás adelante: quitar una orden completa no mueve las anteriores
+            for clave in sorted(ordenes, key=pos.__getitem__, reverse=True):
+                orden, previo = ordenes[clave]
+                final = 0 if clave in completas else orden["cantidad"]
+                self.store.record("consume", ("pedidos_fabricacion", modelo, pos[clave], "cantidad"),
+                                  previo.get("cantidad", 0) - final, previo=previo)
+            lista[:] = [x for x in lista if id(x) not in completas]
+            if not lista:
+                self.pedidos_fabricacion.pop(modelo, None)
+                self._colas_fabricacion.pop(modelo, None)
+                self.store.record("del", ("pedidos_fabricacion", modelo), previo=[])
+        return cubiertas
+
 
     # ---------------------------------------------------------------------
     # Registro de pedidos pendientes
@@ -908,7 +4269,7 @@ class Prevision:
         pedido = norm_codigo(pedido)
         numero_pedido = norm_codigo(numero_pedido)
 
-        self.pedidos.append({
+        pendiente: Pendiente = {
             "modelo": modelo,
             "talla": talla,
             "cantidad": int(cantidad),
@@ -916,10 +4277,149 @@ class Prevision:
             "numero_pedido": numero_pedido or "",
             "cliente": cliente,
             "fecha": fecha,
-        })
-        self.save()
+        }
+        self.pedidos.append(pendiente)
+        self._indexar(pendiente)
+        self._tocar_previsto(modelo)
+        self.store.record("append", ("pedidos",), pendiente)
+        self.commit()
         print(f"✅ Pedido pendiente registrado: {modelo} T{talla} -{cantidad}")
         
+    # -----------------------------
+    # Índice de pendientes por (modelo, talla, pedido)
+    # -----------------------------
+    @staticmethod
+    def clave_pendiente(modelo, talla, pedido) -> Tuple[str, str, str]:
+        """Clave normalizada con la que se casan salidas y pedidos pendientes."""
+        return str(modelo).strip().upper(), norm_talla(talla), norm_codigo(pedido)
+
+    @classmethod
+    def _clave_de(cls, p: Dict) -> Tuple[str, str, str]:
+        return cls.clave_pendiente(p.get("modelo", ""), p.get("talla", ""), p.get("pedido", ""))
+
+    def _indice(self) -> Dict[Tuple[str, str, str], List[Dict]]:
+        if self._indice_pendientes is None:
+            indice: Dict[Tuple[str, str, str], List[Dict]] = {}
+            for p in self.pedidos:
+                indice.setdefault(self._clave_de(p), []).append(p)
+            claves_modelo: Dict[str, Set[Tuple[str, str, str]]] = {}
+            for clave in indice:
+                claves_modelo.setdefault(clave[0], set()).add(clave)
+            self._indice_pendientes = indice
+            self._claves_modelo = claves_modelo
+        return self._indice_pendientes
+
+    def _cubo(self, clave: Tuple[str, str, str]) -> List[Dict]:
+        """Cubo del índice para `clave`; si no existía, lo crea y lo apunta en su modelo."""
+        cubo = self._indice_pendientes.get(clave)
+        if cubo is None:
+            cubo = self._indice_pendientes[clave] = []
+            self._claves_modelo.setdefault(clave[0], set()).add(clave)
+        return cubo
+
+    def _quitar_cubo(self, clave: Tuple[str, str, str]) -> None:
+        self._indice_pendientes.pop(clave, None)
+        claves = self._claves_modelo.get(clave[0])
+        if claves is not None:
+            claves.discard(clave)
+            if not claves:
+                del self._claves_modelo[clave[0]]
+
+    def _indexar(self, p: Dict) -> None:
+        """Añade al índice un pendiente recién añadido al final de la lista."""
+        if self._indice_pendientes is not None:
+            self._cubo(self._clave_de(p)).append(p)
+
+    def _desindexar(self, p: Dict, clave: Tuple[str, str, str]) -> None:
+        if self._indice_pendientes is None:
+            return
+        cubo = self._indice_pendientes.get(clave, [])
+        for i, x in enumerate(cubo):
+            if x is p:
+                del cubo[i]
+                break
+        if not cubo:
+            self._quitar_cubo(clave)
+
+    def _pendientes_modelo(self, modelo: str) -> List[Dict]:
+        """Pendientes del modelo (ya normalizado) por el índice, sin recorrer la lista."""
+        indice = self._indice()
+        return [p for clave in self._claves_modelo.get(modelo, ()) for p in indice[clave]]
+
+    def _posicion(self, p: Dict) -> int:
+        """Posición de `p` (por identidad) en la lista de pendientes."""
+        i = self.pedidos.index(p)      # búsqueda en C; puede dar antes un duplicado igual
+        while self.pedidos[i] is not p:
+            i = self.pedidos.index(p, i + 1)
+        return i
+
+    # Hasta cuántos pendientes sale más barato buscarlos uno a uno (en C) que recorrer la lista
+    _POCOS = 16
+
+    def _posiciones(self, pendientes: List[Dict]) -> Dict[int, int]:
+        """id -> posición en la lista de cada uno de `pendientes`."""
+        if len(pendientes) <= self._POCOS:
+            return {id(p): self._posicion(p) for p in pendientes}
+        ids = {id(p) for p in pendientes}
+        return {id(p): i for i, p in enumerate(self.pedidos) if id(p) in ids}
+
+    def consume_pendings(self, modelo: str, talla: str, pedido: str, cantidad: int) -> int:
+        """Descuenta `cantidad` de los pendientes de (modelo, talla, pedido) en orden de alta.
+
+        Los que quedan cubiertos se eliminan y el último puede quedar con
+        cantidad parcial.  Va por el índice: el coste depende de los
+        pendientes de esa clave, no del total.  Anota las mutaciones (sin
+        persistir) y devuelve las unidades servidas.
+        """
+        return self.consume_pendings_bulk([(modelo, talla, pedido, cantidad)])[0]
+
+    def consume_pendings_bulk(self, lineas) -> List[int]:
+        """Como consume_pendings para muchas salidas (modelo, talla, pedido, cantidad) en una pasada.
+
+        Las líneas se casan en orden por el índice; al final los pendientes
+        servidos del todo se quitan de la lista en un solo recorrido y cada
+        pendiente tocado anota lo servido como "consume".  Devuelve las
+        unidades servidas por línea.
+        """
+        indice = self._indice()
+        servidas: List[int] = []
+        tocados: Dict[int, Tuple[Dict, Dict]] = {}   # id -> (pendiente, previo)
+        completos: Set[int] = set()
+        for modelo, talla, pedido, cantidad in lineas:
+            clave = self.clave_pendiente(modelo, talla, pedido)
+            cubo = indice.get(clave)
+            restante = cantidad
+            while cubo and restante > 0:
+                p = cubo[0]
+                tocados.setdefault(id(p), (p, dict(p)))
+                if restante < p["cantidad"]:
+                    p["cantidad"] -= restante
+                    restante = 0
+                else:
+                    restante -= p["cantidad"]
+                    completos.add(id(p))
+                    del cubo[0]
+            if cubo is not None and not cubo:
+                self._quitar_cubo(clave)
+            if restante != cantidad:
+                self._tocar_previsto(clave[0])
+            servidas.append(cantidad - restante)
+
+        if tocados:
+            pos = self._posiciones([p for p, _ in tocados.values()])
+            pocos = len(tocados) <= self._POCOS
+            # De atrás adelante: quitar un pendiente servido no mueve los anteriores
+            for clave in sorted(tocados, key=pos.__getitem__, reverse=True):
+                p, previo = tocados[clave]
+                final = 0 if clave in completos else p["cantidad"]
+                self.store.record("consume", ("pedidos", pos[clave], "cantidad"),
+                                  previo["cantidad"] - final, previo=previo)
+                if pocos and clave in completos:
+                    del self.pedidos[pos[clave]]
+            if completos and not pocos:
+                self.pedidos[:] = [p for p in self.pedidos if id(p) not in completos]
+        return servidas
+
     # -----------------------------
     # Utilidades de listado (con índice)
     # -----------------------------
@@ -927,6 +4427,25 @@ class Prevision:
         """Devuelve lista [(idx, dict_pedido), ...]."""
         return list(enumerate(self.pedidos, start=1))
 
+    def pendings_for(self, modelo: str, talla: Optional[str] = None,
+                     pedido: Optional[str] = None) -> List[Dict]:
+        """Pendientes de un modelo, opcionalmente filtrados por talla y pedido.
+
+        Siempre por el índice en memoria y con la misma normalización que
+        :meth:`clave_pendiente` ('1234.0' y 1234 son el mismo pedido).  Sin
+        la clave completa se recorren solo las claves del modelo; cada
+        clave devuelve sus pendientes en orden de alta.
+        """
+        if talla is not None and pedido is not None:
+            # Clave completa: un solo cubo
+            return list(self._indice().get(self.clave_pendiente(modelo, talla, pedido), []))
+        modelo, talla_n, pedido_n = self.clave_pendiente(modelo, "" if talla is None else talla,
+                                                          "" if pedido is None else pedido)
+        indice = self._indice()
+        return [p for clave in sorted(self._claves_modelo.get(modelo, ()))
+                if (talla is None or clave[1] == talla_n) and (pedido is None or clave[2] == pedido_n)
+                for p in indice[clave]]
+
     # -----------------------------
     # Editar / Eliminar PEDIDOS PENDIENTES
     # -----------------------------
@@ -939,22 +4458,33 @@ class Prevision:
             print("❌ Índice fuera de rango.")
             return
 
+        if cantidad is not None and cantidad < 0:
+            print("❌ Cantidad no puede ser negativa en pedidos.")
+            return
+
         ped = self.pedidos[index - 1]
+        previo = dict(ped)
 
         # Aplicar cambios directamente sobre el pedido
         if modelo: ped["modelo"] = modelo.upper().strip()
         if talla: ped["talla"] = norm_talla(talla)
         if cantidad is not None:
-            if cantidad < 0:
-                print("❌ Cantidad no puede ser negativa en pedidos.")
-                return
-            ped["cantidad"] = cantidad
+            ped["cantidad"] = int(cantidad)
         if pedido is not None: ped["pedido"] = norm_codigo(pedido)
         if cliente is not None: ped["cliente"] = cliente
         if fecha is not None: ped["fecha"] = fecha
         if numero_pedido is not None: ped["numero_pedido"] = norm_codigo(numero_pedido)
 
-        self.save()
+        clave_antes, clave = self._clave_de(previo), self._clave_de(ped)
+        self._tocar_previsto(clave_antes[0], clave[0])
+        if clave != clave_antes and self._indice_pendientes is not None:
+            self._desindexar(ped, clave_antes)
+            # Se inserta respetando el orden de la lista (los cubos son cortos)
+            cubo = self._cubo(clave)
+            pos = next((j for j, x in enumerate(cubo) if self._posicion(x) > index - 1), len(cubo))
+            cubo.insert(pos, ped)
+        self.store.record("set", ("pedidos", index - 1), ped, previo=previo)
+        self.commit()
         print("✅ Pedido pendiente actualizado.")
 
     def delete_pending(self, index: int) -> None:
@@ -963,8 +4493,12 @@ class Prevision:
             print("❌ Índice fuera de rango.")
             return
 
-        self.pedidos.pop(index - 1)
-        self.save()
+        previo = self.pedidos.pop(index - 1)
+        clave = self._clave_de(previo)
+        self._desindexar(previo, clave)
+        self._tocar_previsto(clave[0])
+        self.store.record("del", ("pedidos", index - 1), previo=previo)
+        self.commit()
         print("🗑️ Pedido pendiente eliminado.")
 
     # -----------------------------
@@ -981,7 +4515,7 @@ class Prevision:
                     {
                         "modelo": modelo,
                         "talla": norm_talla(it.get("talla","")),
-                        "cantidad": int(it.get("cantidad",0) or 0),
+                        "cantidad": it.get("cantidad", 0),
                         "fecha": it.get("fecha") or "",
                         "_pos": i  # posición interna dentro del modelo
                     }
@@ -1000,11 +4534,15 @@ class Prevision:
         m = it["modelo"]
         pos = it["_pos"]
 
-        self.pedidos_fabricacion[m].pop(pos)
+        previo = self.pedidos_fabricacion[m].pop(pos)
+        self._colas_fabricacion.pop(m, None)
+        self._tocar_previsto(m)
+        self.store.record("del", ("pedidos_fabricacion", m, pos), previo=previo)
         if not self.pedidos_fabricacion[m]:
             self.pedidos_fabricacion.pop(m, None)
+            self.store.record("del", ("pedidos_fabricacion", m), previo=[])
 
-        self.save()
+        self.commit()
         print("🗑️ Orden de fabricación eliminada.")
 
     
@@ -1028,19 +4566,26 @@ class Prevision:
         _, it = items[index - 1]
         m = it["modelo"]
         pos = it["_pos"]
+        # La orden puede entrar o salir de su cola: se rehace la del modelo al usarla
+        self._colas_fabricacion.pop(m, None)
+        self._tocar_previsto(m)
 
         if nueva_cantidad == 0:
             # Borrar la orden
-            self.pedidos_fabricacion[m].pop(pos)
+            previo = self.pedidos_fabricacion[m].pop(pos)
+            self.store.record("del", ("pedidos_fabricacion", m, pos), previo=previo)
             if not self.pedidos_fabricacion[m]:
                 self.pedidos_fabricacion.pop(m, None)
-            self.save()
+                self.store.record("del", ("pedidos_fabricacion", m), previo=[])
+            self.commit()
             print("🗑️ Orden de fabricación eliminada (cantidad editada a 0).")
             return
 
         # Actualizar la cantidad de la orden
+        previo = dict(self.pedidos_fabricacion[m][pos])
         self.pedidos_fabricacion[m][pos]["cantidad"] = int(nueva_cantidad)
-        self.save()
+        self.store.record("set", ("pedidos_fabricacion", m, pos, "cantidad"), int(nueva_cantidad), previo=previo)
+        self.commit()
         print(f"✏️ Orden actualizada: {m} T{it['talla']} → {nueva_cantidad}.")
 
 
@@ -1048,42 +4593,148 @@ class Prevision:
     # ---------------------------------------------------------------------
     # Cálculo de stock estimado
     # ---------------------------------------------------------------------
-    def calc_estimated_stock(self, inventory: Inventory) -> List[Dict[str, object]]:
+    def _tocar_previsto(self, *modelos: str) -> None:
+        """Marca los modelos cuya fabricación o pendientes han cambiado (tabla prevista y ATP)."""
+        if self._previsto is not None:
+            self._previsto_sucios.update(modelos)
+        for modelo in modelos:
+            self._atp.pop(modelo, None)
+
+    def _previsto_modelo(self, modelo: str) -> Dict[str, List[int]]:
+        """talla -> [a fabricar, pendientes] del modelo, por su lista de fabricación y el índice."""
+        por_talla: Dict[str, List[int]] = {}
+        for it in self.pedidos_fabricacion.get(modelo, []):
+            por_talla.setdefault(norm_talla(it.get("talla", "")), [0, 0])[0] += it.get("cantidad", 0)
+        indice = self._indice()
+        for clave in self._claves_modelo.get(modelo, ()):
+            fila = por_talla.setdefault(clave[1], [0, 0])
+            fila[1] += sum(p.get("cantidad", 0) for p in indice[clave])
+        return por_talla
+
+    def _tabla_prevista(self) -> Dict[str, Dict[str, List[int]]]:
+        """Fabricación y pendientes por modelo/talla, al día (solo se rehacen los modelos marcados)."""
+        if self._previsto is None:
+            # Una pasada por cada lista
+            previsto: Dict[str, Dict[str, List[int]]] = {}
+            for modelo, items in self.pedidos_fabricacion.items():
+                por_talla = previsto.setdefault(modelo, {})
+                for it in items:
+                    por_talla.setdefault(norm_talla(it.get("talla", "")), [0, 0])[0] += it.get("cantidad", 0)
+            for p in self.pedidos:
+                modelo, talla, _ = self._clave_de(p)
+                previsto.setdefault(modelo, {}).setdefault(talla, [0, 0])[1] += p.get("cantidad", 0)
+            self._previsto = previsto
+            self._previsto_sucios = set()
+        elif self._previsto_sucios:
+            self._indice()
+            for modelo in self._previsto_sucios:
+                if modelo in self.pedidos_fabricacion or modelo in self._claves_modelo:
+                    self._previsto[modelo] = self._previsto_modelo(modelo)
+                else:
+                    self._previsto.pop(modelo, None)
+            self._previsto_sucios = set()
+        return self._previsto
+
+    @staticmethod
+    def _normalizar_columna(serie, fn):
+        """Aplica `fn` una vez por valor distinto de la columna (no por fila)."""
+        codigos, unicos = pd.factorize(serie)
+        normalizados = [fn(v) for v in unicos]
+        if (codigos < 0).any():
+            normalizados.append(fn(None))   # el -1 de los nulos toma el último
+        return np.asarray(normalizados, dtype=object)[codigos]
+
+    def _estimado_pandas(self, inventory: Inventory) -> List[Dict[str, object]]:
+        """Motor "pandas" de calc_estimated_stock: agrega las tres fuentes con group-by.
+
+        Las tallas (y los modelos de los pendientes) se normalizan una vez
+        por valor distinto, se suman por (modelo, talla) y se unen por
+        fuera; el orden y las filas son los del cálculo por modelo/talla.
+        """
+        columnas = ["modelo", "talla", "cantidad"]
+        real = pd.DataFrame(
+            [(m, t, int(q)) for m, tallas in inventory.almacen.items() for t, q in tallas.items()],
+            columns=columnas, dtype=object,
+        ).set_index(["modelo", "talla"])["cantidad"].rename("real")
+        fab = pd.DataFrame(
+            [(m, it.get("talla", ""), it.get("cantidad", 0))
+             for m, items in self.pedidos_fabricacion.items() for it in items],
+            columns=columnas, dtype=object,
+        )
+        fab["talla"] = self._normalizar_columna(fab["talla"], norm_talla)
+        pend = pd.DataFrame(
+            [(p.get("modelo", ""), p.get("talla", ""), p.get("cantidad", 0)) for p in self.pedidos],
+            columns=columnas, dtype=object,
+        )
+        pend["modelo"] = self._normalizar_columna(pend["modelo"], lambda m: str(m).strip().upper())
+        pend["talla"] = self._normalizar_columna(pend["talla"], norm_talla)
+        partes = [
+            real,
+            fab.groupby(["modelo", "talla"], sort=False)["cantidad"].sum().rename("fabricar"),
+            pend.groupby(["modelo", "talla"], sort=False)["cantidad"].sum().rename("pendientes"),
+        ]
+        partes = [x for x in partes if len(x)]
+        if not partes:
+            return []
+        tabla = pd.concat(partes, axis=1).reindex(columns=["real", "fabricar", "pendientes"]).fillna(0)
+        modelos = tabla.index.get_level_values(0)
+        tallas = tabla.index.get_level_values(1)
+        rangos = CATALOGO_TALLAS.rangos(tallas.unique())
+        filas = pd.DataFrame({
+            "modelo": modelos.astype(object),
+            "rango": tallas.map(rangos).astype("int64"),
+            "talla": tallas.astype(object),
+            "total": (tabla["real"] + tabla["fabricar"] - tabla["pendientes"]).astype("int64").to_numpy(),
+        }).sort_values(["modelo", "rango", "talla"], kind="mergesort")
+
+        fichas = {m: inventory.info_modelos.get(m, {}) or self.info_modelos.get(m, {})
+                  for m in filas["modelo"].unique()}
+        return [
+            {
+                "modelo": m,
+                "descripcion": fichas[m].get("descripcion", ""),
+                "color": fichas[m].get("color", ""),
+                "talla": t,
+                "stock_estimado": q,
+            }
+            for m, t, q in zip(filas["modelo"].tolist(), filas["talla"].tolist(), filas["total"].tolist())
+        ]
+
+    # Motores de calc_estimated_stock
+    MOTORES_ESTIMADO = ("tabla", "pandas")
+
+    def calc_estimated_stock(self, inventory: Inventory, motor: str = "tabla") -> List[Dict[str, object]]:
         """
         Stock estimado = stock real + (sumatorio de pedidos_fabricacion) - (sumatorio de pedidos pendientes),
         calculado al vuelo por modelo/talla. No usa 'stock_previsto' persistido.
+
+        Con el motor "tabla", fabricación y pendientes salen de una tabla en
+        memoria que se mantiene con cada alta, salida, entrada o edición
+        (ver _tabla_prevista) y el stock real se lee del almacén, así que el
+        coste es el de las filas devueltas.  El motor "pandas" lo calcula
+        entero con DataFrames (ver _estimado_pandas); sin pandas se usa la
+        tabla.  Ambos dan las mismas filas en el mismo orden.
         """
+        if motor not in self.MOTORES_ESTIMADO:
+            raise ValueError(f"Motor de stock estimado desconocido: {motor}")
+        if motor == "pandas" and pd is not None:
+            return self._estimado_pandas(inventory)
+
         result: List[Dict[str, object]] = []
+        previsto = self._tabla_prevista()
 
-        # Construir el set de todos los modelos y tallas que aparecen en alguna parte
-        modelos = set(inventory.almacen.keys()) \
-                | set(self.pedidos_fabricacion.keys()) \
-                | {str(p.get("modelo","")).strip().upper() for p in self.pedidos}
+        # Todos los modelos que aparecen en alguna parte
+        modelos = set(inventory.almacen.keys()) | set(previsto)
 
         for modelo in sorted(modelos):
             info = inventory.info_modelos.get(modelo, {}) or self.info_modelos.get(modelo, {})
+            stock = inventory.almacen.get(modelo, {})
+            por_talla = previsto.get(modelo, {})
 
-            tallas = set(inventory.almacen.get(modelo, {}).keys())
-            tallas |= {norm_talla(it.get("talla","")) for it in self.pedidos_fabricacion.get(modelo, [])}
-            tallas |= {norm_talla(p.get("talla","")) for p in self.pedidos if str(p.get("modelo","")).strip().upper() == modelo}
-
-            for talla in sorted(tallas, key=talla_sort_key):
-                real = int(inventory.almacen.get(modelo, {}).get(talla, 0))
-
-                fabricar = sum(
-                    int(it.get("cantidad", 0) or 0)
-                    for it in self.pedidos_fabricacion.get(modelo, [])
-                    if norm_talla(it.get("talla","")) == talla
-                )
-
-                pendientes = sum(
-                    int(p.get("cantidad", 0) or 0)
-                    for p in self.pedidos
-                    if str(p.get("modelo","")).strip().upper() == modelo
-                    and norm_talla(p.get("talla","")) == talla
-                )
-
-                total = real + fabricar - pendientes
+            # A igual rango (p. ej. "s" sin normalizar en el almacén y "S") decide la etiqueta
+            for talla in CATALOGO_TALLAS.ordenar(sorted(set(stock) | set(por_talla))):
+                fabricar, pendientes = por_talla.get(talla, (0, 0))
+                total = int(stock.get(talla, 0)) + fabricar - pendientes
 
                 result.append({
                     "modelo": modelo,
@@ -1095,9 +4746,453 @@ class Prevision:
 
         return result
 
+    # ---------------------------------------------------------------------
+    # Orden de corte sugerida
+    # ---------------------------------------------------------------------
+    # Motores de suggest_cut_orders
+    MOTORES_CORTE = ("python", "numpy")
+
+    def _datos_corte(self, inventory: Inventory, talleres, dias_historial: int) -> Dict[str, object]:
+        """Columnas de entrada de suggest_cut_orders, una fila por (modelo, talla).
+
+        Filas del stock estimado más las tallas con salidas que ya no estén
+        en él, agrupadas por modelo y en orden de talla.  La demanda son las
+        salidas de los últimos `dias_historial` días y el taller de cada
+        modelo, el de su última entrada en ese tiempo (sin taller: mínimo 0,
+        lote 1).
+        """
+        desde = (datetime.now() - timedelta(days=dias_historial)).strftime("%Y-%m-%d")
+        demanda: Dict[Tuple[str, str], int] = {}
+        for r in inventory.history("historial_salidas", desde=desde):
+            clave = (str(r.get("modelo", "")).strip().upper(), norm_talla(r.get("talla", "")))
+            demanda[clave] = demanda.get(clave, 0) + int(r.get("cantidad", 0) or 0)
+        taller_modelo: Dict[str, str] = {}
+        for r in inventory.history("historial_entradas", desde=desde):
+            if r.get("taller"):
+                taller_modelo[str(r.get("modelo", "")).strip().upper()] = r["taller"]
+        por_nombre = {t.nombre: t for t in talleres}
+
+        filas = self.calc_estimated_stock(inventory)
+        vistas = {(f["modelo"], f["talla"]) for f in filas}
+        nuevas = [k for k in demanda if k not in vistas]
+        if nuevas:
+            for m, t in nuevas:
+                info = inventory.info_modelos.get(m, {}) or self.info_modelos.get(m, {})
+                filas.append({"modelo": m, "descripcion": info.get("descripcion", ""),
+                              "color": info.get("color", ""), "talla": t, "stock_estimado": 0})
+            rangos = CATALOGO_TALLAS.rangos(f["talla"] for f in filas)
+            filas.sort(key=lambda f: (f["modelo"], rangos[f["talla"]], f["talla"]))
+
+        talleres_fila = [taller_modelo.get(f["modelo"], "") for f in filas]
+        return {
+            "filas": filas,
+            "demanda": [demanda.get((f["modelo"], f["talla"]), 0) for f in filas],
+            "estimado": [int(f["stock_estimado"]) for f in filas],
+            "taller": talleres_fila,
+            "minimo": [por_nombre[t].minimo if t in por_nombre else 0 for t in talleres_fila],
+            "lote": [max(por_nombre[t].lote, 1) if t in por_nombre else 1 for t in talleres_fila],
+        }
+
+    @staticmethod
+    def _corte_python(datos: Dict[str, object], cobertura_dias: int, dias_historial: int) -> List[int]:
+        """Motor "python" de suggest_cut_orders: un recorrido por modelo."""
+        filas, demanda, estimado = datos["filas"], datos["demanda"], datos["estimado"]
+        cantidades = [0] * len(filas)
+        i = 0
+        while i < len(filas):
+            j = i
+            while j < len(filas) and filas[j]["modelo"] == filas[i]["modelo"]:
+                j += 1
+            tramo = range(i, j)
+            necesidad = {k: max(-(-demanda[k] * cobertura_dias // dias_historial) - estimado[k], 0) for k in tramo}
+            base = sum(necesidad.values())
+            if base:
+                lote = datos["lote"][i]
+                total = -(-max(base, datos["minimo"][i]) // lote) * lote
+                extra = total - base
+                # Lo que añaden mínimo y lote se reparte según la curva de tallas (las
+                # tallas con más devoluciones que ventas no cuentan) o, sin curva,
+                # según lo que falta
+                pesos = {k: max(demanda[k], 0) for k in tramo}
+                if not sum(pesos.values()):
+                    pesos = necesidad
+                suma = sum(pesos.values())
+                reparto = {k: extra * pesos[k] // suma for k in tramo}
+                restos = sorted(tramo, key=lambda k: (-(extra * pesos[k] % suma), k))
+                for k in restos[:extra - sum(reparto.values())]:
+                    reparto[k] += 1
+                for k in tramo:
+                    cantidades[k] = necesidad[k] + reparto[k]
+            i = j
+        return cantidades
+
+    @staticmethod
+    def _corte_numpy(datos: Dict[str, object], cobertura_dias: int, dias_historial: int) -> List[int]:
+        """Motor "numpy" de suggest_cut_orders: todo el catálogo con operaciones por columnas.
+
+        Los modelos son tramos contiguos de filas; las sumas por modelo
+        salen de np.add.reduceat y el reparto del resto, de una ordenación
+        por (modelo, resto, fila).  Da lo mismo que _corte_python.
+        """
+        n = len(datos["filas"])
+        if not n:
+            return []
+        modelos = np.asarray([f["modelo"] for f in datos["filas"]], dtype=object)
+        inicio = np.flatnonzero(np.r_[True, modelos[1:] != modelos[:-1]])
+        grupo = np.repeat(np.arange(len(inicio)), np.diff(np.r_[inicio, n]))
+        demanda = np.asarray(datos["demanda"], dtype=np.int64)
+        estimado = np.asarray(datos["estimado"], dtype=np.int64)
+        minimo = np.asarray(datos["minimo"], dtype=np.int64)[inicio]
+        lote = np.asarray(datos["lote"], dtype=np.int64)[inicio]
+
+        necesidad = np.maximum(-(-demanda * cobertura_dias // dias_historial) - estimado, 0)
+        base = np.add.reduceat(necesidad, inicio)
+        total = np.where(base > 0, -(-np.maximum(base, minimo) // lote) * lote, 0)
+        extra = (total - base)[grupo]
+        vendido = np.maximum(demanda, 0)
+        con_demanda = np.add.reduceat(vendido, inicio) > 0
+        pesos = np.where(con_demanda[grupo], vendido, necesidad)
+        suma = np.maximum(np.add.reduceat(pesos, inicio), 1)[grupo]
+        reparto = extra * pesos // suma
+        restos = extra * pesos % suma
+        faltan = (total - base) - np.add.reduceat(reparto, inicio)
+        orden = np.lexsort((np.arange(n), -restos, grupo))
+        puesto = np.empty(n, dtype=np.int64)
+        puesto[orden] = np.arange(n) - inicio[grupo[orden]]
+        reparto += puesto < faltan[grupo]
+        return (necesidad + reparto).tolist()
+
+    def suggest_cut_orders(self, inventory: Inventory, talleres=(), cobertura_dias: int = 90,
+                           dias_historial: int = 365, motor: str = "numpy") -> List[Dict[str, object]]:
+        """Cortes sugeridos por (modelo, talla) para cubrir `cobertura_dias` de ventas.
+
+        La curva de tallas de cada modelo sale de sus salidas de los últimos
+        `dias_historial` días: el objetivo de una talla es lo vendido en ella
+        escalado a la cobertura (redondeando hacia arriba) y se corta lo que
+        falte sobre el stock estimado.  Si el total del modelo no llega al
+        mínimo de su taller o no es múltiplo de su lote (`talleres`: los
+        Workshop, ver WorkshopManager.list_all), se sube y lo añadido se
+        reparte según la curva (o según lo que falta, si no hay ventas).
+
+        El motor "numpy" calcula el catálogo entero por columnas (ver
+        _corte_numpy); sin numpy se usa "python".  Devuelve solo las filas
+        con corte: {modelo, descripcion, color, taller, talla, demanda,
+        stock_estimado, objetivo, cantidad}, listas para register_orders_bulk.
+        """
+        if motor not in self.MOTORES_CORTE:
+            raise ValueError(f"Motor de orden de corte desconocido: {motor}")
+        cobertura_dias, dias_historial = max(int(cobertura_dias), 0), max(int(dias_historial), 1)
+        datos = self._datos_corte(inventory, talleres, dias_historial)
+        if motor == "numpy" and np is not None:
+            cantidades = self._corte_numpy(datos, cobertura_dias, dias_historial)
+        else:
+            cantidades = self._corte_python(datos, cobertura_dias, dias_historial)
+        return [
+            {
+                "modelo": f["modelo"],
+                "descripcion": f["descripcion"],
+                "color": f["color"],
+                "taller": taller,
+                "talla": f["talla"],
+                "demanda": demanda,
+                "stock_estimado": f["stock_estimado"],
+                "objetivo": -(-demanda * cobertura_dias // dias_historial),
+                "cantidad": q,
+            }
+            for f, taller, demanda, q in zip(datos["filas"], datos["taller"], datos["demanda"], cantidades)
+            if q > 0
+        ]
+
+    # ---------------------------------------------------------------------
+    # Proyección de stock por periodos
+    # ---------------------------------------------------------------------
+    PERIODOS_PROYECCION = ("mes", "semana")
+
+    @staticmethod
+    def periodo_de(fecha, periodo: str = "mes") -> Optional[str]:
+        """Periodo "AAAA-MM" (o semana ISO "AAAA-Wss") de una fecha AAAA-MM-DD; None si no lo es."""
+        try:
+            d = datetime.strptime(str(fecha or "")[:10], "%Y-%m-%d")
+        except ValueError:
+            return None
+        if periodo == "semana":
+            anio, semana, _ = d.isocalendar()
+            return f"{anio:04d}-W{semana:02d}"
+        return f"{d.year:04d}-{d.month:02d}"
+
+    def _proyeccion(self, inventory: Inventory, periodo: str, modelo: Optional[str] = None):
+        """Genera ((modelo, talla), tramos) con tramos = [(periodo, entradas, salidas, stock), ...].
+
+        Las órdenes de fabricación entran en el periodo de su `fecha` y los
+        pendientes salen en el de la suya (la FechaEntrega importada); lo
+        vencido o sin fecha cuenta en el periodo en curso, que siempre es
+        el primer tramo y parte del stock real.  Por clave se ordenan sus
+        movimientos una vez y se acumulan en un solo recorrido; el último
+        tramo coincide con calc_estimated_stock.  Con `modelo`, solo sus tallas.
+        """
+        if periodo not in self.PERIODOS_PROYECCION:
+            raise ValueError(f"Periodo de proyección desconocido: {periodo}")
+        actual = self.periodo_de(datetime.now().strftime("%Y-%m-%d"), periodo)
+        periodos: Dict[object, str] = {}   # fecha -> periodo (se repiten mucho)
+
+        def periodo_mov(fecha) -> str:
+            per = periodos.get(fecha)
+            if per is None:
+                per = max(self.periodo_de(fecha, periodo) or actual, actual)
+                periodos[fecha] = per
+            return per
+
+        # (modelo, talla) como en calc_estimated_stock -> [(periodo, entra, sale)]
+        eventos: Dict[Tuple[str, str], List[Tuple[str, int, int]]] = {}
+        for m, items in self.pedidos_fabricacion.items():
+            for it in items:
+                eventos.setdefault((m, norm_talla(it.get("talla", ""))), []).append(
+                    (periodo_mov(it.get("fecha")), it.get("cantidad", 0), 0))
+        # Los pendientes, por el índice (ya normalizados)
+        for (m, talla, _), cubo in self._indice().items():
+            evs = eventos.setdefault((m, talla), [])
+            evs.extend((periodo_mov(p.get("fecha")), 0, p.get("cantidad", 0)) for p in cubo)
+
+        claves = set(eventos)
+        claves.update((m, t) for m, tallas in inventory.almacen.items() for t in tallas)
+        if modelo:
+            claves = {k for k in claves if k[0] == modelo}
+        rangos = CATALOGO_TALLAS.rangos(t for _, t in claves)
+        for clave in sorted(claves, key=lambda k: (k[0], rangos[k[1]], k[1])):
+            stock = int(inventory.almacen.get(clave[0], {}).get(clave[1], 0))
+            tramos: List[Tuple[str, int, int, int]] = []
+            per, entradas, salidas = actual, 0, 0
+            for per_mov, entra, sale in sorted(eventos.get(clave, ())):
+                if per_mov != per:
+                    stock += entradas - salidas
+                    tramos.append((per, entradas, salidas, stock))
+                    per, entradas, salidas = per_mov, 0, 0
+                entradas += entra
+                salidas += sale
+            stock += entradas - salidas
+            tramos.append((per, entradas, salidas, stock))
+            yield clave, tramos
+
+    def project_stock(self, inventory: Inventory, periodo: str = "mes",
+                      modelo: Optional[str] = None) -> List[Dict[str, object]]:
+        """Stock proyectado por (modelo, talla, periodo): real + fabricación - pendientes acumulados.
+
+        Una fila por periodo con movimientos (y siempre la del periodo en
+        curso); `periodo` es "mes" o "semana".  Con `modelo`, solo ese.
+        """
+        modelo = str(modelo).strip().upper() if modelo else None
+        filas: List[Dict[str, object]] = []
+        for (m, talla), tramos in self._proyeccion(inventory, periodo, modelo):
+            info = inventory.info_modelos.get(m, {}) or self.info_modelos.get(m, {})
+            for per, entradas, salidas, stock in tramos:
+                filas.append({
+                    "modelo": m,
+                    "descripcion": info.get("descripcion", ""),
+                    "color": info.get("color", ""),
+                    "talla": talla,
+                    "periodo": per,
+                    "entradas": entradas,
+                    "salidas": salidas,
+                    "stock_proyectado": stock,
+                })
+        return filas
+
+    def first_negative_periods(self, inventory: Inventory, periodo: str = "mes") -> List[Dict[str, object]]:
+        """Por cada (modelo, talla) que se queda en negativo, el primer periodo en que ocurre."""
+        filas: List[Dict[str, object]] = []
+        for (m, talla), tramos in self._proyeccion(inventory, periodo):
+            negativo = next((t for t in tramos if t[3] < 0), None)
+            if negativo is None:
+                continue
+            info = inventory.info_modelos.get(m, {}) or self.info_modelos.get(m, {})
+            filas.append({
+                "modelo": m,
+                "descripcion": info.get("descripcion", ""),
+                "color": info.get("color", ""),
+                "talla": talla,
+                "stock_real": int(inventory.almacen.get(m, {}).get(talla, 0)),
+                "periodo": negativo[0],
+                "stock_proyectado": negativo[3],
+            })
+        return filas
+
+    # ---------------------------------------------------------------------
+    # Disponible para prometer (ATP)
+    # ---------------------------------------------------------------------
+    @staticmethod
+    def _dia(fecha) -> str:
+        """AAAA-MM-DD de una fecha; "" si no lo es (cuenta como ya vencida)."""
+        try:
+            return datetime.strptime(str(fecha or "")[:10], "%Y-%m-%d").strftime("%Y-%m-%d")
+        except ValueError:
+            return ""
+
+    def _atp_modelo(self, modelo: str) -> Dict[str, Tuple[List[str], List[int]]]:
+        """talla -> (fechas, mínimos) del modelo (normalizado), creado al consultarlo.
+
+        `fechas` son los días con fabricación o pendientes en orden y
+        `minimos[i]` lo mínimo que llega a acumular fabricación - pendientes
+        desde el tramo i hasta el final (el tramo 0 es antes de la primera
+        fecha).  Los mínimos no decrecen, así que se buscan por bisección.
+        """
+        tablas = self._atp.get(modelo)
+        if tablas is None:
+            eventos: Dict[str, List[Tuple[str, int]]] = {}
+            for it in self.pedidos_fabricacion.get(modelo, []):
+                eventos.setdefault(norm_talla(it.get("talla", "")), []).append(
+                    (self._dia(it.get("fecha")), it.get("cantidad", 0)))
+            indice = self._indice()
+            for clave in self._claves_modelo.get(modelo, ()):
+                eventos.setdefault(clave[1], []).extend(
+                    (self._dia(p.get("fecha")), -p.get("cantidad", 0)) for p in indice[clave])
+            tablas = {}
+            for talla, evs in eventos.items():
+                fechas: List[str] = []
+                puntos = [0]
+                for dia, delta in sorted(evs):
+                    if fechas and fechas[-1] == dia:
+                        puntos[-1] += delta
+                    else:
+                        fechas.append(dia)
+                        puntos.append(puntos[-1] + delta)
+                for i in range(len(puntos) - 2, -1, -1):
+                    puntos[i] = min(puntos[i], puntos[i + 1])
+                tablas[talla] = (fechas, puntos)
+            self._atp[modelo] = tablas
+        return tablas
+
+    def _consultar_atp(self, inventory: Inventory, modelo: str, talla: str, cantidad: int, fecha: str,
+                       prometido: int = 0) -> Dict[str, object]:
+        fechas, minimos = self._atp_modelo(modelo).get(talla, ((), (0,)))
+        hoy = datetime.now().strftime("%Y-%m-%d")
+        # Tomar unidades en `fecha` baja todo lo proyectado desde ahí: manda el mínimo futuro
+        base = int(inventory.almacen.get(modelo, {}).get(talla, 0)) - prometido
+        disponible = base + minimos[bisect_right(fechas, max(fecha, hoy))]
+        i = bisect_left(minimos, cantidad - base)
+        if i >= len(minimos):
+            fecha_posible = None
+        else:
+            fecha_posible = max(fechas[i - 1], hoy) if i else hoy
+        return {
+            "modelo": modelo,
+            "talla": talla,
+            "cantidad": cantidad,
+            "fecha": fecha,
+            "disponible": max(disponible, 0),
+            "cumple": disponible >= cantidad,
+            "fecha_posible": fecha_posible,
+        }
+
+    def available_to_promise(self, inventory: Inventory, modelo: str, talla: str, cantidad: int,
+                             fecha: Optional[str] = None) -> Dict[str, object]:
+        """¿Se pueden comprometer `cantidad` uds de (modelo, talla) para `fecha` (hoy si no se da)?
+
+        Cuenta el stock real, las órdenes de fabricación en su `fecha` y
+        los pendientes en la suya (lo vencido o sin fecha, ya).  Lo
+        disponible en una fecha es lo mínimo que queda desde ella en
+        adelante, para no dejar sin cubrir pendientes posteriores.  Por
+        modelo se precalcula una vez (ver _atp_modelo) y cada consulta es
+        una bisección.  Devuelve `disponible`, `cumple` y `fecha_posible`
+        (primer día en que se podría, o None si con lo previsto no llega).
+        """
+        modelo = str(modelo).strip().upper()
+        return self._consultar_atp(inventory, modelo, norm_talla(talla), int(cantidad),
+                                   self._dia(fecha) or datetime.now().strftime("%Y-%m-%d"))
+
+    def available_to_promise_bulk(self, inventory: Inventory, lineas) -> List[Dict[str, object]]:
+        """available_to_promise para las líneas (modelo, talla, cantidad, fecha) de un pedido entero.
+
+        Las líneas de una misma talla se reparten por fecha: lo que se
+        promete a una deja de estar disponible para las siguientes (una
+        línea que no cabe no reserva nada).  Para `fecha_posible` lo ya
+        prometido cuenta como reservado desde hoy, así que nunca sale antes
+        de lo real.  Devuelve un resultado por línea, en el orden de entrada.
+        """
+        hoy = datetime.now().strftime("%Y-%m-%d")
+        normalizadas = [(str(m).strip().upper(), norm_talla(t), int(c), self._dia(f) or hoy)
+                        for m, t, c, f in lineas]
+        resultados: List[Optional[Dict[str, object]]] = [None] * len(normalizadas)
+        prometido: Dict[Tuple[str, str], int] = {}
+        for i in sorted(range(len(normalizadas)), key=lambda k: normalizadas[k][3]):
+            modelo, talla, cantidad, fecha = normalizadas[i]
+            ya = prometido.get((modelo, talla), 0)
+            r = self._consultar_atp(inventory, modelo, talla, cantidad, fecha, prometido=ya)
+            if r["cumple"]:
+                prometido[(modelo, talla)] = ya + cantidad
+            resultados[i] = r
+        return resultados
+
+    # -----------------------------
+    # Modelos: existencia y renombrado (por el índice de pendientes)
+    # -----------------------------
+    def has_model(self, modelo: str) -> bool:
+        """True si el modelo tiene ficha, órdenes de fabricación o pendientes."""
+        modelo = str(modelo).strip().upper()
+        if modelo in self.info_modelos or modelo in self.pedidos_fabricacion:
+            return True
+        self._indice()
+        # `ordenes` es el formato antiguo: tras la migración queda vacía
+        return bool(self._claves_modelo.get(modelo)) or any(o.get("modelo") == modelo for o in self.ordenes)
+
+    def rename_model(self, antiguo: str, nuevo: str) -> int:
+        """Cambia el código `antiguo` por `nuevo` en fichas, fabricación y pendientes.
+
+        Los pendientes del modelo se toman del índice (coste según sus
+        filas); cada cambio se anota y se persiste con un commit.  Devuelve
+        los pendientes renombrados.  Lanza ValueError si `nuevo` ya existe
+        en la previsión.
+        """
+        antiguo = str(antiguo).strip().upper()
+        nuevo = str(nuevo).strip().upper()
+        if not nuevo or nuevo == antiguo:
+            raise ValueError(f"Código de modelo no válido o igual al actual: {nuevo!r}")
+        if self.has_model(nuevo):
+            raise ValueError(f"El modelo {nuevo} ya existe: renombrar sobre él mezclaría sus datos.")
+        self._tocar_previsto(antiguo, nuevo)
+        if antiguo in self.info_modelos:
+            info = self.info_modelos.pop(antiguo)
+            self.info_modelos[nuevo] = info
+            self.store.record("set", ("info_modelos", nuevo), info)
+            self.store.record("del", ("info_modelos", antiguo), previo=info)
+        if antiguo in self.pedidos_fabricacion:
+            lista = self.pedidos_fabricacion.pop(antiguo)
+            self.pedidos_fabricacion[nuevo] = lista
+            self.store.record("set", ("pedidos_fabricacion", nuevo), lista)
+            self.store.record("del", ("pedidos_fabricacion", antiguo), previo=lista)
+            colas = self._colas_fabricacion.pop(antiguo, None)
+            if colas is not None:
+                self._colas_fabricacion[nuevo] = colas
+
+        # Ordenes antiguas (si aún quedan)
+        for i, orden in enumerate(self.ordenes):
+            if orden.get("modelo") == antiguo:
+                previo = dict(orden)
+                orden["modelo"] = nuevo
+                self.store.record("set", ("ordenes", i, "modelo"), nuevo, previo=previo)
+
+        # Pendientes: se renombran y sus cubos pasan a las claves del modelo nuevo
+        pendientes = self._pendientes_modelo(antiguo)
+        pos = self._posiciones(pendientes)
+        for p in pendientes:
+            previo = dict(p)
+            p["modelo"] = nuevo
+            self.store.record("set", ("pedidos", pos[id(p)], "modelo"), nuevo, previo=previo)
+        for clave in list(self._claves_modelo.get(antiguo, ())):
+            cubo = self._indice_pendientes[clave]
+            self._quitar_cubo(clave)
+            destino = self._cubo((nuevo,) + clave[1:])
+            destino.extend(cubo)
+            if len(destino) > len(cubo):
+                destino.sort(key=self._posicion)
+        self.commit()
+        return len(pendientes)
 
-    
     def save(self) -> None:
+        # Quien guarda sin anotar puede haber tocado pendientes a mano (p. ej. renombrar)
+        self._indice_pendientes = None
+        self._colas_fabricacion = {}
+        self._previsto = None
+        self._atp = {}
         self.store.data["ordenes"] = self.ordenes
         self.store.data["pedidos"] = self.pedidos
         self.store.data["info_modelos"] = self.info_modelos
@@ -1105,6 +5200,76 @@ class Prevision:
         # Ojo: NO escribir "stock"
         self.store.save()
 
+    def commit(self) -> None:
+        """Persiste las mutaciones anotadas (journal) o guarda completo."""
+        self.store.commit()
+
+
+###############################################################################
+# Migraciones de esquema
+###############################################################################
+
+# Por tipo de fichero ("inventario", "prevision", "talleres", "clientes"): lista
+# ordenada de (versión, función que actualiza los datos en sitio).  Al abrir un
+# fichero con una versión anterior se aplican una vez (ver DataStore.migrate).
+MIGRACIONES: Dict[str, List[Tuple[int, Callable[[Dict], None]]]] = {}
+
+
+def migracion(tipo: str, version: int):
+    """Decorador: registra `fn(data)` como la migración `version` de los ficheros `tipo`."""
+    def registrar(fn):
+        MIGRACIONES.setdefault(tipo, []).append((version, fn))
+        MIGRACIONES[tipo].sort(key=lambda m: m[0])
+        return fn
+    return registrar
+
+
+def version_esquema(tipo: str) -> int:
+    """Versión de esquema actual de `tipo` (la de su última migración, 0 si no tiene)."""
+    return max((v for v, _ in MIGRACIONES.get(tipo, [])), default=0)
+
+
+@migracion("prevision", 1)
+def _migrar_ordenes_a_fabricacion(data: Dict) -> None:
+    """Fusiona las órdenes antiguas (`ordenes`) en `pedidos_fabricacion`.
+
+    No duplica talla/fecha de un mismo modelo.  Los ficheros que ya pasaron
+    por la migración antigua (marca `__migracion_ordenes_fusionada__`) no
+    se tocan.
+    """
+    ordenes = data.setdefault("ordenes", [])
+    if not ordenes or data.get("__migracion_ordenes_fusionada__", False):
+        return
+    fabricacion = data.setdefault("pedidos_fabricacion", {})
+    for o in ordenes:
+        m = str(o.get("modelo", "")).strip().upper()
+        t = norm_talla(o.get("talla", ""))
+        c = int(o.get("cantidad", 0) or 0)
+        f = o.get("fecha") or ""
+        if c <= 0:
+            continue
+        lista = fabricacion.setdefault(m, [])
+        # intenta fusionar con un item existente (misma talla y fecha)
+        existing = next((it for it in lista
+                        if norm_talla(it.get("talla")) == t and (it.get("fecha") or "") == f), None)
+        if existing:
+            existing["cantidad"] = int(existing.get("cantidad", 0) or 0) + c
+        else:
+            lista.append({"talla": t, "cantidad": c, "fecha": f})
+    # La marca se conserva por si el fichero lo abre una versión anterior del programa
+    data["__migracion_ordenes_fusionada__"] = True
+    ordenes.clear()
+
+
+@migracion("prevision", 2)
+def _normalizar_tallas_pedidos(data: Dict) -> None:
+    """Normaliza las tallas de los pedidos pendientes ('36.0' → '36')."""
+    for p in data.get("pedidos", []):
+        if not isinstance(p, dict):
+            continue
+        nt = norm_talla(p.get("talla", ""))
+        if p.get("talla", "") != nt:
+            p["talla"] = nt
 
 ###############################################################################
 # Sistema principal
@@ -1123,7 +5288,14 @@ class GestorStock:
                  path_inventario: str = "datos_almacen.json",
                  path_prevision: str = "prevision.json",
                  path_talleres: str = "talleres.json",
-                 path_clientes: str = "clientes.json"):
+                 path_clientes: str = "clientes.json",
+                 journal: bool = False,
+                 path_sqlite: Optional[str] = None,
+                 async_write: bool = False,
+                 formato: Optional[str] = None,
+                 historial_segmentado: bool = False,
+                 historial_columnar: bool = False,
+                 conflictos: str = "fusionar"):
         # Definimos estructuras por defecto
         inv_default = {
             "almacen": {},
@@ -1139,57 +5311,53 @@ class GestorStock:
         }
         talleres_default: Dict[str, Dict] = {}
         clientes_default: Dict[str, Dict] = {}
+        # Un fichero nuevo nace con el esquema al día (no hay nada que migrar)
+        for tipo, default in (("inventario", inv_default), ("prevision", pre_default),
+                              ("talleres", talleres_default), ("clientes", clientes_default)):
+            if version_esquema(tipo):
+                default[DataStore.SCHEMA_KEY] = version_esquema(tipo)
         # Creamos data stores
-        self.ds_inventario = DataStore(path_inventario, inv_default)
-        self.ds_prevision = DataStore(path_prevision, pre_default)
-        self.ds_talleres = DataStore(path_talleres, talleres_default)
-        self.ds_clientes = DataStore(path_clientes, clientes_default)
+        if path_sqlite:
+            # Inventario y previsión en un único fichero SQLite (ver importar_json_a_sqlite)
+            self.ds_inventario = SQLiteDataStore(path_sqlite, inv_default, "inventario")
+            self.ds_prevision = SQLiteDataStore(path_sqlite, pre_default, "prevision")
+        else:
+            # journal=True: los movimientos se anotan en <fichero>.journal (ver DataStore)
+            # async_write=True: el disco lo escribe un hilo aparte (ver DataStore)
+            # formato=None conserva el formato de cada fichero (ver FORMATOS_SNAPSHOT)
+            # historial_segmentado=True: históricos en un fichero por mes (ver HistorialSegmentado)
+            # historial_columnar=True: históricos por columnas en memoria (ver HistorialColumnar)
+            # conflictos: qué hacer si otro proceso escribió el fichero (ver DataStore)
+            historiales = ("historial_entradas", "historial_salidas")
+            self.ds_inventario = DataStore(path_inventario, inv_default, journal=journal,
+                                           async_write=async_write, formato=formato,
+                                           segmentar=historiales if historial_segmentado else (),
+                                           columnar=historiales if historial_columnar else (),
+                                           conflictos=conflictos)
+            self.ds_prevision = DataStore(path_prevision, pre_default, journal=journal,
+                                          async_write=async_write, formato=formato,
+                                          conflictos=conflictos)
+        self.ds_talleres = DataStore(path_talleres, talleres_default, async_write=async_write,
+                                     conflictos=conflictos)
+        self.ds_clientes = DataStore(path_clientes, clientes_default, async_write=async_write,
+                                     conflictos=conflictos)
+        # Migraciones de esquema pendientes: una sola vez por fichero (ver MIGRACIONES)
+        for tipo, ds in (("inventario", self.ds_inventario), ("prevision", self.ds_prevision),
+                         ("talleres", self.ds_talleres), ("clientes", self.ds_clientes)):
+            aplicadas = ds.migrate(MIGRACIONES.get(tipo, []))
+            if aplicadas:
+                print(f"ℹ️ {os.path.basename(ds.path)}: esquema actualizado a la versión {aplicadas[-1]}.")
         # Instanciamos entidades
         self.prevision = Prevision(self.ds_prevision)
         self.inventory = Inventory(self.ds_inventario, self.prevision)
         self.workshops = WorkshopManager(self.ds_talleres)
         self.clients = ClientManager(self.ds_clientes)
-        # --- Migración/fusión de órdenes antiguas a pedidos_fabricacion ---
-        # Toma todo lo que haya en self.prevision.ordenes y lo asegura en pedidos_fabricacion
-        # sin duplicar talla/fecha para un mismo modelo. Se ejecuta SOLO una vez.
-        migrado = self.ds_prevision.data.get("__migracion_ordenes_fusionada__", False)
-        if self.prevision.ordenes and not migrado:
-            for o in self.prevision.ordenes:
-                m = str(o.get("modelo", "")).strip().upper()
-                t = norm_talla(o.get("talla", ""))
-                c = int(o.get("cantidad", 0) or 0)
-                f = o.get("fecha") or ""
-                if c <= 0:
-                    continue
-                lista = self.prevision.pedidos_fabricacion.setdefault(m, [])
-                # intenta fusionar con un item existente (misma talla y fecha)
-                existing = next((it for it in lista
-                                if norm_talla(it.get("talla")) == t and (it.get("fecha") or "") == f), None)
-                if existing:
-                    existing["cantidad"] = int(existing.get("cantidad", 0) or 0) + c
-                else:
-                    lista.append({"talla": t, "cantidad": c, "fecha": f})
-
-            # ✅ marcar como ejecutada y limpiar 'ordenes' para no re-sumar nunca más
-            self.ds_prevision.data["__migracion_ordenes_fusionada__"] = True
-            self.prevision.ordenes.clear()
-            # Persistimos cambios
-            self.prevision.save()
-            print("ℹ️ Migración a 'pedidos_fabricacion' ejecutada una sola vez.")
-
-
-        # Normaliza tallas ya guardadas en prevision para evitar '36.0' duplicadas
-        try:
-            changed = False
-            for p in self.prevision.pedidos:
-                nt = norm_talla(p.get('talla',''))
-                if p.get('talla','') != nt:
-                    p['talla'] = nt
-                    changed = True
-            if changed:
-                self.prevision.save()
-        except Exception:
-            pass
+        # Si una recarga o fusión con cambios de otro proceso toca secciones en sitio
+        # (a través de self: restaurar un backup reinstancia Inventory y Prevision)
+        self.ds_inventario.add_reload_listener(lambda claves: self.inventory.refresh_sections(claves))
+        self.ds_prevision.add_reload_listener(lambda claves: self.prevision.refresh_sections(claves))
+        self.ds_talleres.add_reload_listener(self._rebuild_derived)
+        self.ds_clientes.add_reload_listener(self._rebuild_derived)
         # Directorios y rutas de exportación/importación
         # Ruta por defecto para los CSV exportados (coincide con los scripts originales)
         self.EXPORT_DIR = r"Z:\GLOBALIA\STOCK UNIFORMES\csv_exportados"
@@ -1202,6 +5370,59 @@ class GestorStock:
         except Exception:
             # Si falla (por ejemplo, en sistemas sin esa unidad), ignoramos
             pass
+
+    @contextmanager
+    def transaction(self):
+        """Agrupa muchas operaciones en una escritura por fichero modificado.
+
+        Uso: ``with gestor.transaction(): ...``.  Las llamadas a save/commit
+        de las clases de dominio se difieren; al salir se escribe una vez
+        cada store sucia.  Si escapa una excepción, se restaura en memoria el
+        estado previo y no se escribe nada.
+        """
+        stores = (self.ds_inventario, self.ds_prevision, self.ds_talleres, self.ds_clientes)
+        try:
+            with ExitStack() as stack:
+                for ds in stores:
+                    stack.enter_context(ds.batch())
+                yield self
+        except BaseException:
+            self._rebuild_derived()
+            raise
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Espera a que todas las escrituras en segundo plano estén en disco."""
+        ok = True
+        for ds in (self.ds_inventario, self.ds_prevision, self.ds_talleres, self.ds_clientes):
+            ok = ds.flush(timeout) and ok
+        return ok
+
+    def refresh(self) -> Dict[str, Set[str]]:
+        """Recarga lo que otro proceso haya cambiado en disco (ver DataStore.refresh).
+
+        Es barato si nada cambió, así que se puede llamar en cada rerun de
+        Streamlit o en cada vuelta del menú.  Devuelve las secciones
+        recargadas por fichero (vacío si no hubo cambios).  Si en alguna se
+        descartaron cambios propios que ya no encajaban, se recargan igualmente
+        todas y al final se lanza ConflictoVersion contándolo.
+        """
+        cambios, conflicto = {}, None
+        for ds in (self.ds_inventario, self.ds_prevision, self.ds_talleres, self.ds_clientes):
+            try:
+                claves = ds.refresh()
+            except ConflictoVersion as e:
+                conflicto, claves = conflicto or e, set(ds.data)
+            if claves:
+                cambios[os.path.basename(ds.path)] = claves
+        if conflicto is not None:
+            raise conflicto
+        return cambios
+
+    def _rebuild_derived(self, claves: Optional[Set[str]] = None) -> None:
+        """Reconstruye las estructuras derivadas de los datos de las stores."""
+        self.workshops = WorkshopManager(self.ds_talleres)
+        self.clients = ClientManager(self.ds_clientes)
+
     def _exportar_stock_negativo(self) -> None:
         """Exporta un listado de tallas con stock real negativo."""
         info = self.inventory.info_modelos
@@ -1268,6 +5489,12 @@ class GestorStock:
     def run(self) -> None:
         """Bucle principal interactivo."""
         while True:
+            # Lo que la app u otro puesto hayan guardado mientras tanto
+            try:
+                for fichero, claves in self.refresh().items():
+                    print(f"🔄 {fichero} recargado ({', '.join(sorted(claves))})")
+            except ConflictoVersion as e:
+                print(f"⚠️ {e}")
             print("\n--- SISTEMA DE GESTIÓN DE STOCK Y PREVISIÓN ---")
             print("1. Registrar entrada de stock")
             print("2. Registrar salida de stock")
@@ -1290,60 +5517,77 @@ class GestorStock:
             print("19. Gestionar órdenes de fabricación (listar/editar/eliminar)")
             print("20. Gestionar pedidos pendientes (editar/eliminar)")
             print("21. Auditar y arreglar el Stock")
-            print("22. Salir")
-            opcion = input("Elige una opción: ")
-            if opcion == "1":
-                self._menu_registrar_entrada()
-            elif opcion == "2":
-                self._menu_registrar_salida()
-            elif opcion == "3":
-                modelo = input("Modelo a consultar (vacío para todos): ").upper()
-                self.inventory.consult_stock(modelo_filtro=modelo)
-            elif opcion == "4":
-                self._menu_registrar_orden()
-            elif opcion == "5":
-                self._menu_registrar_pedido()
-            elif opcion == "6":
-                est = self.prevision.calc_estimated_stock(self.inventory)
-                for item in est:
-                    alerta = "⚠️" if item["stock_estimado"] < 10 else ""
-                    print(f"{item['modelo']} T{item['talla']} = {item['stock_estimado']} uds {alerta}")
-            elif opcion == "7":
-                self._menu_talleres()
-            elif opcion == "8":
-                self._menu_clientes()
-            elif opcion == "9":
-                # Exportar todos los datos a CSV
-                self._exportar_todos_los_datos()
-            elif opcion == "10":
-                self._importar_albaranes_excel()
-            elif opcion == "11":
-                self._importar_pedidos_excel()
-            elif opcion == "12":
-                self._crear_backup_manual()
-            elif opcion == "13":
-                self._restaurar_backup()
-            elif opcion == "14":
-                self._menu_modificar_stock()
-            elif opcion == "15":
-                self._menu_modificar_cliente_modelo()
-            elif opcion == "16":
-                self._menu_renombrar_modelo()
-            elif opcion == "17":
-                self._exportar_stock_negativo()
-            elif opcion == "18":
-                self._ajustar_stock_negativo_a_cero()
-            elif opcion == "19":
-                self._menu_gestion_ordenes()
-            elif opcion == "20":
-                self._menu_gestion_pedidos()
-            elif opcion == "21":
-                self._menu_auditar_y_arreglar()
-            elif opcion == "22":
-                print("👋 Saliendo del sistema. ¡Hasta pronto!")
-                break
-            else:
-                print("❌ Opción no válida.")
+            print("22. Consultar stock a una fecha")
+            print("23. Proyección de stock por periodos")
+            print("24. Disponible para prometer (ATP)")
+            print("25. Orden de corte sugerida")
+            # Salir va siempre en 0: las opciones nuevas se añaden al final sin renumerar
+            print("0. Salir")
+            opcion = input("Elige una opción: ").strip().lower()
+            try:
+                if opcion == "1":
+                    self._menu_registrar_entrada()
+                elif opcion == "2":
+                    self._menu_registrar_salida()
+                elif opcion == "3":
+                    modelo = input("Modelo a consultar (vacío para todos): ").upper()
+                    self.inventory.consult_stock(modelo_filtro=modelo)
+                elif opcion == "4":
+                    self._menu_registrar_orden()
+                elif opcion == "5":
+                    self._menu_registrar_pedido()
+                elif opcion == "6":
+                    est = self.prevision.calc_estimated_stock(self.inventory)
+                    for item in est:
+                        alerta = "⚠️" if item["stock_estimado"] < 10 else ""
+                        print(f"{item['modelo']} T{item['talla']} = {item['stock_estimado']} uds {alerta}")
+                elif opcion == "7":
+                    self._menu_talleres()
+                elif opcion == "8":
+                    self._menu_clientes()
+                elif opcion == "9":
+                    # Exportar todos los datos a CSV
+                    self._exportar_todos_los_datos()
+                elif opcion == "10":
+                    self._importar_albaranes_excel()
+                elif opcion == "11":
+                    self._importar_pedidos_excel()
+                elif opcion == "12":
+                    self._crear_backup_manual()
+                elif opcion == "13":
+                    self._restaurar_backup()
+                elif opcion == "14":
+                    self._menu_modificar_stock()
+                elif opcion == "15":
+                    self._menu_modificar_cliente_modelo()
+                elif opcion == "16":
+                    self._menu_renombrar_modelo()
+                elif opcion == "17":
+                    self._exportar_stock_negativo()
+                elif opcion == "18":
+                    self._ajustar_stock_negativo_a_cero()
+                elif opcion == "19":
+                    self._menu_gestion_ordenes()
+                elif opcion == "20":
+                    self._menu_gestion_pedidos()
+                elif opcion == "21":
+                    self._menu_auditar_y_arreglar()
+                elif opcion == "22":
+                    self._menu_stock_a_fecha()
+                elif opcion == "23":
+                    self._menu_proyeccion()
+                elif opcion == "24":
+                    self._menu_disponible_prometer()
+                elif opcion == "25":
+                    self._menu_orden_corte()
+                elif opcion in ("0", "q"):
+                    print("👋 Saliendo del sistema. ¡Hasta pronto!")
+                    break
+                else:
+                    print("❌ Opción no válida.")
+            except ConflictoVersion as e:
+                # Otro puesto cambió los mismos datos: lo descartado ya está recargado
+                print(f"❌ {e}")
     # Submenú de entrada
         # Submenú de entrada (nuevo flujo: modelo -> taller+fecha -> bucle talla/cantidad)
     def _menu_registrar_entrada(self) -> None:
@@ -1454,13 +5698,10 @@ class GestorStock:
             cliente_resuelto = cliente
             if not cliente_resuelto:
                 cliente_pend = ""
-                for p in self.prevision.pedidos:
-                    if (str(p.get("modelo","")).strip().upper() == modelo and
-                        norm_talla(p.get("talla","")) == talla and
-                        p.get("pedido","") == pedido):
-                        cliente_pend = p.get("cliente","") or ""
-                        if cliente_pend:
-                            break
+                for p in self.prevision.pendings_for(modelo, talla, pedido):
+                    cliente_pend = p.get("cliente","") or ""
+                    if cliente_pend:
+                        break
                 cliente_info = self.prevision.info_modelos.get(modelo, {}).get("cliente", "")
                 cliente_resuelto = cliente_pend or cliente_info or ""
 
@@ -1569,6 +5810,145 @@ class GestorStock:
                         sel.add(x)
         return sorted(sel)
 
+    def _menu_stock_a_fecha(self) -> None:
+        """Stock según los movimientos al final de un día (ver Inventory.stock_at)."""
+        fecha = input("Fecha (AAAA-MM-DD): ").strip()
+        modelo = input("Modelo a consultar (vacío para todos): ").strip().upper() or None
+        try:
+            stock = self.inventory.stock_at(fecha, modelo)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return
+        if not stock:
+            print(f"ℹ️ Sin stock según los movimientos a {fecha}.")
+            return
+        print(f"\n📅 STOCK A {fecha} (según entradas y salidas registradas)")
+        for m, tallas in stock.items():
+            print(f"\n🔹 {m} - {self.inventory.info_modelos.get(m, {}).get('descripcion', '')}")
+            for talla, cantidad in tallas.items():
+                print(f"  Talla {talla}: {cantidad} uds")
+        if self.inventory._cierres_calculados and \
+                input("¿Guardar los cierres calculados para acelerar próximas consultas? (s/n): ").lower() == "s":
+            print(f"✅ {self.inventory.save_checkpoints()} cierres guardados.")
+
+    def _menu_proyeccion(self) -> None:
+        """Primer periodo en negativo por talla y, si se pide, la proyección de un modelo."""
+        periodo = "semana" if input("Periodo: 1) mes  2) semana [1]: ").strip() == "2" else "mes"
+        negativos = self.prevision.first_negative_periods(self.inventory, periodo)
+        if not negativos:
+            print("✅ Ninguna talla se queda en negativo con la fabricación y los pendientes actuales.")
+        else:
+            print(f"\n⚠️ TALLAS QUE SE QUEDAN EN NEGATIVO (por {periodo})")
+            for r in negativos:
+                print(f"{r['modelo']} T{r['talla']}: real {r['stock_real']} -> "
+                      f"{r['stock_proyectado']} en {r['periodo']}")
+        modelo = input("Ver la proyección de un modelo (vacío para terminar): ").strip().upper()
+        if not modelo:
+            return
+        filas = self.prevision.project_stock(self.inventory, periodo, modelo=modelo)
+        if not filas:
+            print(f"ℹ️ Sin stock, fabricación ni pendientes para {modelo}.")
+            return
+        for r in filas:
+            alerta = "⚠️" if r["stock_proyectado"] < 0 else ""
+            print(f"{r['modelo']} T{r['talla']} {r['periodo']}: +{r['entradas']} -{r['salidas']} "
+                  f"= {r['stock_proyectado']} uds {alerta}")
+
+    def _menu_disponible_prometer(self) -> None:
+        """Consulta ATP de un modelo/talla o comprueba todas las líneas de un Excel de pedidos."""
+        print("\n--- Disponible para prometer ---")
+        print("1. Consultar un modelo/talla")
+        print("2. Comprobar un Excel de pedidos (formato del de pendientes)")
+        op = input("Opción: ").strip()
+        if op == "1":
+            modelo = input("Modelo: ").strip().upper()
+            talla = input("Talla: ").strip()
+            try:
+                cantidad = int(input("Cantidad: ").strip())
+            except ValueError:
+                print("❌ Cantidad no válida.")
+                return
+            fecha = input("Fecha de entrega (AAAA-MM-DD, vacío = hoy): ").strip() or None
+            r = self.prevision.available_to_promise(self.inventory, modelo, talla, cantidad, fecha)
+            if r["cumple"]:
+                print(f"✅ Se pueden prometer {cantidad} uds de {r['modelo']} T{r['talla']} para {r['fecha']} "
+                      f"(disponibles {r['disponible']}).")
+            elif r["fecha_posible"]:
+                print(f"⚠️ Para {r['fecha']} solo hay {r['disponible']} uds; las {cantidad} estarían el {r['fecha_posible']}.")
+            else:
+                print(f"❌ Para {r['fecha']} solo hay {r['disponible']} uds y con la fabricación prevista no se llega a {cantidad}.")
+            return
+        if op != "2":
+            print("❌ Opción no válida.")
+            return
+        if pd is None:
+            print("❌ La librería pandas no está disponible; no se puede leer el Excel.")
+            return
+        ruta = input("Ruta del Excel de pedidos: ").strip()
+        try:
+            df = pd.read_excel(ruta, skiprows=26)
+        except Exception as e:
+            print(f"❌ Error leyendo el Excel: {e}")
+            return
+        columnas = ["CodigoArticulo", "DesTalla", "UnidadesPendientes", "FechaEntrega"]
+        if not all(col in df.columns for col in columnas):
+            print(f"❌ El Excel no contiene todas las columnas necesarias: {columnas}")
+            return
+        lineas = []
+        for _, fila in df.iterrows():
+            valor = fila["UnidadesPendientes"]
+            if pd.isna(valor):
+                continue
+            try:
+                cantidad = int(valor)
+            except (TypeError, ValueError):
+                continue
+            lineas.append((fila["CodigoArticulo"], fila["DesTalla"], cantidad, parse_fecha_excel(fila["FechaEntrega"])))
+        resultados = self.prevision.available_to_promise_bulk(self.inventory, lineas)
+        filas = [{
+            "MODELO": r["modelo"], "TALLA": r["talla"], "CANTIDAD": r["cantidad"], "FECHA": r["fecha"],
+            "DISPONIBLE": r["disponible"], "CUMPLE": "SI" if r["cumple"] else "NO",
+            "FECHA_POSIBLE": r["fecha_posible"] or "",
+        } for r in resultados]
+        for f in filas:
+            marca = "✅" if f["CUMPLE"] == "SI" else "⚠️"
+            detalle = "" if f["CUMPLE"] == "SI" else f" -> {f['FECHA_POSIBLE'] or 'no se llega'}"
+            print(f"{marca} {f['MODELO']} T{f['TALLA']} {f['CANTIDAD']} uds para {f['FECHA']}: "
+                  f"disponibles {f['DISPONIBLE']}{detalle}")
+        print(f"ℹ️ {sum(r['cumple'] for r in resultados)} de {len(resultados)} líneas se pueden prometer.")
+        if filas and input("¿Exportar a CSV? (s/N): ").strip().lower() == "s":
+            self._export_csv("atp_pedido", filas, list(filas[0]))
+
+    def _menu_orden_corte(self) -> None:
+        """Calcula la orden de corte sugerida y, si se confirma, la da de alta como órdenes de fabricación."""
+        print("\n--- Orden de corte sugerida ---")
+        try:
+            cobertura = int(input("Días de cobertura (Enter = 90): ").strip() or 90)
+            dias = int(input("Días de histórico de salidas para la curva (Enter = 365): ").strip() or 365)
+        except ValueError:
+            print("❌ Número no válido.")
+            return
+        cortes = self.prevision.suggest_cut_orders(self.inventory, self.workshops.list_all(), cobertura, dias)
+        if not cortes:
+            print("ℹ️ Con esa cobertura no hace falta cortar nada.")
+            return
+        modelo_actual = None
+        for c in cortes:
+            if c["modelo"] != modelo_actual:
+                modelo_actual = c["modelo"]
+                print(f"✂️ {modelo_actual} {c['descripcion']} (taller: {c['taller'] or '—'})")
+            print(f"   T{c['talla']}: cortar {c['cantidad']} (vendidas {c['demanda']}, "
+                  f"objetivo {c['objetivo']}, estimado {c['stock_estimado']})")
+        print(f"ℹ️ {len({c['modelo'] for c in cortes})} modelos, {sum(c['cantidad'] for c in cortes)} uds en total.")
+        if input("¿Exportar a CSV? (s/N): ").strip().lower() == "s":
+            filas = [{k.upper(): v for k, v in c.items()} for c in cortes]
+            self._export_csv("orden_corte_sugerida", filas, list(filas[0]))
+        if input("¿Dar de alta estas órdenes de fabricación? (s/N): ").strip().lower() == "s":
+            fecha = input("Fecha de las órdenes (AAAA-MM-DD, vacío = hoy): ").strip() or None
+            altas = self.prevision.register_orders_bulk(
+                [(c["modelo"], c["talla"], c["cantidad"]) for c in cortes], fecha)
+            print(f"✅ {altas} órdenes de fabricación registradas.")
+
     def _menu_auditar_y_arreglar(self) -> None:
         """
         1) Audita sin aplicar
@@ -1577,7 +5957,8 @@ class GestorStock:
         4) Permite exportar CSV del informe antes/después
         """
         filtro_modelo = input("Auditar solo un modelo (Enter = todos): ").strip().upper() or None
-        cambios = self.inventory.audit_and_fix_stock(aplicar=False, solo_modelo=filtro_modelo)
+        completa = input("¿Verificación completa desde todo el histórico? (s/N): ").strip().lower() == "s"
+        cambios = self.inventory.audit_and_fix_stock(aplicar=False, solo_modelo=filtro_modelo, completa=completa)
 
         if not cambios:
             print("✅ Sin desajustes. Todo cuadra con el histórico.")
@@ -1870,7 +6251,8 @@ class GestorStock:
                 "CLIENTE": e.get("cliente", modelo_info.get("cliente", ""))
             })
         # Añadir totales por modelo y total general
-        entradas_sorted = sorted(entradas_export, key=lambda x: (x["MODELO"], talla_sort_key(x["TALLA"])))
+        rangos = CATALOGO_TALLAS.rangos(x["TALLA"] for x in entradas_export)
+        entradas_sorted = sorted(entradas_export, key=lambda x: (x["MODELO"], rangos[x["TALLA"]]))
         entradas_con_totales = []
         total_general_ent = 0
         total_modelo = 0
@@ -1979,7 +6361,8 @@ class GestorStock:
                 "ALBARAN": s["albaran"],
                 "CLIENTE": s.get("cliente") or modelo_info.get("cliente", "")
             })
-        salidas_sorted = sorted(salidas_export, key=lambda x: (x["MODELO"], talla_sort_key(x["TALLA"])))
+        rangos = CATALOGO_TALLAS.rangos(x["TALLA"] for x in salidas_export)
+        salidas_sorted = sorted(salidas_export, key=lambda x: (x["MODELO"], rangos[x["TALLA"]]))
         salidas_con_totales = []
         total_general_sal = 0
         total_modelo = 0
@@ -2035,7 +6418,8 @@ class GestorStock:
         total_general = 0
         for modelo in sorted(self.inventory.almacen.keys()):
             total_modelo = 0
-            for talla, cantidad in sorted(self.inventory.almacen[modelo].items(), key=lambda x: talla_sort_key(x[0])):
+            for talla in CATALOGO_TALLAS.ordenar(self.inventory.almacen[modelo]):
+                cantidad = self.inventory.almacen[modelo][talla]
                 stock_list.append({
                     "MODELO": modelo,
                     "DESCRIPCION": info.get(modelo, {}).get("descripcion", ""),
@@ -2068,7 +6452,7 @@ class GestorStock:
         for modelo, items in self.prevision.pedidos_fabricacion.items():
             modelo_info = info.get(modelo, self.prevision.info_modelos.get(modelo, {}))
             for it in items:
-                if int(it.get("cantidad", 0) or 0) <= 0:
+                if it.get("cantidad", 0) <= 0:
                     continue
                 ordenes_export.append({
                     "FECHA": it.get("fecha", ""),
@@ -2076,10 +6460,11 @@ class GestorStock:
                     "DESCRIPCION": modelo_info.get("descripcion", ""),
                     "COLOR": modelo_info.get("color", ""),
                     "TALLA": norm_talla(it.get("talla", "")),
-                    "CANTIDAD": int(it.get("cantidad", 0) or 0),
+                    "CANTIDAD": it.get("cantidad", 0),
                 })
 
-        ordenes_sorted = sorted(ordenes_export, key=lambda x: (x["MODELO"], talla_sort_key(x["TALLA"])))
+        rangos = CATALOGO_TALLAS.rangos(x["TALLA"] for x in ordenes_export)
+        ordenes_sorted = sorted(ordenes_export, key=lambda x: (x["MODELO"], rangos[x["TALLA"]]))
         ordenes_con_totales = []
         total_general_ord = 0
         total_modelo = 0
@@ -2177,7 +6562,8 @@ class GestorStock:
             })
         # Añadir totales por modelo y total general a pedidos pendientes
         # Agrupamos por modelo
-        pedidos_export_sorted = sorted(pedidos_export, key=lambda x: (x["MODELO"], talla_sort_key(x["TALLA"])))
+        rangos = CATALOGO_TALLAS.rangos(x["TALLA"] for x in pedidos_export)
+        pedidos_export_sorted = sorted(pedidos_export, key=lambda x: (x["MODELO"], rangos[x["TALLA"]]))
         pedidos_con_totales = []
         total_general_pedidos = 0
         total_modelo = 0
@@ -2242,7 +6628,8 @@ class GestorStock:
                 "STOCK_ESTIMADO": item["stock_estimado"]
             })
         # Añadir totales por modelo y total general al stock estimado
-        estimado_sorted = sorted(estimado_export, key=lambda x: (x["MODELO"], talla_sort_key(x["TALLA"])))
+        rangos = CATALOGO_TALLAS.rangos(x["TALLA"] for x in estimado_export)
+        estimado_sorted = sorted(estimado_export, key=lambda x: (x["MODELO"], rangos[x["TALLA"]]))
         estimado_con_totales = []
         total_general_est = 0
         total_modelo = 0
@@ -2284,9 +6671,12 @@ class GestorStock:
             "STOCK_ESTIMADO": total_general_est
         })
         self._export_csv("05_stock_estimado", estimado_con_totales, ["MODELO", "DESCRIPCION", "COLOR", "TALLA", "STOCK_ESTIMADO"])
-        # Exportar informe de stock bajo
-        low_stock_export = [item for item in estimado_export if item["STOCK_ESTIMADO"] < 10]
-        self._export_csv("06_orden_corte_sugerida", low_stock_export, ["MODELO", "DESCRIPCION", "COLOR", "TALLA", "STOCK_ESTIMADO"])
+        # Orden de corte sugerida (curva de tallas de las salidas, mínimos y lotes de cada taller)
+        corte_export = [{k.upper(): v for k, v in c.items()}
+                        for c in self.prevision.suggest_cut_orders(self.inventory, self.workshops.list_all())]
+        self._export_csv("06_orden_corte_sugerida", corte_export,
+                         ["MODELO", "DESCRIPCION", "COLOR", "TALLER", "TALLA", "DEMANDA", "STOCK_ESTIMADO",
+                          "OBJETIVO", "CANTIDAD"])
 
     # # ------------------------------------------------------------------
     # # Importar albaranes desde Excel (con control de duplicados)
@@ -2390,13 +6780,11 @@ class GestorStock:
                 return
 
         # 4) Procesar con el modo elegido
-        nuevas_salidas = 0
-        import_rows = []      # Log general de albaranes importados
-        pedidos_servicios = []  # Log de pendientes servidos
-
+        salidas = []
+        pendiente_antes = []  # pendiente de la clave antes de cada línea (para servido/restante)
+        pendiente_clave: Dict[Tuple[str, str, str], int] = {}
         for L in lineas:
             modelo = L["modelo"]; talla = L["talla"]; pedido = L["pedido"]
-            albaran = L["albaran"]; fecha = L["fecha"]
             qty_excel = int(L["cantidad_excel"])
             qty_prev = int(L["ya_prev"])
 
@@ -2414,68 +6802,57 @@ class GestorStock:
                 qty = qty_excel
 
             # Resolver cliente (igual que antes): por pendiente coincidente o info_modelos
-            cliente_pend = ""
-            for p in self.prevision.pedidos:
-                if (str(p.get("modelo","")).strip().upper() == modelo and
-                    norm_talla(p.get("talla","")) == talla and
-                    p.get("pedido","") == pedido):
-                    cliente_pend = p.get("cliente","") or ""
-                    if cliente_pend:
-                        break
+            pendientes = self.prevision.pendings_for(modelo, talla, pedido)
+            cliente_pend = next((p.get("cliente") for p in pendientes if p.get("cliente")), "")
             cliente_info = self.prevision.info_modelos.get(modelo, {}).get("cliente", "")
-            cliente_resuelto = cliente_pend or cliente_info or ""
 
-            # Guardar copia de pedidos antes para calcular servido/restante
-            pedidos_antes = list(self.prevision.pedidos)
+            clave = (modelo, talla, pedido)
+            if clave not in pendiente_clave:
+                pendiente_clave[clave] = sum(p.get("cantidad", 0) for p in pendientes)
+            pendiente_antes.append(pendiente_clave[clave])
+            # Una devolución (cantidad negativa) no repone pendientes
+            pendiente_clave[clave] = max(pendiente_clave[clave] - max(qty, 0), 0)
+
+            salidas.append({
+                "modelo": modelo, "talla": talla, "cantidad": qty,
+                "cliente": cliente_pend or cliente_info or "",
+                "pedido": pedido, "albaran": L["albaran"], "fecha": L["fecha"],
+            })
+
+        # Todas las salidas en una pasada y una escritura por fichero
+        resultados = self.inventory.register_exits_bulk(salidas)
 
-            # Registrar salida final
-            ok = self.inventory.register_exit(
-                modelo, talla, qty, cliente=cliente_resuelto,
-                pedido=pedido, albaran=albaran, fecha=fecha
-            )
-            if not ok:
+        nuevas_salidas = 0
+        import_rows = []      # Log general de albaranes importados
+        pedidos_servicios = []  # Log de pendientes servidos
+        for S, res, total_antes in zip(salidas, resultados, pendiente_antes):
+            if not res["registrada"]:
                 continue
             nuevas_salidas += 1
-
-            # Calcular original/servido/restante usando la copia previa
-            total_antes = sum(
-                int(p.get("cantidad", 0) or 0)
-                for p in pedidos_antes
-                if str(p.get("modelo","")).strip().upper() == modelo
-                and norm_talla(p.get("talla","")) == talla
-                and (p.get("pedido","") or "") == pedido
-            )
-            total_despues = sum(
-                int(p.get("cantidad", 0) or 0)
-                for p in self.prevision.pedidos
-                if str(p.get("modelo","")).strip().upper() == modelo
-                and norm_talla(p.get("talla","")) == talla
-                and (p.get("pedido","") or "") == pedido
-            )
-            cantidad_servida = min(int(qty), int(total_antes))
-            restante = max(int(total_despues), 0)
-
             pedidos_servicios.append({
-                "MODELO": modelo,
-                "TALLA": talla,
-                "PEDIDO": pedido,
+                "MODELO": res["modelo"],
+                "TALLA": res["talla"],
+                "PEDIDO": res["pedido"],
                 "CANTIDAD_ORIGINAL": int(total_antes),
-                "CANTIDAD_SERVIDA": int(cantidad_servida),
-                "RESTANTE": int(restante),
-                "FECHA_ALBARAN": fecha,
-                "NUMERO_ALBARAN": albaran,
+                "CANTIDAD_SERVIDA": int(res["servidos"]),
+                "RESTANTE": int(total_antes) - int(res["servidos"]),
+                "FECHA_ALBARAN": S["fecha"],
+                "NUMERO_ALBARAN": S["albaran"],
             })
             import_rows.append({
-                "FECHA": fecha,
-                "MODELO": modelo,
-                "TALLA": talla,
-                "CANTIDAD": int(qty),
-                "PEDIDO": pedido,
-                "ALBARAN": albaran,
-                "CLIENTE": cliente_resuelto,
+                "FECHA": S["fecha"],
+                "MODELO": res["modelo"],
+                "TALLA": res["talla"],
+                "CANTIDAD": int(res["aplicado"]),
+                "PEDIDO": res["pedido"],
+                "ALBARAN": S["albaran"],
+                "CLIENTE": S["cliente"],
             })
 
         print(f"✅ Importación completada: {nuevas_salidas} movimientos de albaranes procesados.")
+        for res in resultados:
+            for aviso in res["avisos"]:
+                print(f"⚠️ {res['modelo']} T{res['talla']} pedido {res['pedido']}: {aviso}")
 
         # CSV de albaranes importados (ajustados a la cantidad realmente aplicada)
         if import_rows:
@@ -2522,50 +6899,52 @@ class GestorStock:
         nuevos = 0
         duplicados = 0
         import_rows = []  # filas importadas para log
-        for _, fila in df.iterrows():
-            modelo = str(fila["CodigoArticulo"]).strip().upper()
-            talla = norm_talla(fila["DesTalla"])
-            pedido = norm_codigo(fila["SuPedido"])
-            valor = fila["UnidadesPendientes"]
-            if pd.isna(valor):
-                continue
-            try:
-                cantidad = int(valor)
-            except:
-                continue
-            fecha = parse_fecha_excel(fila["FechaEntrega"])
-            numero_pedido = norm_codigo(fila["NumeroPedido"])
-            clave = (modelo, talla, pedido)
-            if clave in ya_existentes:
-                duplicados += 1
-                continue
-            # Resolver cliente: por columna 'Cliente' (si existe) o por info_modelos
-            tiene_cliente = "Cliente" in df.columns
-            cliente_excel = ""
-            if tiene_cliente and not pd.isna(fila["Cliente"]):
-                cliente_excel = str(fila["Cliente"]).strip()
+        # Una sola escritura de prevision.json para todo el Excel
+        with self.transaction():
+            for _, fila in df.iterrows():
+                modelo = str(fila["CodigoArticulo"]).strip().upper()
+                talla = norm_talla(fila["DesTalla"])
+                pedido = norm_codigo(fila["SuPedido"])
+                valor = fila["UnidadesPendientes"]
+                if pd.isna(valor):
+                    continue
+                try:
+                    cantidad = int(valor)
+                except:
+                    continue
+                fecha = parse_fecha_excel(fila["FechaEntrega"])
+                numero_pedido = norm_codigo(fila["NumeroPedido"])
+                clave = (modelo, talla, pedido)
+                if clave in ya_existentes:
+                    duplicados += 1
+                    continue
+                # Resolver cliente: por columna 'Cliente' (si existe) o por info_modelos
+                tiene_cliente = "Cliente" in df.columns
+                cliente_excel = ""
+                if tiene_cliente and not pd.isna(fila["Cliente"]):
+                    cliente_excel = str(fila["Cliente"]).strip()
 
-            cliente_info = self.prevision.info_modelos.get(modelo, {}).get("cliente", "")
-            cliente_resuelto = cliente_excel or cliente_info or ""
+                cliente_info = self.prevision.info_modelos.get(modelo, {}).get("cliente", "")
+                cliente_resuelto = cliente_excel or cliente_info or ""
 
-            # Registrar pendiente con cliente resuelto
-            self.prevision.register_pending(
-                modelo, talla, cantidad, pedido,
-                cliente=cliente_resuelto, fecha=fecha, numero_pedido=numero_pedido
-            )
-            ya_existentes.add(clave)
-            nuevos += 1
+                # Registrar pendiente con cliente resuelto
+                self.prevision.register_pending(
+                    modelo, talla, cantidad, pedido,
+                    cliente=cliente_resuelto, fecha=fecha, numero_pedido=numero_pedido
+                )
+                ya_existentes.add(clave)
+                nuevos += 1
 
-            # Log: guardar el cliente real
-            import_rows.append({
-                "FECHA": fecha,
-                "PEDIDO": pedido,
-                "NUMERO_PEDIDO": numero_pedido,
-                "MODELO": modelo,
-                "TALLA": talla,
-                "CANTIDAD": cantidad,
-                "CLIENTE": cliente_resuelto
-            })
+                # Log: guardar el cliente real
+                import_rows.append({
+                    "FECHA": fecha,
+                    "PEDIDO": pedido,
+                    "NUMERO_PEDIDO": numero_pedido,
+                    "MODELO": modelo,
+                    "TALLA": talla,
+                    "CANTIDAD": cantidad,
+                    "CLIENTE": cliente_resuelto
+                })
 
         print(f"✅ Se han importado {nuevos} nuevos pedidos desde el Excel.")
         if duplicados:
@@ -2580,62 +6959,90 @@ class GestorStock:
     # ------------------------------------------------------------------
     # Backup y restauración
     # ------------------------------------------------------------------
+    def backups(self) -> BackupStore:
+        """Almacén de copias de seguridad (carpeta backups junto al inventario)."""
+        return BackupStore(os.path.join(os.path.dirname(self.ds_inventario.path), "backups"))
+
+    def _stores(self) -> Dict[str, DataStore]:
+        return {"inventario": self.ds_inventario, "prevision": self.ds_prevision,
+                "talleres": self.ds_talleres, "clientes": self.ds_clientes}
+
+    def crear_backup(self, etiqueta: str = "") -> Dict:
+        """Copia deduplicada de los cuatro ficheros (ver BackupStore.crear)."""
+        return self.backups().crear(self._stores(), etiqueta)
+
+    def restaurar_backup(self, punto_id: str, nombres: Optional[List[str]] = None) -> List[str]:
+        """Restaura un punto de backup (todos los ficheros o `nombres`) y recarga las clases."""
+        restaurados = self.backups().restaurar(punto_id, self._stores(), nombres)
+        # Reinstanciar clases para sincronizar estructuras internas
+        self.prevision = Prevision(self.ds_prevision)
+        self.inventory = Inventory(self.ds_inventario, self.prevision)
+        self._rebuild_derived()
+        return restaurados
+
     def _crear_backup_manual(self) -> None:
-        """Crea una copia de seguridad de los JSON en la carpeta backups."""
-        carpeta = os.path.join(os.path.dirname(self.ds_inventario.path), "backups")
-        os.makedirs(carpeta, exist_ok=True)
-        fecha = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        ruta_datos = os.path.join(carpeta, f"datos_almacen_{fecha}.json")
-        ruta_prevision = os.path.join(carpeta, f"prevision_{fecha}.json")
+        """Crea una copia de seguridad deduplicada en la carpeta backups."""
         try:
-            # Copiamos los ficheros
-            with open(self.ds_inventario.path, "r", encoding="utf-8") as src, open(ruta_datos, "w", encoding="utf-8") as dst:
-                dst.write(src.read())
-            with open(self.ds_prevision.path, "r", encoding="utf-8") as src, open(ruta_prevision, "w", encoding="utf-8") as dst:
-                dst.write(src.read())
-            print(f"✅ Backup creado:\n - {ruta_datos}\n - {ruta_prevision}")
+            r = self.crear_backup("manual")
+            print(f"✅ Backup creado ({r['id']}): {r['nuevos']} de {r['trozos']} trozos nuevos, "
+                  f"{r['bytes_nuevos']:,} bytes escritos.")
+            if r["podados"]:
+                print(f"🗑️ {r['podados']} backups antiguos eliminados por la política de retención.")
         except Exception as e:
             print(f"❌ Error creando backup: {e}")
 
     def _restaurar_backup(self) -> None:
-        """Permite seleccionar un backup y restaurar uno de los dos ficheros."""
+        """Permite seleccionar un punto de backup (o una copia antigua en JSON) y restaurarlo."""
         carpeta = os.path.join(os.path.dirname(self.ds_inventario.path), "backups")
-        if not os.path.exists(carpeta):
+        puntos = self.backups().puntos()
+        # Copias antiguas: ficheros JSON sueltos de un solo fichero de datos
+        archivos = sorted(f for f in os.listdir(carpeta) if f.endswith(".json")
+                          and os.path.isfile(os.path.join(carpeta, f))) if os.path.isdir(carpeta) else []
+        if not puntos and not archivos:
             print("❌ No hay backups disponibles.")
             return
-        archivos = [f for f in os.listdir(carpeta) if f.endswith(".json")]
-        if not archivos:
-            print("❌ No hay archivos de backup en la carpeta.")
-            return
         print("\nBackups disponibles:")
         enumerados = {}
-        for i, archivo in enumerate(sorted(archivos), 1):
-            print(f"{i}. {archivo}")
+        for i, p in enumerate(puntos, 1):
+            print(f"{i}. {p['fecha']} {p.get('etiqueta', '')} ({', '.join(p['ficheros'])})")
+            enumerados[str(i)] = p
+        for i, archivo in enumerate(archivos, len(puntos) + 1):
+            print(f"{i}. {archivo} (copia antigua)")
             enumerados[str(i)] = archivo
-        seleccion = input("Selecciona número de archivo para restaurar (0 para cancelar): ")
+        seleccion = input("Selecciona número de backup para restaurar (0 para cancelar): ")
         if seleccion == "0":
             print("❌ Cancelado.")
             return
-        nombre = enumerados.get(seleccion)
-        if not nombre:
+        elegido = enumerados.get(seleccion)
+        if not elegido:
             print("❌ Opción no válida.")
             return
+        if isinstance(elegido, dict):
+            confirm = input(f"⚠️ Esto sobrescribirá {', '.join(elegido['ficheros'])}. ¿Confirmas? (s/n): ").lower()
+            if confirm != "s":
+                print("❌ Operación cancelada.")
+                return
+            try:
+                restaurados = self.restaurar_backup(elegido["id"])
+                print(f"✅ Restaurado backup del {elegido['fecha']}: {', '.join(restaurados)}")
+            except Exception as e:
+                print(f"❌ Error restaurando backup: {e}")
+            return
+        nombre = elegido
         if "datos_almacen" in nombre:
-            destino = self.ds_inventario.path
+            store = self.ds_inventario
         elif "prevision" in nombre:
-            destino = self.ds_prevision.path
+            store = self.ds_prevision
         else:
             print("❌ Nombre de archivo no reconocido para restaurar.")
             return
+        destino = store.path
         confirm = input(f"⚠️ Esto sobrescribirá {os.path.basename(destino)}. ¿Confirmas? (s/n): ").lower()
         if confirm == "s":
             origen = os.path.join(carpeta, nombre)
             try:
-                with open(origen, "r", encoding="utf-8") as src, open(destino, "w", encoding="utf-8") as dst:
-                    dst.write(src.read())
-                # Recargamos datos en memoria
-                self.ds_inventario.data = self.ds_inventario.load()
-                self.ds_prevision.data = self.ds_prevision.load()
+                # Sustituye el estado persistido y lo recarga en memoria
+                store.import_snapshot(origen)
                 # Reinstanciar clases para sincronizar estructuras internas
                 self.prevision = Prevision(self.ds_prevision)
                 self.inventory = Inventory(self.ds_inventario, self.prevision)
@@ -2660,11 +7067,17 @@ class GestorStock:
                 if not talleres:
                     print("(sin talleres)")
                 for t in talleres:
-                    print(f"- {t.nombre} (contacto: {t.contacto or '—'})")
+                    print(f"- {t.nombre} (contacto: {t.contacto or '—'}, corte mínimo: {t.minimo}, lote: {t.lote})")
             elif op == "2":
                 nombre = input("Nombre del taller: ")
                 contacto = input("Contacto (opcional): ") or None
-                self.workshops.add(nombre, contacto)
+                try:
+                    minimo = int(input("Corte mínimo en uds (Enter = 0): ").strip() or 0)
+                    lote = int(input("Lote: múltiplo de corte en uds (Enter = 1): ").strip() or 1)
+                except ValueError:
+                    print("❌ Número no válido.")
+                    continue
+                self.workshops.add(nombre, contacto, minimo, lote)
             elif op == "3":
                 talleres_lista = self.workshops.list_all()
                 if not talleres_lista:
@@ -2674,7 +7087,15 @@ class GestorStock:
                 nombre = prompt_select_name("Taller a editar (prefijo/número):", talleres_nombres, allow_empty=False)
                 nuevo_nombre = input("Nuevo nombre (dejar vacío para no cambiar): ") or None
                 nuevo_contacto = input("Nuevo contacto (dejar vacío para no cambiar): ") or None
-                self.workshops.edit(nombre, nuevo_nombre or None, nuevo_contacto or None)
+                try:
+                    nuevo_minimo = input("Nuevo corte mínimo (dejar vacío para no cambiar): ").strip()
+                    nuevo_minimo = int(nuevo_minimo) if nuevo_minimo else None
+                    nuevo_lote = input("Nuevo lote (dejar vacío para no cambiar): ").strip()
+                    nuevo_lote = int(nuevo_lote) if nuevo_lote else None
+                except ValueError:
+                    print("❌ Número no válido.")
+                    continue
+                self.workshops.edit(nombre, nuevo_nombre or None, nuevo_contacto or None, nuevo_minimo, nuevo_lote)
             elif op == "4":
                 talleres_lista = self.workshops.list_all()
                 if not talleres_lista:
@@ -2846,67 +7267,20 @@ class GestorStock:
             print("❌ Código no válido o igual al actual.")
             return
 
-        # Comprobar si el nuevo ya existe en alguna estructura principal
-        existe_nuevo = (
-            nuevo in self.inventory.almacen or
-            nuevo in self.inventory.info_modelos or
-            nuevo in self.prevision.info_modelos or
-            nuevo in self.prevision.pedidos_fabricacion
-        )
-        if existe_nuevo:
+        # Comprobar si el nuevo ya existe (stock, fichas, movimientos, fabricación o pendientes)
+        if self.inventory.has_model(nuevo) or self.prevision.has_model(nuevo):
             print(f"❌ El modelo {nuevo} ya existe. Elige otro código.")
             return
 
         # Comprobar si el antiguo existe en alguna estructura (no solo en almacen)
-        existe_antiguo = (
-            antiguo in self.inventory.almacen or
-            antiguo in self.inventory.info_modelos or
-            antiguo in self.prevision.info_modelos or
-            antiguo in self.prevision.pedidos_fabricacion or
-            any(e.get("modelo") == antiguo for e in self.inventory.historial_entradas) or
-            any(s.get("modelo") == antiguo for s in self.inventory.historial_salidas) or
-            any(o.get("modelo") == antiguo for o in self.prevision.ordenes) or
-            any(p.get("modelo") == antiguo for p in self.prevision.pedidos)
-        )
+        existe_antiguo = self.inventory.has_model(antiguo) or self.prevision.has_model(antiguo)
         if not existe_antiguo:
             print(f"❌ No se encuentra el modelo {antiguo} en los datos.")
             return
 
-        # Asegurar contenedor en almacen para renombrar, aunque esté vacío
-        if antiguo in self.inventory.almacen:
-            self.inventory.almacen[nuevo] = self.inventory.almacen.pop(antiguo)
-        else:
-            self.inventory.almacen.setdefault(nuevo, {})
-
-        # Renombrar en info_modelos (inventario y previsión)
-        if antiguo in self.inventory.info_modelos:
-            self.inventory.info_modelos[nuevo] = self.inventory.info_modelos.pop(antiguo)
-        if antiguo in self.prevision.info_modelos:
-            self.prevision.info_modelos[nuevo] = self.prevision.info_modelos.pop(antiguo)
-
-        # Renombrar claves de pedidos_fabricacion
-        if antiguo in self.prevision.pedidos_fabricacion:
-            self.prevision.pedidos_fabricacion[nuevo] = self.prevision.pedidos_fabricacion.pop(antiguo)
-
-        # Historiales
-        for entrada in self.inventory.historial_entradas:
-            if entrada.get("modelo") == antiguo:
-                entrada["modelo"] = nuevo
-        for salida in self.inventory.historial_salidas:
-            if salida.get("modelo") == antiguo:
-                salida["modelo"] = nuevo
-
-        # Ordenes antiguas (si aún quedan) y pedidos pendientes
-        for orden in self.prevision.ordenes:
-            if orden.get("modelo") == antiguo:
-                orden["modelo"] = nuevo
-        for pedido in self.prevision.pedidos:
-            if pedido.get("modelo") == antiguo:
-                pedido["modelo"] = nuevo
-
-        # Guardar
-        self.inventory.save()
-        self.prevision.save()
+        # Stock, fichas, historiales y cierres; luego fabricación y pendientes
+        self.inventory.rename_model(antiguo, nuevo)
+        self.prevision.rename_model(antiguo, nuevo)
         print(f"✅ Modelo {antiguo} renombrado como {nuevo} en todas las estructuras.")
 
 
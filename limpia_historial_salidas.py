@@ -21,26 +21,25 @@ Recomendación: ejecuta primero SIN --apply para revisar el informe.
 import argparse
 import json
 import os
-import shutil
 from datetime import datetime
 from typing import Any, Dict, List, Optional, Tuple, Set, Union
 
+from gestor_oop import ConflictoVersion, DataStore, leer_json
+
 Json = Dict[str, Any]
 
 def load_json(path: str) -> Json:
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    # Admite también los formatos compacto/comprimido de DataStore
+    return leer_json(path)
 
 def save_json(path: str, data: Json) -> None:
     with open(path, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=4)
 
-def backup_file(path: str) -> str:
+def backup_path(path: str) -> str:
     ts = datetime.now().strftime("%Y%m%d-%H%M%S")
     base, ext = os.path.splitext(path)
-    bak = f"{base}.backup-{ts}{ext or '.json'}"
-    shutil.copy2(path, bak)
-    return bak
+    return f"{base}.backup-{ts}{ext or '.json'}"
 
 def to_str_no_decimal(v: Union[str, int, float]) -> str:
     """
@@ -181,8 +180,14 @@ def main():
     clientes_path = args.clientes
     dry_run = not args.apply
 
-    # Carga archivos
-    datos = load_json(datos_path)
+    # Carga archivos (datos vía DataStore: incluye el journal si lo hay)
+    store_datos = DataStore(datos_path, {})
+    bak = None
+    if not dry_run:
+        # Backup antes de tocar nada; export_snapshot incluye journal e históricos por mes
+        bak = backup_path(datos_path)
+        store_datos.export_snapshot(bak)
+    datos = store_datos.data
     prev = load_json(prevision_path)
     cli = load_json(clientes_path)
 
@@ -228,8 +233,14 @@ def main():
 
     # Guardado con backup
     if not dry_run:
-        bak = backup_file(datos_path)
-        save_json(datos_path, datos)
+        try:
+            store_datos.save()
+        except ConflictoVersion as e:
+            # Otro proceso (la app, el menú) escribió mientras limpiábamos: no se pisa
+            print("-----------------------------------")
+            print(f"❌ {e}")
+            print(f"No se han escrito cambios; backup en {bak}. Vuelve a ejecutar el script.")
+            return
         print("-----------------------------------")
         print(f"Backup creado en      : {bak}")
         print(f"Cambios guardados en  : {datos_path}")
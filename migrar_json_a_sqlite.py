@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+migrar_json_a_sqlite.py
+
+- Vuelca datos_almacen.json y prevision.json (incluido su journal, si lo hay)
+  a un único fichero SQLite utilizable con GestorStock(path_sqlite=...).
+- Reescribe por completo los ámbitos de inventario y previsión del destino.
+- Los JSON originales no se modifican.
+
+Uso:
+  python migrar_json_a_sqlite.py \
+    --datos datos_almacen.json \
+    --prevision prevision.json \
+    --sqlite almacen.db
+"""
+import argparse
+import os
+
+from gestor_oop import importar_json_a_sqlite
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Importa los JSON del gestor a SQLite")
+    ap.add_argument("--datos", default="datos_almacen.json", help="Ruta a datos_almacen.json")
+    ap.add_argument("--prevision", default="prevision.json", help="Ruta a prevision.json")
+    ap.add_argument("--sqlite", required=True, help="Fichero SQLite destino")
+    args = ap.parse_args()
+
+    for ruta in (args.datos, args.prevision):
+        if not os.path.exists(ruta):
+            print(f"❌ No existe {ruta}")
+            return
+
+    resumen = importar_json_a_sqlite(args.sqlite, args.datos, args.prevision)
+
+    print("=== IMPORTACIÓN JSON → SQLITE ===")
+    print(f"Destino               : {args.sqlite}")
+    print("-----------------------------------")
+    for clave, n in resumen.items():
+        print(f"{clave:<32}: {n}")
+
+if __name__ == "__main__":
+    main()
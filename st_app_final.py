@@ -11,6 +11,8 @@ import streamlit as st
 
 # Importar las clases/utilidades del gestor existente (mismo directorio)
 from gestor_oop import (
+    CATALOGO_TALLAS,
+    ConflictoVersion,
     GestorStock,
     norm_talla,
     norm_codigo,
@@ -26,6 +28,10 @@ def get_manager(
     path_prevision: str = "prevision.json",
     path_talleres: str = "talleres.json",
     path_clientes: str = "clientes.json",
+    path_sqlite: str = "",
+    async_write: bool = False,
+    historial_segmentado: bool = False,
+    historial_columnar: bool = False,
 ) -> GestorStock:
     # Crea una única instancia por sesión de Streamlit
     return GestorStock(
@@ -33,6 +39,10 @@ def get_manager(
         path_prevision=path_prevision,
         path_talleres=path_talleres,
         path_clientes=path_clientes,
+        path_sqlite=path_sqlite or None,
+        async_write=async_write,
+        historial_segmentado=historial_segmentado,
+        historial_columnar=historial_columnar,
     )
 
 def _to_df(lista: List[Dict]) -> pd.DataFrame:
@@ -51,6 +61,13 @@ def _error(msg: str):
 
 def _info(msg: str):
     st.info(msg, icon="ℹ️")
+
+def _recargar_tras_conflicto(e: ConflictoVersion) -> GestorStock:
+    """Otro puesto cambió los mismos datos: manager nuevo desde disco y aviso de lo no aplicado."""
+    get_manager.clear()
+    st.session_state["manager"] = get_manager(*st.session_state["manager_args"])
+    _error(f"{e} No hace falta deshacer nada: lo que ves ya son los datos guardados.")
+    return st.session_state["manager"]
 # ---- Export helpers ----
 def _run_export_all(mgr: GestorStock):
     """Lanza la exportación completa a CSV en la ruta definida por el gestor."""
@@ -171,6 +188,7 @@ def _procesar_albaranes_df(df: pd.DataFrame, modo_txt: str, simular: bool):
     pedidos_servicios = []
     pedidos_antes = list(mgr.prevision.pedidos)
 
+    salidas = []
     for L in lineas:
         modelo = L["modelo"]; talla = L["talla"]; pedido = L["pedido"]
         albaran = L["albaran"]; fecha = L["fecha"]
@@ -189,18 +207,12 @@ def _procesar_albaranes_df(df: pd.DataFrame, modo_txt: str, simular: bool):
 
         if not simular:
             # cliente: intenta resolver como en CLI (pendiente, info_modelos, vacío)
-            cliente = ""
-            for p in mgr.prevision.pedidos:
-                if (str(p.get("modelo","")).strip().upper() == modelo and
-                    norm_talla(p.get("talla","")) == talla and
-                    p.get("pedido","") == pedido):
-                    cliente = p.get("cliente","") or ""
-                    if cliente:
-                        break
+            cliente = next((p.get("cliente") for p in mgr.prevision.pendings_for(modelo, talla, pedido)
+                            if p.get("cliente")), "")
             if not cliente:
                 cliente = mgr.prevision.info_modelos.get(modelo, {}).get("cliente", "") or ""
-            mgr.inventory.register_exit(modelo=modelo, talla=talla, cantidad=aplicar,
-                                        cliente=cliente, pedido=pedido, albaran=albaran, fecha=fecha)
+            salidas.append({"modelo": modelo, "talla": talla, "cantidad": aplicar, "cliente": cliente,
+                            "pedido": pedido, "albaran": albaran, "fecha": fecha})
         nuevas_salidas += aplicar
 
         import_rows.append({
@@ -208,6 +220,20 @@ def _procesar_albaranes_df(df: pd.DataFrame, modo_txt: str, simular: bool):
             "PEDIDO": pedido, "ALBARAN": albaran, "CLIENTE": ""
         })
 
+    if salidas:
+        # Todas las salidas en una pasada y una escritura por fichero (st.rerun va fuera)
+        try:
+            resultados = mgr.inventory.register_exits_bulk(salidas)
+        except ConflictoVersion as e:
+            _recargar_tras_conflicto(e)
+            return
+        # Resultado por línea: se enseña tras el st.rerun (ver _mostrar_resultado_albaranes)
+        st.session_state["resultado_albaranes"] = [
+            {"MODELO": r["modelo"], "TALLA": r["talla"], "PEDIDO": r["pedido"], "ALBARAN": S["albaran"],
+             "CANTIDAD": r["aplicado"], "SERVIDO_DE_PENDIENTES": r["servidos"], "AVISOS": " ".join(r["avisos"])}
+            for S, r in zip(salidas, resultados)
+        ]
+
     # detectar pedidos servidos (como en tu versión)
     pedidos_despues = list(mgr.prevision.pedidos)
     set_antes = {(p["modelo"], norm_talla(p["talla"]), p["pedido"]) for p in pedidos_antes}
@@ -230,6 +256,24 @@ def _procesar_albaranes_df(df: pd.DataFrame, modo_txt: str, simular: bool):
     if import_rows:
         st.dataframe(pd.DataFrame(import_rows), use_container_width=True)
 
+def _mostrar_resultado_albaranes():
+    """Líneas de la última importación de albaranes con lo aplicado, lo servido y los avisos."""
+    filas = st.session_state.get("resultado_albaranes")
+    if not filas:
+        return
+    st.markdown("**Resultado de la última importación de albaranes**")
+    con_avisos = [f for f in filas if f["AVISOS"]]
+    if con_avisos:
+        _warn(f"{len(con_avisos)} líneas con avisos (p. ej. stock insuficiente, queda en negativo): "
+              "revisa la columna AVISOS.")
+    sin_pendiente = [f for f in filas if f["SERVIDO_DE_PENDIENTES"] < f["CANTIDAD"]]
+    if sin_pendiente:
+        _info(f"{len(sin_pendiente)} líneas no tenían pendiente suficiente para descontar toda la cantidad.")
+    st.dataframe(_to_df(filas), use_container_width=True)
+    if st.button("Ocultar resultado", key="btn_alb_ocultar"):
+        del st.session_state["resultado_albaranes"]
+        st.rerun()
+
 def _procesar_pedidos_df(df: pd.DataFrame, simular: bool):
     columnas = ["CodigoArticulo", "DesTalla", "UnidadesPendientes", "SuPedido", "FechaEntrega", "NumeroPedido"]
     if not all(col in df.columns for col in columnas):
@@ -241,32 +285,39 @@ def _procesar_pedidos_df(df: pd.DataFrame, simular: bool):
     nuevos, duplicados = 0, 0
     import_rows = []
 
-    for _, fila in df.iterrows():
-        modelo = str(fila["CodigoArticulo"]).strip().upper()
-        talla = norm_talla(fila["DesTalla"])
-        val = fila["UnidadesPendientes"]
-        cantidad = int(val) if not pd.isna(val) else 0
-        pedido = norm_codigo(fila["SuPedido"])
-        numero_pedido = norm_codigo(fila["NumeroPedido"])
-        fecha = parse_fecha_excel(fila["FechaEntrega"])
-        cliente_resuelto = mgr.inventory.info_modelos.get(modelo, {}).get("cliente","") or ""
-
-        k = (modelo, talla, pedido)
-        if k in ya:
-            duplicados += 1
-            continue
-
-        if not simular:
-            mgr.prevision.register_pending(
-                modelo=modelo, talla=talla, cantidad=int(cantidad),
-                pedido=pedido, cliente=cliente_resuelto,
-                fecha=fecha or None, numero_pedido=numero_pedido or None
-            )
-        nuevos += 1
-        import_rows.append({
-            "FECHA": fecha, "PEDIDO": pedido, "NUMERO_PEDIDO": numero_pedido,
-            "MODELO": modelo, "TALLA": talla, "CANTIDAD": int(cantidad), "CLIENTE": cliente_resuelto,
-        })
+    # Una sola escritura de prevision.json para todo el Excel (st.rerun va fuera)
+    try:
+        with mgr.transaction():
+            for _, fila in df.iterrows():
+                modelo = str(fila["CodigoArticulo"]).strip().upper()
+                talla = norm_talla(fila["DesTalla"])
+                val = fila["UnidadesPendientes"]
+                cantidad = int(val) if not pd.isna(val) else 0
+                pedido = norm_codigo(fila["SuPedido"])
+                numero_pedido = norm_codigo(fila["NumeroPedido"])
+                fecha = parse_fecha_excel(fila["FechaEntrega"])
+                cliente_resuelto = mgr.inventory.info_modelos.get(modelo, {}).get("cliente","") or ""
+
+                k = (modelo, talla, pedido)
+                if k in ya:
+                    duplicados += 1
+                    continue
+
+                if not simular:
+                    mgr.prevision.register_pending(
+                        modelo=modelo, talla=talla, cantidad=int(cantidad),
+                        pedido=pedido, cliente=cliente_resuelto,
+                        fecha=fecha or None, numero_pedido=numero_pedido or None
+                    )
+                nuevos += 1
+                import_rows.append({
+                    "FECHA": fecha, "PEDIDO": pedido, "NUMERO_PEDIDO": numero_pedido,
+                    "MODELO": modelo, "TALLA": talla, "CANTIDAD": int(cantidad), "CLIENTE": cliente_resuelto,
+                })
+    except ConflictoVersion as e:
+        # Otro puesto tocó los mismos pedidos: se recarga y se avisa de lo no aplicado
+        _recargar_tras_conflicto(e)
+        return
 
     if not simular:
         _success(f"Importación completada: {nuevos} nuevos pedidos añadidos. Ignorados duplicados: {duplicados}.")
@@ -397,7 +448,7 @@ def _tallas_disponibles(mgr: GestorStock, modelo: str) -> List[str]:
 
     # Limpieza y orden
     tallas = {norm_talla(t) for t in tallas if str(t).strip()}
-    return sorted(tallas)
+    return CATALOGO_TALLAS.ordenar(tallas)
 
 def talla_select(label: str, modelo: str, key_sel: str, key_txt: str, allow_manual: bool = True) -> str:
     """
@@ -670,15 +721,47 @@ with st.sidebar:
     prev_path = st.text_input("Previsión JSON", "prevision.json")
     tall_path = st.text_input("Talleres JSON", "talleres.json")
     cli_path = st.text_input("Clientes JSON", "clientes.json")
+    sqlite_path = st.text_input("Base SQLite (opcional, sustituye a inventario/previsión JSON)", "").strip()
+    async_write = st.checkbox("Guardar JSON en segundo plano", value=False,
+                              help="No espera al disco en cada cambio (útil en unidades de red).")
+    historial_segmentado = st.checkbox("Históricos por mes (carga bajo demanda)", value=False,
+                                       help="Reparte entradas/salidas en un fichero por mes. "
+                                            "Una vez convertido, se abre así siempre.")
+    historial_columnar = st.checkbox("Históricos en columnas (menos memoria)", value=False,
+                                     help="Guarda entradas/salidas por columnas en memoria; "
+                                          "el fichero no cambia.")
+    manager_args = (inv_path, prev_path, tall_path, cli_path, sqlite_path,
+                    async_write, historial_segmentado, historial_columnar)
     if st.button("🔄 Cargar/Recargar"):
         # Invalida la cache del manager
         get_manager.clear()
-        st.session_state["manager"] = get_manager(inv_path, prev_path, tall_path, cli_path)
+        st.session_state["manager"] = get_manager(*manager_args)
         _success("Datos cargados.")
     if "manager" not in st.session_state:
-        st.session_state["manager"] = get_manager(inv_path, prev_path, tall_path, cli_path)
+        st.session_state["manager"] = get_manager(*manager_args)
+    st.session_state["manager_args"] = manager_args
 
     mgr: GestorStock = st.session_state["manager"]
+    # El manager está en cache: recoge lo que otros puestos hayan guardado (barato si nada cambió)
+    try:
+        recargados = mgr.refresh()
+    except ConflictoVersion as e:
+        recargados = {}
+        mgr = _recargar_tras_conflicto(e)
+    if recargados:
+        st.caption("🔄 Recargado de disco: " + "; ".join(
+            f"{fichero} ({', '.join(sorted(claves))})" for fichero, claves in recargados.items()))
+
+    stats = mgr.ds_inventario.write_stats()
+    if stats.get("asincrono"):
+        estado = "pendiente" if stats["pendiente"] else "al día"
+        st.caption(f"💾 Guardado: {estado} · escrituras {stats['escritas']} "
+                   f"(agrupadas {stats['agrupadas']}, errores {stats['errores']})")
+        if st.button("Guardar ahora"):
+            if mgr.flush(timeout=30):
+                _success("Cambios escritos en disco.")
+            else:
+                _error("No se pudieron escribir todos los cambios (revisa la consola).")
 
     st.divider()
     st.caption("Consejo: este MVP escribe en los mismos JSON. Haz copias si quieres probar sin riesgo.")
@@ -708,7 +791,8 @@ with tab_stock:
     for m in modelos:
         if modelo_sel != "(Todos)" and m != modelo_sel:
             continue
-        for t, q in sorted(mgr.inventory.almacen.get(m, {}).items(), key=lambda x: x[0]):
+        for t in mgr.inventory.size_grid(m):
+            q = mgr.inventory.almacen[m][t]
             if talla_sel and norm_talla(t) != norm_talla(talla_sel):
                 continue
             info = mgr.inventory.info_modelos.get(m, {})
@@ -735,6 +819,25 @@ with tab_stock:
         if st.button("Exportar stock actual + (opcional) negativas", key="btn_export_stock"):
             _run_export_all(mgr)
 
+    with st.expander("📅 Stock a una fecha (según movimientos)"):
+        st.caption("Entradas menos salidas registradas hasta el final del día indicado.")
+        col_f1, col_f2 = st.columns([1, 2])
+        with col_f1:
+            sf_fecha = st.text_input("Fecha (YYYY-MM-DD)", value=datetime.now().strftime("%Y-%m-%d"), key="sf_fecha")
+        with col_f2:
+            sf_modelo = st.selectbox("Modelo", ["(Todos)"] + modelos, key="sf_modelo")
+        if st.button("Consultar", key="btn_stock_fecha"):
+            try:
+                stock_fecha = mgr.inventory.stock_at(sf_fecha, None if sf_modelo == "(Todos)" else sf_modelo)
+                filas_fecha = [{"MODELO": m, "TALLA": t, "STOCK": q}
+                               for m, tallas in stock_fecha.items() for t, q in tallas.items()]
+                if filas_fecha:
+                    st.dataframe(_to_df(filas_fecha), use_container_width=True)
+                else:
+                    _info("Sin stock según los movimientos a esa fecha.")
+            except ValueError as e:
+                _error(str(e))
+
     with st.expander("🧹 Utilidades de saneo de stock"):
         col_u1, col_u2 = st.columns(2)
 
@@ -902,6 +1005,8 @@ with tab_movs:
                     set_last_update(mgr, f"Entrada {modelo} T:{talla} +{int(cantidad)}")
                     st.rerun()
 
+                except ConflictoVersion as e:
+                    _recargar_tras_conflicto(e)
                 except Exception as e:
                     _error(f"Error registrando entrada: {e}")
 
@@ -944,6 +1049,8 @@ with tab_movs:
                         set_last_update(mgr, f"Salida {modelo} T:{talla} -{int(cant)} Ped:{pedido} Alb:{albaran}")
                     st.rerun()
 
+                except ConflictoVersion as e:
+                    _recargar_tras_conflicto(e)
                 except Exception as e:
                     _error(f"Error registrando salida: {e}")
 
@@ -974,6 +1081,95 @@ with tab_prevision:
     else:
         st.dataframe(est_df, use_container_width=True)
 
+    with st.expander("📈 Proyección por periodos (fabricación y pendientes por fecha)"):
+        st.caption("Stock real + órdenes de fabricación - pendientes, acumulado por periodo según sus fechas. "
+                   "Lo vencido o sin fecha cuenta en el periodo actual.")
+        col_p1, col_p2 = st.columns([1, 2])
+        with col_p1:
+            pr_periodo = st.radio("Periodo", ["mes", "semana"], horizontal=True, key="pr_periodo")
+        with col_p2:
+            pr_modelo = st.selectbox("Modelo", ["(Todos)"] + sorted(mgr.inventory.almacen.keys()), key="pr_modelo")
+        negativos = mgr.prevision.first_negative_periods(mgr.inventory, pr_periodo)
+        if pr_modelo != "(Todos)":
+            negativos = [r for r in negativos if r["modelo"] == pr_modelo]
+        if negativos:
+            st.markdown("**Primer periodo en negativo**")
+            st.dataframe(_to_df(negativos), use_container_width=True)
+        else:
+            _info("Ninguna talla se queda en negativo.")
+        if pr_modelo != "(Todos)":
+            st.dataframe(_to_df(mgr.prevision.project_stock(mgr.inventory, pr_periodo, modelo=pr_modelo)),
+                         use_container_width=True)
+
+    with st.expander("🤝 Disponible para prometer (ATP)"):
+        st.caption("Unidades que se pueden comprometer para una fecha sin dejar sin cubrir pendientes "
+                   "posteriores (stock real + fabricación - pendientes, según sus fechas).")
+        col_a1, col_a2, col_a3, col_a4 = st.columns([2, 1, 1, 1])
+        with col_a1:
+            atp_modelo = st.selectbox("Modelo", sorted(mgr.inventory.almacen.keys()), key="atp_modelo")
+        with col_a2:
+            atp_talla = st.text_input("Talla", key="atp_talla")
+        with col_a3:
+            atp_cant = st.number_input("Cantidad", min_value=1, step=1, value=1, key="atp_cant")
+        with col_a4:
+            atp_fecha = st.date_input("Fecha de entrega", value=datetime.now().date(), key="atp_fecha")
+        if st.button("Consultar", key="btn_atp"):
+            if not atp_modelo or not atp_talla.strip():
+                _error("Indica modelo y talla.")
+            else:
+                r = mgr.prevision.available_to_promise(mgr.inventory, atp_modelo, atp_talla, int(atp_cant),
+                                                       atp_fecha.strftime("%Y-%m-%d"))
+                if r["cumple"]:
+                    _success(f"Se pueden prometer {r['cantidad']} uds para {r['fecha']} (disponibles {r['disponible']}).")
+                elif r["fecha_posible"]:
+                    _warn(f"Para {r['fecha']} solo hay {r['disponible']} uds; estarían el {r['fecha_posible']}.")
+                else:
+                    _error(f"Para {r['fecha']} solo hay {r['disponible']} uds y con la fabricación prevista no se llega.")
+
+        st.markdown("**Comprobar un pedido entero (Excel con el formato del de pendientes)**")
+        up_atp = st.file_uploader("Arrastra o selecciona Excel", type=["xlsx", "xls"], key="atp_upl")
+        skip_atp = st.number_input("Filas a saltar (header)", min_value=0, step=1, value=26, key="atp_skip")
+        if st.button("Comprobar pedido", key="btn_atp_lote"):
+            if not up_atp:
+                _error("Sube un Excel primero.")
+            else:
+                df_atp = pd.read_excel(io.BytesIO(up_atp.read()), skiprows=int(skip_atp))
+                columnas = ["CodigoArticulo", "DesTalla", "UnidadesPendientes", "FechaEntrega"]
+                if not all(col in df_atp.columns for col in columnas):
+                    _error(f"Faltan columnas necesarias: {columnas}")
+                else:
+                    df_atp = df_atp.dropna(subset=["UnidadesPendientes"])
+                    lineas = [(f["CodigoArticulo"], f["DesTalla"], int(f["UnidadesPendientes"]),
+                               parse_fecha_excel(f["FechaEntrega"])) for _, f in df_atp.iterrows()]
+                    res = mgr.prevision.available_to_promise_bulk(mgr.inventory, lineas)
+                    st.caption(f"{sum(r['cumple'] for r in res)} de {len(res)} líneas se pueden prometer.")
+                    st.dataframe(_to_df(res), use_container_width=True)
+
+    with st.expander("✂️ Orden de corte sugerida"):
+        st.caption("Corte por talla para cubrir los días indicados según la curva de tallas de las salidas, "
+                   "sobre el stock estimado y con el mínimo y el lote del taller de cada modelo.")
+        col_c1, col_c2 = st.columns(2)
+        with col_c1:
+            corte_cob = st.number_input("Días de cobertura", min_value=1, step=1, value=90, key="corte_cob")
+        with col_c2:
+            corte_dias = st.number_input("Días de histórico de salidas", min_value=1, step=1, value=365, key="corte_dias")
+        if st.button("Calcular corte", key="btn_corte"):
+            st.session_state["corte_sugerido"] = mgr.prevision.suggest_cut_orders(
+                mgr.inventory, mgr.workshops.list_all(), int(corte_cob), int(corte_dias))
+        cortes = st.session_state.get("corte_sugerido")
+        if cortes is not None:
+            if not cortes:
+                _info("Con esa cobertura no hace falta cortar nada.")
+            else:
+                st.caption(f"{len({c['modelo'] for c in cortes})} modelos, {sum(c['cantidad'] for c in cortes)} uds.")
+                st.dataframe(_to_df(cortes), use_container_width=True)
+                corte_fecha = st.date_input("Fecha de las órdenes", value=datetime.now().date(), key="corte_fecha")
+                if st.button("Dar de alta como órdenes de fabricación", key="btn_corte_alta"):
+                    altas = mgr.prevision.register_orders_bulk(
+                        [(c["modelo"], c["talla"], c["cantidad"]) for c in cortes], corte_fecha.strftime("%Y-%m-%d"))
+                    st.session_state.pop("corte_sugerido", None)
+                    _success(f"{altas} órdenes de fabricación registradas.")
+
     st.divider()
     st.markdown("### Pedidos pendientes")
     # Listado simple
@@ -1096,6 +1292,8 @@ with tab_prevision:
                             _success("Pedido pendiente actualizado.")
                             set_last_update(mgr, f"Editar pendiente IDX:{idx_ed}")
                             st.rerun()
+                        except ConflictoVersion as e:
+                            _recargar_tras_conflicto(e)
                         except Exception as e:
                             _error(f"Error: {e}")
 
@@ -1125,6 +1323,8 @@ with tab_prevision:
                             _success("Pedido pendiente eliminado.")
                             set_last_update(mgr, f"Eliminar pendiente IDX:{idx_del}")
                             st.rerun()
+                        except ConflictoVersion as e:
+                            _recargar_tras_conflicto(e)
                         except Exception as e:
                             _error(f"Error: {e}")
 
@@ -1201,6 +1401,8 @@ with tab_prevision:
                         _success("Orden actualizada/eliminada.")
                         set_last_update(mgr, f"Editar/Eliminar orden fabricación IDX:{idx_edit} Nueva:{int(nueva)}")
                         st.rerun()
+                    except ConflictoVersion as e:
+                        _recargar_tras_conflicto(e)
                     except Exception as e:
                         _error(f"Error: {e}")
 
@@ -1217,10 +1419,13 @@ with tab_prevision:
 with tab_auditoria:
     st.subheader("Auditoría de stock vs histórico")
     solo_modelo = st.text_input("Filtrar por modelo (opcional)", value="").upper().strip() or None
+    completa = st.checkbox("Verificación completa (recalcula desde todo el histórico)", value=False,
+                           key="chk_audit_completa",
+                           help="Sin marcar solo se revisan las tallas con movimientos o ajustes desde la última auditoría.")
     if st.button("🔎 Auditar", key="btn_audit_go"):
         pass
 
-    cambios = mgr.inventory.audit_and_fix_stock(aplicar=False, solo_modelo=solo_modelo)
+    cambios = mgr.inventory.audit_and_fix_stock(aplicar=False, solo_modelo=solo_modelo, completa=completa)
     if not cambios:
         _success("Sin desajustes. Todo cuadra.")
     else:
@@ -1329,22 +1534,27 @@ with tab_catalogo:
 
     st.divider()
     st.subheader("Talleres")
-    t_rows = [{"NOMBRE": t.nombre, "CONTACTO": t.contacto or ""} for t in mgr.workshops.list_all()]
+    t_rows = [{"NOMBRE": t.nombre, "CONTACTO": t.contacto or "", "CORTE_MINIMO": t.minimo, "LOTE": t.lote}
+              for t in mgr.workshops.list_all()]
     st.dataframe(_to_df(t_rows), use_container_width=True)
 
     with st.form("form_add_taller"):
-        t1, t2 = st.columns([2,2])
+        t1, t2, t3, t4 = st.columns([2,2,1,1])
         with t1:
             t_nombre = st.text_input("Nombre taller").strip()
         with t2:
             t_contacto = st.text_input("Contacto (opcional)").strip()
+        with t3:
+            t_minimo = st.number_input("Corte mínimo (uds)", min_value=0, step=1, value=0)
+        with t4:
+            t_lote = st.number_input("Lote (uds)", min_value=1, step=1, value=1)
         sub_t = st.form_submit_button("Añadir taller")
         if sub_t:
             if not t_nombre:
                 _error("Nombre obligatorio.")
             else:
                 try:
-                    mgr.workshops.add(t_nombre, t_contacto or None)
+                    mgr.workshops.add(t_nombre, t_contacto or None, int(t_minimo), int(t_lote))
                     _success("Taller añadido.")
                 except Exception as e:
                     _error(f"Error: {e}")
@@ -1418,6 +1628,8 @@ with tab_imports:
                 df = pd.read_excel(ruta, skiprows=25)  # como en la versión CLI
                 _procesar_albaranes_df(df, modo_dup_fx, simular_alb_fx)
 
+    _mostrar_resultado_albaranes()
+
     st.divider()
 
     # ---------- PEDIDOS PENDIENTES ----------
@@ -1481,41 +1693,54 @@ with tab_backups:
 
     col_b1, col_b2 = st.columns(2)
     with col_b1:
+        st.caption("Solo se guarda lo que cambió desde la copia anterior (comprimido). Se conservan "
+                   "la última copia de cada una de las últimas 24 horas, 30 días y 12 meses.")
         if st.button("Crear backup ahora", key="btn_backup_create_main"):
             try:
-                fecha = _timestamp()
-                ruta_datos = os.path.join(back_dir, f"datos_almacen_{fecha}.json")
-                ruta_prevision = os.path.join(back_dir, f"prevision_{fecha}.json")
-                with open(mgr.ds_inventario.path, "r", encoding="utf-8") as src, open(ruta_datos, "w", encoding="utf-8") as dst:
-                    dst.write(src.read())
-                with open(mgr.ds_prevision.path, "r", encoding="utf-8") as src, open(ruta_prevision, "w", encoding="utf-8") as dst:
-                    dst.write(src.read())
-                _success(f"Backup creado:\n- {ruta_datos}\n- {ruta_prevision}")
+                r = mgr.crear_backup("manual")
+                _success(f"Backup creado ({r['id']}): {r['nuevos']} de {r['trozos']} trozos nuevos, "
+                         f"{r['bytes_nuevos']:,} bytes escritos.")
+                if r["podados"]:
+                    _info(f"{r['podados']} backups antiguos eliminados por la política de retención.")
             except Exception as e:
                 _error(f"Error creando backup: {e}")
 
     with col_b2:
-        archivos = [f for f in os.listdir(back_dir) if f.endswith(".json")]
+        puntos = mgr.backups().puntos()
+        opciones = {f"{p['fecha']} {p.get('etiqueta', '')} ({', '.join(p['ficheros'])})": p for p in puntos}
+        # Copias antiguas: ficheros JSON sueltos
+        archivos = [f for f in os.listdir(back_dir)
+                    if f.endswith(".json") and os.path.isfile(os.path.join(back_dir, f))]
         archivos.sort(reverse=True)
-        sel = st.selectbox("Selecciona backup a restaurar", ["(ninguno)"] + archivos)
+        opciones.update({f"{f} (copia antigua)": f for f in archivos})
+        sel = st.selectbox("Selecciona backup a restaurar", ["(ninguno)"] + list(opciones))
         if st.button("Restaurar seleccionado", key="btn_backup_restore_main"):
             if sel == "(ninguno)":
                 _warn("Elige un archivo de backup.")
+            elif isinstance(opciones[sel], dict):
+                try:
+                    restaurados = mgr.restaurar_backup(opciones[sel]["id"])
+                    _success(f"Restaurado backup del {opciones[sel]['fecha']}: {', '.join(restaurados)}")
+                    set_last_update(mgr, f"Restaurado backup: {opciones[sel]['fecha']}")
+                    st.rerun()
+                except Exception as e:
+                    _error(f"Error restaurando backup: {e}")
             else:
+                sel = opciones[sel]
                 try:
                     origen = os.path.join(back_dir, sel)
                     if "datos_almacen" in sel:
-                        destino = mgr.ds_inventario.path
+                        store = mgr.ds_inventario
                     elif "prevision" in sel:
-                        destino = mgr.ds_prevision.path
+                        store = mgr.ds_prevision
                     else:
                         _error("Nombre de backup no reconocido (debe incluir 'datos_almacen' o 'prevision').")
-                        destino = None
-                    if destino:
-                        with open(origen, "r", encoding="utf-8") as src, open(destino, "w", encoding="utf-8") as dst:
-                            dst.write(src.read())
+                        store = None
+                    if store is not None:
+                        destino = store.path
+                        store.import_snapshot(origen)
                         get_manager.clear()
-                        st.session_state["manager"] = get_manager(inv_path, prev_path, tall_path, cli_path)
+                        st.session_state["manager"] = get_manager(*manager_args)
                         _success(f"Restaurado '{sel}' en {destino}")
                         set_last_update(mgr, f"Restaurado backup: {sel}")
                         st.rerun()
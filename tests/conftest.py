@@ -0,0 +1,100 @@
+"""Utilidades comunes de los tests: datos de ejemplo y gestores sobre copias en tmp_path."""
+import contextlib
+import copy
+import io
+import json
+import os
+import random
+import shutil
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gestor_oop import GestorStock  # noqa: E402
+
+RUTAS = ("datos_almacen.json", "prevision.json", "talleres.json", "clientes.json")
+MODELOS = ("M001", "M002", "M003", "M004")
+TALLAS = ("S", "M", "L", "38", "40")
+
+
+def datos_ejemplo(semilla: int = 1):
+    """Inventario y previsión pequeños con stock, históricos, pendientes y órdenes abiertas."""
+    rng = random.Random(semilla)
+    almacen = {m: {t: rng.randint(0, 30) for t in TALLAS} for m in MODELOS}
+    entradas = [{"modelo": m, "talla": t, "cantidad": rng.randint(1, 10),
+                 "fecha": f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                 "taller": "", "proveedor": "", "observaciones": ""}
+                for m in MODELOS for t in TALLAS for _ in range(2)]
+    salidas = [{"modelo": m, "talla": t, "cantidad": rng.randint(1, 5),
+                "fecha": f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                "pedido": "", "albaran": f"A{rng.randint(1, 9)}", "cliente": ""}
+               for m in MODELOS for t in TALLAS]
+    pedidos = [{"modelo": rng.choice(MODELOS), "talla": rng.choice(TALLAS), "cantidad": rng.randint(1, 8),
+                "pedido": f"P{rng.randint(1, 4)}", "numero_pedido": "", "cliente": "C",
+                "fecha": f"2025-{rng.randint(1, 12):02d}-01"}
+               for _ in range(30)]
+    fabricacion = {m: [{"talla": rng.choice(TALLAS), "cantidad": rng.randint(1, 20),
+                        "fecha": f"2025-{rng.randint(1, 12):02d}-01"} for _ in range(4)]
+                   for m in MODELOS[:3]}
+    info = {m: {"descripcion": f"Modelo {m}", "color": "", "cliente": ""} for m in MODELOS}
+    inventario = {"almacen": almacen, "historial_entradas": entradas, "historial_salidas": salidas,
+                  "info_modelos": info}
+    prevision = {"ordenes": [], "pedidos": pedidos, "info_modelos": dict(info),
+                 "pedidos_fabricacion": fabricacion}
+    return inventario, prevision
+
+
+def escribir_datos(carpeta, inventario, prevision) -> None:
+    for ruta, datos in zip(RUTAS, (inventario, prevision, {}, {})):
+        with open(os.path.join(carpeta, ruta), "w", encoding="utf-8") as f:
+            json.dump(datos, f, ensure_ascii=False)
+
+
+def abrir_gestor(carpeta, **kwargs) -> GestorStock:
+    """GestorStock sobre los ficheros de `carpeta`, sin los mensajes de arranque."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return GestorStock(*(os.path.join(carpeta, r) for r in RUTAS), **kwargs)
+
+
+def copiar_datos(carpeta, nombre: str) -> str:
+    """Copia los ficheros de datos de `carpeta` a una subcarpeta independiente."""
+    destino = os.path.join(carpeta, nombre)
+    os.makedirs(destino)
+    for ruta in RUTAS:
+        shutil.copy(os.path.join(carpeta, ruta), destino)
+    return destino
+
+
+def estado(gs):
+    """Copia de las secciones de inventario y previsión que tocan los movimientos."""
+    inv, prev = gs.inventory, gs.prevision
+    return copy.deepcopy({
+        "almacen": inv.almacen,
+        "historial_entradas": list(inv.historial_entradas),
+        "historial_salidas": list(inv.historial_salidas),
+        "pedidos": prev.pedidos,
+        "pedidos_fabricacion": prev.pedidos_fabricacion,
+    })
+
+
+def movimientos(gs):
+    """Entradas (cubren órdenes), salidas (consumen pendientes) y altas/ediciones de previsión."""
+    p = gs.prevision.pedidos[0]
+    gs.inventory.register_entry("M001", "S", 7, fecha="2025-06-01")
+    gs.inventory.register_entry("M002", "38", 50, fecha="2025-06-02")
+    gs.inventory.register_exit(p["modelo"], p["talla"], p["cantidad"] + 1, "C", p["pedido"], "ALB1",
+                               fecha="2025-06-03")
+    gs.inventory.register_exit("M003", "L", 2, "C", "P9", "ALB2", fecha="2025-06-04")
+    gs.prevision.register_pending("M004", "M", 5, "P7", "C", fecha="2025-07-01")
+    gs.prevision.register_order("M004", "M", 12, fecha="2025-08-01")
+    gs.prevision.delete_pending(2)
+
+
+@pytest.fixture
+def carpeta(tmp_path, monkeypatch):
+    """tmp_path con los datos de ejemplo escritos (y como directorio actual, por las exportaciones)."""
+    monkeypatch.chdir(tmp_path)
+    escribir_datos(str(tmp_path), *datos_ejemplo())
+    return str(tmp_path)
@@ -0,0 +1,96 @@
+"""Disponible para prometer: lo precalculado por modelo se rehace tras cada cambio."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import MODELOS, TALLAS, abrir_gestor
+from gestor_oop import Prevision, norm_talla
+
+HOY = datetime.now()
+
+
+def _dia(desfase: int) -> str:
+    return (HOY + timedelta(days=desfase)).strftime("%Y-%m-%d")
+
+
+FECHAS = (None, _dia(-5), _dia(10), _dia(45), _dia(200))
+
+
+def _consultas(gs):
+    inv, prev = gs.inventory, gs.prevision
+    return [prev.available_to_promise(inv, m, t, c, f)
+            for m in MODELOS + ("N002",) for t in TALLAS for f in FECHAS for c in (1, 8, 40)]
+
+
+def _a_mano(gs, modelo, talla, fecha):
+    """Stock + lo mínimo que llega a acumular fabricación - pendientes desde `fecha` en adelante."""
+    prev = gs.prevision
+    eventos = [(Prevision._dia(it.get("fecha")), it["cantidad"])
+               for it in prev.pedidos_fabricacion.get(modelo, []) if norm_talla(it["talla"]) == talla]
+    eventos += [(Prevision._dia(p.get("fecha")), -p["cantidad"]) for p in prev.pedidos
+                if Prevision._clave_de(p)[:2] == (modelo, talla)]
+    corte = max(fecha or _dia(0), _dia(0))
+    acumulado = sum(d for dia, d in eventos if dia <= corte)
+    minimo = acumulado
+    for dia, delta in sorted(e for e in eventos if e[0] > corte):
+        acumulado += delta
+        minimo = min(minimo, acumulado)
+    return int(gs.inventory.almacen.get(modelo, {}).get(talla, 0)) + minimo
+
+
+@pytest.fixture
+def gs(carpeta):
+    gs = abrir_gestor(carpeta)
+    prev = gs.prevision
+    # Fabricación y pendientes repartidos en el futuro para que la fecha importe
+    for i, (m, t) in enumerate((m, t) for m in MODELOS for t in TALLAS[:3]):
+        prev.register_order(m, t, 10 + i, fecha=_dia(20 + 7 * i))
+        prev.register_pending(m, t, 6 + i % 5, f"F{i}", "C", fecha=_dia(5 + 11 * i))
+    _consultas(gs)      # deja precalculados todos los modelos
+    return gs
+
+
+def test_disponible_coincide_con_acumular_a_mano(gs):
+    for r in _consultas(gs):
+        disponible = _a_mano(gs, r["modelo"], r["talla"], r["fecha"])
+        assert r["disponible"] == max(disponible, 0) and r["cumple"] == (disponible >= r["cantidad"]), r
+
+
+CAMBIOS = {
+    "alta_pendiente": lambda g: g.prevision.register_pending("M004", "S", 9, "N1", "C", fecha=_dia(30)),
+    "editar_pendiente": lambda g: g.prevision.edit_pending(len(g.prevision.pedidos), modelo="M003", talla="L"),
+    "borrar_pendiente": lambda g: g.prevision.delete_pending(len(g.prevision.pedidos)),
+    "alta_orden": lambda g: g.prevision.register_order("M002", "M", 25, fecha=_dia(60)),
+    "entrada_cubre_orden": lambda g: g.inventory.register_entry("M001", "S", 30, fecha=_dia(0)),
+    "salida_consume_pendiente": lambda g: g.inventory.register_exit("M001", "S", 3, "C", "F0", "A9",
+                                                                   fecha=_dia(0)),
+    "editar_orden": lambda g: g.prevision.edit_fabrication_qty(1, 0),
+    "borrar_orden": lambda g: g.prevision.delete_fabrication(2),
+    "renombrar": lambda g: (g.inventory.rename_model("M002", "N002"), g.prevision.rename_model("M002", "N002")),
+}
+
+
+@pytest.mark.parametrize("cambio", sorted(CAMBIOS))
+def test_tras_cada_cambio_responde_como_recien_abierto(gs, carpeta, cambio):
+    CAMBIOS[cambio](gs)
+    assert _consultas(gs) == _consultas(abrir_gestor(carpeta))
+
+
+def test_pedido_entero_reserva_lo_ya_prometido(gs):
+    inv, prev = gs.inventory, gs.prevision
+    libre = next(r for r in _consultas(gs) if r["disponible"] > 2 and r["fecha"] == _dia(0))
+    m, t, n = libre["modelo"], libre["talla"], libre["disponible"]
+    lineas = [(m, t, n - 1, _dia(1)), (m.lower(), t, 2, _dia(1)), ("M002", "M", 1, None)]
+    r = prev.available_to_promise_bulk(inv, lineas)
+    assert r[0]["cumple"] and not r[1]["cumple"]
+    assert r[1]["disponible"] == prev.available_to_promise(inv, m, t, 2, _dia(1))["disponible"] - (n - 1)
+    if m != "M002":
+        assert r[2] == prev.available_to_promise(inv, "M002", "M", 1)
+
+
+def test_cambios_de_otro_proceso_se_ven_tras_refrescar(gs, carpeta):
+    otro = abrir_gestor(carpeta)
+    otro.prevision.register_pending("M003", "S", 50, "X1", "C", fecha=_dia(3))
+    gs.refresh()
+    assert _consultas(gs) == _consultas(otro)
+    assert not gs.prevision.available_to_promise(gs.inventory, "M003", "S", 1, _dia(3))["cumple"]
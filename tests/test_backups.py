@@ -0,0 +1,81 @@
+"""Backups deduplicados: solo se escribe lo que cambió, se restauran y se podan."""
+import os
+from datetime import datetime, timedelta
+
+from conftest import abrir_gestor, estado, movimientos
+from gestor_oop import BackupStore, leer_json, serializar_json
+
+
+def test_copia_sin_cambios_no_escribe_trozos(carpeta):
+    gs = abrir_gestor(carpeta)
+    primera = gs.crear_backup("a")
+    assert primera["nuevos"] > 0
+    segunda = gs.crear_backup("b")
+    assert segunda["nuevos"] == 0 and segunda["bytes_nuevos"] == 0
+    assert segunda["trozos"] == primera["trozos"]
+    gs.inventory.register_entry("M001", "S", 3, fecha="2025-06-01")
+    tercera = gs.crear_backup("c")
+    assert 0 < tercera["nuevos"] < primera["nuevos"]
+
+
+def test_restaurar_un_punto(carpeta):
+    gs = abrir_gestor(carpeta)
+    gs.workshops.add("Taller A", minimo=10, lote=2)
+    antes = estado(gs)
+    punto = gs.crear_backup()["id"]
+    movimientos(gs)
+    gs.workshops.add("Taller B")
+    assert estado(gs) != antes
+    assert sorted(gs.restaurar_backup(punto)) == ["clientes", "inventario", "prevision", "talleres"]
+    assert estado(gs) == antes
+    assert [t.nombre for t in gs.workshops.list_all()] == ["Taller A"]
+    assert estado(abrir_gestor(carpeta)) == antes
+
+
+def _punto_falso(backups, plantilla, fecha):
+    """Copia el manifiesto `plantilla` con otra fecha (y id acorde)."""
+    manifiesto = dict(plantilla, id=fecha.strftime("%Y%m%d-%H%M%S-%f"), fecha=fecha.isoformat(timespec="seconds"))
+    with open(os.path.join(backups.dir_puntos, manifiesto["id"] + ".json"), "wb") as f:
+        f.write(serializar_json(manifiesto, "compacto"))
+    return manifiesto["id"]
+
+
+def test_retencion_por_horas_dias_y_meses(carpeta):
+    gs = abrir_gestor(carpeta)
+    backups = BackupStore(os.path.join(carpeta, "backups"), {"horas": 2, "dias": 2, "meses": 2})
+    real = backups.crear(gs._stores())
+    plantilla = leer_json(os.path.join(backups.dir_puntos, real["id"] + ".json"))
+    os.remove(os.path.join(backups.dir_puntos, real["id"] + ".json"))
+    base = datetime(2025, 6, 15, 12, 30)
+    fechas = [base - timedelta(minutes=m) for m in (0, 10, 70)]            # dos horas
+    fechas += [base - timedelta(days=d) for d in (1, 2, 3)]                # días anteriores
+    fechas += [base - timedelta(days=d) for d in (40, 45, 80)]             # meses anteriores
+    ids = {f: _punto_falso(backups, plantilla, f) for f in fechas}
+    assert backups.podar() == 5
+    conservados = {p["id"] for p in backups.puntos()}
+    # Horas: 12:30 y 11:20; días: el 15 y el 14; meses: junio y mayo (el más reciente de mayo)
+    assert conservados == {ids[base], ids[fechas[2]], ids[fechas[3]], ids[fechas[6]]}
+    # Los trozos siguen ahí para los puntos conservados
+    for punto in conservados:
+        assert backups.leer(punto, "inventario")["almacen"] == gs.inventory.almacen
+
+
+def test_podar_borra_los_trozos_huerfanos(carpeta):
+    gs = abrir_gestor(carpeta)
+    backups = BackupStore(os.path.join(carpeta, "backups"), {"horas": 1, "dias": 0, "meses": 0})
+    viejo = backups.crear(gs._stores())
+    gs.inventory.register_entry("M002", "L", 9, fecha="2025-06-01")
+    # Que el primer punto quede en otra hora para que la retención lo borre
+    ruta = os.path.join(backups.dir_puntos, viejo["id"] + ".json")
+    manifiesto = leer_json(ruta)
+    antiguo = datetime.fromisoformat(manifiesto["fecha"]) - timedelta(hours=3)
+    nuevo_id = _punto_falso(backups, manifiesto, antiguo)
+    os.remove(ruta)
+    objetos = lambda: {n for _, _, fs in os.walk(backups.dir_objetos) for n in fs}
+    antes = objetos()
+    resumen = backups.crear(gs._stores())
+    assert resumen["podados"] == 1
+    assert nuevo_id not in {p["id"] for p in backups.puntos()}
+    # Los trozos que solo usaba el punto borrado desaparecen
+    assert antes - objetos()
+    assert backups.leer(resumen["id"], "inventario")["almacen"] == gs.inventory.almacen
@@ -0,0 +1,106 @@
+"""Las APIs en bloque dejan el mismo estado que las llamadas una a una."""
+import random
+
+import pytest
+
+from conftest import MODELOS, TALLAS, abrir_gestor, copiar_datos, estado
+
+
+def _por_fabricar(gs) -> int:
+    return sum(it["cantidad"] for its in gs.prevision.pedidos_fabricacion.values() for it in its)
+
+
+def _lineas_salida(gs, rng, n):
+    lineas = []
+    for _ in range(n):
+        if rng.random() < 0.6:
+            # Contra un pendiente existente (a veces más de lo pendiente)
+            p = rng.choice(gs.prevision.pedidos)
+            modelo, talla, pedido = p["modelo"], p["talla"], p["pedido"]
+        else:
+            modelo, talla, pedido = rng.choice(MODELOS), rng.choice(TALLAS), f"P{rng.randint(1, 6)}"
+        # Algunas devoluciones (cantidad 0 o negativa) y albaranes sin fecha
+        cantidad = rng.randint(1, 12) if rng.random() < 0.85 else rng.randint(-4, 0)
+        lineas.append({"modelo": modelo, "talla": talla, "cantidad": cantidad, "cliente": "C",
+                       "pedido": pedido, "albaran": f"B{rng.randint(1, 3)}",
+                       "fecha": rng.choice(("2025-09-01", "2025-09-01", ""))})
+    return lineas
+
+
+@pytest.mark.parametrize("semilla", range(5))
+def test_salidas_en_bloque_igual_que_una_a_una(carpeta, semilla):
+    rng = random.Random(semilla)
+    otra = copiar_datos(carpeta, "bloque")
+    en_bloque, una_a_una = abrir_gestor(otra), abrir_gestor(carpeta)
+    lineas = _lineas_salida(en_bloque, rng, 25)
+    resultados = en_bloque.inventory.register_exits_bulk(lineas)
+    for l in lineas:
+        una_a_una.inventory.register_exit(l["modelo"], l["talla"], l["cantidad"], l["cliente"],
+                                          l["pedido"], l["albaran"], fecha=l["fecha"])
+    assert estado(en_bloque) == estado(una_a_una)
+    assert [r["aplicado"] for r in resultados] == [l["cantidad"] for l in lineas]
+    # Y lo persistido es lo mismo
+    assert estado(abrir_gestor(otra)) == estado(una_a_una)
+
+
+@pytest.mark.parametrize("semilla", range(5))
+def test_entradas_en_bloque_igual_que_una_a_una(carpeta, semilla):
+    rng = random.Random(semilla)
+    otra = copiar_datos(carpeta, "bloque")
+    en_bloque, una_a_una = abrir_gestor(otra), abrir_gestor(carpeta)
+    lineas = [{"modelo": rng.choice(MODELOS), "talla": rng.choice(TALLAS), "cantidad": rng.randint(1, 25),
+               "taller": "T", "fecha": "2025-09-02"} for _ in range(25)]
+    por_fabricar = _por_fabricar(en_bloque)
+    resultados = en_bloque.inventory.register_entries_bulk(lineas)
+    for l in lineas:
+        una_a_una.inventory.register_entry(l["modelo"], l["talla"], l["cantidad"], l["taller"], l["fecha"])
+    assert estado(en_bloque) == estado(una_a_una)
+    assert sum(r["cubierto"] for r in resultados) == por_fabricar - _por_fabricar(en_bloque)
+    assert estado(abrir_gestor(otra)) == estado(una_a_una)
+
+
+def test_salidas_en_bloque_en_una_transaccion(carpeta):
+    rng = random.Random(7)
+    otra = copiar_datos(carpeta, "bloque")
+    en_bloque, una_a_una = abrir_gestor(otra), abrir_gestor(carpeta)
+    lineas = _lineas_salida(en_bloque, rng, 40)
+    with en_bloque.transaction():
+        en_bloque.inventory.register_exits_bulk(lineas[:20])
+        en_bloque.inventory.register_exits_bulk(lineas[20:])
+    with una_a_una.transaction():
+        for l in lineas:
+            una_a_una.inventory.register_exit(l["modelo"], l["talla"], l["cantidad"], l["cliente"],
+                                              l["pedido"], l["albaran"], fecha=l["fecha"])
+    assert estado(en_bloque) == estado(una_a_una)
+
+
+def test_salidas_en_bloque_avisan_por_linea(carpeta):
+    gs = abrir_gestor(carpeta)
+    disponible = gs.inventory.almacen["M001"]["S"]
+    resultados = gs.inventory.register_exits_bulk([
+        {"modelo": "M001", "talla": "S", "cantidad": disponible + 5, "pedido": "P1", "albaran": "B1"},
+        {"modelo": "", "talla": "S", "cantidad": 2, "pedido": "P1", "albaran": "B1"},
+        {"modelo": "M002", "talla": "M", "cantidad": 1, "pedido": "NOEXISTE", "albaran": "B1"},
+    ])
+    assert [len(r["avisos"]) for r in resultados] == [1, 1, 0]
+    assert "Stock insuficiente" in resultados[0]["avisos"][0]
+    assert resultados[0]["aplicado"] == disponible + 5 and resultados[1]["aplicado"] == 0
+    assert resultados[2]["servidos"] == 0
+    assert gs.inventory.almacen["M001"]["S"] == -5
+
+
+def test_salidas_en_bloque_registran_devoluciones_y_respetan_la_fecha(carpeta):
+    gs = abrir_gestor(carpeta)
+    p = gs.prevision.pedidos[0]
+    pendiente = sum(x["cantidad"] for x in gs.prevision.pendings_for(p["modelo"], p["talla"], p["pedido"]))
+    stock = gs.inventory.almacen[p["modelo"]][p["talla"]]
+    resultados = gs.inventory.register_exits_bulk([
+        {"modelo": p["modelo"], "talla": p["talla"], "cantidad": -2, "pedido": p["pedido"], "fecha": ""},
+        {"modelo": p["modelo"], "talla": p["talla"], "cantidad": 0, "pedido": p["pedido"], "fecha": "2025-02-03"},
+    ])
+    assert [r["registrada"] for r in resultados] == [True, True]
+    assert [r["aplicado"] for r in resultados] == [-2, 0] and all(r["avisos"] for r in resultados)
+    assert gs.inventory.almacen[p["modelo"]][p["talla"]] == stock + 2
+    assert [s["fecha"] for s in list(gs.inventory.historial_salidas)[-2:]] == ["", "2025-02-03"]
+    # Una devolución no toca los pendientes
+    assert sum(x["cantidad"] for x in gs.prevision.pendings_for(p["modelo"], p["talla"], p["pedido"])) == pendiente
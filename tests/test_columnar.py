@@ -0,0 +1,102 @@
+"""Históricos por columnas: se comportan como la lista de dicts que sustituyen."""
+import json
+import random
+
+import pytest
+
+import gestor_oop
+from conftest import TALLAS, abrir_gestor, estado, movimientos
+from gestor_oop import HistorialColumnar, leer_json
+
+
+def _filas(rng, n=300):
+    """Movimientos con las rarezas de los ficheros reales: claves de más o de menos, tipos mezclados."""
+    filas = []
+    for _ in range(n):
+        fila = {"modelo": rng.choice(("M001", "M002", "m003", "")),
+                "talla": rng.choice(TALLAS + (36, 36.0, "36", None)),
+                "cantidad": rng.choice((rng.randint(-5, 20), rng.randint(1, 9), 2.5, "3", None)),
+                "fecha": rng.choice(("2025-03-01", "2025-11-30", "01/02/2025", "", None, 20250301))}
+        if rng.random() < 0.5:
+            fila["cliente"] = rng.choice(("C1", "C2", ""))
+        if rng.random() < 0.3:
+            fila["pedido"] = rng.choice(("P1", 1234, 1234.0, "1234"))
+        if rng.random() < 0.1:
+            fila["albaran"] = rng.choice(("A1", ["A2", "A3"]))
+        if rng.random() < 0.1:
+            fila["nota"] = {"x": rng.randint(0, 3)}
+        if rng.random() < 0.2:
+            fila = dict(reversed(list(fila.items())))
+        filas.append(fila)
+    return filas
+
+
+def _sumar(filas, campos, ausente=None):
+    out = {}
+    for f in filas:
+        k = tuple(f.get(c, ausente) for c in campos)
+        out[k] = out.get(k, 0) + int(f.get("cantidad") or 0)
+    return out
+
+
+@pytest.mark.parametrize("semilla", range(5))
+def test_ida_y_vuelta_conserva_valores_y_orden_de_claves(semilla):
+    filas = _filas(random.Random(semilla))
+    hist = HistorialColumnar(filas)
+    assert len(hist) == len(filas)
+    assert json.dumps(list(hist)) == json.dumps(filas)
+    assert [hist[i] for i in range(-3, 3)] == filas[-3:] + filas[:3]
+    assert hist[10:20:3] == filas[10:20:3]
+    assert hist == filas and hist == HistorialColumnar(filas)
+
+
+def test_mutaciones_como_en_una_lista():
+    rng = random.Random(7)
+    filas = _filas(rng, 60)
+    hist = HistorialColumnar(filas)
+    hist.append({"modelo": "M009", "talla": "L", "cantidad": 4, "fecha": "2025-06-01"})
+    filas.append({"modelo": "M009", "talla": "L", "cantidad": 4, "fecha": "2025-06-01"})
+    hist[5] = {"fecha": "2025-01-02", "modelo": "M010"}
+    filas[5] = {"fecha": "2025-01-02", "modelo": "M010"}
+    del hist[3]
+    del filas[3]
+    assert hist.pop(0) == filas.pop(0)
+    # Una fila entregada escribe en el historial al cambiarla
+    fila = hist[10]
+    fila["modelo"] = "N001"
+    del fila["fecha"]
+    filas[10]["modelo"] = "N001"
+    filas[10].pop("fecha", None)
+    assert json.dumps(list(hist)) == json.dumps(filas)
+    with pytest.raises(IndexError):
+        hist[len(filas)]
+
+
+@pytest.mark.parametrize("con_numpy", [True, False])
+def test_agregaciones_coinciden_con_recorrer_las_filas(monkeypatch, con_numpy):
+    if con_numpy and gestor_oop.np is None:
+        pytest.skip("numpy no está instalado")
+    if not con_numpy:
+        monkeypatch.setattr(gestor_oop, "np", None)
+    filas = _filas(random.Random(3), 500)
+    hist = HistorialColumnar(filas)
+    for campos in (("modelo",), ("modelo", "talla"), ("talla", "cliente", "pedido")):
+        assert hist.sumar_por(campos, ausente="-") == _sumar(filas, campos, "-")
+    es_m = lambda v: isinstance(v, str) and v.startswith("M")
+    assert hist.indices("modelo", es_m) == [i for i, f in enumerate(filas) if es_m(f.get("modelo"))]
+    assert hist.indices("pedido", lambda v: v == 1234) == [
+        i for i, f in enumerate(filas) if "pedido" in f and f["pedido"] == 1234]
+    pares = hist.posiciones_por("cliente")
+    assert sorted(i for _, pos in pares for i in pos) == [i for i, f in enumerate(filas) if "cliente" in f]
+    for valor, pos in pares:
+        assert all(filas[i]["cliente"] == valor for i in pos)
+
+
+def test_gestor_columnar_da_el_mismo_estado_y_fichero(carpeta):
+    normal, columnar = abrir_gestor(carpeta), abrir_gestor(carpeta, historial_columnar=True)
+    assert isinstance(columnar.inventory.historial_salidas, HistorialColumnar)
+    assert estado(columnar) == estado(normal)
+    movimientos(columnar)
+    en_disco = leer_json(columnar.ds_inventario.path)
+    assert en_disco["historial_salidas"] == list(columnar.inventory.historial_salidas)
+    assert estado(abrir_gestor(carpeta)) == estado(columnar)
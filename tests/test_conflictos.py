@@ -0,0 +1,88 @@
+"""Dos instancias sobre los mismos ficheros: fusión, rechazo y movimientos atómicos."""
+import pytest
+
+from conftest import abrir_gestor, estado
+from gestor_oop import ConflictoVersion, leer_json
+
+
+@pytest.mark.parametrize("journal", [False, True])
+def test_entradas_concurrentes_sobre_la_misma_orden_se_fusionan(carpeta, journal):
+    a, b = abrir_gestor(carpeta, journal=journal), abrir_gestor(carpeta, journal=journal)
+    a.prevision.register_order("M004", "XL", 150, fecha="2025-01-01")
+    b.refresh()
+    stock = a.inventory.almacen["M004"].get("XL", 0)
+    entradas = len(a.inventory.historial_entradas)
+    a.inventory.register_entry("M004", "XL", 1, fecha="2025-01-02")
+    b.inventory.register_entry("M004", "XL", 2, fecha="2025-01-02")
+
+    disco = abrir_gestor(carpeta)
+    assert len(disco.inventory.historial_entradas) == entradas + 2
+    assert disco.inventory.almacen["M004"]["XL"] == stock + 3
+    # Las dos cubren la misma orden: la cantidad restante descuenta ambas
+    assert [o["cantidad"] for o in disco.prevision.pedidos_fabricacion["M004"]] == [147]
+    assert estado(b) == estado(disco)
+    # Nada queda pendiente: las siguientes operaciones y el refresco funcionan
+    assert not b.ds_prevision._pending_ops
+    a.refresh()
+    assert estado(a) == estado(disco)
+    b.prevision.register_pending("M004", "S", 1, "P8", "C")
+    a.inventory.register_exit("M004", "S", 1, "C", "P8", "A1")
+    assert estado(abrir_gestor(carpeta)) == estado(a)
+
+
+def test_salidas_concurrentes_sobre_el_mismo_pendiente_se_fusionan(carpeta):
+    a, b = abrir_gestor(carpeta), abrir_gestor(carpeta)
+    a.prevision.register_pending("M004", "40", 10, "P9", "C", fecha="2025-01-01")
+    b.refresh()
+    a.inventory.register_exit("M004", "40", 3, "C", "P9", "A1")
+    b.inventory.register_exit("M004", "40", 4, "C", "P9", "A2")
+    disco = abrir_gestor(carpeta)
+    assert [p["cantidad"] for p in disco.prevision.pendings_for("M004", "40", "P9")] == [3]
+    assert estado(b) == estado(disco)
+
+
+def test_cambio_que_no_encaja_se_descarta_y_se_informa(carpeta):
+    a, b = abrir_gestor(carpeta), abrir_gestor(carpeta)
+    a.prevision.edit_pending(1, cantidad=99)
+    with pytest.raises(ConflictoVersion) as e:
+        b.prevision.edit_pending(1, cantidad=42)
+    assert [r["path"] for r in e.value.rechazadas] == [["pedidos", 0]]
+    assert "no se ha aplicado: pendiente" in str(e.value) and "repite" not in str(e.value)
+    # Lo de B se ha descartado (no se queda pendiente) y se ve lo del disco
+    assert not b.ds_prevision._pending_ops
+    assert b.prevision.pedidos[0]["cantidad"] == 99
+    assert b.refresh() == {}
+    b.prevision.register_pending("M004", "S", 1, "P8", "C")
+    assert leer_json(b.ds_prevision.path)["pedidos"] == b.prevision.pedidos
+
+
+def test_movimiento_rechazado_no_escribe_ninguna_de_las_dos(carpeta):
+    a = abrir_gestor(carpeta)
+    b = abrir_gestor(carpeta, conflictos="rechazar")
+    a.inventory.register_entry("M001", "S", 1, fecha="2025-01-01")
+    en_disco = estado(abrir_gestor(carpeta))
+    with pytest.raises(ConflictoVersion, match="No se ha aplicado la entrada M001 TS \\+5"):
+        b.inventory.register_entry("M001", "S", 5, fecha="2025-01-01")
+    assert estado(abrir_gestor(carpeta)) == en_disco
+    # B se queda con lo del disco, sin nada pendiente, y puede seguir trabajando
+    assert estado(b) == en_disco
+    assert not b.ds_inventario._pending_ops and not b.ds_prevision._pending_ops
+    b.inventory.register_entry("M001", "S", 5, fecha="2025-01-01")
+    assert estado(abrir_gestor(carpeta)) == estado(b)
+
+
+def test_entrada_sobre_una_orden_que_otro_completo_no_se_aplica(carpeta):
+    a, b = abrir_gestor(carpeta), abrir_gestor(carpeta)
+    a.prevision.register_order("M004", "XL", 5, fecha="2025-01-01")
+    a.prevision.register_order("M004", "XL", 8, fecha="2025-02-01")
+    b.refresh()
+    a.inventory.register_entry("M004", "XL", 5, fecha="2025-03-01")
+    en_disco = estado(abrir_gestor(carpeta))
+    # B cubriría la orden que ya no existe: el movimiento entero se descarta
+    with pytest.raises(ConflictoVersion) as e:
+        b.inventory.register_entry("M004", "XL", 2, fecha="2025-03-01")
+    assert e.value.rechazadas and "No se ha aplicado la entrada M004 TXL +2" in str(e.value)
+    assert estado(abrir_gestor(carpeta)) == en_disco == estado(b)
+    # Repetida sobre el estado real cubre la siguiente orden
+    b.inventory.register_entry("M004", "XL", 2, fecha="2025-03-01")
+    assert [o["cantidad"] for o in b.prevision.pedidos_fabricacion["M004"]] == [6]
@@ -0,0 +1,72 @@
+"""Orden de corte sugerida: los motores "python" y "numpy" dan lo mismo."""
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import MODELOS, TALLAS, abrir_gestor, escribir_datos
+from gestor_oop import Workshop, np
+
+
+def _hace(dias: int) -> str:
+    return (datetime.now() - timedelta(days=dias)).strftime("%Y-%m-%d")
+
+
+def _estado_aleatorio(rng):
+    """Stock, salidas (con alguna devolución) y entradas con taller dentro del último año."""
+    talleres = [Workshop(nombre=f"T{i}", minimo=rng.choice((0, 0, 30, 120)), lote=rng.choice((1, 1, 6, 12)))
+                for i in range(3)]
+    modelos = rng.sample(MODELOS, rng.randint(1, len(MODELOS)))
+    almacen = {m: {t: rng.randint(-10, 15) for t in rng.sample(TALLAS, rng.randint(1, len(TALLAS)))}
+               for m in modelos}
+    salidas = [{"modelo": rng.choice(modelos), "talla": rng.choice(TALLAS),
+                "cantidad": rng.randint(1, 8) if rng.random() < 0.85 else -rng.randint(1, 8),
+                "fecha": _hace(rng.randint(0, 500)), "pedido": "", "albaran": "", "cliente": ""}
+               for _ in range(rng.randint(0, 80))]
+    entradas = [{"modelo": m, "talla": rng.choice(TALLAS), "cantidad": 5, "fecha": _hace(rng.randint(0, 400)),
+                 "taller": rng.choice([t.nombre for t in talleres] + [""]), "proveedor": "", "observaciones": ""}
+                for m in modelos]
+    inventario = {"almacen": almacen, "historial_entradas": entradas, "historial_salidas": salidas,
+                  "info_modelos": {}}
+    prevision = {"ordenes": [], "pedidos": [], "info_modelos": {}, "pedidos_fabricacion": {}}
+    return inventario, prevision, talleres
+
+
+def test_devoluciones_que_anulan_la_curva_no_dividen_por_cero(carpeta):
+    inventario = {"almacen": {"M001": {"S": -5, "M": -2}},
+                  "historial_entradas": [{"modelo": "M001", "talla": "S", "cantidad": 1, "fecha": _hace(20),
+                                          "taller": "T1"}],
+                  "historial_salidas": [{"modelo": "M001", "talla": "S", "cantidad": 3, "fecha": _hace(10)},
+                                        {"modelo": "M001", "talla": "M", "cantidad": -3, "fecha": _hace(5)}],
+                  "info_modelos": {}}
+    escribir_datos(carpeta, inventario, {"pedidos": [], "pedidos_fabricacion": {}})
+    gs = abrir_gestor(carpeta)
+    inv, prev = gs.inventory, gs.prevision
+    talleres = [Workshop(nombre="T1", minimo=20, lote=4)]
+    cortes = prev.suggest_cut_orders(inv, talleres, motor="python")
+    # La devolución de M no cuenta en la curva: lo que añade el mínimo va a S
+    assert {c["talla"]: c["cantidad"] for c in cortes} == {"S": 18, "M": 2}
+    if np is not None:
+        assert prev.suggest_cut_orders(inv, talleres, motor="numpy") == cortes
+
+
+@pytest.mark.skipif(np is None, reason="numpy no está instalado")
+@pytest.mark.parametrize("semilla", range(40))
+def test_motores_de_corte_dan_lo_mismo(tmp_path, monkeypatch, semilla):
+    monkeypatch.chdir(tmp_path)
+    rng = random.Random(semilla)
+    inventario, prevision, talleres = _estado_aleatorio(rng)
+    escribir_datos(str(tmp_path), inventario, prevision)
+    gs = abrir_gestor(str(tmp_path))
+    inv, prev = gs.inventory, gs.prevision
+    por_nombre = {t.nombre: t for t in talleres}
+    for cobertura, dias in ((30, 90), (90, 365), (180, 365)):
+        cortes = prev.suggest_cut_orders(inv, talleres, cobertura, dias, motor="numpy")
+        assert prev.suggest_cut_orders(inv, talleres, cobertura, dias, motor="python") == cortes
+        por_modelo = {}
+        for c in cortes:
+            assert c["cantidad"] >= c["objetivo"] - c["stock_estimado"], c
+            por_modelo.setdefault((c["modelo"], c["taller"]), []).append(c["cantidad"])
+        for (modelo, taller), cantidades in por_modelo.items():
+            t = por_nombre.get(taller, Workshop(nombre=""))
+            assert sum(cantidades) >= t.minimo and sum(cantidades) % t.lote == 0, modelo
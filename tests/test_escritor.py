@@ -0,0 +1,69 @@
+"""Escritura en segundo plano: agrupación de instantáneas y volcado con flush()."""
+import time
+
+from conftest import abrir_gestor
+from gestor_oop import flush_pending_writes, leer_json
+
+
+def test_rafaga_de_cambios_se_agrupa_en_pocas_escrituras(carpeta):
+    gs = abrir_gestor(carpeta, async_write=True)
+    ds = gs.ds_prevision
+    assert ds.flush(5.0)
+    antes = ds.write_stats()["solicitadas"]
+    for i in range(10):
+        gs.prevision.register_pending("M001", "S", i + 1, f"P{i}", "C", fecha="2025-03-01")
+    assert ds.flush(5.0)
+    stats = ds.write_stats()
+    assert stats["solicitadas"] == antes + 10 and stats["agrupadas"] > 0
+    assert stats["escritas"] + stats["agrupadas"] == stats["solicitadas"]
+    assert not stats["pendiente"] and stats["errores"] == 0
+    assert leer_json(ds.path)["pedidos"] == gs.prevision.pedidos
+
+
+def test_otra_store_del_mismo_fichero_ve_lo_pendiente(carpeta):
+    gs = abrir_gestor(carpeta, async_write=True)
+    gs.prevision.register_pending("M002", "M", 4, "P7", "C", fecha="2025-03-01")
+    # Abrir el mismo fichero vuelca antes lo que el escritor tenga pendiente
+    assert abrir_gestor(carpeta).prevision.pedidos == gs.prevision.pedidos
+
+
+def test_flush_pending_writes_vuelca_todos_los_escritores(carpeta):
+    gs = abrir_gestor(carpeta, async_write=True)
+    gs.prevision.register_pending("M003", "L", 2, "P5", "C", fecha="2025-03-01")
+    gs.inventory.register_entry("M003", "L", 6, fecha="2025-03-02")
+    assert flush_pending_writes(5.0)
+    assert not gs.ds_inventario.write_stats()["pendiente"]
+    assert not gs.ds_prevision.write_stats()["pendiente"]
+    assert leer_json(gs.ds_inventario.path)["almacen"]["M003"] == gs.inventory.almacen["M003"]
+    assert leer_json(gs.ds_prevision.path)["pedidos"] == gs.prevision.pedidos
+
+
+def test_movimientos_no_esperan_al_escritor(carpeta, monkeypatch):
+    gs = abrir_gestor(carpeta, async_write=True)
+    assert gs.flush(5.0)
+    lentas = []
+    for ds in (gs.ds_inventario, gs.ds_prevision):
+        escribir = ds._escribir_instantanea
+
+        def lenta(raw, escribir=escribir):
+            lentas.append(1)
+            time.sleep(0.3)
+            escribir(raw)
+        monkeypatch.setattr(ds, "_escribir_instantanea", lenta)
+    inicio = time.monotonic()
+    for i in range(6):
+        gs.inventory.register_entry("M001", "S", i + 1, fecha="2025-03-01")
+    assert time.monotonic() - inicio < 0.3
+    assert gs.flush(10.0)
+    assert gs.ds_inventario.write_stats()["agrupadas"] > 0 and len(lentas) < 12
+    assert leer_json(gs.ds_inventario.path)["almacen"] == gs.inventory.almacen
+
+
+def test_movimiento_se_fusiona_con_lo_que_el_escritor_no_ha_escrito(carpeta):
+    a, b = abrir_gestor(carpeta, async_write=True), abrir_gestor(carpeta)
+    stock = a.inventory.almacen["M002"]["M"]
+    a.inventory.register_entry("M002", "M", 1, fecha="2025-03-01")
+    b.inventory.register_entry("M002", "M", 2, fecha="2025-03-01")
+    a.inventory.register_entry("M002", "M", 4, fecha="2025-03-01")
+    assert a.flush(5.0)
+    assert leer_json(a.ds_inventario.path)["almacen"]["M002"]["M"] == stock + 7
@@ -0,0 +1,98 @@
+"""Los motores de calc_estimated_stock frente al recorrido original por modelo/talla."""
+import random
+from collections import Counter
+
+import pytest
+
+from conftest import abrir_gestor, escribir_datos
+from gestor_oop import norm_talla, talla_sort_key
+
+pytest.importorskip("pandas")
+
+MODELOS = ("M001", "M002", "M003", "X-10", "ab7")
+TALLAS = ("S", "s", " m", "L", "XL", "38", " 40", "42 ", "T.U.", "")
+
+
+def _estimado_original(prevision, inventory):
+    """calc_estimated_stock tal y como era antes de la tabla y de los motores."""
+    result = []
+    modelos = set(inventory.almacen.keys()) \
+        | set(prevision.pedidos_fabricacion.keys()) \
+        | {str(p.get("modelo", "")).strip().upper() for p in prevision.pedidos}
+    for modelo in sorted(modelos):
+        info = inventory.info_modelos.get(modelo, {}) or prevision.info_modelos.get(modelo, {})
+        tallas = set(inventory.almacen.get(modelo, {}).keys())
+        tallas |= {norm_talla(it.get("talla", "")) for it in prevision.pedidos_fabricacion.get(modelo, [])}
+        tallas |= {norm_talla(p.get("talla", "")) for p in prevision.pedidos
+                   if str(p.get("modelo", "")).strip().upper() == modelo}
+        for talla in sorted(tallas, key=talla_sort_key):
+            real = int(inventory.almacen.get(modelo, {}).get(talla, 0))
+            fabricar = sum(int(it.get("cantidad", 0) or 0) for it in prevision.pedidos_fabricacion.get(modelo, [])
+                           if norm_talla(it.get("talla", "")) == talla)
+            pendientes = sum(int(p.get("cantidad", 0) or 0) for p in prevision.pedidos
+                             if str(p.get("modelo", "")).strip().upper() == modelo
+                             and norm_talla(p.get("talla", "")) == talla)
+            result.append({"modelo": modelo, "descripcion": info.get("descripcion", ""),
+                           "color": info.get("color", ""), "talla": talla,
+                           "stock_estimado": real + fabricar - pendientes})
+    return result
+
+
+def _multiconjunto(filas):
+    return Counter(tuple(sorted(f.items())) for f in filas)
+
+
+def _estado_aleatorio(rng):
+    """Stock, pendientes y órdenes con modelos/tallas sin normalizar y cantidades vacías."""
+    almacen = {m: {norm_talla(rng.choice(TALLAS)): rng.randint(-5, 40) for _ in range(rng.randint(0, 5))}
+               for m in rng.sample(MODELOS[:4], rng.randint(1, 4))}
+    pedidos = [{"modelo": rng.choice((m, m.lower(), f" {m} ")), "talla": rng.choice(TALLAS),
+                "cantidad": rng.choice((rng.randint(1, 12), rng.randint(1, 12), 0, None)),
+                "pedido": f"P{rng.randint(1, 5)}", "numero_pedido": "", "cliente": "C",
+                "fecha": f"2025-{rng.randint(1, 12):02d}-01"}
+               for m in (rng.choice(MODELOS) for _ in range(rng.randint(0, 40)))]
+    fabricacion = {m: [{"talla": rng.choice(TALLAS), "cantidad": rng.choice((rng.randint(1, 30), None)),
+                        "fecha": f"2025-{rng.randint(1, 12):02d}-01"} for _ in range(rng.randint(1, 6))]
+                   for m in rng.sample(MODELOS, rng.randint(0, 3))}
+    info = {m: {"descripcion": f"Modelo {m}", "color": rng.choice(("", "AZUL")), "cliente": ""}
+            for m in rng.sample(MODELOS, 2)}
+    info_prev = {m: {"descripcion": f"Prev {m}", "color": "ROJO", "cliente": ""} for m in rng.sample(MODELOS, 2)}
+    inventario = {"almacen": almacen, "historial_entradas": [], "historial_salidas": [], "info_modelos": info}
+    prevision = {"ordenes": [], "pedidos": pedidos, "info_modelos": info_prev,
+                 "pedidos_fabricacion": fabricacion}
+    return inventario, prevision
+
+
+def _movimiento_aleatorio(gs, rng):
+    inv, prev = gs.inventory, gs.prevision
+    modelo, talla = rng.choice(MODELOS[:4]), rng.choice(TALLAS).strip() or "M"
+    accion = rng.randrange(6)
+    if accion == 0:
+        inv.register_entry(modelo, talla, rng.randint(1, 20), fecha="2025-06-01")
+    elif accion == 1 and prev.pedidos:
+        p = rng.choice(prev.pedidos)
+        inv.register_exit(p["modelo"], p["talla"], rng.randint(1, 10), "C", p["pedido"], "A1", fecha="2025-06-02")
+    elif accion == 2:
+        prev.register_pending(modelo, talla, rng.randint(1, 10), f"P{rng.randint(1, 5)}", "C", fecha="2025-07-01")
+    elif accion == 3:
+        prev.register_order(modelo, talla, rng.randint(1, 25), fecha="2025-08-01")
+    elif accion == 4 and prev.pedidos:
+        prev.edit_pending(rng.randint(1, len(prev.pedidos)), talla=rng.choice(("S", "40")),
+                          cantidad=rng.randint(0, 9))
+    elif accion == 5 and prev.pedidos:
+        prev.delete_pending(rng.randint(1, len(prev.pedidos)))
+
+
+@pytest.mark.parametrize("semilla", range(12))
+def test_motores_igual_que_el_recorrido_original(tmp_path, monkeypatch, semilla):
+    monkeypatch.chdir(tmp_path)
+    rng = random.Random(semilla)
+    escribir_datos(str(tmp_path), *_estado_aleatorio(rng))
+    gs = abrir_gestor(str(tmp_path))
+    for _ in range(4):
+        esperado = _multiconjunto(_estimado_original(gs.prevision, gs.inventory))
+        for motor in gs.prevision.MOTORES_ESTIMADO:
+            assert _multiconjunto(gs.prevision.calc_estimated_stock(gs.inventory, motor=motor)) == esperado, motor
+        # La tabla se mantiene con cada operación: se compara también tras unos movimientos
+        for _ in range(rng.randint(1, 6)):
+            _movimiento_aleatorio(gs, rng)
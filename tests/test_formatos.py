@@ -0,0 +1,55 @@
+"""Formatos de instantánea: se detectan solos al cargar y se convierten sin perder datos."""
+import pytest
+
+from conftest import abrir_gestor, estado, movimientos
+from gestor_oop import (FORMATOS_SNAPSHOT, DataStore, convertir_formato, detectar_formato,
+                        deserializar_json, serializar_json)
+
+DATOS = {"almacen": {"M001": {"S": 3, "M": -1}}, "texto": "línea\ncon salto", "lista": [1, 2.5, None]}
+
+
+@pytest.mark.parametrize("formato", FORMATOS_SNAPSHOT)
+def test_cada_formato_se_reconoce_y_decodifica(formato):
+    raw = serializar_json(DATOS, formato)
+    assert detectar_formato(raw) == formato
+    assert deserializar_json(raw) == DATOS
+
+
+def test_json_antiguo_con_bom():
+    raw = "﻿{\n  \"a\": 1\n}\n".encode("utf-8")
+    assert detectar_formato(raw) == "json" and deserializar_json(raw) == {"a": 1}
+    # Un fichero vacío es igual en JSON indentado y compacto: se queda en el de siempre
+    assert detectar_formato(serializar_json({}, "json")) == "json"
+
+
+@pytest.mark.parametrize("formato", FORMATOS_SNAPSHOT)
+def test_la_store_conserva_el_formato_del_fichero(tmp_path, formato):
+    ruta = str(tmp_path / "d.json")
+    DataStore(ruta, {"almacen": {}}, formato=formato).save()
+    ds = DataStore(ruta, {})
+    assert ds.formato == formato
+    ds.data["almacen"]["M009"] = {"L": 2}
+    ds.save()
+    with open(ruta, "rb") as f:
+        assert detectar_formato(f.read()) == formato
+    assert DataStore(ruta, {}).data["almacen"] == {"M009": {"L": 2}}
+
+
+def test_convertir_ida_y_vuelta_con_journal(carpeta):
+    gs = abrir_gestor(carpeta, journal=True)
+    movimientos(gs)
+    esperado = estado(gs)
+    ruta = gs.ds_inventario.path
+    for formato in ("gzip", "lzma", "compacto", "json"):
+        antes, despues = convertir_formato(ruta, formato)
+        assert antes > 0 and despues > 0
+        with open(ruta, "rb") as f:
+            assert detectar_formato(f.read()) == formato
+        assert estado(abrir_gestor(carpeta)) == esperado
+
+
+def test_formato_desconocido_se_rechaza(tmp_path):
+    with pytest.raises(ValueError, match="Formato de instantánea desconocido"):
+        DataStore(str(tmp_path / "d.json"), {}, formato="zstd")
+    with pytest.raises(ValueError):
+        serializar_json({}, "zstd")
@@ -0,0 +1,33 @@
+"""Históricos por meses: acceso por posición e importación a SQLite."""
+import os
+
+from conftest import abrir_gestor, estado, movimientos
+from gestor_oop import HistorialSegmentado, importar_json_a_sqlite
+
+
+def _segmentado(carpeta):
+    gs = abrir_gestor(carpeta, historial_segmentado=True)
+    gs.inventory.save()
+    return abrir_gestor(carpeta, historial_segmentado=True)
+
+
+def test_posicion_solo_lee_el_mes_que_la_contiene(carpeta):
+    lista = list(abrir_gestor(carpeta).inventory.historial_entradas)
+    hist = _segmentado(carpeta).inventory.historial_entradas
+    assert isinstance(hist, HistorialSegmentado)
+    mes = min(hist.meses())
+    hist.liberar()
+    assert hist[0] == sorted(lista, key=HistorialSegmentado.mes_de)[0]
+    assert set(hist._segmentos) == {mes}
+    esperado = [m for mes in hist.meses() for m in hist.del_mes(mes)]
+    assert [hist[i] for i in range(-len(hist), len(hist))] == esperado + esperado
+    assert hist[3:9:2] == esperado[3:9:2] and hist[-4:] == esperado[-4:]
+
+
+def test_importar_a_sqlite_un_historial_por_meses(carpeta):
+    gs = _segmentado(carpeta)
+    movimientos(gs)
+    ruta = os.path.join(carpeta, "almacen.sqlite")
+    resumen = importar_json_a_sqlite(ruta, gs.ds_inventario.path, gs.ds_prevision.path)
+    assert resumen["inventario.historial_entradas"] == len(gs.inventory.historial_entradas)
+    assert estado(abrir_gestor(carpeta, path_sqlite=ruta)) == estado(gs)
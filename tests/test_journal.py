@@ -0,0 +1,53 @@
+"""Modo journal: lo que se relee es lo que había en memoria."""
+import json
+import os
+
+from conftest import abrir_gestor, estado, movimientos
+from gestor_oop import DataStore, leer_json
+
+
+def test_journal_reaplica_las_mutaciones_al_cargar(carpeta):
+    gs = abrir_gestor(carpeta, journal=True)
+    gs.inventory.register_entry("M001", "M", 1, fecha="2025-05-01")   # primera: instantánea con id
+    with open(gs.ds_inventario.path, "rb") as f:
+        instantanea = f.read()
+    movimientos(gs)
+    # Los movimientos van al journal: la instantánea no se reescribe
+    with open(gs.ds_inventario.path, "rb") as f:
+        assert f.read() == instantanea
+    assert os.path.getsize(gs.ds_inventario.journal_path) > 0
+    assert estado(abrir_gestor(carpeta)) == estado(gs)
+
+
+def test_journal_ignora_una_ultima_linea_truncada(carpeta):
+    gs = abrir_gestor(carpeta, journal=True)
+    movimientos(gs)
+    esperado = estado(gs)
+    with open(gs.ds_inventario.journal_path, "a", encoding="utf-8") as f:
+        f.write('{"op": "incr", "path": ["almacen", "M001"')
+    assert estado(abrir_gestor(carpeta, journal=True)) == esperado
+
+
+def test_journal_de_otra_instantanea_no_se_aplica(tmp_path):
+    ruta = str(tmp_path / "d.json")
+    ds = DataStore(ruta, {"almacen": {}}, journal=True)
+    ds.save()
+    ds.data["almacen"]["M"] = 1
+    ds.record("set", ("almacen", "M"), 1)
+    ds.commit()
+    with open(ds.journal_path, encoding="utf-8") as f:
+        lineas = f.readlines()
+    # Instantánea reescrita por otro medio: el journal antiguo es residuo y no se reaplica
+    with open(ruta, "w", encoding="utf-8") as f:
+        json.dump({"almacen": {"X": 5}, DataStore.SNAPSHOT_ID_KEY: "otra"}, f)
+    with open(ds.journal_path, "w", encoding="utf-8") as f:
+        f.writelines(lineas)
+    assert DataStore(ruta, {}).data["almacen"] == {"X": 5}
+
+
+def test_compactar_vuelca_el_journal(carpeta):
+    gs = abrir_gestor(carpeta, journal=True)
+    movimientos(gs)
+    gs.ds_inventario.compact()
+    assert not os.path.exists(gs.ds_inventario.journal_path)
+    assert leer_json(gs.ds_inventario.path)["almacen"] == gs.inventory.almacen
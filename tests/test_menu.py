@@ -0,0 +1,15 @@
+"""Menú de consola: salir no depende de cuántas opciones haya."""
+import pytest
+
+from conftest import abrir_gestor
+
+
+@pytest.mark.parametrize("salir", ["0", "q", " Q "])
+def test_salir_tiene_tecla_fija(carpeta, monkeypatch, capsys, salir):
+    gs = abrir_gestor(carpeta)
+    respuestas = iter([salir])
+    monkeypatch.setattr("builtins.input", lambda *_: next(respuestas))
+    gs.run()
+    salida = capsys.readouterr().out
+    assert "0. Salir" in salida and "Saliendo del sistema" in salida
+    assert "25. Orden de corte sugerida" in salida
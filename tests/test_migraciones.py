@@ -0,0 +1,45 @@
+"""Migraciones de esquema: se aplican una vez al abrir y sellan la versión."""
+import json
+import os
+
+from conftest import RUTAS, abrir_gestor, datos_ejemplo, escribir_datos
+from gestor_oop import DataStore, leer_json, version_esquema
+
+
+def test_fichero_antiguo_se_migra_una_sola_vez(carpeta):
+    inventario, prevision = datos_ejemplo()
+    prevision["pedidos"][0]["talla"] = "36.0"
+    prevision["ordenes"] = [{"modelo": "m001", "talla": "38.0", "cantidad": 4, "fecha": "2025-02-01"},
+                            {"modelo": "M001", "talla": "38", "cantidad": 1, "fecha": "2025-02-01"},
+                            {"modelo": "M009", "talla": "S", "cantidad": 0, "fecha": ""}]
+    escribir_datos(carpeta, inventario, prevision)
+    ruta = os.path.join(carpeta, RUTAS[1])
+    gs = abrir_gestor(carpeta)
+    datos = leer_json(ruta)
+    assert datos[DataStore.SCHEMA_KEY] == version_esquema("prevision") >= 2
+    assert datos["ordenes"] == [] and datos["pedidos"][0]["talla"] == "36"
+    assert {"talla": "38", "cantidad": 5, "fecha": "2025-02-01"} in datos["pedidos_fabricacion"]["M001"]
+    assert "M009" not in datos["pedidos_fabricacion"]
+    assert gs.prevision.pedidos == datos["pedidos"]
+
+    # Al día: abrir no vuelve a escribir el fichero
+    with open(ruta, "rb") as f:
+        migrado = f.read()
+    sello = os.stat(ruta).st_mtime_ns
+    abrir_gestor(carpeta)
+    with open(ruta, "rb") as f:
+        assert f.read() == migrado
+    assert os.stat(ruta).st_mtime_ns == sello
+
+
+def test_migrate_aplica_en_orden_solo_las_posteriores(tmp_path):
+    ruta = str(tmp_path / "d.json")
+    with open(ruta, "w", encoding="utf-8") as f:
+        json.dump({"pasos": [], DataStore.SCHEMA_KEY: 1}, f)
+    migraciones = [(3, lambda d: d["pasos"].append(3)), (1, lambda d: d["pasos"].append(1)),
+                   (2, lambda d: d["pasos"].append(2))]
+    ds = DataStore(ruta, {})
+    assert ds.migrate(migraciones) == [2, 3]
+    assert ds.schema_version == 3
+    assert leer_json(ruta)["pasos"] == [2, 3]
+    assert DataStore(ruta, {}).migrate(migraciones) == []
@@ -0,0 +1,54 @@
+"""Índice de pendientes: las consultas parciales normalizan igual que la clave completa."""
+import os
+
+import pytest
+
+from conftest import MODELOS, TALLAS, abrir_gestor, datos_ejemplo, escribir_datos
+from gestor_oop import Prevision, importar_json_a_sqlite
+
+
+def _por_recorrido(pedidos, modelo, talla=None, pedido=None):
+    """Lo que debe salir: pendientes cuya clave normalizada encaja con el filtro."""
+    m, t, c = Prevision.clave_pendiente(modelo, talla or "", pedido or "")
+    return [p for p in pedidos if Prevision._clave_de(p)[0] == m
+            and (talla is None or Prevision._clave_de(p)[1] == t)
+            and (pedido is None or Prevision._clave_de(p)[2] == c)]
+
+
+@pytest.fixture
+def gestores(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    carpeta = str(tmp_path)
+    inventario, prevision = datos_ejemplo()
+    # Pedidos guardados como número o con decimales, y tallas escritas de otra forma
+    prevision["pedidos"] += [
+        {"modelo": "m001", "talla": "s", "cantidad": 2, "pedido": 1234.0, "cliente": "C", "fecha": "2025-01-01"},
+        {"modelo": "M001", "talla": "S", "cantidad": 5, "pedido": "1234", "cliente": "C", "fecha": "2025-01-02"},
+        {"modelo": "M001", "talla": "38.0", "cantidad": 1, "pedido": "1234.0", "cliente": "C", "fecha": "2025-01-03"},
+    ]
+    escribir_datos(carpeta, inventario, prevision)
+    ruta = os.path.join(carpeta, "almacen.sqlite")
+    importar_json_a_sqlite(ruta, os.path.join(carpeta, "datos_almacen.json"),
+                           os.path.join(carpeta, "prevision.json"))
+    return abrir_gestor(carpeta), abrir_gestor(carpeta, path_sqlite=ruta)
+
+
+def test_pedido_numerico_se_encuentra_sin_la_talla(gestores):
+    for gs in gestores:
+        prev = gs.prevision
+        assert [p["cantidad"] for p in prev.pendings_for("M001", pedido="1234")] == [1, 2, 5]
+        assert [p["cantidad"] for p in prev.pendings_for("m001", pedido=1234.0)] == [1, 2, 5]
+        assert [p["cantidad"] for p in prev.pendings_for("M001", "S", "1234")] == [2, 5]
+
+
+def test_consultas_parciales_coinciden_con_el_recorrido(gestores):
+    for gs in gestores:
+        prev = gs.prevision
+        prev.register_pending("M002", "L", 3, "P2", "C", fecha="2025-03-01")
+        pedidos_cod = {p.get("pedido") for p in prev.pedidos} | {"1234.0", "NO"}
+        for modelo in MODELOS + ("M009",):
+            for talla in (None,) + TALLAS:
+                for pedido in (None,) + tuple(pedidos_cod):
+                    esperado = _por_recorrido(prev.pedidos, modelo, talla, pedido)
+                    obtenido = prev.pendings_for(modelo, talla, pedido)
+                    assert sorted(map(id, obtenido)) == sorted(map(id, esperado)), (modelo, talla, pedido)
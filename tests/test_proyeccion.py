@@ -0,0 +1,92 @@
+"""Proyección de stock por periodos: el barrido por clave coincide con acumular a mano."""
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import MODELOS, TALLAS, abrir_gestor, escribir_datos, movimientos
+from gestor_oop import Prevision, norm_talla
+
+
+def _dia(desfase: int) -> str:
+    return (datetime.now() + timedelta(days=desfase)).strftime("%Y-%m-%d")
+
+
+def _datos(rng):
+    """Stock, fabricación y pendientes con fechas pasadas, futuras, vacías o no válidas."""
+    fecha = lambda: rng.choice((_dia(rng.randint(-90, 300)), _dia(rng.randint(0, 60)), "", None, "pronto"))
+    almacen = {m: {t: rng.randint(-5, 20) for t in rng.sample(TALLAS, 3)} for m in MODELOS}
+    fabricacion = {m: [{"talla": rng.choice(TALLAS + ("38.0",)), "cantidad": rng.randint(1, 15), "fecha": fecha()}
+                       for _ in range(rng.randint(0, 6))] for m in MODELOS}
+    pedidos = [{"modelo": rng.choice(MODELOS), "talla": rng.choice(TALLAS), "cantidad": rng.randint(1, 9),
+                "pedido": f"P{rng.randint(1, 5)}", "cliente": "C", "fecha": fecha()} for _ in range(60)]
+    inventario = {"almacen": almacen, "historial_entradas": [], "historial_salidas": [], "info_modelos": {}}
+    prevision = {"ordenes": [], "pedidos": pedidos, "info_modelos": {}, "pedidos_fabricacion": fabricacion}
+    return inventario, prevision
+
+
+def _a_mano(gs, periodo):
+    """{(modelo, talla): [(periodo, entradas, salidas, stock acumulado)]} sumando movimiento a movimiento."""
+    inv, prev = gs.inventory, gs.prevision
+    actual = Prevision.periodo_de(datetime.now().strftime("%Y-%m-%d"), periodo)
+    per = lambda f: max(Prevision.periodo_de(f, periodo) or actual, actual)
+    tramos = {}
+    for m, items in prev.pedidos_fabricacion.items():
+        for it in items:
+            t = tramos.setdefault((m, norm_talla(it["talla"])), {}).setdefault(per(it.get("fecha")), [0, 0])
+            t[0] += it["cantidad"]
+    for p in prev.pedidos:
+        m, talla, _ = Prevision.clave_pendiente(p["modelo"], p["talla"], p["pedido"])
+        tramos.setdefault((m, talla), {}).setdefault(per(p.get("fecha")), [0, 0])[1] += p["cantidad"]
+    for m, tallas in inv.almacen.items():
+        for t in tallas:
+            tramos.setdefault((m, t), {})
+    out = {}
+    for clave, por_periodo in tramos.items():
+        por_periodo.setdefault(actual, [0, 0])
+        stock = inv.almacen.get(clave[0], {}).get(clave[1], 0)
+        filas = []
+        for p in sorted(por_periodo):
+            stock += por_periodo[p][0] - por_periodo[p][1]
+            filas.append((p, por_periodo[p][0], por_periodo[p][1], stock))
+        out[clave] = filas
+    return out
+
+
+@pytest.mark.parametrize("semilla", range(8))
+@pytest.mark.parametrize("periodo", Prevision.PERIODOS_PROYECCION)
+def test_proyeccion_coincide_con_acumular_a_mano(tmp_path, monkeypatch, semilla, periodo):
+    monkeypatch.chdir(tmp_path)
+    escribir_datos(str(tmp_path), *_datos(random.Random(semilla)))
+    gs = abrir_gestor(str(tmp_path))
+    inv, prev = gs.inventory, gs.prevision
+    esperado = _a_mano(gs, periodo)
+
+    obtenido = {}
+    for f in prev.project_stock(inv, periodo):
+        obtenido.setdefault((f["modelo"], f["talla"]), []).append(
+            (f["periodo"], f["entradas"], f["salidas"], f["stock_proyectado"]))
+    assert obtenido == esperado
+
+    # El último tramo es el stock estimado de siempre
+    estimado = {(e["modelo"], e["talla"]): e["stock_estimado"] for e in prev.calc_estimated_stock(inv)}
+    assert {k: v[-1][3] for k, v in obtenido.items()} == estimado
+
+    negativos = {(f["modelo"], f["talla"]): (f["periodo"], f["stock_proyectado"])
+                 for f in prev.first_negative_periods(inv, periodo)}
+    assert negativos == {k: next((t[0], t[3]) for t in v if t[3] < 0)
+                         for k, v in esperado.items() if any(t[3] < 0 for t in v)}
+
+    modelo = MODELOS[semilla % len(MODELOS)]
+    assert prev.project_stock(inv, periodo, modelo.lower()) == [
+        f for f in prev.project_stock(inv, periodo) if f["modelo"] == modelo]
+
+
+def test_proyeccion_sigue_a_los_movimientos(carpeta):
+    gs = abrir_gestor(carpeta)
+    movimientos(gs)
+    gs.prevision.register_pending("M001", "S", 4, "P8", "C", fecha=_dia(40))
+    otro = abrir_gestor(carpeta)
+    assert gs.prevision.project_stock(gs.inventory, "semana") == otro.prevision.project_stock(otro.inventory, "semana")
+    with pytest.raises(ValueError):
+        gs.prevision.project_stock(gs.inventory, "trimestre")
@@ -0,0 +1,44 @@
+"""Renombrar modelos: todo pasa al código nuevo y nunca se pisa un modelo existente."""
+import pytest
+
+from conftest import abrir_gestor, estado
+
+
+def test_renombrar_sobre_un_modelo_existente_no_pierde_datos(carpeta):
+    gs = abrir_gestor(carpeta)
+    antes = estado(gs)
+    info = (dict(gs.inventory.info_modelos), dict(gs.prevision.info_modelos))
+    with pytest.raises(ValueError, match="M002 ya existe"):
+        gs.inventory.rename_model("M001", "M002")
+    with pytest.raises(ValueError, match="M002 ya existe"):
+        gs.prevision.rename_model("M001", "M002")
+    assert estado(gs) == antes
+    assert (gs.inventory.info_modelos, gs.prevision.info_modelos) == info
+    assert estado(abrir_gestor(carpeta)) == antes
+
+
+def test_renombrar_sobre_un_modelo_que_solo_tiene_pendientes(carpeta):
+    gs = abrir_gestor(carpeta)
+    gs.prevision.register_pending("N001", "S", 3, "P1", "C")
+    antes = estado(gs)
+    with pytest.raises(ValueError):
+        gs.inventory.rename_model("M001", "N001")
+    assert estado(gs) == antes
+
+
+def test_renombrar_mueve_todo_al_codigo_nuevo(carpeta):
+    gs = abrir_gestor(carpeta)
+    inv, prev = gs.inventory, gs.prevision
+    stock = dict(inv.almacen["M001"])
+    movimientos = len(inv.history("historial_entradas", modelo="M001"))
+    pendientes = len(prev.pendings_for("M001"))
+    ordenes = list(prev.pedidos_fabricacion["M001"])
+    assert inv.rename_model("m001", "n001") > 0
+    assert prev.rename_model("M001", "N001") == pendientes
+    for gestor in (gs, abrir_gestor(carpeta)):
+        inv, prev = gestor.inventory, gestor.prevision
+        assert not inv.has_model("M001") and not prev.has_model("M001")
+        assert inv.almacen["N001"] == stock
+        assert len(inv.history("historial_entradas", modelo="N001")) == movimientos
+        assert len(prev.pendings_for("N001")) == pendientes
+        assert prev.pedidos_fabricacion["N001"] == ordenes
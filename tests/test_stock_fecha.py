@@ -0,0 +1,79 @@
+"""stock_at con cierres trimestrales frente a reproducir el histórico completo."""
+import random
+
+import pytest
+
+from conftest import MODELOS, TALLAS, abrir_gestor, datos_ejemplo, escribir_datos
+from gestor_oop import leer_json, norm_talla
+
+
+def _reproduccion_completa(inv, fecha):
+    stock = {}
+    for clave, signo in (("historial_entradas", 1), ("historial_salidas", -1)):
+        for r in getattr(inv, clave):
+            if (r.get("fecha") or "") > fecha:
+                continue
+            k = (str(r.get("modelo", "")).strip().upper(), norm_talla(r.get("talla", "")))
+            stock[k] = stock.get(k, 0) + signo * int(r.get("cantidad", 0) or 0)
+    return {k: q for k, q in stock.items() if q}
+
+
+def _plano(stock):
+    return {(m, t): q for m, tallas in stock.items() for t, q in tallas.items()}
+
+
+def _fechas(rng, n=15):
+    return sorted(f"{rng.choice((2024, 2025, 2026))}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+                  for _ in range(n))
+
+
+@pytest.mark.parametrize("semilla", range(4))
+def test_stock_at_igual_que_reproducir_todo(tmp_path, monkeypatch, semilla):
+    monkeypatch.chdir(tmp_path)
+    escribir_datos(str(tmp_path), *datos_ejemplo(semilla))
+    gs = abrir_gestor(str(tmp_path))
+    inv, rng = gs.inventory, random.Random(semilla)
+    for fecha in _fechas(rng):
+        assert _plano(inv.stock_at(fecha)) == _reproduccion_completa(inv, fecha), fecha
+    # Un alta con fecha atrasada invalida los cierres posteriores
+    inv.register_entry(rng.choice(MODELOS), rng.choice(TALLAS), 9, fecha="2025-02-10")
+    for fecha in _fechas(rng):
+        assert _plano(inv.stock_at(fecha)) == _reproduccion_completa(inv, fecha), fecha
+    modelo = rng.choice(MODELOS)
+    assert _plano(inv.stock_at("2025-08-15", modelo)) == {
+        k: q for k, q in _reproduccion_completa(inv, "2025-08-15").items() if k[0] == modelo}
+
+
+def test_stock_at_no_escribe_nada(carpeta):
+    gs = abrir_gestor(carpeta, journal=True)
+    with open(gs.ds_inventario.path, "rb") as f:
+        antes = f.read()
+    gs.inventory.stock_at("2025-12-31")
+    assert not gs.ds_inventario._pending_ops
+    with open(gs.ds_inventario.path, "rb") as f:
+        assert f.read() == antes
+    # Guardarlos es explícito, y otro puesto arranca ya con ellos
+    assert gs.inventory.save_checkpoints() > 0
+    otro = abrir_gestor(carpeta)
+    assert otro.inventory.cierres_stock == gs.inventory.cierres_stock
+    assert otro.inventory.stock_at("2025-12-31") == gs.inventory.stock_at("2025-12-31")
+
+
+def test_save_solo_descarta_los_cierres_desde_lo_tocado(carpeta):
+    gs = abrir_gestor(carpeta)
+    inv = gs.inventory
+    inv.stock_at("2025-12-31")
+    inv.save_checkpoints()
+    cierres = sorted(inv.cierres_stock)
+    # Tocar solo el stock no afecta a los cierres
+    inv.almacen["M001"]["S"] = 999
+    inv.save()
+    assert sorted(inv.cierres_stock) == cierres
+    # Editar a mano un movimiento de julio invalida los cierres de julio en adelante
+    mov = next(r for r in inv.historial_salidas if r["fecha"][:7] == "2025-07")
+    mov["cantidad"] += 4
+    inv.save(historial_desde=mov["fecha"])
+    assert sorted(inv.cierres_stock) == [m for m in cierres if m < "2025-07"]
+    assert leer_json(gs.ds_inventario.path)["cierres_stock"] == inv.cierres_stock
+    for fecha in ("2025-06-30", "2025-07-31", "2025-11-15"):
+        assert _plano(inv.stock_at(fecha)) == _reproduccion_completa(inv, fecha)
@@ -0,0 +1,27 @@
+"""El catálogo de tallas ordena igual que talla_sort_key."""
+import random
+
+from gestor_oop import CatalogoTallas, norm_talla, talla_sort_key
+
+TALLAS = ("XS", "S", "M", "L", "XL", "XXL", "3XL", "34", "36", "38", "40", "42", "44", "46",
+          "T.U.", "UNICA", "6", "8", "10", "12", "2XL", "S/M", "L/XL", "")
+
+
+def test_ordenar_igual_que_talla_sort_key():
+    rng = random.Random(5)
+    catalogo = CatalogoTallas(TALLAS[:5])
+    for _ in range(20):
+        tallas = [rng.choice(TALLAS) for _ in range(rng.randint(1, 15))]
+        # Las tallas nuevas se dan de alta sobre la marcha sin desordenar las conocidas
+        ordenadas = catalogo.ordenar(tallas)
+        assert sorted(ordenadas) == sorted(tallas)
+        assert [talla_sort_key(norm_talla(t)) for t in ordenadas] == \
+            sorted(talla_sort_key(norm_talla(t)) for t in tallas)
+
+
+def test_ids_estables_y_sin_renormalizar():
+    catalogo = CatalogoTallas()
+    assert catalogo.id(" m ") == catalogo.id("M") == catalogo.id("m")
+    assert catalogo.etiqueta(catalogo.id(" m ")) == "M"
+    # Numéricas antes que letras; se devuelven las etiquetas tal cual llegaron
+    assert catalogo.ordenar(["40", " m", "38"]) == ["38", "40", " m"]
@@ -0,0 +1,30 @@
+"""Cantidades antiguas guardadas como texto o decimal: se tipan al cargar sin abortar."""
+import os
+
+from conftest import RUTAS, datos_ejemplo, escribir_datos
+from gestor_oop import GestorStock, tipar_registros
+
+
+def test_cantidades_enteras_escritas_como_decimal_pasan_a_entero():
+    filas = [{"cantidad": "12.0"}, {"cantidad": 7.0}, {"cantidad": " 3 "}, {"cantidad": "4,0"},
+             {"cantidad": ""}, {"cantidad": None}]
+    tipar_registros(filas)
+    assert [f["cantidad"] for f in filas] == [12, 7, 3, 4, 0, 0]
+    assert all(type(f["cantidad"]) is int for f in filas)
+
+
+def test_valores_no_enteros_avisan_y_no_detienen_la_carga(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    inventario, prevision = datos_ejemplo()
+    inventario["historial_entradas"][0]["cantidad"] = "12.0"
+    inventario["historial_salidas"][0]["cantidad"] = "2,5"
+    prevision["pedidos"][0]["cantidad"] = "abc"
+    escribir_datos(str(tmp_path), inventario, prevision)
+    gs = GestorStock(*(os.path.join(str(tmp_path), r) for r in RUTAS))
+    assert gs.inventory.historial_entradas[0]["cantidad"] == 12
+    assert gs.inventory.historial_salidas[0]["cantidad"] == 2.5
+    assert gs.prevision.pedidos[0]["cantidad"] == 0
+    avisos = capsys.readouterr().out
+    assert "tiene decimales" in avisos and "no es un número" in avisos
+    # El resto del gestor funciona con esos datos
+    gs.prevision.calc_estimated_stock(gs.inventory)
@@ -0,0 +1,64 @@
+"""Lotes y transacciones: todo o nada, y una sola escritura al salir."""
+import os
+
+import pytest
+
+from conftest import abrir_gestor, estado, movimientos
+from gestor_oop import importar_json_a_sqlite, leer_json
+
+
+@pytest.mark.parametrize("journal", [False, True])
+def test_transaccion_con_excepcion_deshace_todo(carpeta, journal):
+    gs = abrir_gestor(carpeta, journal=journal)
+    antes = estado(gs)
+    estimado = gs.prevision.calc_estimated_stock(gs.inventory)
+    en_disco = {ruta: open(ruta, "rb").read() for ruta in (gs.ds_inventario.path, gs.ds_prevision.path)}
+    with pytest.raises(RuntimeError):
+        with gs.transaction():
+            movimientos(gs)
+            raise RuntimeError("fallo a mitad")
+    assert estado(gs) == antes
+    # Las estructuras derivadas (índices, colas, tabla prevista) vuelven con los datos
+    assert gs.prevision.calc_estimated_stock(gs.inventory) == estimado
+    for ruta, raw in en_disco.items():
+        assert open(ruta, "rb").read() == raw
+    assert not os.path.exists(gs.ds_inventario.journal_path)
+
+
+def test_transaccion_escribe_una_vez_al_salir(carpeta):
+    gs = abrir_gestor(carpeta)
+    antes = leer_json(gs.ds_inventario.path)
+    with gs.transaction():
+        movimientos(gs)
+        assert gs.ds_inventario.dirty
+        assert leer_json(gs.ds_inventario.path) == antes
+    assert estado(abrir_gestor(carpeta)) == estado(gs)
+
+
+def test_deshacer_conserva_lo_anterior_al_lote_aun_sin_escribir(carpeta):
+    gs = abrir_gestor(carpeta, async_write=True)
+    gs.prevision.register_pending("M004", "S", 3, "P8", "C", fecha="2025-05-01")
+    antes = estado(gs)
+    with pytest.raises(RuntimeError):
+        with gs.transaction():
+            movimientos(gs)
+            raise RuntimeError("fallo a mitad")
+    assert estado(gs) == antes
+    assert gs.flush(5.0)
+    assert estado(abrir_gestor(carpeta)) == antes
+
+
+def test_transaccion_con_excepcion_deshace_todo_en_sqlite(carpeta):
+    ruta = os.path.join(carpeta, "almacen.sqlite")
+    importar_json_a_sqlite(ruta, os.path.join(carpeta, "datos_almacen.json"),
+                           os.path.join(carpeta, "prevision.json"))
+    gs = abrir_gestor(carpeta, path_sqlite=ruta)
+    antes = estado(gs)
+    with pytest.raises(RuntimeError):
+        with gs.transaction():
+            movimientos(gs)
+            raise RuntimeError("fallo a mitad")
+    assert estado(gs) == antes
+    # Los ids de fila siguen alineados: lo siguiente se escribe donde toca
+    movimientos(gs)
+    assert estado(abrir_gestor(carpeta, path_sqlite=ruta)) == estado(gs)